@@ -2,6 +2,7 @@ import traceback
 import uvicorn
 import os
 import urllib.parse
+import uuid
 
 import logging
 import logging.handlers as handlers
@@ -11,11 +12,25 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 from pydantic import BaseModel
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 from PIL import Image
 
-from sqlalchemy import create_engine, MetaData, Table, and_, text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    UniqueConstraint,
+    and_,
+    bindparam,
+    create_engine,
+    text,
+)
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -27,6 +42,8 @@ encoded_password = urllib.parse.quote_plus(
     os.getenv("MYSQL_PASS")
 )  # Safely encode the password
 log_base_directory = os.getenv("LOG_BASE_DIRECTORY")
+# Frame claim queue: a FAILED frame is handed out again until it reaches this many attempts
+CLAIM_MAX_ATTEMPTS = int(os.getenv("CLAIM_MAX_ATTEMPTS", 3))
 
 # ================================== Create the engine ==================================
 
@@ -46,6 +63,27 @@ metadata = MetaData()
 # Reflect existing table
 frame_data_table = Table("frames_storage", metadata, autoload_with=engine)
 
+# Work queue leases: one row per (frame, usecase) once a worker has claimed the frame.
+# status: LEASED -> DONE | FAILED. A LEASED row whose leased_until has passed can be
+# claimed again, so frames from crashed workers are not lost.
+frame_claims_table = Table(
+    "frame_claims",
+    metadata,
+    Column("id", BigInteger, primary_key=True, autoincrement=True),
+    Column("frame_id", Integer, nullable=False),
+    Column("usecase", String(64), nullable=False),
+    Column("worker_id", String(128), nullable=False),
+    Column("lease_token", String(64), nullable=False),
+    Column("leased_until", DateTime, nullable=False),
+    Column("status", String(16), nullable=False, default="LEASED"),
+    Column("attempts", Integer, nullable=False, default=1),
+    Column("updated_at", DateTime, nullable=False),
+    UniqueConstraint("frame_id", "usecase", name="uq_frame_claims_frame_usecase"),
+    Index("ix_frame_claims_usecase_status", "usecase", "status", "leased_until"),
+    Index("ix_frame_claims_lease_token", "lease_token"),
+)
+metadata.create_all(engine, tables=[frame_claims_table])
+
 # ================================== Logger Configurations ==================================
 
 # Check if log directory exists
@@ -128,6 +166,37 @@ class FrameResponse(BaseModel):
     frame_time: datetime
 
 
+class ClaimFramesRequest(BaseModel):
+    usecase: str
+    worker_id: str
+    camera_ids: List[int]
+    limit: int = 8
+    lease_seconds: int = 120
+    lookback_seconds: int = 600
+
+
+class ClaimedFrame(BaseModel):
+    id: int
+    camera_id: int
+    frame_time: datetime
+    frame_data: str
+    lease_token: str
+    leased_until: datetime
+    attempts: int
+
+
+class ClaimFramesResponse(BaseModel):
+    lease_token: Optional[str]
+    frames: List[ClaimedFrame]
+
+
+class CompleteFramesRequest(BaseModel):
+    usecase: str
+    lease_token: str
+    frame_ids: List[int]
+    status: str = "DONE"  # DONE | FAILED
+
+
 class CaseAIDetails(BaseModel):
     case_id: int
     cameras_rtsp: List[int]
@@ -140,6 +209,20 @@ class SuspectDetailsResponse(BaseModel):
     camera_rtsp_ids: List[int]
 
 
+# ================================== Helpers ==================================
+
+
+def to_raw_frames_url(frame_data: str) -> str:
+    """Rewrite a stored frame path/URL to ROOT_URL/raw_frames/<filename>."""
+    parsed = urllib.parse.urlparse(frame_data)
+    # Extract filename from either URL path or raw string
+    src_filename = os.path.basename(parsed.path if parsed.path else frame_data) or os.path.basename(frame_data)
+    # Normalize ROOT_URL
+    normalized_root = ROOT_URL.rstrip("/") if ROOT_URL else ""
+    # Construct URL pointing to raw_frames
+    return f"{normalized_root}/raw_frames/{src_filename}" if normalized_root else frame_data
+
+
 # ================================== APIs Defined ==================================
 
 
@@ -302,16 +385,7 @@ def get_frame_by_time(
         try:
             frame_dict = dict(frame)
             if "frame_data" in frame_dict and isinstance(frame_dict["frame_data"], str):
-                parsed = urllib.parse.urlparse(frame_dict["frame_data"])
-                # Extract filename from either URL path or raw string
-                src_filename = os.path.basename(
-                    parsed.path if parsed.path else frame_dict["frame_data"]) or os.path.basename(
-                    frame_dict["frame_data"])
-                # Normalize ROOT_URL
-                normalized_root = ROOT_URL.rstrip("/") if ROOT_URL else ""
-                # Construct URL pointing to raw_frames
-                frame_dict["frame_data"] = f"{normalized_root}/raw_frames/{src_filename}" if normalized_root else \
-                    frame_dict["frame_data"]
+                frame_dict["frame_data"] = to_raw_frames_url(frame_dict["frame_data"])
                 logger.debug(f"Rewritten frame_data to raw_frames URL: {frame_dict['frame_data']}")
             return frame_dict
         except Exception:
@@ -404,6 +478,161 @@ def get_suspect_details(suspect_id: int, db=Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Claimable = never claimed, lease expired, or failed with attempts left
+_CLAIMABLE_SQL = (
+    "(c.id IS NULL"
+    " OR (c.status = 'LEASED' AND c.leased_until < UTC_TIMESTAMP())"
+    " OR (c.status = 'FAILED' AND c.attempts < :max_attempts))"
+)
+
+
+@app.post("/claim_frames", response_model=ClaimFramesResponse, tags=["Frames"])
+def claim_frames(request: ClaimFramesRequest, db: Session = Depends(get_db)):
+    """
+    Leases up to `limit` unprocessed frames of the given cameras to a worker.
+
+    Frames are handed out oldest first. Each (frame, usecase) pair is leased
+    through an upsert on frame_claims, which is atomic per row, so concurrent
+    workers never receive the same frame. A lease that is not completed
+    before `lease_seconds` expires becomes claimable again.
+
+    Args:
+        request (ClaimFramesRequest): usecase, worker id, camera set and limits.
+        db (Session): SQLAlchemy DB session, injected via FastAPI Depends.
+
+    Returns:
+        ClaimFramesResponse: The lease token and the frames won by it.
+    """
+    try:
+        logger.info(
+            f"Claim request | usecase={request.usecase} worker={request.worker_id} "
+            f"cameras={request.camera_ids} limit={request.limit}"
+        )
+        if not request.camera_ids or request.limit <= 0:
+            return {"lease_token": None, "frames": []}
+
+        params = {
+            "usecase": request.usecase,
+            "worker_id": request.worker_id,
+            "camera_ids": request.camera_ids,
+            "limit": int(request.limit),
+            "lookback": int(request.lookback_seconds),
+            "lease_seconds": int(request.lease_seconds),
+            "max_attempts": CLAIM_MAX_ATTEMPTS,
+            "lease_token": uuid.uuid4().hex,
+        }
+
+        # 1) Candidate frames for this usecase (no claim, expired lease, or retryable failure)
+        candidates_sql = text(
+            f"SELECT f.id FROM {frame_data_table.name} f "
+            f"LEFT JOIN {frame_claims_table.name} c ON c.frame_id = f.id AND c.usecase = :usecase "
+            "WHERE f.camera_id IN :camera_ids "
+            "AND f.frame_time >= UTC_TIMESTAMP() - INTERVAL :lookback SECOND "
+            f"AND {_CLAIMABLE_SQL} "
+            "ORDER BY f.frame_time ASC, f.id ASC LIMIT :limit"
+        ).bindparams(bindparam("camera_ids", expanding=True))
+        frame_ids = [row[0] for row in db.execute(candidates_sql, params).fetchall()]
+        logger.debug(f"Claim candidates: {frame_ids}")
+        if not frame_ids:
+            return {"lease_token": None, "frames": []}
+
+        # 2) Lease them. lease_token is assigned first; the other columns only change
+        #    when this request's token won the row, so a lost race leaves the row untouched.
+        won_sql = "lease_token = VALUES(lease_token)"
+        upsert_sql = text(
+            f"INSERT INTO {frame_claims_table.name} "
+            "(frame_id, usecase, worker_id, lease_token, leased_until, status, attempts, updated_at) "
+            "VALUES (:frame_id, :usecase, :worker_id, :lease_token, "
+            "UTC_TIMESTAMP() + INTERVAL :lease_seconds SECOND, 'LEASED', 1, UTC_TIMESTAMP()) "
+            "ON DUPLICATE KEY UPDATE "
+            "lease_token = IF((status = 'LEASED' AND leased_until < UTC_TIMESTAMP()) "
+            "OR (status = 'FAILED' AND attempts < :max_attempts), VALUES(lease_token), lease_token), "
+            f"worker_id = IF({won_sql}, VALUES(worker_id), worker_id), "
+            f"attempts = IF({won_sql}, attempts + 1, attempts), "
+            f"status = IF({won_sql}, 'LEASED', status), "
+            f"leased_until = IF({won_sql}, VALUES(leased_until), leased_until), "
+            f"updated_at = IF({won_sql}, VALUES(updated_at), updated_at)"
+        )
+        db.execute(upsert_sql, [dict(params, frame_id=fid) for fid in frame_ids])
+        db.commit()
+
+        # 3) Return only the frames this token actually won
+        claimed_sql = text(
+            "SELECT f.id, f.camera_id, f.frame_time, f.frame_data, "
+            "c.lease_token, c.leased_until, c.attempts "
+            f"FROM {frame_claims_table.name} c JOIN {frame_data_table.name} f ON f.id = c.frame_id "
+            "WHERE c.lease_token = :lease_token AND c.usecase = :usecase "
+            "ORDER BY f.frame_time ASC, f.id ASC"
+        )
+        frames = []
+        for row in db.execute(claimed_sql, params).mappings().fetchall():
+            frame = dict(row)
+            if isinstance(frame.get("frame_data"), str):
+                frame["frame_data"] = to_raw_frames_url(frame["frame_data"])
+            frames.append(frame)
+
+        logger.info(
+            f"Claimed {len(frames)}/{len(frame_ids)} frames | usecase={request.usecase} "
+            f"worker={request.worker_id} lease_token={params['lease_token']}"
+        )
+        return {"lease_token": params["lease_token"], "frames": frames}
+
+    except SQLAlchemyError:
+        db.rollback()
+        logger.error("In claim_frames :: Database error while claiming frames.")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+    except Exception:
+        logger.error("In claim_frames :: Unexpected error while claiming frames.")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+@app.post("/complete_frames", tags=["Frames"])
+def complete_frames(request: CompleteFramesRequest, db: Session = Depends(get_db)):
+    """
+    Marks leased frames DONE or FAILED.
+
+    Only rows still leased under `lease_token` are updated, so a worker whose
+    lease expired cannot complete a frame that was handed to someone else.
+    """
+    status = request.status.strip().upper()
+    if status not in {"DONE", "FAILED"}:
+        raise HTTPException(status_code=400, detail="status must be DONE or FAILED")
+    if not request.frame_ids:
+        return {"message": "No frames to complete", "updated": 0}
+
+    try:
+        complete_sql = text(
+            f"UPDATE {frame_claims_table.name} "
+            "SET status = :status, leased_until = UTC_TIMESTAMP(), updated_at = UTC_TIMESTAMP() "
+            "WHERE usecase = :usecase AND lease_token = :lease_token "
+            "AND frame_id IN :frame_ids AND status = 'LEASED'"
+        ).bindparams(bindparam("frame_ids", expanding=True))
+        result = db.execute(
+            complete_sql,
+            {
+                "status": status,
+                "usecase": request.usecase,
+                "lease_token": request.lease_token,
+                "frame_ids": request.frame_ids,
+            },
+        )
+        db.commit()
+        logger.info(
+            f"Completed frames | usecase={request.usecase} status={status} "
+            f"frame_ids={request.frame_ids} updated={result.rowcount}"
+        )
+        return {"message": "Frames completed", "updated": result.rowcount}
+
+    except SQLAlchemyError:
+        db.rollback()
+        logger.error("In complete_frames :: Database error while completing frames.")
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=500, detail="Database error occurred.")
+
+
 @app.post("/image_copy", tags=["Frames"])
 async def image_copy(
         image_source_url: str, image_des_url: str, image_size: int = IMAGE_SIZE
@@ -1,23 +1,32 @@
+from common import startup  # first, so the start-up timing covers the imports below
 import os
 import my_utils as mu
 import config as cfg
-import requests
+from common.http_client import get_client
 from model_init import get_model_device, load_model_from_path
 from datetime import datetime, timezone, timedelta
 import json
 import time
 import cv2
+from common.pipeline import PipelineRunner
+from common import frame_queue, ingest, motion_gate, sharding
+from typing import Any, Dict, List, Optional
+
+startup.mark("imports")
 
 PERSON_WEIGHT_PATH = "pt_model/ppe-kit-detection-2.pt"
 PERSON_MODEL = load_model_from_path(PERSON_WEIGHT_PATH)
 
 DEVICE = get_model_device()
+GATE = motion_gate.get_gate()
 
 frame_status_url = cfg.FRAME_STATUS_URL
 get_frame_url = cfg.GET_FRAME_URL
 COPY_IMAGES_URL = cfg.COPY_IMAGES_URL
 DELETE_SOURCE_IMAGE_URL = cfg.DELETE_SOURCE_IMAGE_URL
 
+USECASE = "ppe_detection"
+
 # ==================================================================================
 # Optional visualization toggle: set to True to save detection overlays
 # You can also comment out the entire block below where this flag is used
@@ -41,386 +50,618 @@ def set_response_schema(current_time: datetime, frame_status: str, camera_id: in
     cfg.logger.debug(
         "Posting frame status | url=%s payload=%s", frame_status_url, payload
     )
-    requests.post(frame_status_url, json=payload)
+    if cfg.HTTP_ASYNC_STATUS:
+        get_client().post_async("frame_status", frame_status_url, json=payload)
+    else:
+        get_client().post("frame_status", frame_status_url, json=payload)
 
 
-if __name__ == "__main__":
-    cfg.logger.info("PPE Detection service starting up")
-    cfg.logger.info("Model weights: %s | Device: %s", PERSON_WEIGHT_PATH, DEVICE)
-    while True:
-        try:
-            start_cycle_ts = time.time()
-            camera_list = mu.get_all_camera()
-            cfg.logger.info(f"camera_list :: {camera_list}")
+# ============================ Per-camera stages ============================
+# A camera goes through resolve -> fetch -> load -> inference -> publish. Each
+# stage receives the frame context built by the previous one and returns None
+# when the camera has nothing more to do this cycle.
+
+
+def resolve_camera(camera: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Look up the active PPE mapping for a camera.
+
+    Returns a frame context holding the camera id, mapping row and parsed ROI
+    boxes, or None when the camera has no active PPE mapping.
+    """
+    camera_id = int(camera["id"])
+    cfg.logger.info(f"Running AI on camera_id :: {camera_id}")
+
+    cfg.logger.debug(f"Configured Result type id :: {cfg.RESULT_TYPE_ID}")
+    roi_details = mu.get_roi_by_result_type_id_and_camera_rtsp_id(
+        cfg.RESULT_TYPE_ID, camera_id
+    )
+    cfg.logger.info(
+        f"ROI DETAILS for RESULT_TYPE_ID :: {cfg.RESULT_TYPE_ID} and camera_id :: {camera_id} are \n {roi_details}"
+    )
+    if not roi_details:
+        return None
+
+    # ROI boxes were parsed once when the mapping cache loaded
+    roi_boxes = roi_details.get("roi_boxes") or []
+    cfg.logger.debug("Parsed ROI boxes count=%d", len(roi_boxes))
+    return {"camera_id": camera_id, "roi_details": roi_details, "roi_boxes": roi_boxes}
+
+
+def fetch_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ask the frames API for the camera's frame from one minute ago.
+
+    Adds the frame time and the frame's disk path/URL to the context.
+    """
+    camera_id = ctx["camera_id"]
+    # Use current UTC time minus 1 minute for frame fetching
+    dt_utc_minus_1 = datetime.now(timezone.utc) - timedelta(minutes=1)
+    current_time = dt_utc_minus_1.strftime("%Y-%m-%d %H:%M:%S")
+    params = {
+        "frame_time": current_time,  # Replace with the desired datetime
+        "camera_id": int(camera_id),
+    }
+    cfg.logger.info(f"Fetching frame | url={get_frame_url} params={params}")
+
+    t_get_start = time.time()
+    response = get_client().get("get_frame", get_frame_url, params=params)
+    t_get_end = time.time()
+    cfg.perf_logger.info(
+        "get_frame latency_ms=%.2f camera_id=%s",
+        (t_get_end - t_get_start) * 1000,
+        camera_id,
+    )
+
+    if response.status_code == 200:
+        cfg.logger.info(f"Frame API Response :: {response.status_code}")
+
+    else:
+        cfg.logger.error(f"Error: {response.status_code}, {response.text}")
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="started",
+        camera_id=int(camera_id),
+    )
+    response = response.json()
+    image_path = response.get("frame_data")
+    cfg.logger.info(f"Image get from api :: {image_path}")
+    if not image_path:
+        return None
+
+    ctx["camera_id"] = int(image_path.split("/")[-2])
+    cfg.logger.info(f"Proceeding with Camera ID :: {ctx['camera_id']} ")
+    return attach_frame(ctx, image_path, current_time)
+
+
+def attach_frame(ctx: Dict[str, Any], image_path: str, current_time: str) -> Dict[str, Any]:
+    """Record the frame's disk path/URL and time on the context and mark it processing."""
+    cfg.logger.debug(f"cfg.ROOT_PATH :: {cfg.ROOT_PATH}")
+    cfg.logger.debug(f"cfg.ROOT_URL :: {cfg.ROOT_URL}")
+    # Normalize ROOT_URL to avoid double slashes like http://ip//frames/...
+    base_url = (cfg.ROOT_URL or "").rstrip("/")
+    image_path_url = image_path.replace(cfg.ROOT_PATH, base_url)
+    cfg.logger.debug(f"Converted image_path_url (normalized): {image_path_url}")
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="processing",
+        camera_id=int(ctx["camera_id"]),
+    )
+
+    ctx.update(
+        current_time=current_time,
+        main_image_path=image_path,
+        image_path_url=image_path_url,
+    )
+    return ctx
+
+
+def claim_contexts(camera_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resolve the cameras' mappings and lease their next unprocessed frames.
+
+    Used when FRAME_SOURCE=claim. Returns one context per claimed frame, ready
+    for `load_frame`.
+    """
+    resolved = {}
+    for camera in camera_list:
+        ctx = resolve_camera(camera)
+        if ctx:
+            resolved[ctx["camera_id"]] = ctx
+
+    contexts = []
+    for frame in frame_queue.claim_frames(USECASE, list(resolved)):
+        base = resolved.get(int(frame["camera_id"]))
+        if base is None:
+            continue
+        ctx = dict(base, frame_id=frame["id"], lease_token=frame["lease_token"])
+        set_response_schema(
+            current_time=frame["frame_time"],
+            frame_status="started",
+            camera_id=int(ctx["camera_id"]),
+        )
+        contexts.append(attach_frame(ctx, frame["frame_data"], frame["frame_time"]))
+    return contexts
+
+
+def crop_rois(ctx: Dict[str, Any]) -> Optional[ingest.CropRois]:
+    """The camera's ROI boxes when its mapping selects ROI-cropped inference
+    (roi_type, see ingest.crop_selected), else None."""
+    roi_details = ctx["roi_details"]
+    roi_type = roi_details.get("roi_type") if isinstance(roi_details, dict) else None
+    return (ctx["roi_boxes"], []) if ctx["roi_boxes"] and ingest.crop_selected(roi_type) else None
+
+
+def load_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Read and decode the frame (see common/ingest.py), preferring the local frames volume.
+
+    Adds `img` (letterboxed CHW array, or one per ROI crop when the mapping
+    selects cropped inference), `img0` (decoded BGR frame, possibly reduced)
+    and the frame's original shape/scale to the context. Reports the frame as
+    failed when neither disk nor HTTP can be read.
+    """
+    camera_id = ctx["camera_id"]
+    image_path_url = ctx["image_path_url"]
+    main_image_path = ctx["main_image_path"]
+
+    cfg.logger.info(f"Proceeding with Image Size :: {cfg.IMAGE_SIZE} ")
+    t_load_start = time.time()
+    frame = ingest.load_frame(image_path_url, main_image_path, int(cfg.IMAGE_SIZE), crop=crop_rois(ctx))
+    t_load_end = time.time()
+    cfg.perf_logger.info(
+        "load_image latency_ms=%.2f camera_id=%s path=%s source=%s scale=%.2f crops=%d",
+        (t_load_end - t_load_start) * 1000,
+        camera_id,
+        image_path_url,
+        frame.source[0] if frame else "none",
+        frame.scale if frame else 0.0,
+        len(frame.img) if frame and isinstance(frame.img, list) else 0,
+    )
 
-            for camera in camera_list:
-                camera_id = int(camera["id"])
-                cfg.logger.info(f"Running AI on camera_id :: {camera_id}")
-                cam_start_ts = time.time()
+    if frame is None:
+        cfg.logger.error(
+            "Image fetch failed from both HTTP and disk. Skipping this frame. url=%s path=%s",
+            image_path_url,
+            main_image_path,
+        )
+        set_response_schema(
+            current_time=ctx["current_time"],
+            frame_status="failed",
+            camera_id=int(camera_id),
+        )
+        frame_queue.complete_frame(USECASE, ctx, "FAILED")
+        return None
+
+    return ingest.attach(ctx, frame)
+
+
+def allowed_labels(ctx: Dict[str, Any]) -> Optional[List[str]]:
+    """Labels the camera's mapping allows (None keeps every label)."""
+    roi_details = ctx["roi_details"]
+    return roi_details.get("allowed_labels") if isinstance(roi_details, dict) else None
+
+
+def frame_changed(ctx: Dict[str, Any]) -> bool:
+    """Motion gate: whether the frame changed inside the camera's ROI boxes."""
+    return GATE.check(ctx["camera_id"], ctx["img0"], ctx["frame_shape"], boxes=ctx["roi_boxes"])
+
+
+def static_result(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Result for a frame the motion gate skipped."""
+    cfg.logger.info("Frame unchanged; skipping inference | camera_id=%s", ctx["camera_id"])
+    return GATE.static_result(ctx["camera_id"], {"detection": [], "inference_time": 0.0})
+
+
+def run_inference(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the PPE detector on a single loaded frame, keeping only the
+    mapping's allowed labels inside its ROI boxes. Unchanged frames skip the
+    detector (see common/motion_gate.py)."""
+    camera_id = ctx["camera_id"]
+    cfg.logger.info(f"Usecase Selected :: {USECASE}")
+    cfg.logger.info("ppe_detection usecase detected")
+    if not frame_changed(ctx):
+        return static_result(ctx)
+
+    t_inf_start = time.time()
+    result = mu.predict(
+        PERSON_MODEL,
+        ctx["img"],
+        ctx["frame_geometry"],
+        DEVICE,
+        float(cfg.MODEL_CONF),
+        float(cfg.MODEL_IOU),
+        USECASE,
+        str(camera_id),
+        labels=allowed_labels(ctx),
+        rois=ctx["roi_boxes"],
+    )
+    t_inf_end = time.time()
+    cfg.perf_logger.info(
+        "inference latency_ms=%.2f camera_id=%s detections=%s",
+        (t_inf_end - t_inf_start) * 1000,
+        camera_id,
+        (len(result.get("detection", [])) if isinstance(result, dict) else -1),
+    )
+    GATE.remember(camera_id, result)
+    return result
+
+
+def publish_result(ctx: Dict[str, Any], result: Optional[Dict[str, Any]]) -> None:
+    """Copy the event image, store the (already label/ROI filtered) result and
+    mark the frame completed."""
+    camera_id = ctx["camera_id"]
+    roi_boxes = ctx["roi_boxes"]
+    current_time = ctx["current_time"]
+    image_path_url = ctx["image_path_url"]
+    main_image_path = ctx["main_image_path"]
+
+    cfg.logger.info(f"Result of PPE Model::{result}")
+
+    # Allowed labels and ROI boxes were applied in mu.predict / mu.predict_batch
+    cfg.logger.info(
+        "Detections after label/ROI filtering | allowed=%s rois=%s count=%s",
+        allowed_labels(ctx),
+        len(roi_boxes),
+        len(result.get("detection", [])) if isinstance(result, dict) else 0,
+    )
 
-                cfg.logger.debug(f"Configured Result type id :: {cfg.RESULT_TYPE_ID}")
-                roi_details = mu.get_roi_by_result_type_id_and_camera_rtsp_id(
-                    cfg.RESULT_TYPE_ID, camera_id
+    # ==================================================================================
+    # Optional visualization block (can be commented out)
+    if VISUALIZE_OUTPUTS and result and result.get("detection"):
+        try:
+            vis_img = ingest.full_frame(ctx).copy()
+            for det in result.get("detection", []):
+                x1, y1, x2, y2 = det.get("location", [0, 0, 0, 0])
+                label = det.get("label", "")
+                color = (0, 255, 0) if label in ("hardhat", "vest") else (0, 0, 255)
+                cv2.rectangle(
+                    vis_img,
+                    (int(x1), int(y1)),
+                    (int(x2), int(y2)),
+                    color,
+                    2,
                 )
-                cfg.logger.info(
-                    f"ROI DETAILS for RESULT_TYPE_ID :: {cfg.RESULT_TYPE_ID} and camera_id :: {camera_id} are \n {roi_details}"
+                cv2.putText(
+                    vis_img,
+                    str(label),
+                    (int(x1), max(0, int(y1) - 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    color,
+                    2,
+                    cv2.LINE_AA,
                 )
 
-                # Parse ROI boxes if available (supports formats like {"location": [[x1,y1,x2,y2], ...]})
-                roi_boxes = []
-                if roi_details:
-                    roi_raw = (
-                        roi_details.get("roi") if isinstance(roi_details, dict) else None
+            # Resize to 640x640 for output visualization
+            vis_img = cv2.resize(vis_img, (640, 640))
+
+            os.makedirs("ppe_outputs", exist_ok=True)
+            out_name = image_path_url.split("/")[-1]
+            out_path = os.path.join("ppe_outputs", out_name)
+            cv2.imwrite(out_path, vis_img)
+            cfg.logger.info("Saved visualization image: %s", out_path)
+        except Exception as e:
+            cfg.logger.warning("Failed to generate visualization: %s", e)
+        # ==================================================================================
+
+    # If ROI provided, also draw ROI overlays on the original image and use it as copy source.
+    # Only frames with detections are copied, so the overlay is skipped otherwise.
+    overlay_source_url = None
+    if roi_boxes and result and result.get("detection"):
+        try:
+            over_img = ingest.full_frame(ctx).copy()
+            over_img = mu.draw_rois(over_img, roi_boxes)
+            # Save alongside the raw frame path with "_roi" suffix
+            src_dir = os.path.dirname(main_image_path)
+            src_base = os.path.basename(main_image_path)
+            name, ext = os.path.splitext(src_base)
+            overlay_filename = f"{name}_roi{ext or '.jpg'}"
+            overlay_disk_path = os.path.join(src_dir, overlay_filename)
+            # Only attempt to save overlay if the destination directory is writable on this host.
+            # This avoids permission errors when the raw frame path lives on a different machine
+            # (e.g., /home/dev1079) while this code runs on dev1034.
+            dest_dir = os.path.dirname(overlay_disk_path)
+            if os.path.isdir(dest_dir) and os.access(dest_dir, os.W_OK):
+                saved_path = mu.save_overlay_image(over_img, overlay_disk_path)
+                if saved_path:
+                    base_url = (cfg.ROOT_URL or "").rstrip("/")
+                    # Convert disk path to URL analogous to how raw frames are served
+                    overlay_source_url = saved_path.replace(cfg.ROOT_PATH, base_url)
+                    cfg.logger.info(
+                        "Prepared ROI overlay source: %s", overlay_source_url
                     )
-                    roi_boxes = mu.parse_roi_boxes(roi_raw)
-                    cfg.logger.debug("Parsed ROI boxes count=%d", len(roi_boxes))
-                    # Use current UTC time minus 1 minute for frame fetching
-                    dt_utc_minus_1 = datetime.now(timezone.utc) - timedelta(minutes=1)
-                    current_time = dt_utc_minus_1.strftime("%Y-%m-%d %H:%M:%S")
-                    params = {
-                        "frame_time": current_time,  # Replace with the desired datetime
-                        "camera_id": int(camera_id),
-                    }
+                else:
                     cfg.logger.info(
-                        f"Fetching frame | url={get_frame_url} params={params}"
+                        "Overlay save not available; will use raw source image"
                     )
+            else:
+                cfg.logger.debug(
+                    "Skipping overlay save; non-writable or non-local path: %s",
+                    dest_dir,
+                )
+        except Exception as e:
+            cfg.logger.warning("Failed to create ROI overlay source: %s", e)
+
+    # Proceed only if we have at least one detection
+    if result and result.get("detection"):
+        params = {
+            # If overlay is available use it, else use original raw frame URL
+            "image_source_url": overlay_source_url or image_path_url,
+            "image_des_url": image_path_url.replace("raw_frames", "events"),
+            "image_size": cfg.IMAGE_SIZE,
+        }
+        cfg.logger.info(f"copy output image :: {params}")
+
+        t_copy_start = time.time()
+        response = get_client().post("copy_image", COPY_IMAGES_URL, params=params)
+        t_copy_end = time.time()
+        cfg.perf_logger.info(
+            "copy_image latency_ms=%.2f camera_id=%s status=%s",
+            (t_copy_end - t_copy_start) * 1000,
+            camera_id,
+            response.status_code,
+        )
+
+        if response.status_code == 200:
+            cfg.logger.info("Copy API succeeded, persisting results to backend DB")
+            mu.store_result(
+                file_name=image_path_url.split("/")[-1],
+                file_path=os.path.dirname(
+                    main_image_path.replace("raw_frames", "events")
+                ),
+                file_url=image_path_url.replace("raw_frames", "events"),
+                bounding_box=result,
+                frame_time=current_time,
+                camera_id=int(camera_id),
+            )
 
-                    t_get_start = time.time()
-                    response = requests.get(get_frame_url, params=params)
-                    t_get_end = time.time()
-                    cfg.perf_logger.info(
-                        "get_frame latency_ms=%.2f camera_id=%s",
-                        (t_get_end - t_get_start) * 1000,
-                        camera_id,
-                    )
+            cfg.logger.debug(f"Result Added into database successfully ....")
+        else:
+            cfg.logger.error(
+                "Copy API failed | status=%s body=%s",
+                response.status_code,
+                getattr(response, "text", ""),
+            )
+    else:
+        cfg.logger.info(
+            "No detections after label filtering; skipping copy/store for camera_id=%s",
+            camera_id,
+        )
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="completed",
+        camera_id=int(camera_id),
+    )
+    frame_queue.complete_frame(USECASE, ctx, "DONE")
+
+    # # Call API to delete source image after processing
+    # delete_params = {"image_source_url": image_path_url}
+    # cfg.logger.info(
+    #     f"Calling DELETE_SOURCE_IMAGE_URL API with: {delete_params}"
+    # )
+    # cfg.logger.debug(f"Delete API :: {DELETE_SOURCE_IMAGE_URL}")
+    #
+    # t_del_start = time.time()
+    # delete_response = get_client().delete(
+    #     "delete_image", DELETE_SOURCE_IMAGE_URL, params=delete_params
+    # )
+    # t_del_end = time.time()
+    # cfg.perf_logger.info(
+    #     "delete_image latency_ms=%.2f camera_id=%s status=%s",
+    #     (t_del_end - t_del_start) * 1000,
+    #     camera_id,
+    #     delete_response.status_code,
+    # )
+    # cfg.logger.info(
+    #     "Source image deleted successfully | status=%s url=%s path=%s",
+    #     delete_response.status_code,
+    #     image_path_url,
+    #     main_image_path,
+    # )
+
+
+def fetch_and_load(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the fetch and load stages for a resolved camera."""
+    # Claimed frames arrive with their path already attached
+    if "main_image_path" not in ctx:
+        ctx = fetch_frame(ctx)
+    if ctx:
+        ctx = load_frame(ctx)
+    return ctx
+
+
+def prepare_camera(camera: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the resolve, fetch and load stages for a camera."""
+    ctx = resolve_camera(camera)
+    if ctx:
+        ctx = fetch_and_load(ctx)
+    return ctx
+
+
+def infer_batch(contexts: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Run the detector over several loaded frames, BATCH_SIZE frames per pass.
+    Frames the motion gate finds unchanged are left out of the batch."""
+    t_inf_start = time.time()
+    changed = [frame_changed(ctx) for ctx in contexts]
+    active = [ctx for ctx, moved in zip(contexts, changed) if moved]
+    detected = iter(
+        mu.predict_batch(
+            PERSON_MODEL,
+            [ctx["img"] for ctx in active],
+            [ctx["frame_geometry"] for ctx in active],
+            DEVICE,
+            float(cfg.MODEL_CONF),
+            float(cfg.MODEL_IOU),
+            cfg.BATCH_SIZE,
+            labels_list=[allowed_labels(ctx) for ctx in active],
+            rois_list=[ctx["roi_boxes"] for ctx in active],
+        )
+    )
+    cfg.perf_logger.info(
+        "batch_inference latency_ms=%.2f frames=%d skipped=%d",
+        (time.time() - t_inf_start) * 1000,
+        len(active),
+        len(contexts) - len(active),
+    )
+    # In frame order, so a skipped frame reuses its camera's latest result
+    results = []
+    for ctx, moved in zip(contexts, changed):
+        if moved:
+            result = next(detected)
+            GATE.remember(ctx["camera_id"], result)
+        else:
+            result = static_result(ctx)
+        results.append(result)
+    return results
+
+
+# ============================ Cycle runners ============================
+
+
+def run_sequential_cycle(camera_list: List[Dict[str, Any]]) -> None:
+    """Process cameras one at a time, one forward pass per camera."""
+    for camera in camera_list:
+        cam_start_ts = time.time()
+        ctx = prepare_camera(camera)
+        if ctx:
+            result = run_inference(ctx)
+            publish_result(ctx, result)
+
+        cfg.logger.info(
+            "AI Processing Ended - **************************************************"
+        )
+        cfg.perf_logger.info(
+            "camera_cycle_total_ms=%.2f camera_id=%s",
+            (time.time() - cam_start_ts) * 1000,
+            camera["id"],
+        )
+
+
+def run_batched_cycle(camera_list: List[Dict[str, Any]]) -> None:
+    """Load every active camera's frame first, then run the detector over all
+    of them in batches of at most BATCH_SIZE frames."""
+    t_prepare_start = time.time()
+    contexts = []
+    for camera in camera_list:
+        ctx = prepare_camera(camera)
+        if ctx:
+            contexts.append(ctx)
+    cfg.perf_logger.info(
+        "batch_prepare latency_ms=%.2f cameras=%d frames=%d",
+        (time.time() - t_prepare_start) * 1000,
+        len(camera_list),
+        len(contexts),
+    )
+    if not contexts:
+        return
 
-                    if response.status_code == 200:
-                        cfg.logger.info(f"Frame API Response :: {response.status_code}")
+    process_batch(contexts)
 
-                    else:
-                        cfg.logger.error(
-                            f"Error: {response.status_code}, {response.text}"
-                        )
 
-                    set_response_schema(
-                        current_time=current_time,
-                        frame_status="started",
-                        camera_id=int(camera_id),
-                    )
-                    response = response.json()
-                    image_path = response.get("frame_data")
-                    main_image_path = image_path
-                    cfg.logger.info(f"Image get from api :: {image_path}")
-
-                    if image_path:
-                        cfg.logger.debug(f"cfg.ROOT_PATH :: {cfg.ROOT_PATH}")
-                        cfg.logger.debug(f"cfg.ROOT_URL :: {cfg.ROOT_URL}")
-                        # Normalize ROOT_URL to avoid double slashes like http://ip//frames/...
-                        base_url = (cfg.ROOT_URL or "").rstrip("/")
-                        image_path_url = image_path.replace(cfg.ROOT_PATH, base_url)
-                        cfg.logger.debug(
-                            f"Converted image_path_url (normalized): {image_path_url}"
-                        )
-
-                        camera_id = int(image_path.split("/")[-2])
-                        cfg.logger.info(f"Proceeding with Camera ID :: {camera_id} ")
-
-                        set_response_schema(
-                            current_time=current_time,
-                            frame_status="processing",
-                            camera_id=int(camera_id),
-                        )
-
-                        cfg.logger.info(
-                            f"Proceeding with Image Size :: {cfg.IMAGE_SIZE} "
-                        )
-                        t_load_start = time.time()
-                        load_result = mu.load_image_from_url(
-                            image_path_url, int(cfg.IMAGE_SIZE)
-                        )
-                        t_load_end = time.time()
-                        cfg.perf_logger.info(
-                            "load_image latency_ms=%.2f camera_id=%s path=%s",
-                            (t_load_end - t_load_start) * 1000,
-                            camera_id,
-                            image_path_url,
-                        )
-
-                        # Handle failures from load_image_from_url (e.g., HTTP 404)
-                        if not load_result or load_result is False:
-                            cfg.logger.warning(
-                                "Image fetch failed over HTTP for URL: %s. Attempting local disk path: %s",
-                                image_path_url,
-                                main_image_path,
-                            )
-                            disk_result = mu.load_image_from_disk(
-                                main_image_path, int(cfg.IMAGE_SIZE)
-                            )
-                            if not disk_result or disk_result is False:
-                                cfg.logger.error(
-                                    "Image fetch failed from both HTTP and disk. Skipping this frame. url=%s path=%s",
-                                    image_path_url,
-                                    main_image_path,
-                                )
-                                set_response_schema(
-                                    current_time=current_time,
-                                    frame_status="failed",
-                                    camera_id=int(camera_id),
-                                )
-                                continue
-                            else:
-                                img, img0, image_path = disk_result
-                        else:
-                            img, img0, image_path = load_result
-
-                        usecase = "ppe_detection"
-
-                        cfg.logger.info(f"Usecase Selected :: {usecase}")
-                        cfg.logger.info("ppe_detection usecase detected")
-
-                        t_inf_start = time.time()
-                        result = mu.predict(
-                            PERSON_MODEL,
-                            img,
-                            img0,
-                            DEVICE,
-                            float(cfg.MODEL_CONF),
-                            float(cfg.MODEL_IOU),
-                            usecase,
-                            str(camera_id),
-                        )
-                        t_inf_end = time.time()
-                        cfg.perf_logger.info(
-                            "inference latency_ms=%.2f camera_id=%s detections=%s",
-                            (t_inf_end - t_inf_start) * 1000,
-                            camera_id,
-                            (
-                                len(result.get("detection", []))
-                                if isinstance(result, dict)
-                                else -1
-                            ),
-                        )
-
-                        cfg.logger.info(f"Result of PPE Model::{result}")
-
-                        # Filter detections based on allowed labels from ROI mapping (if provided)
-                        allowed = None
-                        try:
-                            allowed = (
-                                roi_details.get("allowed_labels")
-                                if isinstance(roi_details, dict)
-                                else None
-                            )
-                        except Exception:
-                            allowed = None
-
-                        if allowed and isinstance(result, dict):
-                            before = len(result.get("detection", []))
-                            result["detection"] = [
-                                d
-                                for d in result.get("detection", [])
-                                if d.get("label") in set(allowed)
-                            ]
-                            after = len(result.get("detection", []))
-                            cfg.logger.info(
-                                "Filtered detections by allowed labels | allowed=%s before=%s after=%s",
-                                allowed,
-                                before,
-                                after,
-                            )
-
-                        # Filter detections to be inside provided ROI boxes (if any)
-                        if roi_boxes and isinstance(result, dict):
-                            before_roi = len(result.get("detection", []))
-                            result["detection"] = mu.filter_detections_by_rois(
-                                result.get("detection", []), roi_boxes
-                            )
-                            after_roi = len(result.get("detection", []))
-                            cfg.logger.info(
-                                "Filtered detections by ROI | before=%s after=%s rois=%s",
-                                before_roi,
-                                after_roi,
-                                len(roi_boxes),
-                            )
-
-                        # ==================================================================================
-                        # Optional visualization block (can be commented out)
-                        if VISUALIZE_OUTPUTS and result and result.get("detection"):
-                            try:
-                                vis_img = img0.copy()
-                                for det in result.get("detection", []):
-                                    x1, y1, x2, y2 = det.get("location", [0, 0, 0, 0])
-                                    label = det.get("label", "")
-                                    color = (
-                                        (0, 255, 0)
-                                        if label in ("hardhat", "vest")
-                                        else (0, 0, 255)
-                                    )
-                                    cv2.rectangle(
-                                        vis_img,
-                                        (int(x1), int(y1)),
-                                        (int(x2), int(y2)),
-                                        color,
-                                        2,
-                                    )
-                                    cv2.putText(
-                                        vis_img,
-                                        str(label),
-                                        (int(x1), max(0, int(y1) - 5)),
-                                        cv2.FONT_HERSHEY_SIMPLEX,
-                                        0.6,
-                                        color,
-                                        2,
-                                        cv2.LINE_AA,
-                                    )
-
-                                # Resize to 640x640 for output visualization
-                                vis_img = cv2.resize(vis_img, (640, 640))
-
-                                os.makedirs("ppe_outputs", exist_ok=True)
-                                out_name = image_path_url.split("/")[-1]
-                                out_path = os.path.join("ppe_outputs", out_name)
-                                cv2.imwrite(out_path, vis_img)
-                                cfg.logger.info(
-                                    "Saved visualization image: %s", out_path
-                                )
-                            except Exception as e:
-                                cfg.logger.warning(
-                                    "Failed to generate visualization: %s", e
-                                )
-                            # ==================================================================================
-
-                        # If ROI provided, also draw ROI overlays on the original image and use it as copy source
-                        overlay_source_url = None
-                        if roi_boxes:
-                            try:
-                                over_img = img0.copy()
-                                over_img = mu.draw_rois(over_img, roi_boxes)
-                                # Save alongside the raw frame path with "_roi" suffix
-                                src_dir = os.path.dirname(main_image_path)
-                                src_base = os.path.basename(main_image_path)
-                                name, ext = os.path.splitext(src_base)
-                                overlay_filename = f"{name}_roi{ext or '.jpg'}"
-                                overlay_disk_path = os.path.join(src_dir, overlay_filename)
-                                # Only attempt to save overlay if the destination directory is writable on this host.
-                                # This avoids permission errors when the raw frame path lives on a different machine
-                                # (e.g., /home/dev1079) while this code runs on dev1034.
-                                dest_dir = os.path.dirname(overlay_disk_path)
-                                if os.path.isdir(dest_dir) and os.access(dest_dir, os.W_OK):
-                                    saved_path = mu.save_overlay_image(over_img, overlay_disk_path)
-                                    if saved_path:
-                                        base_url = (cfg.ROOT_URL or "").rstrip("/")
-                                        # Convert disk path to URL analogous to how raw frames are served
-                                        overlay_source_url = saved_path.replace(cfg.ROOT_PATH, base_url)
-                                        cfg.logger.info("Prepared ROI overlay source: %s", overlay_source_url)
-                                    else:
-                                        cfg.logger.info("Overlay save not available; will use raw source image")
-                                else:
-                                    cfg.logger.debug(
-                                        "Skipping overlay save; non-writable or non-local path: %s",
-                                        dest_dir,
-                                    )
-                            except Exception as e:
-                                cfg.logger.warning("Failed to create ROI overlay source: %s", e)
-
-                        # Proceed only if we have at least one detection
-                        if result and result.get("detection"):
-                            params = {
-                                # If overlay is available use it, else use original raw frame URL
-                                "image_source_url": overlay_source_url or image_path_url,
-                                "image_des_url": image_path_url.replace(
-                                    "raw_frames", "events"
-                                ),
-                                "image_size": cfg.IMAGE_SIZE,
-                            }
-                            cfg.logger.info(f"copy output image :: {params}")
-
-                            t_copy_start = time.time()
-                            response = requests.post(COPY_IMAGES_URL, params=params)
-                            t_copy_end = time.time()
-                            cfg.perf_logger.info(
-                                "copy_image latency_ms=%.2f camera_id=%s status=%s",
-                                (t_copy_end - t_copy_start) * 1000,
-                                camera_id,
-                                response.status_code,
-                            )
-
-                            if response.status_code == 200:
-                                cfg.logger.info(
-                                    "Copy API succeeded, persisting results to backend DB"
-                                )
-                                mu.store_result(
-                                    file_name=image_path_url.split("/")[-1],
-                                    file_path=os.path.dirname(
-                                        main_image_path.replace("raw_frames", "events")
-                                    ),
-                                    file_url=image_path_url.replace(
-                                        "raw_frames", "events"
-                                    ),
-                                    bounding_box=result,
-                                    frame_time=current_time,
-                                    camera_id=int(camera_id),
-                                )
-
-                                cfg.logger.debug(
-                                    f"Result Added into database successfully ...."
-                                )
-                            else:
-                                cfg.logger.error(
-                                    "Copy API failed | status=%s body=%s",
-                                    response.status_code,
-                                    getattr(response, "text", ""),
-                                )
-                        else:
-                            cfg.logger.info(
-                                "No detections after label filtering; skipping copy/store for camera_id=%s",
-                                camera_id,
-                            )
-
-                        set_response_schema(
-                            current_time=current_time,
-                            frame_status="completed",
-                            camera_id=int(camera_id),
-                        )
-
-                        # # Call API to delete source image after processing
-                        # delete_params = {"image_source_url": image_path_url}
-                        # cfg.logger.info(
-                        #     f"Calling DELETE_SOURCE_IMAGE_URL API with: {delete_params}"
-                        # )
-                        # cfg.logger.debug(f"Delete API :: {DELETE_SOURCE_IMAGE_URL}")
-                        #
-                        # t_del_start = time.time()
-                        # delete_response = requests.delete(
-                        #     DELETE_SOURCE_IMAGE_URL, params=delete_params
-                        # )
-                        # t_del_end = time.time()
-                        # cfg.perf_logger.info(
-                        #     "delete_image latency_ms=%.2f camera_id=%s status=%s",
-                        #     (t_del_end - t_del_start) * 1000,
-                        #     camera_id,
-                        #     delete_response.status_code,
-                        # )
-                        # cfg.logger.info(
-                        #     "Source image deleted successfully | status=%s url=%s path=%s",
-                        #     delete_response.status_code,
-                        #     image_path_url,
-                        #     main_image_path,
-                        # )
-
-                cfg.logger.info(
-                    "AI Processing Ended - **************************************************"
-                )
-                cfg.perf_logger.info(
-                    "camera_cycle_total_ms=%.2f camera_id=%s",
-                    (time.time() - cam_start_ts) * 1000,
-                    camera_id,
-                )
-            cfg.logger.info(f"Sleeping for {cfg.SLEEP_TIME} Seconds")
+def process_batch(contexts: List[Dict[str, Any]]) -> None:
+    """Run batched inference over loaded frames and publish each result."""
+    cfg.logger.info(
+        "Running batched inference | usecase=%s frames=%d batch_size=%d",
+        USECASE,
+        len(contexts),
+        cfg.BATCH_SIZE,
+    )
+    results = infer_batch(contexts)
+
+    for ctx, result in zip(contexts, results):
+        publish_result(ctx, result)
+        cfg.logger.info(
+            "AI Processing Ended - **************************************************"
+        )
+
+
+def run_pipeline_cycle(runner: PipelineRunner, camera_list: List[Dict[str, Any]]) -> None:
+    """Resolve mappings on this thread, against the mapping-cache snapshot
+    refreshed once per cycle, then hand the active cameras to the staged pipeline."""
+    contexts = []
+    for camera in camera_list:
+        ctx = resolve_camera(camera)
+        if ctx:
+            contexts.append(ctx)
+    runner.run_cycle(ingest.by_input_shape(contexts))
+
+
+def run_claim_cycle(runner: Optional[PipelineRunner], camera_list: List[Dict[str, Any]]) -> int:
+    """Lease the next frames from the claim queue and process them in the
+    configured RUN_MODE. Returns the number of frames claimed."""
+    contexts = claim_contexts(camera_list)
+    if not contexts:
+        return 0
+    if runner is not None:
+        runner.run_cycle(ingest.by_input_shape(contexts))
+    elif cfg.RUN_MODE == "batch":
+        loaded = [ctx for ctx in (load_frame(c) for c in contexts) if ctx]
+        if loaded:
+            process_batch(loaded)
+    else:
+        for ctx in contexts:
+            ctx = load_frame(ctx)
+            if ctx:
+                _publish_and_log(ctx, run_inference(ctx))
+    return len(contexts)
+
+
+def _publish_and_log(ctx: Dict[str, Any], result: Optional[Dict[str, Any]]) -> None:
+    publish_result(ctx, result)
+    cfg.logger.info(
+        "AI Processing Ended - **************************************************"
+    )
+
+
+if __name__ == "__main__":
+    cfg.logger.info("PPE Detection service starting up")
+    cfg.logger.info("Model weights: %s | Device: %s", PERSON_WEIGHT_PATH, DEVICE)
+    cfg.logger.info("Run mode: %s | Batch size: %s", cfg.RUN_MODE, cfg.BATCH_SIZE)
+    cfg.logger.info("Frame source: %s | Worker: %s", cfg.FRAME_SOURCE, cfg.WORKER_ID)
+    runner = None
+    if cfg.RUN_MODE == "pipeline":
+        runner = PipelineRunner(
+            USECASE,
+            prepare_fn=fetch_and_load,
+            infer_fn=infer_batch,
+            publish_fn=_publish_and_log,
+            fetch_workers=cfg.PIPELINE_FETCH_WORKERS,
+            publish_workers=cfg.PIPELINE_PUBLISH_WORKERS,
+            queue_size=cfg.PIPELINE_QUEUE_SIZE,
+            batch_size=cfg.BATCH_SIZE,
+        )
+    startup.watch_db(mu.db)
+    startup.mark("init")
+    startup.log_summary()
+    while True:
+        try:
+            start_cycle_ts = time.time()
+            camera_list = sharding.mine(mu.get_all_camera())
+            cfg.logger.info(f"camera_list :: {camera_list}")
+
+            claimed = 0
+            if cfg.FRAME_SOURCE == "claim":
+                claimed = run_claim_cycle(runner, camera_list)
+            elif runner is not None:
+                run_pipeline_cycle(runner, camera_list)
+            elif cfg.RUN_MODE == "batch":
+                run_batched_cycle(camera_list)
+            else:
+                run_sequential_cycle(camera_list)
+
             cfg.perf_logger.info(
                 "iteration_total_ms=%.2f", (time.time() - start_cycle_ts) * 1000
             )
-            time.sleep(cfg.SLEEP_TIME)
+            get_client().log_latency_summary()
+            mu.db.log_latency_summary()
+            GATE.log_stats()
+            if cfg.FRAME_SOURCE == "claim":
+                # Keep draining while the queue has work; back off only when it is empty
+                if not claimed:
+                    time.sleep(cfg.CLAIM_IDLE_SLEEP)
+            else:
+                cfg.logger.info(f"Sleeping for {cfg.SLEEP_TIME} Seconds")
+                time.sleep(cfg.SLEEP_TIME)
 
         except Exception as e:
             cfg.logger.exception("Unhandled exception in main loop: %s", e)
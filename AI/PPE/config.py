@@ -1,5 +1,6 @@
 import logging
 import os
+import socket
 from datetime import datetime
 from logger_config import setup_logger, setup_performance_logger
 
@@ -19,6 +20,19 @@ MYSQL_PASS = os.getenv("MYSQL_PASS")
 MYSQL_DB_NAME = os.getenv("MYSQL_DB_NAME")
 MYSQL_PORT = int(os.getenv("MYSQL_PORT"))
 
+# ===================== MySQL pool (see common/db.py) =====================
+DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 4))
+# Seconds to wait for a free pooled connection before failing the query
+DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 10))
+DB_CONNECT_TIMEOUT: int = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+# Reconnect attempts for reads after a dropped connection; the first is
+# immediate, then the backoff doubles up to DB_RETRY_BACKOFF_MAX seconds
+DB_RETRIES: int = int(os.getenv("DB_RETRIES", 3))
+DB_RETRY_BACKOFF: float = float(os.getenv("DB_RETRY_BACKOFF", 0.5))
+DB_RETRY_BACKOFF_MAX: float = float(os.getenv("DB_RETRY_BACKOFF_MAX", 10))
+# Run named queries on server-side prepared statements cached per connection
+DB_PREPARED_STATEMENTS = str(os.getenv("DB_PREPARED_STATEMENTS", "1")).strip().lower() in {"1", "true", "yes", "on"}
+
 RESULT_TYPE_ID = int(os.getenv("RESULT_TYPE_ID"))
 
 # User context
@@ -30,6 +44,14 @@ RESULT_MAPPING_TABLE_NAME: str = os.getenv(
     "RESULT_MAPPING_TABLE_NAME", "camera_rtsp_result_type_mapping"
 )
 
+# ===================== Mapping cache (see common/mapping_cache.py) =====================
+# Camera and usecase-mapping rows are loaded in bulk and reused until the tables change
+MAPPING_CACHE_ENABLED = str(os.getenv("MAPPING_CACHE_ENABLED", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# Seconds between change-token checks (one aggregate query per table)
+MAPPING_CACHE_CHECK_INTERVAL: float = float(os.getenv("MAPPING_CACHE_CHECK_INTERVAL", 10))
+# Full reload at least this often, even when the tokens did not move
+MAPPING_CACHE_MAX_AGE: float = float(os.getenv("MAPPING_CACHE_MAX_AGE", 300))
+
 # Model configs
 MODEL_CONF = float(os.getenv("MODEL_CONF"))
 MODEL_IOU = float(os.getenv("MODEL_IOU"))
@@ -38,6 +60,18 @@ MODEL_IOU = float(os.getenv("MODEL_IOU"))
 # Default is "0" to use GPU 0 when available.
 DEVICE: str = os.getenv("DEVICE", "0")
 
+# Detection loop mode: "sequential" runs one forward pass per camera, "batch"
+# loads every camera's frame first and runs them through the model together,
+# "pipeline" overlaps fetch/decode, inference and publishing on separate threads.
+RUN_MODE: str = os.getenv("RUN_MODE", "sequential").strip().lower()
+# Maximum number of frames per forward pass when RUN_MODE=batch or pipeline
+BATCH_SIZE: int = int(os.getenv("BATCH_SIZE", 8))
+
+# ===================== Pipeline (RUN_MODE=pipeline) =====================
+PIPELINE_FETCH_WORKERS: int = int(os.getenv("PIPELINE_FETCH_WORKERS", 4))
+PIPELINE_PUBLISH_WORKERS: int = int(os.getenv("PIPELINE_PUBLISH_WORKERS", 2))
+PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", 16))
+
 # API endpoints from environment
 FRAME_STATUS_URL = os.getenv("FRAME_STATUS_URL")
 GET_FRAME_URL = os.getenv("GET_FRAME_URL")
@@ -45,6 +79,149 @@ COPY_IMAGES_URL = os.getenv("COPY_IMAGES_URL")
 ADD_RESULT_URL = os.getenv("ADD_RESULT_URL")  # From Backend APIs
 DELETE_SOURCE_IMAGE_URL = os.getenv("DELETE_SOURCE_IMAGE_URL")
 
+# ===================== Inference backend =====================
+# eager | torchscript | onnxruntime | onnxruntime_int8 (see common/inference_engine.py)
+INFERENCE_BACKEND: str = os.getenv("INFERENCE_BACKEND", "eager").strip().lower()
+# fp16 where supported (CUDA); ignored on CPU
+INFERENCE_HALF = str(os.getenv("INFERENCE_HALF", "0")).strip().lower() in {"1", "true", "yes", "on"}
+# Compare compiled-backend boxes against eager on the first frame of each input shape
+INFERENCE_PARITY_CHECK = str(os.getenv("INFERENCE_PARITY_CHECK", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# Minimum IoU for a compiled-backend box to count as matching the eager box
+INFERENCE_PARITY_IOU: float = float(os.getenv("INFERENCE_PARITY_IOU", 0.9))
+# Optional directory or glob of sample frames used to warm up and verify the backend at startup
+INFERENCE_PARITY_SAMPLES: str = os.getenv("INFERENCE_PARITY_SAMPLES", "")
+# CPU threads for torch / ONNX Runtime (0 keeps the library default)
+INFERENCE_THREADS: int = int(os.getenv("INFERENCE_THREADS", 0))
+# Cache the fused fp32 model next to the weights (keyed by their hash) so restarts skip unpickle + fuse
+INFERENCE_FUSED_CACHE = str(os.getenv("INFERENCE_FUSED_CACHE", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# Rectangular inputs padded only to the stride (1), or IMAGE_SIZE x IMAGE_SIZE squares (0)
+INFERENCE_RECT = str(os.getenv("INFERENCE_RECT", "1")).strip().lower() in {"1", "true", "yes", "on"}
+
+# ===================== INT8 quantization (INFERENCE_BACKEND=onnxruntime_int8, see common/quantization.py) =====================
+# "static": calibrated on stored raw frames; "dynamic": activation ranges computed per call
+INFERENCE_INT8_MODE: str = os.getenv("INFERENCE_INT8_MODE", "static").strip().lower()
+# Directory (searched recursively) or glob of stored raw frames for calibration and evaluation
+INFERENCE_INT8_CALIBRATION: str = os.getenv("INFERENCE_INT8_CALIBRATION", "")
+INFERENCE_INT8_CALIBRATION_SIZE: int = int(os.getenv("INFERENCE_INT8_CALIBRATION_SIZE", 64))
+INFERENCE_INT8_EVAL_SIZE: int = int(os.getenv("INFERENCE_INT8_EVAL_SIZE", 64))
+# Refuse the int8 model when its mAP@0.5 is more than this below fp32
+INFERENCE_INT8_MAX_MAP_DROP: float = float(os.getenv("INFERENCE_INT8_MAX_MAP_DROP", 0.02))
+
+# ===================== Inference server (server: AI/inference_server.py, client: common/inference_client.py) =====================
+# Client: run detection on the shared micro-batching server instead of an
+# in-process model, e.g. http://127.0.0.1:8601 (empty keeps the local model)
+INFERENCE_SERVER_URL: str = os.getenv("INFERENCE_SERVER_URL", "").strip()
+# Load the model locally when the server cannot be reached at startup
+INFERENCE_SERVER_FALLBACK = str(os.getenv("INFERENCE_SERVER_FALLBACK", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# Server: comma-separated weights to serve; clients address them by file name
+INFERENCE_SERVER_WEIGHTS = [p.strip() for p in os.getenv("INFERENCE_SERVER_WEIGHTS", "").split(",") if p.strip()]
+INFERENCE_SERVER_HOST: str = os.getenv("INFERENCE_SERVER_HOST", "0.0.0.0")
+INFERENCE_SERVER_PORT: int = int(os.getenv("INFERENCE_SERVER_PORT", 8601))
+# A batch runs when it holds MAX_BATCH frames or its oldest frame has waited MAX_WAIT_MS
+INFERENCE_SERVER_MAX_BATCH: int = int(os.getenv("INFERENCE_SERVER_MAX_BATCH", 16))
+INFERENCE_SERVER_MAX_WAIT_MS: float = float(os.getenv("INFERENCE_SERVER_MAX_WAIT_MS", 20))
+INFERENCE_SERVER_QUEUE_SIZE: int = int(os.getenv("INFERENCE_SERVER_QUEUE_SIZE", 256))
+# Seconds between queue latency / batch fill / throughput lines on the performance log
+INFERENCE_SERVER_STATS_INTERVAL: float = float(os.getenv("INFERENCE_SERVER_STATS_INTERVAL", 60))
+
+# ===================== Frame ingest (see common/ingest.py) =====================
+# Read frames straight from the shared frames volume when the path exists locally
+INGEST_PREFER_LOCAL = str(os.getenv("INGEST_PREFER_LOCAL", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# "read": one read into a reusable per-thread buffer; "mmap": memory-map the file
+INGEST_READ_MODE: str = os.getenv("INGEST_READ_MODE", "read").strip().lower()
+# Largest JPEG decode reduction (1, 2, 4 or 8); only used while the reduced
+# frame still covers IMAGE_SIZE, so the model input resolution is unchanged
+INGEST_MAX_REDUCTION: int = int(os.getenv("INGEST_MAX_REDUCTION", 8))
+
+# ===================== Motion gate (see common/motion_gate.py) =====================
+# Skip the detector on frames that did not change since the camera's last frames
+MOTION_GATE_ENABLED = str(os.getenv("MOTION_GATE_ENABLED", "0")).strip().lower() in {"1", "true", "yes", "on"}
+# Width in pixels of the grayscale copy compared against the rolling background
+MOTION_GATE_WIDTH: int = int(os.getenv("MOTION_GATE_WIDTH", 160))
+# Sensitivity: grey-level difference that marks a pixel as changed, and the
+# fraction of (ROI) pixels that must change for the frame to count as moving
+MOTION_GATE_PIXEL_THRESHOLD: float = float(os.getenv("MOTION_GATE_PIXEL_THRESHOLD", 25))
+MOTION_GATE_MIN_CHANGED: float = float(os.getenv("MOTION_GATE_MIN_CHANGED", 0.005))
+# Background update weight per frame (higher adapts faster to lighting changes)
+MOTION_GATE_ALPHA: float = float(os.getenv("MOTION_GATE_ALPHA", 0.1))
+# Run the detector at least this often per camera, even on static frames
+MOTION_GATE_RECHECK_SECONDS: float = float(os.getenv("MOTION_GATE_RECHECK_SECONDS", 900))
+# Result published for a skipped frame: "reuse" (camera's last result) or "empty"
+MOTION_GATE_STATIC_RESULT: str = os.getenv("MOTION_GATE_STATIC_RESULT", "reuse").strip().lower()
+
+# ===================== ROI-cropped inference (see common/preprocess.py) =====================
+# Mode for mappings whose roi_type column is neither "crop" nor "full":
+# "crop" runs the detector on crops around the ROIs, "full" on the whole frame
+ROI_CROP_DEFAULT: str = os.getenv("ROI_CROP_DEFAULT", "full").strip().lower()
+# Margin around each ROI, as a fraction of its longer side
+ROI_CROP_MARGIN: float = float(os.getenv("ROI_CROP_MARGIN", 0.2))
+# Use the full frame when the crops would cover more than this fraction of it
+ROI_CROP_MAX_AREA: float = float(os.getenv("ROI_CROP_MAX_AREA", 0.6))
+# More disjoint crops than this are merged into one bounding crop
+ROI_CROP_MAX_TILES: int = int(os.getenv("ROI_CROP_MAX_TILES", 4))
+# Model-input pixels the crops of a frame may use, as a fraction of the
+# full-frame letterbox's (crops never get less resolution than the full frame)
+ROI_CROP_PIXEL_BUDGET: float = float(os.getenv("ROI_CROP_PIXEL_BUDGET", 0.5))
+
+# ===================== Frame source =====================
+# "time": fetch the frame at now minus one minute from GET_FRAME_URL (default).
+# "claim": lease unprocessed frames from CLAIM_URL and drain them as fast as
+# compute allows; several workers can share one queue.
+FRAME_SOURCE: str = os.getenv("FRAME_SOURCE", "time").strip().lower()
+CLAIM_URL = os.getenv("CLAIM_URL")
+COMPLETE_URL = os.getenv("COMPLETE_URL")
+CLAIM_BATCH_SIZE: int = int(os.getenv("CLAIM_BATCH_SIZE", 8))
+CLAIM_LEASE_SECONDS: int = int(os.getenv("CLAIM_LEASE_SECONDS", 120))
+CLAIM_LOOKBACK_SECONDS: int = int(os.getenv("CLAIM_LOOKBACK_SECONDS", 600))
+# Seconds to wait before claiming again when the queue was empty
+CLAIM_IDLE_SLEEP: float = float(os.getenv("CLAIM_IDLE_SLEEP", 5))
+WORKER_ID: str = os.getenv("WORKER_ID", f"{socket.gethostname()}-{os.getpid()}")
+
+# ===================== HTTP client (keep-alive pool, timeouts) =====================
+HTTP_POOL_SIZE: int = int(os.getenv("HTTP_POOL_SIZE", 10))
+HTTP_CONNECT_TIMEOUT: float = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+HTTP_READ_TIMEOUT: float = float(os.getenv("HTTP_READ_TIMEOUT", 10))
+# Per-endpoint read timeouts in seconds, e.g. "get_frame=5,copy_image=15,load_image=10".
+# Endpoints: frame_status, get_frame, load_image, copy_image, add_result, delete_image, people_counts,
+# inference, inference_models
+HTTP_TIMEOUTS = {
+    name.strip(): float(value)
+    for name, value in (
+        item.split("=", 1) for item in os.getenv("HTTP_TIMEOUTS", "").split(",") if "=" in item
+    )
+}
+# Queue frame status updates on a background sender instead of blocking the loop
+HTTP_ASYNC_STATUS = str(os.getenv("HTTP_ASYNC_STATUS", "1")).strip().lower() in {"1", "true", "yes", "on"}
+HTTP_ASYNC_QUEUE_SIZE: int = int(os.getenv("HTTP_ASYNC_QUEUE_SIZE", 256))
+
+# ===================== Sharding (see common/supervisor.py / common/sharding.py) =====================
+# Worker processes per host started by common/supervisor.py; each keeps the cameras the hash ring gives its SHARD_INDEX
+SHARD_COUNT: int = int(os.getenv("SHARD_COUNT", 1))
+SHARD_INDEX: int = int(os.getenv("SHARD_INDEX", 0))
+SHARD_VNODES: int = int(os.getenv("SHARD_VNODES", 256))
+# Weight files the supervisor loads once into shared memory for all workers (CPU only)
+SHARD_WEIGHTS = [p.strip() for p in os.getenv("SHARD_WEIGHTS", "pt_model/ppe-kit-detection-2.pt").split(",") if p.strip()]
+# Pin each worker to its own slice of the host's CPUs
+SHARD_PIN_CPUS = str(os.getenv("SHARD_PIN_CPUS", "1")).strip().lower() in {"1", "true", "yes", "on"}
+# torch intra-op threads per worker (0: one per CPU of its slice) and inter-op threads
+SHARD_THREADS: int = int(os.getenv("SHARD_THREADS", 0))
+SHARD_INTEROP_THREADS: int = int(os.getenv("SHARD_INTEROP_THREADS", 1))
+# Seconds before a worker that exited is started again
+SHARD_RESTART_DELAY: float = float(os.getenv("SHARD_RESTART_DELAY", 5))
+
+# ===================== Camera leases (see common/leases.py) =====================
+# Split cameras between replicas on any host through lease rows in MySQL (replaces the per-host hash ring)
+CAMERA_LEASES = str(os.getenv("CAMERA_LEASES", "0")).strip().lower() in {"1", "true", "yes", "on"}
+# Replicas with the same group share one set of cameras; each replica is identified by WORKER_ID
+LEASE_GROUP: str = os.getenv("LEASE_GROUP", "ppe")
+# A replica's leases expire this long after its last heartbeat, then other replicas claim its cameras
+LEASE_TTL_SECONDS: float = float(os.getenv("LEASE_TTL_SECONDS", 60))
+LEASE_HEARTBEAT_SECONDS: float = float(os.getenv("LEASE_HEARTBEAT_SECONDS", 15))
+LEASE_REPLICA_TABLE: str = os.getenv("LEASE_REPLICA_TABLE", "ai_replica")
+LEASE_TABLE: str = os.getenv("LEASE_TABLE", "ai_camera_lease")
+# Create the two tables on start-up if they do not exist
+LEASE_CREATE_TABLES = str(os.getenv("LEASE_CREATE_TABLES", "1")).strip().lower() in {"1", "true", "yes", "on"}
+
 # ================================== Logger Configurations ==================================
 # Use custom logger setup from logger_config.py. Requires LOG_BASE_DIRECTORY to be set.
 log_base_directory = os.getenv("LOG_BASE_DIRECTORY")
@@ -65,6 +242,112 @@ logger.debug(
     MODEL_CONF,
     MODEL_IOU,
 )
+logger.debug(
+    "DB pool config: DB_POOL_SIZE=%s, DB_POOL_TIMEOUT=%s, DB_CONNECT_TIMEOUT=%s, DB_RETRIES=%s, DB_RETRY_BACKOFF=%s, DB_PREPARED_STATEMENTS=%s",
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_CONNECT_TIMEOUT,
+    DB_RETRIES,
+    DB_RETRY_BACKOFF,
+    DB_PREPARED_STATEMENTS,
+)
 logger.debug("DB table config: CAMERA_TABLE_NAME=%s", CAMERA_TABLE_NAME)
 logger.debug("DB table config: RESULT_MAPPING_TABLE_NAME=%s", RESULT_MAPPING_TABLE_NAME)
+logger.debug(
+    "Mapping cache config: MAPPING_CACHE_ENABLED=%s, MAPPING_CACHE_CHECK_INTERVAL=%s, MAPPING_CACHE_MAX_AGE=%s",
+    MAPPING_CACHE_ENABLED,
+    MAPPING_CACHE_CHECK_INTERVAL,
+    MAPPING_CACHE_MAX_AGE,
+)
 logger.debug("Device config: DEVICE=%s", DEVICE)
+logger.debug("Run mode config: RUN_MODE=%s, BATCH_SIZE=%s", RUN_MODE, BATCH_SIZE)
+logger.debug(
+    "Pipeline config: PIPELINE_FETCH_WORKERS=%s, PIPELINE_PUBLISH_WORKERS=%s, PIPELINE_QUEUE_SIZE=%s",
+    PIPELINE_FETCH_WORKERS,
+    PIPELINE_PUBLISH_WORKERS,
+    PIPELINE_QUEUE_SIZE,
+)
+logger.debug(
+    "Ingest config: INGEST_PREFER_LOCAL=%s, INGEST_READ_MODE=%s, INGEST_MAX_REDUCTION=%s",
+    INGEST_PREFER_LOCAL,
+    INGEST_READ_MODE,
+    INGEST_MAX_REDUCTION,
+)
+logger.debug(
+    "HTTP config: HTTP_POOL_SIZE=%s, HTTP_CONNECT_TIMEOUT=%s, HTTP_READ_TIMEOUT=%s, HTTP_TIMEOUTS=%s, HTTP_ASYNC_STATUS=%s",
+    HTTP_POOL_SIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_TIMEOUTS,
+    HTTP_ASYNC_STATUS,
+)
+logger.debug(
+    "Frame source config: FRAME_SOURCE=%s, CLAIM_URL=%s, CLAIM_BATCH_SIZE=%s, CLAIM_LEASE_SECONDS=%s, WORKER_ID=%s",
+    FRAME_SOURCE,
+    CLAIM_URL,
+    CLAIM_BATCH_SIZE,
+    CLAIM_LEASE_SECONDS,
+    WORKER_ID,
+)
+logger.debug(
+    "Inference config: INFERENCE_BACKEND=%s, INFERENCE_HALF=%s, INFERENCE_PARITY_CHECK=%s, INFERENCE_THREADS=%s, "
+    "INFERENCE_FUSED_CACHE=%s, INFERENCE_RECT=%s",
+    INFERENCE_BACKEND,
+    INFERENCE_HALF,
+    INFERENCE_PARITY_CHECK,
+    INFERENCE_THREADS,
+    INFERENCE_FUSED_CACHE,
+    INFERENCE_RECT,
+)
+logger.debug(
+    "Inference server config: INFERENCE_SERVER_URL=%s, INFERENCE_SERVER_WEIGHTS=%s, "
+    "INFERENCE_SERVER_MAX_BATCH=%s, INFERENCE_SERVER_MAX_WAIT_MS=%s",
+    INFERENCE_SERVER_URL,
+    INFERENCE_SERVER_WEIGHTS,
+    INFERENCE_SERVER_MAX_BATCH,
+    INFERENCE_SERVER_MAX_WAIT_MS,
+)
+logger.debug(
+    "INT8 config: INFERENCE_INT8_MODE=%s, INFERENCE_INT8_CALIBRATION=%s, INFERENCE_INT8_MAX_MAP_DROP=%s",
+    INFERENCE_INT8_MODE,
+    INFERENCE_INT8_CALIBRATION,
+    INFERENCE_INT8_MAX_MAP_DROP,
+)
+logger.debug(
+    "Motion gate config: MOTION_GATE_ENABLED=%s, MOTION_GATE_PIXEL_THRESHOLD=%s, MOTION_GATE_MIN_CHANGED=%s, "
+    "MOTION_GATE_RECHECK_SECONDS=%s, MOTION_GATE_STATIC_RESULT=%s",
+    MOTION_GATE_ENABLED,
+    MOTION_GATE_PIXEL_THRESHOLD,
+    MOTION_GATE_MIN_CHANGED,
+    MOTION_GATE_RECHECK_SECONDS,
+    MOTION_GATE_STATIC_RESULT,
+)
+logger.debug(
+    "ROI crop config: ROI_CROP_DEFAULT=%s, ROI_CROP_MARGIN=%s, ROI_CROP_MAX_AREA=%s, ROI_CROP_MAX_TILES=%s, "
+    "ROI_CROP_PIXEL_BUDGET=%s",
+    ROI_CROP_DEFAULT,
+    ROI_CROP_MARGIN,
+    ROI_CROP_MAX_AREA,
+    ROI_CROP_MAX_TILES,
+    ROI_CROP_PIXEL_BUDGET,
+)
+logger.debug(
+    "Sharding config: SHARD_COUNT=%s, SHARD_INDEX=%s, SHARD_WEIGHTS=%s, SHARD_PIN_CPUS=%s, SHARD_THREADS=%s, "
+    "SHARD_INTEROP_THREADS=%s",
+    SHARD_COUNT,
+    SHARD_INDEX,
+    SHARD_WEIGHTS,
+    SHARD_PIN_CPUS,
+    SHARD_THREADS,
+    SHARD_INTEROP_THREADS,
+)
+logger.debug(
+    "Camera lease config: CAMERA_LEASES=%s, LEASE_GROUP=%s, LEASE_TTL_SECONDS=%s, LEASE_HEARTBEAT_SECONDS=%s, "
+    "LEASE_TABLE=%s, LEASE_REPLICA_TABLE=%s",
+    CAMERA_LEASES,
+    LEASE_GROUP,
+    LEASE_TTL_SECONDS,
+    LEASE_HEARTBEAT_SECONDS,
+    LEASE_TABLE,
+    LEASE_REPLICA_TABLE,
+)
@@ -1,32 +1,27 @@
-import urllib
 from urllib.parse import urlparse
 import config as cfg
-import requests
-from utils.datasets import *
-from utils.general import *
-from utils.torch_utils import *
+from common.http_client import get_client
+from common.db import get_db
+from common import preprocess
+from common.inference_engine import load_fused_model
+from utils.general import non_max_suppression, scale_coords
+from utils.torch_utils import select_device, time_synchronized
 from datetime import datetime, timezone
 from collections import defaultdict
-import mysql.connector
 import json
+from common.mapping_cache import MappingCache, decode_labels
 import os
 from typing import List, Dict, Any, Optional, Tuple
 import cv2
 import numpy as np
+import torch
 
 format = "%Y-%m-%d %H:%M:%S"
 
 ADD_RESULT_URL = os.getenv("ADD_RESULT_URL")
 
-conn = mysql.connector.connect(
-    host=cfg.MYSQL_HOST,
-    user=cfg.MYSQL_USER,
-    password=cfg.MYSQL_PASS,
-    database=cfg.MYSQL_DB_NAME,
-    port=cfg.MYSQL_PORT,
-)
-
-cfg.logger.info(f"Connected to :: {conn}")
+# Pooled MySQL access (see common/db.py); replaces the single import-time connection
+db = get_db()
 
 
 def store_result(file_name, file_path, file_url, bounding_box, frame_time, camera_id):
@@ -99,7 +94,7 @@ def store_result(file_name, file_path, file_url, bounding_box, frame_time, camer
             list(payload.keys()),
         )
         t_post_start = time_synchronized()
-        response = requests.post(ADD_RESULT_URL, json=payload)
+        response = get_client().post("add_result", ADD_RESULT_URL, json=payload)
         t_post_end = time_synchronized()
         cfg.perf_logger.info(
             "add_result latency_ms=%.2f camera_id=%s status=%s",
@@ -152,23 +147,23 @@ def get_device():
 
 def load_model(weight_path, map_location):
     cfg.logger.info("Load Model")
-    return (
-        torch.load(weight_path, map_location=map_location)["model"]
-        .float()
-        .fuse()
-        .eval()
-    )
+    return load_fused_model(weight_path, map_location)
 
 
 def load_image_from_url(image_path, img_size=640):
     try:
         if image_path:
-            req = urllib.request.urlopen(image_path)
-            arr = np.asarray(bytearray(req.read()), dtype=np.uint8)
+            response = get_client().get("load_image", image_path)
+            if response.status_code != 200:
+                cfg.logger.error(
+                    "Error in load_image_from_url :: HTTP %s for %s",
+                    response.status_code,
+                    image_path,
+                )
+                return False
+            arr = np.frombuffer(response.content, dtype=np.uint8)
             img0 = cv2.imdecode(arr, -1)
-            img = letterbox(img0, new_shape=img_size, scaleup=False)[0]
-            img = img[:, :, ::-1].transpose(2, 0, 1)  # to 3x416x416
-            img = np.ascontiguousarray(img)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
             return img, img0, image_path
         else:
             cfg.logger.error("ERROR: image not found from URL")
@@ -182,9 +177,7 @@ def load_image_from_disk(image_path, img_size=640):
     try:
         if os.path.exists(image_path):
             img0 = cv2.imread(image_path)
-            img = letterbox(img0, new_shape=img_size, scaleup=False)[0]
-            img = img[:, :, ::-1].transpose(2, 0, 1)  # to 3x416x416
-            img = np.ascontiguousarray(img)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
             return img, img0, image_path
         else:
             cfg.logger.error("ERROR: image not found in local")
@@ -193,7 +186,99 @@ def load_image_from_disk(image_path, img_size=640):
         return False
 
 
-def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id):
+def frame_shape(im0) -> Tuple[int, ...]:
+    """Shape boxes are rescaled to: an original frame, or its (h, w, c) when the
+    frame was decoded at reduced resolution (see common/ingest.py)."""
+    return tuple(im0) if isinstance(im0, (tuple, list)) else im0.shape
+
+
+def rescale_boxes(det, input_shape, im0):
+    """Rescale det[:, :4] in place from the model input to original-frame pixels.
+
+    `im0` is the frame's cached `preprocess.Geometry` (a constant-time lookup),
+    or an original frame / (h, w, c) shape for which the gain is recomputed.
+    """
+    if isinstance(im0, preprocess.Geometry):
+        det[:, :4] = preprocess.to_original(det[:, :4], im0).round()
+    else:
+        det[:, :4] = scale_coords(input_shape, det[:, :4], frame_shape(im0)).round()
+    return det
+
+
+def frame_tiles(img, im0s) -> Tuple[List[Any], List[Any]]:
+    """(canvases, geometries) of one frame: its ROI crops when it was loaded
+    cropped (lists, see common/ingest.py), else the single letterboxed frame."""
+    if isinstance(img, list):
+        return img, list(im0s)
+    return [img], [im0s]
+
+
+def run_detector(model, imgs, device, conf_thres, iou_thres, classes=None):
+    """Forward pass + NMS for same-shape letterboxed frames (HWC BGR uint8).
+
+    Returns one (n, 6) xyxy/conf/cls tensor (or None) per frame, in model input
+    pixels. `classes` (class indices, see `label_classes`) drops every other
+    class inside NMS. A `RemoteDetector` (INFERENCE_SERVER_URL, see
+    common/inference_client.py) runs both on the shared inference server instead.
+    """
+    if hasattr(model, "detect"):
+        return model.detect(imgs, conf_thres, iou_thres, classes)
+    # Letterboxed HWC BGR uint8 -> Nx3xHxW float in [0, 1] (see common/preprocess.py)
+    batch = preprocess.batch_tensor(imgs, device)
+    with torch.no_grad():
+        pred = model(batch)[0]
+    return non_max_suppression(pred, conf_thres, iou_thres, classes=classes, agnostic=False)
+
+
+def label_classes(names, labels) -> Optional[List[int]]:
+    """Class indices of `labels` for the `classes` argument of NMS.
+
+    None (keep every class) when no labels are given. Labels the model does not
+    know are ignored, so a list naming none of its classes keeps nothing.
+    """
+    if not labels:
+        return None
+    wanted = set(labels)
+    return [i for i, name in enumerate(names) if name in wanted]
+
+
+def keep_classes(det, classes):
+    """Rows of an (n, 6) detection tensor whose class is in `classes` (None keeps all)."""
+    if classes is None:
+        return det
+    return det[(det[:, 5:6] == det.new_tensor(classes)).any(1)]
+
+
+def roi_mask(det, rois) -> torch.Tensor:
+    """(n,) bool: rows of a rescaled (n, 6) detection tensor whose center lies
+    inside any ROI box [x1, y1, x2, y2].
+
+    Same rule as `filter_detections_by_rois` (integer center of the integer
+    box, bounds inclusive), evaluated for every box/ROI pair at once.
+    """
+    boxes = det[:, :4].trunc()
+    centers = ((boxes[:, :2] + boxes[:, 2:]) / 2).trunc()[:, None, :]
+    r = torch.as_tensor(rois, dtype=det.dtype, device=det.device).reshape(1, -1, 4)
+    return ((centers >= r[..., :2]) & (centers <= r[..., 2:])).all(2).any(1)
+
+
+def format_detections(det, names) -> List[Dict[str, Any]]:
+    """Convert an (n, 6) detection tensor to the [{label, location}] result format.
+
+    Boxes and classes are materialised with a single `.tolist()`.
+    """
+    if det is None or not len(det):
+        return []
+    rows = det[:, [0, 1, 2, 3, 5]].int().tolist()
+    return [{"label": names[row[4]], "location": row[:4]} for row in rows]
+
+
+def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id, labels=None, rois=None):
+    """Detect on one letterboxed frame, or on all ROI crops of a frame in one batch.
+
+    Only `labels` (class names; filtered inside NMS) are kept, and with `rois`
+    only boxes whose center lies inside one of them (see `roi_mask`).
+    """
     try:
         cfg.logger.info("In Prediction")
         cfg.logger.debug(f"Device: {device}")
@@ -201,28 +286,19 @@ def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id)
         cfg.logger.debug(f"IOU Threshold: {iou_thres}")
         cfg.logger.debug(f"Usecase: {usecase}")
         cfg.logger.debug(f"Camera ID: {camera_id}")
-        cfg.logger.debug(f"Original image shape (im0s): {im0s.shape}")
-        cfg.logger.debug(f"Input image shape (img): {img.shape}")
+        cfg.logger.debug(f"Original image shape (im0s): {frame_shape(im0s)}")
+        tiles, geometries = frame_tiles(img, im0s)
+        cfg.logger.debug(f"Input image shape (img): {tiles[0].shape} crops: {len(tiles) if isinstance(img, list) else 0}")
 
         # cfg.logger.info(f"model: {model}")
         names = model.module.names if hasattr(model, "module") else model.names
         cfg.logger.debug(f"Class names: {names}")
+        classes = label_classes(names, labels)
+        cfg.logger.debug(f"Class filter: {classes} ROIs: {len(rois or [])}")
 
-        img = torch.from_numpy(img).to(device)
-        img = img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
-
-        # Inference
+        # Inference + NMS for the requested classes (PPE model emits: no_vest, no_hardhat, hardhat, vest)
         t1 = time_synchronized()
-        pred = model(img)[0]
-
-        # Apply NMS for all classes (PPE model emits: no_vest, no_hardhat, hardhat, vest)
-        pred = non_max_suppression(
-            pred, conf_thres, iou_thres, classes=None, agnostic=False
-        )
+        pred = run_detector(model, tiles, device, conf_thres, iou_thres, classes)
         t2 = time_synchronized()
         cfg.logger.debug(f"NMS completed in {t2 - t1:.4f} seconds")
 
@@ -237,22 +313,12 @@ def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id)
             if det is not None and len(det):
                 cfg.logger.info("{} detections found.".format(len(det)))
 
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0s.shape).round()
-                for *xyxy, conf, cls in det:
-                    tmp_dict = {}
-                    x1 = int(xyxy[0])
-                    y1 = int(xyxy[1])
-                    x2 = int(xyxy[2])
-                    y2 = int(xyxy[3])
-                    tmp_dict["label"] = names[int(cls)]
-                    tmp_dict["location"] = [x1, y1, x2, y2]
-                    result_list.append(tmp_dict)
-
-                    cfg.logger.debug(
-                        f"Detection added - Label: {tmp_dict['label']}, "
-                        f"Box: {tmp_dict['location']}, Conf: {conf:.2f}"
-                    )
+                # Rescale boxes from img_size (of the frame or crop) to im0 size
+                rescale_boxes(det, tiles[i].shape[:2], geometries[i])
+                if rois:
+                    det = det[roi_mask(det, rois)]
+                    cfg.logger.debug(f"{len(det)} detections inside ROIs")
+                result_list.extend(format_detections(det, names))
 
         result_dict["detection"] = result_list
         result_dict["inference_time"] = t2 - t1
@@ -265,6 +331,94 @@ def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id)
         cfg.logger.error("An error occurred in predict() :: %s", str(e))
 
 
+def predict_batch(
+    model, imgs, im0s_list, device, conf_thres, iou_thres, batch_size=8, labels_list=None, rois_list=None
+):
+    """Run the detector over several letterboxed frames in as few forward passes as possible.
+
+    Frames are grouped by letterboxed shape (cameras with the same resolution
+    share a shape) and every group is sent through the model in chunks of at
+    most `batch_size`. `non_max_suppression` already returns one tensor per
+    image, so each frame gets its own result back.
+
+    `labels_list` and `rois_list` (aligned with `imgs`) filter each frame as
+    `predict()` does. When every frame of a chunk wants the same classes the
+    filter runs inside NMS; otherwise each frame is masked after NMS.
+
+    A frame loaded as ROI crops (a list of canvases with a list of geometries,
+    see common/ingest.py) is batched crop by crop, and its result holds the
+    detections of all its crops in full-frame coordinates.
+
+    Returns a list aligned with `imgs` holding result dicts in the same format
+    as `predict()`. `inference_time` is the frame's share of its batch time.
+    An entry is None when a batch containing that frame failed.
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(imgs)
+    if not imgs:
+        return results
+    names = model.module.names if hasattr(model, "module") else model.names
+    batch_size = max(1, int(batch_size))
+
+    # (frame index, canvas, geometry): one entry per frame, or per crop of a cropped frame
+    entries = []
+    for idx, (img, im0s) in enumerate(zip(imgs, im0s_list)):
+        tiles, geometries = frame_tiles(img, im0s)
+        entries.extend((idx, tile, geom) for tile, geom in zip(tiles, geometries))
+    groups: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for k, (_, tile, _) in enumerate(entries):
+        groups[tuple(tile.shape)].append(k)
+    cfg.logger.debug(
+        "predict_batch frames=%d inputs=%d shape_groups=%d batch_size=%d",
+        len(imgs),
+        len(entries),
+        len(groups),
+        batch_size,
+    )
+
+    detections: List[List[Dict[str, Any]]] = [[] for _ in imgs]
+    times = [0.0] * len(imgs)
+    failed = set()
+    for shape, members in groups.items():
+        for start in range(0, len(members), batch_size):
+            chunk = members[start : start + batch_size]
+            frames = [entries[k][0] for k in chunk]
+            try:
+                classes = [label_classes(names, labels_list[i]) if labels_list else None for i in frames]
+                shared = classes[0] if all(c == classes[0] for c in classes) else None
+                t1 = time_synchronized()
+                pred = run_detector(model, [entries[k][1] for k in chunk], device, conf_thres, iou_thres, shared)
+                t2 = time_synchronized()
+                cfg.perf_logger.info(
+                    "batch_forward latency_ms=%.2f frames=%d shape=%s",
+                    (t2 - t1) * 1000,
+                    len(chunk),
+                    shape,
+                )
+
+                for det, idx, frame_classes, k in zip(pred, frames, classes, chunk):
+                    if det is not None and len(det):
+                        if shared is None:
+                            det = keep_classes(det, frame_classes)
+                        rescale_boxes(det, shape[:2], entries[k][2])
+                        if rois_list and rois_list[idx]:
+                            det = det[roi_mask(det, rois_list[idx])]
+                        detections[idx].extend(format_detections(det, names))
+                    times[idx] += (t2 - t1) / len(chunk)
+            except Exception as e:
+                failed.update(frames)
+                cfg.logger.error(
+                    "An error occurred in predict_batch() shape=%s frames=%d :: %s",
+                    shape,
+                    len(chunk),
+                    str(e),
+                )
+
+    for idx in range(len(imgs)):
+        if idx not in failed:
+            results[idx] = {"detection": detections[idx], "inference_time": times[idx]}
+    return results
+
+
 def update_label(result_dict, img, usecases):
     try:
         """PPE use case: no label overrides are required.
@@ -308,43 +462,46 @@ def convert_coordinates(orig_coords, orig_size=(1920, 1080), new_size=(640, 640)
         return None
 
 
+def _prepare_mapping(row: Dict[str, Any]) -> None:
+    """Pre-parse a mapping row once per cache load: ROI boxes and PPE labels."""
+    row["roi_boxes"] = parse_roi_boxes(row.get("roi"))
+    parsed = decode_labels(row.get("labels"))
+    row["labels_parsed"] = parsed
+    if isinstance(parsed, dict):
+        # Expected format: {"ppe": ["no_vest", "no_hardhat", "vest", "hardhat"]}
+        ppe_list = parsed.get("ppe")
+        labels_list = [str(x).strip() for x in ppe_list] if isinstance(ppe_list, list) else []
+    elif isinstance(parsed, list):
+        labels_list = [str(x).strip() for x in parsed]
+    else:
+        # Fallback to comma-separated
+        labels_list = [s.strip() for s in str(parsed).split(",") if s.strip()]
+    row["allowed_labels"] = labels_list
+
+
+MAPPINGS = MappingCache(
+    db,
+    prepare=_prepare_mapping,
+    enabled=cfg.MAPPING_CACHE_ENABLED,
+    check_interval=cfg.MAPPING_CACHE_CHECK_INTERVAL,
+    max_age=cfg.MAPPING_CACHE_MAX_AGE,
+)
+
+
 def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id):
     try:
-        cursor = conn.cursor(dictionary=True)
         # Use result_type_id as usecase_id and camera_rtsp_id as camera_id based on new schema
-        query = (
-            f"SELECT * FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
-            "WHERE status = 1 "
-            "AND usecase_id = %s "
-            "AND camera_id = %s "
-            "AND start_time_utc <= UTC_TIMESTAMP() "
-            "AND end_time_utc >= UTC_TIMESTAMP() "
-            "ORDER BY id DESC LIMIT 1"
-        )
         cfg.logger.debug(
-            "Fetching ROI mapping | table=%s usecase_id=%s camera_id=%s",
+            "Looking up ROI mapping | table=%s usecase_id=%s camera_id=%s",
             cfg.RESULT_MAPPING_TABLE_NAME,
             result_type_id,
             camera_rtsp_id,
         )
-        cursor.execute(query, (result_type_id, camera_rtsp_id))
-        row = cursor.fetchone()
-        cursor.close()
+        row = MAPPINGS.active_mapping(result_type_id, camera_rtsp_id)
 
         if not row:
-            # Try to fetch most recent mapping to print its configured time range for visibility
-            try:
-                cursor = conn.cursor(dictionary=True)
-                fallback_q = (
-                    f"SELECT id, start_time_utc, end_time_utc, status, labels FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
-                    "WHERE usecase_id = %s AND camera_id = %s ORDER BY id DESC LIMIT 1"
-                )
-                cursor.execute(fallback_q, (result_type_id, camera_rtsp_id))
-                latest = cursor.fetchone()
-                cursor.close()
-            except Exception:
-                latest = None
-
+            # Most recent mapping (from the same snapshot) to print its configured time range
+            latest = MAPPINGS.latest_mapping(result_type_id, camera_rtsp_id)
             now_utc = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
             if latest:
                 start_str = str(latest.get("start_time_utc"))
@@ -368,46 +525,19 @@ def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id)
                 )
             return None
 
+        # If any other usecase key is provided instead of 'ppe', do not consider mapping
+        parsed = row.get("labels_parsed")
+        if isinstance(parsed, dict) and "ppe" not in parsed:
+            cfg.logger.info(
+                "Labels provided for a non-PPE usecase; ignoring mapping | camera_id=%s labels_keys=%s",
+                camera_rtsp_id,
+                list(parsed.keys()),
+            )
+            return None
+
         # Validate labels contains at least one of the required PPE labels
         required_labels = {"no_vest", "no_hardhat", "vest", "hardhat"}
-        labels_field = row.get("labels")
-        labels_list = []
-        if labels_field:
-            try:
-                # Try JSON parse first (supports list or dict formats)
-                parsed = (
-                    json.loads(labels_field)
-                    if isinstance(labels_field, str)
-                    else labels_field
-                )
-                if isinstance(parsed, dict):
-                    # Expected format: {"ppe": ["no_vest", "no_hardhat", "vest", "hardhat"]}
-                    # If any other usecase key is provided instead of 'ppe', do not consider mapping
-                    if "ppe" not in parsed:
-                        cfg.logger.info(
-                            "Labels provided for a non-PPE usecase; ignoring mapping | camera_id=%s labels_keys=%s",
-                            camera_rtsp_id,
-                            list(parsed.keys()),
-                        )
-                        return None
-                    ppe_list = parsed.get("ppe")
-                    if isinstance(ppe_list, list):
-                        labels_list = [str(x).strip() for x in ppe_list]
-                    else:
-                        labels_list = []
-                elif isinstance(parsed, list):
-                    labels_list = [str(x).strip() for x in parsed]
-                else:
-                    # Fallback to comma-separated
-                    labels_list = [
-                        s.strip() for s in str(labels_field).split(",") if s.strip()
-                    ]
-            except Exception:
-                # Fallback to comma-separated
-                labels_list = [
-                    s.strip() for s in str(labels_field).split(",") if s.strip()
-                ]
-
+        labels_list = row.get("allowed_labels") or []
         has_required = any(lbl in required_labels for lbl in labels_list)
         if not has_required:
             cfg.logger.info(
@@ -423,8 +553,7 @@ def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id)
             result_type_id,
             labels_list,
         )
-        # Attach the allowed labels for downstream filtering in app.py
-        row["allowed_labels"] = labels_list
+        # allowed_labels and roi_boxes were attached by _prepare_mapping for app.py
         return row
     except Exception as e:
         cfg.logger.info(
@@ -434,16 +563,11 @@ def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id)
 
 
 def get_all_camera():
+    """Return every camera row; refreshes the mapping cache once per cycle."""
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = f"SELECT * FROM {cfg.CAMERA_TABLE_NAME}"
         cfg.logger.debug("Fetching cameras from table: %s", cfg.CAMERA_TABLE_NAME)
-        cursor.execute(
-            query,
-        )
-        result = cursor.fetchall()
-        cursor.close()
-        return result
+        MAPPINGS.refresh()
+        return MAPPINGS.cameras()
     except Exception as e:
         cfg.logger.error("An error occurred in get_all_camera :: %s", str(e))
         # Return empty list to allow the app loop to continue gracefully
@@ -15,13 +15,9 @@ from pathlib import Path
 
 import cv2
 import numpy as np
-import pandas as pd
 import torch
 import torchvision
-import yaml
 
-from utils.google_utils import gsutil_getsize
-from utils.metrics import fitness
 from utils.torch_utils import init_torch_seeds
 
 # Settings
@@ -29,7 +25,6 @@ torch.set_printoptions(linewidth=320, precision=5, profile="long")
 np.set_printoptions(
     linewidth=320, formatter={"float_kind": "{:11.5g}".format}
 )  # format short g, %precision=5
-pd.options.display.max_columns = 10
 cv2.setNumThreads(
     0
 )  # prevent OpenCV from multithreading (incompatible with PyTorch DataLoader)
@@ -773,6 +768,11 @@ def strip_optimizer(
 
 def print_mutation(hyp, results, yaml_file="hyp_evolved.yaml", bucket=""):
     # Print mutation results to evolve.txt (for use with train.py --evolve)
+    # Imported here so inference-only imports of this module stay light
+    import yaml
+    from utils.google_utils import gsutil_getsize
+    from utils.metrics import fitness
+
     a = "%10s" * len(hyp) % tuple(hyp.keys())  # hyperparam keys
     b = "%10.3g" * len(hyp) % tuple(hyp.values())  # hyperparam values
     c = (
@@ -0,0 +1,324 @@
+"""DeepSort association microbenchmark and parity check (people counting).
+
+Replays a detection sequence through two DeepSort `Tracker`s that differ only
+in `_match`, the association step of `Tracker.update`:
+
+    batched    the current code: one gated cost matrix for all confirmed tracks
+               (stacked Kalman gating, one cosine distance matrix), solved per
+               cascade level on its sub-matrix, and a vectorized IoU cost
+    reference  the per-track form it replaced, kept here verbatim: a
+               gating_distance call per track, a nearest-neighbour distance
+               per target, and the cost recomputed at every cascade level
+
+Both trackers get the same detections, so every frame's matches, unmatched
+tracks and unmatched detections must be identical; the exit status is 1 on
+the first frame where they differ. The per-frame `_match` time is reported
+for both.
+
+The sequence is synthetic by default (--objects people walking with ReID-like
+features, missed detections and clutter). A recorded one can be replayed with
+--sequence: an .npz with one row per detection in the arrays `frame` (int),
+`tlwh` (N x 4), `confidence` (N) and `feature` (N x D); --save-sequence writes
+the synthetic sequence in that format. Examples (from AI/):
+
+    python benchmarks/bench_association.py --objects 20,50,100,200 --output association.json
+    python benchmarks/bench_association.py --sequence recorded_heads.npz
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+AI_DIR = Path(__file__).resolve().parent.parent
+SORT_DIR = AI_DIR / "people_count" / "tracking" / "deep_sort_pytorch" / "deep_sort"
+# Import the sort package on its own: deep_sort/__init__.py pulls in the ReID net
+sys.path.insert(0, str(SORT_DIR))
+
+import numpy as np  # noqa: E402
+
+from sort import iou_matching, linear_assignment, nn_matching  # noqa: E402
+from sort.detection import Detection  # noqa: E402
+from sort.tracker import Tracker  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+# ============================ Reference (per-track) path ============================
+
+
+def reference_nn_euclidean_distance(x, y):
+    """nn_matching's former _nn_euclidean_distance: smallest distance of each `y` to any `x`."""
+    distances = nn_matching._pdist(x, y)
+    return np.maximum(0.0, distances.min(axis=0))
+
+
+def reference_nn_cosine_distance(x, y):
+    """nn_matching's former _nn_cosine_distance: smallest cosine distance of each `y` to any `x`."""
+    distances = nn_matching._cosine_distance(x, y)
+    return distances.min(axis=0)
+
+
+def reference_distance(metric: nn_matching.NearestNeighborDistanceMetric, features, targets):
+    """NearestNeighborDistanceMetric.distance' former loop: one nearest-neighbour distance per target."""
+    if metric._pairwise is nn_matching._cosine_distance:
+        nn_distance = reference_nn_cosine_distance
+    else:
+        nn_distance = reference_nn_euclidean_distance
+    cost_matrix = np.zeros((len(targets), len(features)))
+    for i, target in enumerate(targets):
+        cost_matrix[i, :] = nn_distance(metric.samples[target], features)
+    return cost_matrix
+
+
+def reference_gate_cost_matrix(kf, cost_matrix, tracks, detections, track_indices, detection_indices):
+    """linear_assignment.gate_cost_matrix' former loop: one gating_distance call per track."""
+    gating_threshold = linear_assignment.kalman_filter.chi2inv95[4]
+    measurements = np.asarray([detections[i].to_xyah() for i in detection_indices])
+    for row, track_idx in enumerate(track_indices):
+        track = tracks[track_idx]
+        gating_distance = kf.gating_distance(track.mean, track.covariance, measurements, False)
+        cost_matrix[row, gating_distance > gating_threshold] = linear_assignment.INFTY_COST
+    return cost_matrix
+
+
+def reference_matching_cascade(distance_metric, max_distance, cascade_depth, tracks, detections, track_indices):
+    """linear_assignment.matching_cascade' former loop: the cost recomputed for every level."""
+    unmatched_detections = list(range(len(detections)))
+    matches = []
+    for level in range(cascade_depth):
+        if len(unmatched_detections) == 0:
+            break
+        track_indices_l = [k for k in track_indices if tracks[k].time_since_update == 1 + level]
+        if len(track_indices_l) == 0:
+            continue
+        matches_l, _, unmatched_detections = linear_assignment.min_cost_matching(
+            distance_metric, max_distance, tracks, detections, track_indices_l, unmatched_detections
+        )
+        matches += matches_l
+    unmatched_tracks = list(set(track_indices) - set(k for k, _ in matches))
+    return matches, unmatched_tracks, unmatched_detections
+
+
+def reference_iou_cost(tracks, detections, track_indices, detection_indices):
+    """iou_matching.iou_cost' former loop: one iou call per track."""
+    cost_matrix = np.zeros((len(track_indices), len(detection_indices)))
+    for row, track_idx in enumerate(track_indices):
+        if tracks[track_idx].time_since_update > 1:
+            cost_matrix[row, :] = linear_assignment.INFTY_COST
+            continue
+        bbox = tracks[track_idx].to_tlwh()
+        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+        cost_matrix[row, :] = 1.0 - iou_matching.iou(bbox, candidates)
+    return cost_matrix
+
+
+class ReferenceTracker(Tracker):
+    """Tracker whose `_match` is the per-track association above."""
+
+    def _match(self, detections):
+        def gated_metric(tracks, dets, track_indices, detection_indices):
+            features = np.array([dets[i].feature for i in detection_indices])
+            targets = np.array([tracks[i].track_id for i in track_indices])
+            cost_matrix = reference_distance(self.metric, features, targets)
+            return reference_gate_cost_matrix(self.kf, cost_matrix, tracks, dets, track_indices, detection_indices)
+
+        confirmed_tracks = [i for i, t in enumerate(self.tracks) if t.is_confirmed()]
+        unconfirmed_tracks = [i for i, t in enumerate(self.tracks) if not t.is_confirmed()]
+        matches_a, unmatched_tracks_a, unmatched_detections = reference_matching_cascade(
+            gated_metric, self.metric.matching_threshold, self.max_age, self.tracks, detections, confirmed_tracks
+        )
+        iou_track_candidates = unconfirmed_tracks + [k for k in unmatched_tracks_a if self.tracks[k].time_since_update == 1]
+        unmatched_tracks_a = [k for k in unmatched_tracks_a if self.tracks[k].time_since_update != 1]
+        matches_b, unmatched_tracks_b, unmatched_detections = linear_assignment.min_cost_matching(
+            reference_iou_cost,
+            self.max_iou_distance,
+            self.tracks,
+            detections,
+            iou_track_candidates,
+            unmatched_detections,
+        )
+        matches = matches_a + matches_b
+        unmatched_tracks = list(set(unmatched_tracks_a + unmatched_tracks_b))
+        return matches, unmatched_tracks, unmatched_detections
+
+
+# ============================ Inputs ============================
+
+
+def synthetic_sequence(objects: int, frames: int, seed: int, dim: int = 512) -> Dict[str, np.ndarray]:
+    """`objects` heads walking across a 1920x1080 frame, each with a noisy appearance
+    vector; 15% of them are missed per frame and a few clutter boxes appear."""
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform((0, 0), (1920, 1080), (objects, 2))
+    vel = rng.normal(0, 3, (objects, 2))
+    size = rng.uniform(20, 80, objects)
+    appearance = rng.normal(size=(objects, dim))
+    rows: Dict[str, List[Any]] = {"frame": [], "tlwh": [], "confidence": [], "feature": []}
+    for f in range(frames):
+        pos += vel + rng.normal(0, 1, pos.shape)
+        for i in np.flatnonzero(rng.random(objects) > 0.15):
+            w = size[i] * rng.uniform(0.9, 1.1)
+            rows["tlwh"].append((pos[i, 0] - w / 2, pos[i, 1] - 0.6 * w, w, 1.2 * w))
+            rows["feature"].append(appearance[i] + rng.normal(0, 0.6, dim))
+            rows["confidence"].append(rng.uniform(0.5, 1.0))
+            rows["frame"].append(f)
+        for _ in range(rng.integers(0, 10)):
+            x, y = rng.uniform((0, 0), (1920, 1080))
+            rows["tlwh"].append((x, y, 30.0, 36.0))
+            rows["feature"].append(rng.normal(size=dim))
+            rows["confidence"].append(rng.uniform(0.5, 1.0))
+            rows["frame"].append(f)
+    return {
+        "frame": np.asarray(rows["frame"], dtype=np.int64),
+        "tlwh": np.asarray(rows["tlwh"], dtype=np.float64),
+        "confidence": np.asarray(rows["confidence"], dtype=np.float64),
+        "feature": np.asarray(rows["feature"], dtype=np.float32),
+    }
+
+
+def load_sequence(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        return {key: data[key] for key in ("frame", "tlwh", "confidence", "feature")}
+
+
+def frames_of(sequence: Dict[str, np.ndarray]) -> List[List[Detection]]:
+    """Detections grouped per frame (frames without detections included)."""
+    frames: List[List[Detection]] = [[] for _ in range(int(sequence["frame"].max()) + 1 if len(sequence["frame"]) else 0)]
+    for f, tlwh, conf, feature in zip(sequence["frame"], sequence["tlwh"], sequence["confidence"], sequence["feature"]):
+        frames[int(f)].append(Detection(tlwh, conf, feature))
+    return frames
+
+
+# ============================ Timing ============================
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{q}": round(float(np.percentile(arr, q)), 3) for q in PERCENTILES}
+    summary.update(mean=round(float(arr.mean()), 3), n=int(arr.size))
+    return summary
+
+
+def instrument(tracker: Tracker, log: List[Any], samples: List[float]) -> Tracker:
+    """Record the time and the (order-independent) result of every `_match` call."""
+    match = tracker._match
+
+    def timed_match(detections):
+        t0 = time.perf_counter()
+        result = match(detections)
+        samples.append((time.perf_counter() - t0) * 1000)
+        matches, unmatched_tracks, unmatched_detections = result
+        log.append((sorted(matches), sorted(unmatched_tracks), sorted(unmatched_detections)))
+        return result
+
+    tracker._match = timed_match
+    return tracker
+
+
+def run_sequence(name: str, frames: List[List[Detection]], args: argparse.Namespace) -> Dict[str, Any]:
+    """Track `frames` with both trackers and compare their association frame by frame."""
+    result: Dict[str, Any] = {"sequence": name, "frames": len(frames), "detections": sum(len(f) for f in frames)}
+    logs: Dict[str, List[Any]] = {}
+    peak_tracks = 0
+    for label, cls in (("reference", ReferenceTracker), ("batched", Tracker)):
+        metric = nn_matching.NearestNeighborDistanceMetric("cosine", args.max_dist, args.nn_budget)
+        samples: List[float] = []
+        logs[label] = []
+        tracker = instrument(cls(metric, max_iou_distance=args.max_iou_distance, max_age=args.max_age, n_init=args.n_init), logs[label], samples)
+        for detections in frames:
+            tracker.predict()
+            tracker.update(detections)
+            peak_tracks = max(peak_tracks, len(tracker.tracks))
+        result[label] = summarize(samples[args.warmup :] or samples)
+    result["peak_tracks"] = peak_tracks
+    diverged = next((f for f, (a, b) in enumerate(zip(logs["reference"], logs["batched"])) if a != b), None)
+    result["first_divergent_frame"] = diverged
+    ref_ms, new_ms = result["reference"]["mean"], result["batched"]["mean"]
+    result["speedup"] = round(ref_ms / new_ms, 2) if new_ms else None
+    return result
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'sequence':>14}{'frames':>8}{'tracks':>8}{'reference ms':>16}{'batched ms':>16}{'speedup':>9}{'identical':>11}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cells = "".join(
+            "{:>16}".format("%.2f/%.2f" % (r[label]["p50"], r[label]["p95"])) for label in ("reference", "batched")
+        )
+        identical = "yes" if r["first_divergent_frame"] is None else f"no (#{r['first_divergent_frame']})"
+        print(f"{r['sequence']:>14}{r['frames']:>8}{r['peak_tracks']:>8}{cells}{r['speedup']:>9}{identical:>11}")
+    print("(cells are p50/p95 ms of Tracker._match per frame; tracks is the peak track count)")
+
+
+# ============================ CLI ============================
+
+
+def _csv(cast: Callable[[str], Any]) -> Callable[[str], List[Any]]:
+    return lambda value: [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--objects", type=_csv(int), default=[20, 50, 100, 200], help="people per synthetic sequence")
+    parser.add_argument("--frames", type=int, default=100, help="frames per synthetic sequence")
+    parser.add_argument("--sequence", default="", help="replay this recorded .npz instead of synthetic sequences")
+    parser.add_argument("--save-sequence", default="", help="write the last synthetic sequence here (.npz)")
+    parser.add_argument("--max-dist", type=float, default=0.2, help="DeepSort max_dist (cosine matching threshold)")
+    parser.add_argument("--max-iou-distance", type=float, default=0.7)
+    parser.add_argument("--max-age", type=int, default=70)
+    parser.add_argument("--n-init", type=int, default=3)
+    parser.add_argument("--nn-budget", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10, help="frames left out of the timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="write results JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.sequence:
+        sequences = [(Path(args.sequence).stem, load_sequence(args.sequence))]
+    else:
+        sequences = [
+            (f"{n} people", synthetic_sequence(n, args.frames, args.seed + n)) for n in args.objects
+        ]
+        if args.save_sequence:
+            np.savez_compressed(args.save_sequence, **sequences[-1][1])
+
+    results = []
+    for name, sequence in sequences:
+        result = run_sequence(name, frames_of(sequence), args)
+        results.append(result)
+        print(f"done {name} speedup={result['speedup']}", file=sys.stderr)
+
+    failed = [r["sequence"] for r in results if r["first_divergent_frame"] is not None]
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "args": vars(args),
+        },
+        "results": results,
+        "parity_failures": failed,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print_table(results)
+    if failed:
+        print(f"\nAssociation differs from the reference for: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
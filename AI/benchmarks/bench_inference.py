@@ -0,0 +1,532 @@
+"""Per-stage inference benchmark for the YOLOv5 detection path.
+
+Builds detectors from `models/yolov5*.yaml` or `models/hub/*.yaml` with random
+weights, so no production weights are needed. Each configuration in the
+matrix below runs the same stages the services run on every frame:
+
+    decode       ingest.decode (JPEG -> BGR, reduced when IMAGE_SIZE allows)  per frame
+    letterbox    preprocess.letterbox_frame                                    per frame
+    to_tensor    preprocess.batch_tensor                                       per batch
+    forward      the inference engine (eager / torchscript / onnxruntime ...)  per batch
+    nms          utils.general.non_max_suppression                             per batch
+    scale_coords preprocess.to_original for every frame's boxes               per batch
+
+Inputs are rectangular unless INFERENCE_RECT=0 pads them to squares; each run
+reports its input shape and the share of it that is padding.
+
+The matrix is models x image sizes x batch sizes x thread counts x backends.
+Frames are synthetic JPEGs at --frame-size, or real frames from --samples.
+--weights benchmarks a trained checkpoint instead of random-weight models.
+p50/p95/p99 per stage (ms) are written as JSON. With --baseline, the p50 and
+p95 of each (configuration, stage) are compared against a saved run, and the
+exit status is 1 when any of them regressed by more than --tolerance.
+
+With --rois (boxes in frame pixels), every configuration also runs in ROI-crop
+mode (mappings with roi_type=crop): decode and letterbox go through
+ingest.decode / ingest.letterbox with those ROIs, so each batch holds the crops
+of its frames. Each (model, backend, image size) also reports recall inside
+the ROIs for full-frame and crop inference: against the YOLO labels next to
+the --samples frames (same stem, .txt) when every frame has one, otherwise
+against the full-frame detections (which then score 1.0 by definition).
+
+Examples (from AI/):
+
+    python benchmarks/bench_inference.py --models yolov5s --img-sizes 320,640 \
+        --batch-sizes 1,4 --threads 4 --backends eager,onnxruntime --output run.json
+    python benchmarks/bench_inference.py ... --baseline benchmarks/baseline.json
+    python benchmarks/bench_inference.py --weights PPE/pt_model/ppe-kit-detection-2.pt \
+        --samples "frames/**/*.jpg" --rois 1200,300,1900,1000
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+AI_DIR = Path(__file__).resolve().parent.parent
+SERVICE_DIR = AI_DIR / "PPE"  # config.py, models/ and utils/
+sys.path.insert(0, str(AI_DIR))  # common/
+sys.path.insert(0, str(SERVICE_DIR))
+
+# config.py reads these at import; the benchmark needs none of the backends
+_BENCH_ENV = {
+    "IMAGE_SIZE": "640",
+    "SLEEP_TIME": "0",
+    "MYSQL_PORT": "3306",
+    "RESULT_TYPE_ID": "0",
+    "MODEL_CONF": "0.25",
+    "MODEL_IOU": "0.45",
+    "LOG_BASE_DIRECTORY": os.path.join(tempfile.gettempdir(), "bench_inference_logs"),
+    "INFERENCE_PARITY_SAMPLES": "",
+}
+for _name, _value in _BENCH_ENV.items():
+    os.environ.setdefault(_name, _value)
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+import config as cfg  # noqa: E402
+from common import ingest, preprocess  # noqa: E402
+from common.inference_engine import create_engine  # noqa: E402
+from models.yolo import Model  # noqa: E402
+from utils.general import box_iou, non_max_suppression, xywh2xyxy  # noqa: E402
+
+STAGES = ("decode", "letterbox", "to_tensor", "forward", "nms", "scale_coords")
+PERCENTILES = (50, 95, 99)
+
+
+# ============================ Inputs ============================
+
+
+def model_config(name: str) -> Path:
+    """models/<name>.yaml, then models/hub/<name>.yaml."""
+    for path in (SERVICE_DIR / "models" / f"{name}.yaml", SERVICE_DIR / "models" / "hub" / f"{name}.yaml"):
+        if path.is_file():
+            return path
+    raise FileNotFoundError(f"No model config for {name} in models/ or models/hub/")
+
+
+def build_model(name: str, workdir: Path, seed: int) -> Tuple[Any, str]:
+    """Random-weight fused model plus a saved .pt (engines key compiled artifacts by it)."""
+    torch.manual_seed(seed)
+    model = Model(str(model_config(name))).fuse().eval()
+    weight_path = workdir / f"{name}.pt"
+    torch.save({"model": model}, weight_path)
+    return model, str(weight_path)
+
+
+def load_weights(path: str, device: torch.device) -> Tuple[Any, str]:
+    """A trained checkpoint, loaded as the services load it (my_utils.load_model)."""
+    return torch.load(path, map_location=device)["model"].float().fuse().eval(), path
+
+
+def synthetic_frames(count: int, width: int, height: int, seed: int) -> List[bytes]:
+    """Camera-like JPEGs: blurred noise with a few rectangles, so encode/decode cost is realistic."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        img = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        img = cv2.GaussianBlur(img, (0, 0), 3)
+        for _ in range(8):
+            x, y = int(rng.integers(0, width - 64)), int(rng.integers(0, height - 64))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(img, (x, y), (x + int(rng.integers(16, 64)), y + int(rng.integers(32, 64))), color, -1)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        frames.append(buf.tobytes())
+    return frames
+
+
+def sample_paths(pattern: str, count: int) -> List[str]:
+    import glob
+
+    paths = sorted(glob.glob(pattern, recursive=True))[:count]
+    if not paths:
+        raise FileNotFoundError(f"No sample frames match {pattern}")
+    return paths
+
+
+def sample_frames(pattern: str, count: int) -> List[bytes]:
+    return [Path(p).read_bytes() for p in sample_paths(pattern, count)]
+
+
+def sample_labels(pattern: str, count: int) -> Optional[List[np.ndarray]]:
+    """YOLO labels (cls cx cy w h, normalised) of the sample frames; None unless every frame has them."""
+    labels = []
+    for path in sample_paths(pattern, count):
+        label_path = Path(path).with_suffix(".txt")
+        if not label_path.is_file():
+            return None
+        labels.append(np.loadtxt(label_path, ndmin=2, dtype=np.float32).reshape(-1, 5))
+    return labels
+
+
+def parse_rois(value: str) -> List[List[int]]:
+    """"x1,y1,x2,y2;x1,y1,x2,y2" -> ROI boxes."""
+    rois = [[int(float(v)) for v in box.split(",")] for box in value.split(";") if box.strip()]
+    if any(len(box) != 4 for box in rois):
+        raise argparse.ArgumentTypeError(f"ROI boxes must be x1,y1,x2,y2: {value}")
+    return rois
+
+
+# ============================ Timing ============================
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{q}": round(float(np.percentile(arr, q)), 3) for q in PERCENTILES}
+    summary.update(mean=round(float(arr.mean()), 3), n=int(arr.size))
+    return summary
+
+
+def timed(fn: Callable[[], Any], samples: List[float]) -> Any:
+    t0 = time.perf_counter()
+    out = fn()
+    samples.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def _inputs(img: Any, geom: Any) -> Tuple[List[np.ndarray], List[preprocess.Geometry]]:
+    """(canvases, geometries) of a letterboxed frame, or of its ROI crops."""
+    return (img, geom) if isinstance(img, list) else ([img], [geom])
+
+
+def run_config(
+    engine: Any,
+    frames: List[bytes],
+    img_size: int,
+    batch_size: int,
+    iters: int,
+    warmup: int,
+    conf: float,
+    iou: float,
+    crop: Optional[ingest.CropRois] = None,
+) -> Dict[str, Any]:
+    """Time every stage over `iters` batches (after `warmup` untimed batches).
+
+    With `crop` the batch holds the ROI crops of its frames; crops of
+    different shapes (frames of different sizes) run as separate batches.
+    """
+    device = engine.device
+    times: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    input_shape = None
+    inputs_per_frame = 1.0
+    padding = 0.0
+    t_start = time.perf_counter()
+    for step in range(warmup + iters):
+        if step == warmup:
+            t_start = time.perf_counter()
+        record = step >= warmup
+        sink: Dict[str, List[float]] = times if record else {stage: [] for stage in STAGES}
+        groups: Dict[Tuple[int, ...], Tuple[List[np.ndarray], List[preprocess.Geometry]]] = {}
+        for k in range(batch_size):
+            data = np.frombuffer(frames[(step * batch_size + k) % len(frames)], dtype=np.uint8)
+            img0, scale, shape = timed(
+                lambda: ingest.decode(data, img_size, cfg.INGEST_MAX_REDUCTION, crop), sink["decode"]
+            )
+            img, geom = timed(lambda: ingest.letterbox(img0, scale, shape, img_size, crop), sink["letterbox"])
+            for canvas, g in zip(*_inputs(img, geom)):
+                group = groups.setdefault(canvas.shape, ([], []))
+                group[0].append(canvas)
+                group[1].append(g)
+        inputs_per_frame = sum(len(c) for c, _ in groups.values()) / batch_size
+        padding = preprocess.padding_ratio([g for _, geometries in groups.values() for g in geometries])
+        batches = timed(
+            lambda: [(preprocess.batch_tensor(c, device), g) for c, g in groups.values()], sink["to_tensor"]
+        )
+        input_shape = list(batches[0][0].shape[2:])
+        preds = timed(lambda: [engine(batch)[0] for batch, _ in batches], sink["forward"])
+        dets = timed(
+            lambda: [non_max_suppression(pred, conf, iou, classes=None, agnostic=False) for pred in preds],
+            sink["nms"],
+        )
+
+        def _scale():
+            for group_dets, (_, geometries) in zip(dets, batches):
+                for det, g in zip(group_dets, geometries):
+                    if det is not None and len(det):
+                        det[:, :4] = preprocess.to_original(det[:, :4], g).round()
+
+        timed(_scale, sink["scale_coords"])
+    elapsed = time.perf_counter() - t_start
+    return {
+        "mode": "crop" if crop else "full",
+        "input_shape": input_shape,
+        "inputs_per_frame": round(inputs_per_frame, 2),
+        "padding": round(padding, 3),
+        "fps": round(iters * batch_size / max(elapsed, 1e-9), 2),
+        "stages": {stage: summarize(samples) for stage, samples in times.items()},
+    }
+
+
+# ============================ ROI recall ============================
+
+
+def detect_frame(
+    engine: Any, data: np.ndarray, img_size: int, conf: float, iou: float, crop: Optional[ingest.CropRois]
+) -> Tuple[torch.Tensor, Tuple[int, int, int]]:
+    """(n, 6) detections in original-frame pixels, and the frame's shape."""
+    img0, scale, shape = ingest.decode(data, img_size, cfg.INGEST_MAX_REDUCTION, crop)
+    dets = []
+    for canvas, g in zip(*_inputs(*ingest.letterbox(img0, scale, shape, img_size, crop))):
+        det = non_max_suppression(engine(preprocess.batch_tensor([canvas], engine.device))[0], conf, iou)[0]
+        det[:, :4] = preprocess.to_original(det[:, :4], g).round()
+        dets.append(det.cpu())
+    return torch.cat(dets), shape
+
+
+def inside_rois(boxes: torch.Tensor, rois: List[List[int]]) -> torch.Tensor:
+    """(n,) bool: box centers inside any ROI, the rule the services filter with (my_utils.roi_mask)."""
+    centers = ((boxes[:, :2].trunc() + boxes[:, 2:4].trunc()) / 2).trunc()[:, None, :]
+    r = torch.as_tensor(rois, dtype=boxes.dtype).reshape(1, -1, 4)
+    return ((centers >= r[..., :2]) & (centers <= r[..., 2:])).all(2).any(1)
+
+
+def matched(pred: torch.Tensor, target: torch.Tensor, iou_thres: float = 0.5) -> int:
+    """Targets (cls, xyxy) matched one-to-one by a same-class prediction at IoU >= iou_thres."""
+    if not len(pred) or not len(target):
+        return 0
+    ious = box_iou(target[:, 1:5], pred[:, :4])
+    ious[target[:, 0:1] != pred[None, :, 5]] = 0
+    used = set()
+    for row in ious:
+        for p in row.argsort(descending=True).tolist():
+            if row[p] < iou_thres:
+                break
+            if p not in used:
+                used.add(p)
+                break
+    return len(used)
+
+
+def roi_recall(
+    engine: Any,
+    frames: List[bytes],
+    labels: Optional[List[np.ndarray]],
+    img_size: int,
+    conf: float,
+    iou: float,
+    rois: List[List[int]],
+) -> Dict[str, Any]:
+    """Recall at IoU 0.5 of full-frame and ROI-crop inference, counting only boxes centred in `rois`."""
+    hits = {"full": 0, "crop": 0}
+    detections = {"full": 0, "crop": 0}
+    reference_boxes = 0
+    for k, frame in enumerate(frames):
+        data = np.frombuffer(frame, dtype=np.uint8)
+        out = {}
+        for mode, crop in (("full", None), ("crop", (rois, []))):
+            det, shape = detect_frame(engine, data, img_size, conf, iou, crop)
+            out[mode] = det[inside_rois(det[:, :4], rois)]
+            detections[mode] += len(out[mode])
+        if labels is not None:
+            target = torch.from_numpy(labels[k].copy())
+            target[:, 1:5] = xywh2xyxy(target[:, 1:5]) * torch.tensor([shape[1], shape[0]] * 2)
+        else:
+            target = torch.cat((out["full"][:, 5:6], out["full"][:, :4]), 1)
+        target = target[inside_rois(target[:, 1:5], rois)]
+        reference_boxes += len(target)
+        for mode in hits:
+            hits[mode] += matched(out[mode], target)
+    return {
+        "reference": "labels" if labels is not None else "full_frame",
+        "reference_boxes": reference_boxes,
+        "detections": detections,
+        "recall_full": round(hits["full"] / reference_boxes, 4) if reference_boxes else None,
+        "recall_crop": round(hits["crop"] / reference_boxes, 4) if reference_boxes else None,
+    }
+
+
+# ============================ Baseline comparison ============================
+
+
+def config_key(result: Dict[str, Any]) -> str:
+    key = "{model}/img{img_size}/b{batch_size}/t{threads}/{backend}".format(**result)
+    return key + "/crop" if result.get("mode") == "crop" else key
+
+
+def compare(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float, min_ms: float
+) -> Dict[str, Any]:
+    """Per (configuration, stage) p50/p95 ratios against `baseline`; regressions flagged."""
+    base = {config_key(r): r for r in baseline.get("results", [])}
+    rows, regressions = [], []
+    for result in results:
+        key = config_key(result)
+        ref = base.get(key)
+        if ref is None:
+            continue
+        for stage in STAGES:
+            for q in ("p50", "p95"):
+                new = result["stages"][stage][q]
+                old = ref["stages"].get(stage, {}).get(q)
+                if not old:
+                    continue
+                ratio = new / old
+                row = {"config": key, "stage": stage, "stat": q, "baseline_ms": old, "ms": new, "ratio": round(ratio, 3)}
+                rows.append(row)
+                # Sub-`min_ms` differences are timer noise on a laptop
+                if ratio > 1 + tolerance and new - old > min_ms:
+                    regressions.append(row)
+    missing = sorted(set(base) - {config_key(r) for r in results})
+    return {"tolerance": tolerance, "min_ms": min_ms, "rows": rows, "regressions": regressions, "missing": missing}
+
+
+def print_table(results: List[Dict[str, Any]], comparison: Optional[Dict[str, Any]]) -> None:
+    header = f"{'config':<44}" + "".join(f"{stage:>14}" for stage in STAGES) + f"{'fps':>9}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        cells = "".join(
+            "{:>14}".format("%.2f/%.2f" % (result["stages"][s]["p50"], result["stages"][s]["p95"])) for s in STAGES
+        )
+        print(f"{config_key(result):<44}{cells}{result['fps']:>9}")
+    print("(cells are p50/p95 ms; decode and letterbox are per frame, the rest per batch)")
+    if comparison is not None:
+        print(f"\nRegressions (> {comparison['tolerance']:.0%} and > {comparison['min_ms']} ms):")
+        for row in comparison["regressions"]:
+            print("  {config} {stage} {stat}: {baseline_ms:.2f} -> {ms:.2f} ms (x{ratio})".format(**row))
+        if not comparison["regressions"]:
+            print("  none")
+        if comparison["missing"]:
+            print("  not run (in baseline only): " + ", ".join(comparison["missing"]))
+    recalls = [r for r in results if r.get("recall")]
+    if recalls:
+        print("\nRecall inside the ROIs (IoU 0.5), full frame -> crops:")
+        for result in recalls:
+            recall = result["recall"]
+            print(
+                "  {key}: {full} -> {crop} ({n} {ref} boxes)".format(
+                    key=config_key(result),
+                    full=recall["recall_full"],
+                    crop=recall["recall_crop"],
+                    n=recall["reference_boxes"],
+                    ref=recall["reference"],
+                )
+            )
+
+
+# ============================ CLI ============================
+
+
+def _csv(cast: Callable[[str], Any]) -> Callable[[str], List[Any]]:
+    return lambda value: [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", type=_csv(str), default=["yolov5s"], help="yolov5s,yolov5m,... or hub names")
+    parser.add_argument("--weights", default="", help="trained .pt to benchmark instead of --models")
+    parser.add_argument("--img-sizes", type=_csv(int), default=[640])
+    parser.add_argument("--batch-sizes", type=_csv(int), default=[1])
+    parser.add_argument("--threads", type=_csv(int), default=[os.cpu_count() or 1])
+    parser.add_argument("--backends", type=_csv(str), default=["eager"], help="eager,torchscript,onnxruntime,...")
+    parser.add_argument("--frame-size", default="1920x1080", help="WxH of synthetic frames")
+    parser.add_argument("--samples", default="", help="glob of real frames to use instead of synthetic ones")
+    parser.add_argument("--frames", type=int, default=16, help="distinct frames to cycle through")
+    parser.add_argument(
+        "--rois", type=parse_rois, default=[], help="x1,y1,x2,y2;... in frame pixels: also run ROI-crop mode"
+    )
+    parser.add_argument("--iters", type=int, default=20, help="timed batches per configuration")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed batches per configuration")
+    parser.add_argument("--conf", type=float, default=cfg.MODEL_CONF)
+    parser.add_argument("--iou", type=float, default=cfg.MODEL_IOU)
+    parser.add_argument("--device", default="cpu", help="cpu or a CUDA index")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="write results JSON here")
+    parser.add_argument("--baseline", default="", help="compare against a saved results JSON")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown ratio over baseline")
+    parser.add_argument("--min-ms", type=float, default=0.5, help="ignore slowdowns smaller than this")
+    return parser.parse_args(argv)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=AI_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    device = torch.device("cpu" if args.device == "cpu" else f"cuda:{args.device}")
+    labels = None
+    if args.samples:
+        frames = sample_frames(args.samples, args.frames)
+        labels = sample_labels(args.samples, args.frames)
+    else:
+        width, height = (int(v) for v in args.frame_size.lower().split("x"))
+        frames = synthetic_frames(args.frames, width, height, args.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_inference_") as workdir:
+        models = [Path(args.weights).stem] if args.weights else args.models
+        crops = [None, (args.rois, [])] if args.rois else [None]
+        for model_name in models:
+            if args.weights:
+                model, weight_path = load_weights(args.weights, device)
+            else:
+                model, weight_path = build_model(model_name, Path(workdir), args.seed)
+            for threads in args.threads:
+                torch.set_num_threads(threads)
+                cv2.setNumThreads(threads)
+                cfg.INFERENCE_THREADS = threads
+                for backend in args.backends:
+                    engine = create_engine(model, weight_path, device, backend=backend)
+                    for img_size in args.img_sizes:
+                        recall = None
+                        if args.rois and threads == args.threads[0]:
+                            recall = roi_recall(engine, frames, labels, img_size, args.conf, args.iou, args.rois)
+                        for batch_size in args.batch_sizes:
+                            for crop in crops:
+                                run = run_config(
+                                    engine,
+                                    frames,
+                                    img_size,
+                                    batch_size,
+                                    args.iters,
+                                    args.warmup,
+                                    args.conf,
+                                    args.iou,
+                                    crop,
+                                )
+                                run.update(
+                                    model=model_name,
+                                    img_size=img_size,
+                                    batch_size=batch_size,
+                                    threads=threads,
+                                    backend=backend,
+                                    # create_engine falls back to eager when a backend is unavailable
+                                    engine=getattr(engine, "backend", "eager"),
+                                )
+                                if crop and recall and batch_size == args.batch_sizes[0]:
+                                    run["recall"] = recall
+                                results.append(run)
+                                print(f"done {config_key(run)} fps={run['fps']}", file=sys.stderr)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_revision": _git_revision(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "frames": "samples:" + args.samples if args.samples else "synthetic:" + args.frame_size,
+            "inference_rect": cfg.INFERENCE_RECT,
+            "roi_crop": {
+                "margin": cfg.ROI_CROP_MARGIN,
+                "max_area": cfg.ROI_CROP_MAX_AREA,
+                "max_tiles": cfg.ROI_CROP_MAX_TILES,
+                "pixel_budget": cfg.ROI_CROP_PIXEL_BUDGET,
+            },
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    comparison = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            comparison = compare(results, json.load(f), args.tolerance, args.min_ms)
+        report["comparison"] = comparison
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print_table(results, comparison)
+    return 1 if comparison and comparison["regressions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""Crop and ReID preprocessing microbenchmark for DeepSort (people counting).
+
+Times the two steps between head detection and the ReID forward pass, for
+several crop counts per frame, in their current form and in the per-crop form
+they replaced:
+
+    crops       DeepSort.crops: box conversion + slicing of every head
+    preprocess  Extractor._preprocess: resize + normalise into one NCHW batch
+    forward     the ReID net on that batch (with --forward)
+
+The reference versions are kept here verbatim (a Python loop over the boxes,
+then cv2.resize, ToTensor and Normalize per crop followed by torch.cat). Each
+configuration also checks that the current path matches the reference: the
+largest absolute difference of the preprocessed batches and the largest cosine
+distance between the ReID features of both batches. The exit status is 1 when
+either exceeds its tolerance.
+
+The ReID net has random weights unless --ckpt points at a checkpoint
+(deep_sort/deep/checkpoint/ckpt.t7), and the frame is synthetic, so no
+production data is needed. Examples (from AI/):
+
+    python benchmarks/bench_reid.py --crops 5,20,50,100,300 --forward --output reid.json
+    python benchmarks/bench_reid.py --ckpt people_count/tracking/deep_sort_pytorch/deep_sort/deep/checkpoint/ckpt.t7
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+AI_DIR = Path(__file__).resolve().parent.parent
+SERVICE_DIR = AI_DIR / "people_count"  # tracking/ (DeepSort and the ReID extractor)
+sys.path.insert(0, str(SERVICE_DIR))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+import torchvision.transforms as transforms  # noqa: E402
+
+from tracking.deep_sort_pytorch.deep_sort.deep.feature_extractor import Extractor  # noqa: E402
+from tracking.deep_sort_pytorch.deep_sort.deep.model import Net  # noqa: E402
+from tracking.deep_sort_pytorch.deep_sort.deep_sort import DeepSort  # noqa: E402
+
+STAGES = ("crops", "preprocess", "forward")
+PERCENTILES = (50, 95, 99)
+
+
+# ============================ Reference (per-crop) path ============================
+
+
+def reference_crops(bbox_xywh: torch.Tensor, ori_img: np.ndarray) -> List[np.ndarray]:
+    """DeepSort._get_features' former loop: one _xywh_to_xyxy and slice per box."""
+    height, width = ori_img.shape[:2]
+    im_crops = []
+    for box in bbox_xywh:
+        x, y, w, h = box
+        x1 = max(int(x - w / 2), 0)
+        x2 = min(int(x + w / 2), width - 1)
+        y1 = max(int(y - h / 2), 0)
+        y2 = min(int(y + h / 2), height - 1)
+        im_crops.append(ori_img[y1:y2, x1:x2])
+    return im_crops
+
+
+_NORM = transforms.Compose(
+    [
+        transforms.ToTensor(),
+        transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
+    ]
+)
+
+
+def reference_preprocess(im_crops: List[np.ndarray], size=(64, 128)) -> torch.Tensor:
+    """Extractor._preprocess' former per-crop resize, ToTensor and Normalize, then torch.cat."""
+
+    def _resize(im, size):
+        return cv2.resize(im.astype(np.float32) / 255.0, size)
+
+    return torch.cat([_NORM(_resize(im, size)).unsqueeze(0) for im in im_crops], dim=0).float()
+
+
+# ============================ Inputs ============================
+
+
+def synthetic_frame(width: int, height: int, seed: int) -> np.ndarray:
+    """Blurred noise, so crops and resizes see camera-like pixel values."""
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+
+
+def head_boxes(count: int, width: int, height: int, seed: int) -> torch.Tensor:
+    """`count` head-sized center/size boxes, some of them clipped by the frame edges."""
+    rng = np.random.default_rng(seed)
+    w = rng.uniform(12, 80, count)
+    h = w * rng.uniform(1.0, 1.4, count)
+    x = rng.uniform(0, width, count)
+    y = rng.uniform(0, height, count)
+    return torch.tensor(np.stack([x, y, w, h], axis=1), dtype=torch.float32)
+
+
+def build_extractor(ckpt: str, device: str, workdir: Path, seed: int) -> Extractor:
+    """The services' Extractor, on `ckpt` or on a random-weight ReID net saved to `workdir`."""
+    if not ckpt:
+        torch.manual_seed(seed)
+        ckpt = str(workdir / "reid_random.t7")
+        torch.save({"net_dict": Net(reid=True).state_dict()}, ckpt)
+    return Extractor(ckpt, use_cuda=device != "cpu")
+
+
+# ============================ Timing ============================
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{q}": round(float(np.percentile(arr, q)), 3) for q in PERCENTILES}
+    summary.update(mean=round(float(arr.mean()), 3), n=int(arr.size))
+    return summary
+
+
+def timed(fn: Callable[[], Any], samples: List[float]) -> Any:
+    t0 = time.perf_counter()
+    out = fn()
+    samples.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def run_config(
+    extractor: Extractor,
+    tracker: DeepSort,
+    frame: np.ndarray,
+    boxes: torch.Tensor,
+    iters: int,
+    warmup: int,
+    forward: bool,
+) -> Dict[str, Any]:
+    """Time both paths for one crop count and check the current one against the reference."""
+    paths = {
+        "reference": (lambda: reference_crops(boxes, frame), reference_preprocess),
+        "vectorized": (lambda: tracker.crops(boxes, frame), extractor._preprocess),
+    }
+    result: Dict[str, Any] = {"crops": len(boxes)}
+    batches = {}
+    for name, (crop_fn, preprocess_fn) in paths.items():
+        samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        for i in range(warmup + iters):
+            timings: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            crops = timed(crop_fn, timings["crops"])
+            batch = timed(lambda: preprocess_fn(crops), timings["preprocess"])
+            if forward:
+                with torch.no_grad():
+                    timed(lambda: extractor.net(batch.to(extractor.device)), timings["forward"])
+            if i >= warmup:
+                for stage in STAGES:
+                    samples[stage] += timings[stage]
+        batches[name] = batch
+        result[name] = {stage: summarize(values) for stage, values in samples.items() if values}
+
+    ref, new = batches["reference"], batches["vectorized"]
+    with torch.no_grad():
+        f_ref = extractor.net(ref.to(extractor.device)).cpu()
+        f_new = extractor.net(new.to(extractor.device)).cpu()
+    cosine = torch.nn.functional.cosine_similarity(f_ref, f_new, dim=1)
+    result["parity"] = {
+        "input_max_abs": float((ref - new).abs().max()),
+        "feature_max_cosine_distance": float((1 - cosine).max()),
+    }
+    ref_ms = sum(result["reference"][s]["p50"] for s in ("crops", "preprocess"))
+    new_ms = sum(result["vectorized"][s]["p50"] for s in ("crops", "preprocess"))
+    result["speedup"] = round(ref_ms / new_ms, 2) if new_ms else None
+    return result
+
+
+def print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'crops':>6}" + "".join(f"{name + ' ' + s:>26}" for name in ("reference", "vectorized") for s in STAGES[:2])
+    header += f"{'speedup':>9}{'max|d input|':>14}{'max cos dist':>14}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        cells = "".join(
+            "{:>26}".format("%.2f/%.2f" % (result[name][s]["p50"], result[name][s]["p95"]))
+            for name in ("reference", "vectorized")
+            for s in STAGES[:2]
+        )
+        parity = result["parity"]
+        print(
+            f"{result['crops']:>6}{cells}{result['speedup']:>9}"
+            f"{parity['input_max_abs']:>14.2e}{parity['feature_max_cosine_distance']:>14.2e}"
+        )
+    print("(cells are p50/p95 ms per frame)")
+    if any("forward" in result["vectorized"] for result in results):
+        print("\nReID forward p50/p95 ms per frame:")
+        for result in results:
+            fwd = result["vectorized"]["forward"]
+            print(f"  {result['crops']:>4} crops: {fwd['p50']:.2f}/{fwd['p95']:.2f}")
+
+
+# ============================ CLI ============================
+
+
+def _csv(cast: Callable[[str], Any]) -> Callable[[str], List[Any]]:
+    return lambda value: [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--crops", type=_csv(int), default=[5, 20, 50, 100, 300], help="head crops per frame")
+    parser.add_argument("--frame-size", default="1920x1080", help="WxH of the synthetic frame")
+    parser.add_argument("--ckpt", default="", help="ReID checkpoint (random weights when empty)")
+    parser.add_argument("--forward", action="store_true", help="also time the ReID forward pass")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--iters", type=int, default=20, help="timed runs per crop count")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed runs per crop count")
+    parser.add_argument("--device", default="cpu", help="cpu or cuda")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--input-tolerance", type=float, default=1e-4, help="max |difference| of the input batches")
+    parser.add_argument("--feature-tolerance", type=float, default=1e-4, help="max cosine distance of the features")
+    parser.add_argument("--output", default="", help="write results JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    torch.set_num_threads(args.threads)
+    cv2.setNumThreads(args.threads)
+    width, height = (int(v) for v in args.frame_size.lower().split("x"))
+    frame = synthetic_frame(width, height, args.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_reid_") as workdir:
+        extractor = build_extractor(args.ckpt, args.device, Path(workdir), args.seed)
+        tracker = DeepSort(args.ckpt, extractor=extractor)
+        for count in args.crops:
+            boxes = head_boxes(count, width, height, args.seed + count)
+            result = run_config(extractor, tracker, frame, boxes, args.iters, args.warmup, args.forward)
+            results.append(result)
+            print(f"done crops={count} speedup={result['speedup']}", file=sys.stderr)
+
+    failed = [
+        r["crops"]
+        for r in results
+        if r["parity"]["input_max_abs"] > args.input_tolerance
+        or r["parity"]["feature_max_cosine_distance"] > args.feature_tolerance
+    ]
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "ckpt": args.ckpt or "random",
+            "args": vars(args),
+        },
+        "results": results,
+        "parity_failures": failed,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print_table(results)
+    if failed:
+        print(f"\nParity outside tolerance for crop counts: {failed}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,389 @@
+"""Tracker strategy benchmark: counting accuracy versus cost (people counting).
+
+Replays a head detection sequence through every strategy of
+tracking/strategies.py (deepsort, sort, centroid) and counts line crossings
+with the people counting rule (a track is counted once, bottom -> top is IN
+and top -> bottom is OUT, against a horizontal line at --line-y). For each
+strategy it reports:
+
+    IN/OUT      the counts, and their error against the ground truth
+    id switches times a ground-truth person's matched track id changes
+    ms/frame    p50/p95 of the strategy's `update`; with --reid, the ReID
+                crops and forward pass deepsort needs are timed and added
+
+The ground truth is the same counting rule applied to the sequence's
+`object_id`s. deepsort uses the sequence's `feature`s for association, so its
+accuracy does not depend on the ReID net used for timing (random weights
+unless --ckpt).
+
+The sequences are synthetic by default: --people heads in view on average,
+walking up or down across the line at about --speed px per frame (raise it
+to mimic a low sampling rate), with missed detections, low-confidence
+clutter and noisy ReID-like features. A recorded one can be replayed with
+--sequence: an .npz with the arrays of bench_association.py (`frame`,
+`tlwh`, `confidence`, `feature`) plus `object_id` (-1 for clutter; without
+it only the counts are reported). Examples (from AI/):
+
+    python benchmarks/bench_trackers.py --people 1,3,10,30 --output trackers.json
+    python benchmarks/bench_trackers.py --sequence recorded_heads.npz --line-y 600 --reid
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+AI_DIR = Path(__file__).resolve().parent.parent
+SERVICE_DIR = AI_DIR / "people_count"  # tracking/ (the strategies, DeepSort and the ReID extractor)
+sys.path.insert(0, str(SERVICE_DIR))
+
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+from tracking import strategies  # noqa: E402
+from tracking.deep_sort_pytorch.deep_sort.sort.iou_matching import iou_batch  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+WIDTH, HEIGHT = 1920, 1080
+
+
+# ============================ Sequences ============================
+
+
+def synthetic_sequence(
+    people: float, frames: int, seed: int, mean_speed: float = 12.0, dim: int = 512
+) -> Dict[str, np.ndarray]:
+    """Heads walking up or down across a 1920x1080 frame at about `mean_speed` px
+    per frame, `people` of them in view on average, each with a noisy appearance
+    vector; 10% of them are missed per frame and a few low-confidence clutter
+    boxes appear."""
+    rng = np.random.default_rng(seed)
+    spawn_rate = people * mean_speed / HEIGHT  # arrivals per frame for `people` in view
+    walkers: List[Dict[str, Any]] = []
+    next_object = 0
+    rows: Dict[str, List[Any]] = {"frame": [], "tlwh": [], "confidence": [], "feature": [], "object_id": []}
+    for f in range(frames):
+        for _ in range(rng.poisson(spawn_rate)):
+            up = rng.random() < 0.5
+            walkers.append(
+                {
+                    "id": next_object,
+                    "pos": np.array([rng.uniform(100, WIDTH - 100), HEIGHT + 20.0 if up else -20.0]),
+                    "vel": np.array([rng.normal(0, 4), -1 if up else 1]) * [1, rng.uniform(0.5, 1.5) * mean_speed],
+                    "size": rng.uniform(30, 70),
+                    "appearance": rng.normal(size=dim),
+                }
+            )
+            next_object += 1
+        for walker in walkers:
+            walker["pos"] += walker["vel"] + rng.normal(0, 2, 2)
+        walkers = [w for w in walkers if -40 <= w["pos"][1] <= HEIGHT + 40]
+        for walker in walkers:
+            if rng.random() < 0.1:
+                continue
+            w = walker["size"] * rng.uniform(0.9, 1.1)
+            x, y = walker["pos"]
+            rows["tlwh"].append((x - w / 2, y - 0.6 * w, w, 1.2 * w))
+            rows["feature"].append(walker["appearance"] + rng.normal(0, 0.35, dim))
+            rows["confidence"].append(rng.uniform(0.5, 1.0))
+            rows["object_id"].append(walker["id"])
+            rows["frame"].append(f)
+        for _ in range(rng.integers(0, 3)):
+            x, y = rng.uniform((0, 0), (WIDTH, HEIGHT))
+            rows["tlwh"].append((x, y, 30.0, 36.0))
+            rows["feature"].append(rng.normal(size=dim))
+            rows["confidence"].append(rng.uniform(0.3, 0.6))
+            rows["object_id"].append(-1)
+            rows["frame"].append(f)
+    return {
+        "frame": np.asarray(rows["frame"], dtype=np.int64),
+        "tlwh": np.asarray(rows["tlwh"], dtype=np.float64).reshape(-1, 4),
+        "confidence": np.asarray(rows["confidence"], dtype=np.float64),
+        "feature": np.asarray(rows["feature"], dtype=np.float32).reshape(-1, dim),
+        "object_id": np.asarray(rows["object_id"], dtype=np.int64),
+    }
+
+
+def load_sequence(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        sequence = {key: data[key] for key in ("frame", "tlwh", "confidence", "feature")}
+        if "object_id" in data:
+            sequence["object_id"] = data["object_id"]
+    return sequence
+
+
+def frames_of(sequence: Dict[str, np.ndarray]) -> List[np.ndarray]:
+    """Row indices of the sequence per frame (frames without detections included)."""
+    count = int(sequence["frame"].max()) + 1 if len(sequence["frame"]) else 0
+    order = np.argsort(sequence["frame"], kind="stable")
+    bounds = np.searchsorted(sequence["frame"][order], np.arange(count + 1))
+    return [order[bounds[f] : bounds[f + 1]] for f in range(count)]
+
+
+# ============================ Counting ============================
+
+
+class LineCounter:
+    """people_count's crossing rule for a horizontal line: once per track id."""
+
+    def __init__(self, line_y: float):
+        self.line_y = line_y
+        self.last: Dict[int, float] = {}
+        self.counted: set = set()
+        self.in_count = 0
+        self.out_count = 0
+
+    def update(self, track_id: int, cy: float) -> None:
+        prev = self.last.get(track_id)
+        self.last[track_id] = cy
+        if prev is None or track_id in self.counted:
+            return
+        if prev - self.line_y > 0 >= cy - self.line_y:
+            self.in_count += 1
+            self.counted.add(track_id)
+        elif prev - self.line_y < 0 <= cy - self.line_y:
+            self.out_count += 1
+            self.counted.add(track_id)
+
+
+def ground_truth_counts(sequence: Dict[str, np.ndarray], frames: List[np.ndarray], line_y: float) -> Tuple[int, int]:
+    counter = LineCounter(line_y)
+    for rows in frames:
+        for r in rows:
+            object_id = int(sequence["object_id"][r])
+            if object_id >= 0:
+                x, y, w, h = sequence["tlwh"][r]
+                counter.update(object_id, y + h / 2)
+    return counter.in_count, counter.out_count
+
+
+def match_objects(outputs: np.ndarray, tlwh: np.ndarray, object_ids: np.ndarray, min_iou: float = 0.5) -> Dict[int, int]:
+    """Greedily pair the frame's output tracks with its ground-truth heads by IoU: object id -> track id."""
+    keep = object_ids >= 0
+    tlwh, object_ids = tlwh[keep], object_ids[keep]
+    if len(outputs) == 0 or len(tlwh) == 0:
+        return {}
+    track_tlwh = outputs[:, :4].astype(np.float64)
+    track_tlwh[:, 2:] -= track_tlwh[:, :2]
+    iou = iou_batch(track_tlwh, tlwh)
+    pairs: Dict[int, int] = {}
+    used_tracks, used_objects = set(), set()
+    for flat in np.argsort(-iou, axis=None):
+        t, o = np.unravel_index(flat, iou.shape)
+        if iou[t, o] < min_iou:
+            break
+        if t in used_tracks or o in used_objects:
+            continue
+        used_tracks.add(t)
+        used_objects.add(o)
+        pairs[int(object_ids[o])] = int(outputs[t, 4])
+    return pairs
+
+
+# ============================ Replay ============================
+
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms or [0.0], dtype=np.float64)
+    summary = {f"p{q}": round(float(np.percentile(arr, q)), 3) for q in PERCENTILES}
+    summary.update(mean=round(float(arr.mean()), 3), n=len(samples_ms))
+    return summary
+
+
+def run_strategy(
+    mode: str,
+    sequence: Dict[str, np.ndarray],
+    frames: List[np.ndarray],
+    image: np.ndarray,
+    extractor: Any,
+    args: argparse.Namespace,
+) -> Dict[str, Any]:
+    tracker = strategies.create(
+        mode,
+        extractor=extractor,
+        max_dist=args.max_dist,
+        min_confidence=args.min_confidence,
+        nms_max_overlap=args.nms_max_overlap,
+        max_iou_distance=args.max_iou_distance,
+        max_age=args.max_age,
+        n_init=args.n_init,
+        nn_budget=args.nn_budget,
+        centroid_max_distance=args.centroid_max_distance,
+    )
+    has_truth = "object_id" in sequence
+    counter = LineCounter(args.line_y)
+    last_track: Dict[int, int] = {}
+    switches = 0
+    update_ms: List[float] = []
+    reid_ms: List[float] = []
+    for f, rows in enumerate(frames):
+        if len(rows) == 0:
+            tracker.increment_ages()
+            continue
+        tlwh = sequence["tlwh"][rows]
+        xywh = torch.tensor(np.c_[tlwh[:, :2] + tlwh[:, 2:] / 2, tlwh[:, 2:]], dtype=torch.float32)
+        confs = torch.tensor(sequence["confidence"][rows], dtype=torch.float32).unsqueeze(1)
+        features = sequence["feature"][rows] if tracker.uses_reid else None
+        if tracker.uses_reid and args.reid:
+            t0 = time.perf_counter()
+            extractor(tracker.crops(xywh, image))
+            if f >= args.warmup:
+                reid_ms.append((time.perf_counter() - t0) * 1000)
+        t0 = time.perf_counter()
+        outputs = np.asarray(tracker.update(xywh, confs, image, features=features))
+        if f >= args.warmup:
+            update_ms.append((time.perf_counter() - t0) * 1000)
+        for x1, y1, x2, y2, track_id in outputs.tolist():
+            counter.update(track_id, (y1 + y2) / 2.0)
+        if has_truth:
+            for object_id, track_id in match_objects(outputs, tlwh, sequence["object_id"][rows]).items():
+                if last_track.get(object_id, track_id) != track_id:
+                    switches += 1
+                last_track[object_id] = track_id
+
+    result: Dict[str, Any] = {
+        "in": counter.in_count,
+        "out": counter.out_count,
+        "tracks": tracker.next_id - 1,
+        "update_ms": summarize(update_ms),
+    }
+    if has_truth:
+        result["id_switches"] = switches
+    if reid_ms:
+        result["reid_ms"] = summarize(reid_ms)
+    cost = result["update_ms"]["mean"] + (result["reid_ms"]["mean"] if reid_ms else 0.0)
+    result["total_ms"] = round(cost, 3)
+    return result
+
+
+def run_sequence(name: str, sequence: Dict[str, np.ndarray], image: np.ndarray, extractor: Any, args) -> Dict[str, Any]:
+    frames = frames_of(sequence)
+    busy = [len(rows) for rows in frames]
+    result: Dict[str, Any] = {
+        "sequence": name,
+        "frames": len(frames),
+        "detections_per_frame": round(float(np.mean(busy)), 2) if busy else 0.0,
+    }
+    if "object_id" in sequence:
+        result["truth"] = dict(zip(("in", "out"), ground_truth_counts(sequence, frames, args.line_y)))
+    for mode in args.modes:
+        r = run_strategy(mode, sequence, frames, image, extractor, args)
+        if "truth" in result:
+            r["count_error"] = abs(r["in"] - result["truth"]["in"]) + abs(r["out"] - result["truth"]["out"])
+        result[mode] = r
+    return result
+
+
+def print_table(results: List[Dict[str, Any]], modes: List[str]) -> None:
+    header = f"{'sequence':>14}{'heads/frame':>13}{'tracker':>10}{'IN/OUT':>10}{'truth':>10}{'count err':>11}"
+    header += f"{'id switches':>13}{'update ms':>14}{'reid ms':>16}{'total ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        truth = r.get("truth")
+        for i, mode in enumerate(modes):
+            m = r[mode]
+            lead = f"{r['sequence']:>14}{r['detections_per_frame']:>13}" if i == 0 else " " * 27
+            reid = "%.2f/%.2f" % (m["reid_ms"]["p50"], m["reid_ms"]["p95"]) if "reid_ms" in m else "-"
+            print(
+                f"{lead}{mode:>10}{'%d/%d' % (m['in'], m['out']):>10}"
+                f"{('%d/%d' % (truth['in'], truth['out'])) if truth else '-':>10}"
+                f"{m.get('count_error', '-'):>11}{m.get('id_switches', '-'):>13}"
+                f"{'%.2f/%.2f' % (m['update_ms']['p50'], m['update_ms']['p95']):>14}{reid:>16}{m['total_ms']:>10.2f}"
+            )
+    print("(update and reid are p50/p95 ms per frame, total is their mean; count err is |dIN|+|dOUT|)")
+
+
+# ============================ CLI ============================
+
+
+def _csv(cast: Callable[[str], Any]) -> Callable[[str], List[Any]]:
+    return lambda value: [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--modes", type=_csv(str), default=list(strategies.MODES), help="strategies to compare")
+    parser.add_argument("--people", type=_csv(float), default=[1, 3, 10, 30], help="heads in view on average (synthetic)")
+    parser.add_argument("--frames", type=int, default=600, help="frames per synthetic sequence")
+    parser.add_argument("--speed", type=float, default=12.0, help="mean walking speed in px per frame (synthetic)")
+    parser.add_argument("--sequence", default="", help="replay this recorded .npz instead of synthetic sequences")
+    parser.add_argument("--save-sequence", default="", help="write the last synthetic sequence here (.npz)")
+    parser.add_argument("--line-y", type=float, default=HEIGHT / 2, help="y of the horizontal counting line")
+    parser.add_argument("--max-dist", type=float, default=0.2, help="DeepSort max_dist (cosine matching threshold)")
+    parser.add_argument("--min-confidence", type=float, default=0.3)
+    parser.add_argument("--nms-max-overlap", type=float, default=0.5)
+    parser.add_argument("--max-iou-distance", type=float, default=0.7)
+    parser.add_argument("--max-age", type=int, default=70)
+    parser.add_argument("--n-init", type=int, default=3)
+    parser.add_argument("--nn-budget", type=int, default=100)
+    parser.add_argument("--centroid-max-distance", type=float, default=2.0, help="in head heights")
+    parser.add_argument("--reid", action="store_true", help="time deepsort's ReID crops and forward pass")
+    parser.add_argument("--ckpt", default="", help="ReID checkpoint for --reid (random weights when empty)")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--warmup", type=int, default=10, help="frames left out of the timings")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="", help="write results JSON here")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    unknown = [m for m in args.modes if m not in strategies.MODES]
+    if unknown:
+        print(f"Unknown tracker modes: {unknown} (choose from {', '.join(strategies.MODES)})", file=sys.stderr)
+        return 2
+    torch.set_num_threads(args.threads)
+    if args.sequence:
+        sequences = [(Path(args.sequence).stem, load_sequence(args.sequence))]
+    else:
+        sequences = [
+            (f"{n:g} in view", synthetic_sequence(n, args.frames, args.seed + int(n * 10), args.speed)) for n in args.people
+        ]
+        if args.save_sequence:
+            np.savez_compressed(args.save_sequence, **sequences[-1][1])
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_trackers_") as workdir:
+        if args.reid:
+            from bench_reid import build_extractor, synthetic_frame
+
+            extractor = build_extractor(args.ckpt, "cpu", Path(workdir), args.seed)
+            image = synthetic_frame(WIDTH, HEIGHT, args.seed)
+        else:
+            # deepsort gets the sequence's features, so the ReID net is never called
+            extractor = lambda crops: np.zeros((0, 512), dtype=np.float32)  # noqa: E731
+            image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        for name, sequence in sequences:
+            result = run_sequence(name, sequence, image, extractor, args)
+            results.append(result)
+            print(f"done {name}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "numpy": np.__version__,
+            "ckpt": (args.ckpt or "random") if args.reid else None,
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    print_table(results, args.modes)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
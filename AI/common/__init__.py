@@ -0,0 +1,13 @@
+"""Modules shared by every AI service (PPE, intrusion, people_count, worker).
+
+Each service imports them from here, e.g. ``from common import ingest``, so a
+fix is made once for all of them. They read their settings from the running
+service's ``config`` module, and the detector and tracking code from its
+``models/``, ``utils/`` and ``tracking/`` packages, so a service must run with
+both its own directory and ``AI/`` on the import path: locally ``dev_envs``
+puts ``..`` on ``PYTHONPATH``, and the Dockerfiles copy this package next to
+the service's code.
+
+Nothing is imported here: ``app.py`` imports ``common.startup`` first so the
+start-up clock covers the service's own imports.
+"""
@@ -0,0 +1,283 @@
+"""Pooled, self-healing MySQL access for the AI services.
+
+* A small thread-safe pool of `mysql.connector` connections (DB_POOL_SIZE),
+  opened lazily, so pipeline threads and the main loop never share one
+  connection.
+* A connection that fails with an operational/interface error (server gone
+  away, timeout, restart) is dropped and the query is retried on a fresh one:
+  the first retry is immediate, later ones back off exponentially up to
+  DB_RETRY_BACKOFF_MAX. Queries are only retried when `retry=True` (reads).
+* Named queries run on prepared cursors cached per connection, so hot
+  statements are parsed by the server once per connection.
+* Every query is timed into a per-name latency histogram, summarised on the
+  performance logger by `log_latency_summary()`; extra hooks can be added
+  with `add_query_hook(fn)` and are called as fn(name, latency_ms, rows, error).
+
+Connections use autocommit so each read sees committed changes.
+"""
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import mysql.connector
+from mysql.connector import errors as mysql_errors
+
+import config as cfg
+from common.http_client import LatencyHistogram
+
+# Errors after which a connection is considered broken and replaced
+_RECONNECT_ERRORS = (mysql_errors.OperationalError, mysql_errors.InterfaceError)
+
+QueryHook = Callable[[str, float, int, Optional[BaseException]], None]
+
+
+class _Connection:
+    """A raw connection plus its prepared cursors, keyed by query name."""
+
+    def __init__(self, cnx: Any):
+        self.cnx = cnx
+        self.statements: Dict[str, Any] = {}
+
+    def cursor(self, name: str, prepared: bool) -> Any:
+        if not prepared:
+            return self.cnx.cursor(dictionary=True)
+        cursor = self.statements.get(name)
+        if cursor is None:
+            cursor = self.cnx.cursor(prepared=True, dictionary=True)
+            self.statements[name] = cursor
+        return cursor
+
+    def close(self) -> None:
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        self.statements.clear()
+        try:
+            self.cnx.close()
+        except Exception:
+            pass
+
+
+class Database:
+    """Connection pool with reconnect/backoff, prepared statements and query timing."""
+
+    def __init__(
+        self,
+        pool_size: int = 4,
+        pool_timeout: float = 10.0,
+        connect_timeout: int = 5,
+        retries: int = 3,
+        retry_backoff: float = 0.5,
+        retry_backoff_max: float = 10.0,
+        prepared: bool = True,
+    ):
+        self.pool_size = max(1, int(pool_size))
+        self.pool_timeout = float(pool_timeout)
+        self.connect_timeout = int(connect_timeout)
+        self.retries = max(0, int(retries))
+        self.retry_backoff = float(retry_backoff)
+        self.retry_backoff_max = float(retry_backoff_max)
+        self.prepared = prepared
+
+        self._idle: "queue.LifoQueue[_Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._hooks: List[QueryHook] = []
+        self._histograms: Dict[str, LatencyHistogram] = {}
+
+    # --------------------------------------------------------- connections
+
+    def _connect(self) -> _Connection:
+        cnx = mysql.connector.connect(
+            host=cfg.MYSQL_HOST,
+            user=cfg.MYSQL_USER,
+            password=cfg.MYSQL_PASS,
+            database=cfg.MYSQL_DB_NAME,
+            port=cfg.MYSQL_PORT,
+            connection_timeout=self.connect_timeout,
+            autocommit=True,
+        )
+        cfg.logger.info("MySQL connection opened | host=%s db=%s", cfg.MYSQL_HOST, cfg.MYSQL_DB_NAME)
+        return _Connection(cnx)
+
+    def _acquire(self) -> _Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_open = self._opened < self.pool_size
+            if can_open:
+                self._opened += 1
+        if can_open:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise mysql_errors.PoolError(
+                f"No free MySQL connection after {self.pool_timeout}s (pool_size={self.pool_size})"
+            )
+
+    def _release(self, conn: _Connection) -> None:
+        self._idle.put(conn)
+
+    def _discard(self, conn: _Connection) -> None:
+        conn.close()
+        with self._lock:
+            self._opened -= 1
+
+    # -------------------------------------------------------------- queries
+
+    def _run(
+        self,
+        name: str,
+        sql: str,
+        params: Sequence[Any],
+        fetch: bool,
+        retry: bool,
+        prepared: Optional[bool],
+    ) -> Any:
+        use_prepared = self.prepared if prepared is None else prepared
+        attempts = 1 + (self.retries if retry else 0)
+        for attempt in range(attempts):
+            t0 = time.time()
+            conn = None
+            try:
+                conn = self._acquire()
+                cursor = conn.cursor(name, use_prepared)
+                try:
+                    cursor.execute(sql, tuple(params))
+                    result = cursor.fetchall() if fetch else cursor.rowcount
+                finally:
+                    if not use_prepared:
+                        cursor.close()
+                self._release(conn)
+                self._record(name, t0, len(result) if fetch else result, None)
+                return result
+            except _RECONNECT_ERRORS as e:
+                if conn is not None:
+                    self._discard(conn)
+                self._record(name, t0, 0, e)
+                if attempt + 1 >= attempts:
+                    raise
+                delay = 0.0 if attempt == 0 else min(
+                    self.retry_backoff * (2 ** (attempt - 1)), self.retry_backoff_max
+                )
+                cfg.logger.warning(
+                    "MySQL connection error on %s; reconnecting in %.1fs (attempt %d/%d) :: %s",
+                    name,
+                    delay,
+                    attempt + 1,
+                    attempts - 1,
+                    e,
+                )
+                time.sleep(delay)
+            except Exception as e:
+                # SQL/data errors leave the connection usable
+                if conn is not None:
+                    self._release(conn)
+                self._record(name, t0, 0, e)
+                raise
+
+    def query(
+        self,
+        name: str,
+        sql: str,
+        params: Sequence[Any] = (),
+        retry: bool = True,
+        prepared: Optional[bool] = None,
+    ) -> List[Dict[str, Any]]:
+        """Run a SELECT and return all rows as dicts. `name` labels timing and the prepared statement."""
+        return self._run(name, sql, params, fetch=True, retry=retry, prepared=prepared)
+
+    def query_one(
+        self,
+        name: str,
+        sql: str,
+        params: Sequence[Any] = (),
+        retry: bool = True,
+        prepared: Optional[bool] = None,
+    ) -> Optional[Dict[str, Any]]:
+        rows = self.query(name, sql, params, retry=retry, prepared=prepared)
+        return rows[0] if rows else None
+
+    def execute(
+        self,
+        name: str,
+        sql: str,
+        params: Sequence[Any] = (),
+        retry: bool = False,
+        prepared: Optional[bool] = None,
+    ) -> int:
+        """Run a write statement (autocommitted) and return the affected row count.
+
+        Writes are not retried unless the caller knows the statement is idempotent.
+        """
+        return self._run(name, sql, params, fetch=False, retry=retry, prepared=prepared)
+
+    # -------------------------------------------------------------- metrics
+
+    def add_query_hook(self, hook: QueryHook) -> None:
+        """Call `hook(name, latency_ms, rows, error)` after every query attempt."""
+        self._hooks.append(hook)
+
+    def _record(self, name: str, t0: float, rows: int, error: Optional[BaseException]) -> None:
+        latency_ms = (time.time() - t0) * 1000
+        hist = self._histograms.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._histograms.setdefault(name, LatencyHistogram())
+        hist.record(latency_ms, error=error is not None)
+        for hook in self._hooks:
+            try:
+                hook(name, latency_ms, rows, error)
+            except Exception as e:
+                cfg.logger.warning("DB query hook failed: %s", e)
+
+    def log_latency_summary(self) -> None:
+        """Log p50/p95/max per query name since the previous summary, then reset."""
+        for name, hist in sorted(self._histograms.items()):
+            snap = hist.snapshot(reset=True)
+            if not snap["count"]:
+                continue
+            cfg.perf_logger.info(
+                "db_latency query=%s count=%d errors=%d p50_ms<=%.0f p95_ms<=%.0f max_ms=%.2f pool_open=%d",
+                name,
+                snap["count"],
+                snap["errors"],
+                snap["p50_ms"],
+                snap["p95_ms"],
+                snap["max_ms"],
+                self._opened,
+            )
+
+
+_db: Optional[Database] = None
+_db_lock = threading.Lock()
+
+
+def get_db() -> Database:
+    """Return the process-wide Database, created from config on first use."""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = Database(
+                    pool_size=cfg.DB_POOL_SIZE,
+                    pool_timeout=cfg.DB_POOL_TIMEOUT,
+                    connect_timeout=cfg.DB_CONNECT_TIMEOUT,
+                    retries=cfg.DB_RETRIES,
+                    retry_backoff=cfg.DB_RETRY_BACKOFF,
+                    retry_backoff_max=cfg.DB_RETRY_BACKOFF_MAX,
+                    prepared=cfg.DB_PREPARED_STATEMENTS,
+                )
+    return _db
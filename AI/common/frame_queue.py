@@ -0,0 +1,75 @@
+"""Client for the frames API claim queue (FRAME_SOURCE=claim).
+
+Instead of asking for the frame at "now minus one minute", a worker leases the
+next unprocessed frames of its cameras from CLAIM_URL and reports each one
+back to COMPLETE_URL once published. Leases expire after CLAIM_LEASE_SECONDS,
+so frames held by a crashed worker are handed out again.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List
+
+import config as cfg
+from common.http_client import get_client
+
+
+def _format_frame_time(value: Any) -> str:
+    """Normalise an API datetime to the "%Y-%m-%d %H:%M:%S" form used for status updates."""
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return str(value)
+
+
+def claim_frames(usecase: str, camera_ids: List[int]) -> List[Dict[str, Any]]:
+    """Lease up to CLAIM_BATCH_SIZE frames for the given cameras, oldest first.
+
+    Returns a list of dicts with id, camera_id, frame_time, frame_data and
+    lease_token. An empty list means there is nothing to do (or the call failed).
+    """
+    if not camera_ids:
+        return []
+    payload = {
+        "usecase": usecase,
+        "worker_id": cfg.WORKER_ID,
+        "camera_ids": [int(c) for c in camera_ids],
+        "limit": cfg.CLAIM_BATCH_SIZE,
+        "lease_seconds": cfg.CLAIM_LEASE_SECONDS,
+        "lookback_seconds": cfg.CLAIM_LOOKBACK_SECONDS,
+    }
+    cfg.logger.debug("Claiming frames | url=%s payload=%s", cfg.CLAIM_URL, payload)
+    try:
+        response = get_client().post("claim_frames", cfg.CLAIM_URL, json=payload)
+    except Exception as e:
+        cfg.logger.error("Claim API exception: %s", e)
+        return []
+    if response.status_code != 200:
+        cfg.logger.error(
+            "Claim API failed | status=%s body=%s",
+            response.status_code,
+            getattr(response, "text", ""),
+        )
+        return []
+
+    frames = response.json().get("frames", [])
+    for frame in frames:
+        frame["frame_time"] = _format_frame_time(frame.get("frame_time"))
+    cfg.logger.info(
+        "Claimed %d frame(s) | usecase=%s cameras=%s", len(frames), usecase, camera_ids
+    )
+    return frames
+
+
+def complete_frame(usecase: str, ctx: Dict[str, Any], status: str = "DONE") -> None:
+    """Report a claimed frame as DONE or FAILED. No-op for frames that were not claimed."""
+    lease_token = ctx.get("lease_token")
+    if not lease_token:
+        return
+    payload = {
+        "usecase": usecase,
+        "lease_token": lease_token,
+        "frame_ids": [int(ctx["frame_id"])],
+        "status": status,
+    }
+    cfg.logger.debug("Completing frame | url=%s payload=%s", cfg.COMPLETE_URL, payload)
+    get_client().post_async("complete_frames", cfg.COMPLETE_URL, json=payload)
@@ -0,0 +1,218 @@
+"""Shared HTTP client for backend calls made by the AI services.
+
+* One `requests.Session` with a keep-alive connection pool, so per-frame calls
+  reuse TCP connections instead of opening a new one every time.
+* Every call has a (connect, read) timeout; read timeouts can be set per
+  endpoint via HTTP_TIMEOUTS.
+* `post_async` hands fire-and-forget calls (frame status updates) to a single
+  background sender thread, which keeps them in submission order.
+* Per-endpoint latency histograms, summarised on the performance logger by
+  `log_latency_summary()` once per cycle.
+
+Callers keep their own error handling: `get/post/delete` return the
+`requests.Response` and raise the usual `requests` exceptions.
+"""
+
+import bisect
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config as cfg
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """Bucketed latency recorder; percentiles are reported as bucket upper bounds."""
+
+    def __init__(self, buckets_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.buckets_ms = buckets_ms
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self) -> None:
+        self.counts = [0] * (len(self.buckets_ms) + 1)
+        self.total = 0
+        self.errors = 0
+        self.max_ms = 0.0
+
+    def record(self, latency_ms: float, error: bool = False) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets_ms, latency_ms)] += 1
+            self.total += 1
+            self.errors += int(error)
+            self.max_ms = max(self.max_ms, latency_ms)
+
+    def _percentile(self, q: float) -> float:
+        target = q * self.total
+        seen = 0
+        for idx, cnt in enumerate(self.counts):
+            seen += cnt
+            if seen >= target and cnt:
+                return self.buckets_ms[idx] if idx < len(self.buckets_ms) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self, reset: bool = True) -> Dict[str, float]:
+        with self._lock:
+            snap = {
+                "count": self.total,
+                "errors": self.errors,
+                "p50_ms": self._percentile(0.50) if self.total else 0.0,
+                "p95_ms": self._percentile(0.95) if self.total else 0.0,
+                "max_ms": self.max_ms,
+            }
+            if reset:
+                self._reset()
+            return snap
+
+
+class BackendClient:
+    """Pooled session with per-endpoint timeouts, latency metrics and an async sender."""
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        endpoint_timeouts: Optional[Dict[str, float]] = None,
+        async_queue_size: int = 256,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        self.endpoint_timeouts = dict(endpoint_timeouts or {})
+
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._hist_lock = threading.Lock()
+
+        self._async_q: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, int(async_queue_size)))
+        self._sender = threading.Thread(target=self._send_loop, name="http-sender", daemon=True)
+        self._sender.start()
+
+    # ------------------------------------------------------------ sync API
+
+    def request(self, method: str, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request and record its latency under `endpoint`."""
+        kwargs.setdefault("timeout", self.timeout_for(endpoint))
+        t0 = time.time()
+        error = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            error = response.status_code >= 400
+            return response
+        finally:
+            self._histogram(endpoint).record((time.time() - t0) * 1000, error=error)
+
+    def get(self, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("GET", endpoint, url, **kwargs)
+
+    def post(self, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", endpoint, url, **kwargs)
+
+    def delete(self, endpoint: str, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("DELETE", endpoint, url, **kwargs)
+
+    # ----------------------------------------------------------- async API
+
+    def post_async(self, endpoint: str, url: str, **kwargs: Any) -> None:
+        """Queue a POST for the background sender.
+
+        When the queue is full the call is sent inline instead of being dropped,
+        which keeps status updates lossless while bounding memory.
+        """
+        try:
+            self._async_q.put_nowait(("POST", endpoint, url, kwargs))
+        except queue.Full:
+            cfg.logger.warning(
+                "HTTP async queue full (%d); sending %s inline", self._async_q.maxsize, endpoint
+            )
+            self._send(("POST", endpoint, url, kwargs))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait up to `timeout` seconds for queued async calls to be sent."""
+        deadline = time.time() + timeout
+        while self._async_q.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return not self._async_q.unfinished_tasks
+
+    def _send_loop(self) -> None:
+        while True:
+            item = self._async_q.get()
+            try:
+                self._send(item)
+            finally:
+                self._async_q.task_done()
+
+    def _send(self, item: tuple) -> None:
+        method, endpoint, url, kwargs = item
+        try:
+            response = self.request(method, endpoint, url, **kwargs)
+            if response.status_code >= 400:
+                cfg.logger.error(
+                    "Async %s failed | url=%s status=%s body=%s",
+                    endpoint,
+                    url,
+                    response.status_code,
+                    getattr(response, "text", "")[:200],
+                )
+        except Exception as e:
+            cfg.logger.error("Async %s exception | url=%s error=%s", endpoint, url, e)
+
+    # ------------------------------------------------------------- metrics
+
+    def timeout_for(self, endpoint: str) -> Tuple[float, float]:
+        return self.connect_timeout, self.endpoint_timeouts.get(endpoint, self.read_timeout)
+
+    def _histogram(self, endpoint: str) -> LatencyHistogram:
+        hist = self._histograms.get(endpoint)
+        if hist is None:
+            with self._hist_lock:
+                hist = self._histograms.setdefault(endpoint, LatencyHistogram())
+        return hist
+
+    def log_latency_summary(self) -> None:
+        """Log p50/p95/max per endpoint since the previous summary, then reset."""
+        for endpoint, hist in sorted(self._histograms.items()):
+            snap = hist.snapshot(reset=True)
+            if not snap["count"]:
+                continue
+            cfg.perf_logger.info(
+                "http_latency endpoint=%s count=%d errors=%d p50_ms<=%.0f p95_ms<=%.0f max_ms=%.2f async_pending=%d",
+                endpoint,
+                snap["count"],
+                snap["errors"],
+                snap["p50_ms"],
+                snap["p95_ms"],
+                snap["max_ms"],
+                self._async_q.qsize(),
+            )
+
+
+_client: Optional[BackendClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> BackendClient:
+    """Return the process-wide BackendClient, created from config on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = BackendClient(
+                    pool_size=cfg.HTTP_POOL_SIZE,
+                    connect_timeout=cfg.HTTP_CONNECT_TIMEOUT,
+                    read_timeout=cfg.HTTP_READ_TIMEOUT,
+                    endpoint_timeouts=cfg.HTTP_TIMEOUTS,
+                    async_queue_size=cfg.HTTP_ASYNC_QUEUE_SIZE,
+                )
+    return _client
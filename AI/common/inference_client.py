@@ -0,0 +1,67 @@
+"""Client for the shared micro-batching inference server (AI/inference_server.py).
+
+With INFERENCE_SERVER_URL set, `model_init.load_model_from_path` returns a
+`RemoteDetector` instead of a local model. It exposes `names` and a
+`detect()` method that `my_utils.run_detector` calls, so `predict`,
+`predict_batch`, `predict_raw` and `detect_batch` work unchanged. Frames are
+sent letterboxed (uint8 HWC, see preprocess.py) in one
+``POST /v1/detect/<model>`` request and boxes come back in model input
+pixels; the caller rescales them with its cached geometry.
+"""
+
+import os
+from typing import List, Optional
+
+import numpy as np
+import torch
+
+from common.http_client import get_client
+
+
+def model_key(weight_path: str) -> str:
+    """Name a weights file is served under: its file name."""
+    return os.path.basename(weight_path)
+
+
+class RemoteDetector:
+    """Stand-in for a local model that runs detection on the inference server."""
+
+    backend = "remote"
+
+    def __init__(self, url: str, weight_path: str):
+        self.url = url.rstrip("/")
+        self.key = model_key(weight_path)
+        response = get_client().get("inference_models", f"{self.url}/v1/models")
+        response.raise_for_status()
+        models = response.json()
+        if self.key not in models:
+            raise KeyError(f"{self.key} is not served by {self.url} (serving {sorted(models)})")
+        self.names = models[self.key]["names"]
+
+    def detect(
+        self,
+        imgs: List[np.ndarray],
+        conf_thres: float,
+        iou_thres: float,
+        classes: Optional[List[int]] = None,
+    ) -> List[torch.Tensor]:
+        """Send same-shape letterboxed frames in one request; returns detections per frame."""
+        body = np.stack(imgs)
+        params = {"conf": conf_thres, "iou": iou_thres}
+        if classes is not None:
+            params["classes"] = ",".join(str(int(c)) for c in classes)
+        response = get_client().post(
+            "inference",
+            f"{self.url}/v1/detect/{self.key}",
+            params=params,
+            data=body.tobytes(),
+            headers={
+                "Content-Type": "application/octet-stream",
+                "X-Shape": ",".join(str(d) for d in body.shape),
+            },
+        )
+        response.raise_for_status()
+        return [
+            torch.tensor(dets, dtype=torch.float32).reshape(-1, 6)
+            for dets in response.json()["detections"]
+        ]
@@ -0,0 +1,439 @@
+"""Pluggable inference backends for the YOLOv5 detectors.
+
+Selected with INFERENCE_BACKEND:
+
+* ``eager``       – the fused PyTorch model, run under ``torch.inference_mode``.
+* ``torchscript`` – ``torch.jit.trace`` per input shape (B, H, W).
+* ``onnxruntime`` – ONNX export per (H, W) with a dynamic batch axis, run on
+  the ONNX Runtime CPU provider (needs ``onnx`` and ``onnxruntime``).
+* ``onnxruntime_int8`` – the ONNX export quantized to INT8 (see
+  quantization.py); a shape only uses it when its mAP drop against fp32 is
+  within INFERENCE_INT8_MAX_MAP_DROP, otherwise it runs eager.
+
+INFERENCE_HALF=1 runs fp16 where the backend/device supports it (CUDA for
+eager and TorchScript); it is ignored elsewhere.
+
+Compiled artifacts are cached next to the ``.pt`` weights and keyed by a
+short hash of the weights, e.g. ``ppe.1a2b3c4d5e.b1x384x640.torchscript.pt``,
+so a new weights file never reuses a stale export. The fused fp32 model every
+backend starts from is cached the same way (``ppe.1a2b3c4d5e.fused.pt``, see
+`load_fused_model`).
+
+Every engine is a drop-in replacement for the model object used by
+``predict``: calling it returns a tuple whose first element is the raw
+prediction tensor, and it exposes ``names``. The first time a compiled engine
+sees a new input shape it compares its boxes against eager output on that
+frame (and on INFERENCE_PARITY_SAMPLES at load time); on a mismatch that
+shape falls back to eager.
+"""
+
+import glob
+import hashlib
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import torch
+import torch.nn as nn
+
+import config as cfg
+from common import preprocess, startup
+from models.common import Conv
+from utils.activations import Hardswish, SiLU
+from utils.general import box_iou, non_max_suppression
+
+
+_digests: Dict[Tuple[str, int, int], str] = {}
+
+
+def weights_digest(weight_path: str, length: int = 10) -> str:
+    """Short sha1 of the weights file, used to key cached artifacts.
+
+    Memoized per (path, size, mtime), so a start-up hashes each file once.
+    """
+    st = os.stat(weight_path)
+    key = (os.path.abspath(weight_path), st.st_size, st.st_mtime_ns)
+    digest = _digests.get(key)
+    if digest is None:
+        sha = hashlib.sha1()
+        with open(weight_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+        digest = _digests[key] = sha.hexdigest()
+    return digest[:length]
+
+
+def fused_model_path(weight_path: str) -> str:
+    """Where the fused model for `weight_path` is cached."""
+    stem, _ = os.path.splitext(weight_path)
+    return f"{stem}.{weights_digest(weight_path)}.fused.pt"
+
+
+def load_fused_model(weight_path: str, map_location: Any) -> nn.Module:
+    """The fused fp32 eval-mode model for a training checkpoint.
+
+    Unpickling the checkpoint (optimizer state, EMA, ...) and fusing conv+bn
+    dominate a cold start, so with INFERENCE_FUSED_CACHE on the result is
+    saved once next to the weights and later starts load it directly. The
+    cache is keyed by the weights digest; an unreadable artifact is rebuilt.
+    """
+    path = fused_model_path(weight_path) if cfg.INFERENCE_FUSED_CACHE else None
+    if path and os.path.exists(path):
+        try:
+            model = torch.load(path, map_location=map_location)["model"].eval()
+            cfg.logger.info("Loaded cached fused model: %s", path)
+            startup.note("fused_cache", "hit")
+            return model
+        except Exception as e:
+            cfg.logger.warning("Cached fused model %s unreadable (%s); rebuilding", path, e)
+    model = torch.load(weight_path, map_location=map_location)["model"].float().fuse().eval()
+    if path:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            torch.save({"model": model, "weights": os.path.basename(weight_path)}, tmp)
+            os.replace(tmp, path)
+            cfg.logger.info("Cached fused model: %s", path)
+        except OSError as e:
+            cfg.logger.warning("Could not cache fused model %s: %s", path, e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    startup.note("fused_cache", "miss" if path else "off")
+    return model
+
+
+def _prepare_for_export(model: nn.Module) -> nn.Module:
+    """Swap in export-friendly activations, as models/export.py does."""
+    for _, m in model.named_modules():
+        m._non_persistent_buffers_set = set()  # pytorch 1.6.0 compatibility
+        if isinstance(m, Conv):
+            if isinstance(m.act, nn.Hardswish):
+                m.act = Hardswish()
+            elif isinstance(m.act, nn.SiLU):
+                m.act = SiLU()
+    return model
+
+
+def boxes_match(
+    ref: Optional[torch.Tensor], test: Optional[torch.Tensor], iou_thres: float
+) -> bool:
+    """True when both NMS outputs hold the same boxes (same class, IoU >= iou_thres)."""
+    n_ref = 0 if ref is None else len(ref)
+    n_test = 0 if test is None else len(test)
+    if n_ref != n_test:
+        return False
+    if n_ref == 0:
+        return True
+    ious = box_iou(ref[:, :4].float(), test[:, :4].float())
+    best_iou, best_idx = ious.max(1)
+    same_cls = ref[:, 5] == test[best_idx, 5]
+    return bool(((best_iou >= iou_thres) & same_cls).all())
+
+
+class EagerEngine:
+    """Fused PyTorch model under inference_mode, optionally in fp16 on CUDA."""
+
+    backend = "eager"
+
+    def __init__(self, model: nn.Module, device: torch.device, half: bool = False):
+        self.device = device
+        self.half = bool(half) and device.type != "cpu"
+        self.model = model.half() if self.half else model
+        self.names = model.module.names if hasattr(model, "module") else model.names
+        self.stride = model.stride
+
+    def __call__(self, img: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        with torch.inference_mode():
+            out = self.model(img.half() if self.half else img.float())
+        return (out[0].float(),) + tuple(out[1:])
+
+
+class _CompiledEngine:
+    """Shared shape cache, parity check and eager fallback for compiled backends."""
+
+    backend = "compiled"
+
+    def __init__(self, eager: EagerEngine, weight_path: str):
+        self.eager = eager
+        self.device = eager.device
+        self.half = eager.half
+        self.names = eager.names
+        self.stride = eager.stride
+        self.weight_path = weight_path
+        self.digest = weights_digest(weight_path)
+        self._runners: Dict[Tuple[int, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    # Subclasses implement _key, _build and _run
+    def _key(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        raise NotImplementedError
+
+    def _build(self, key: Tuple[int, ...], img: torch.Tensor) -> Any:
+        raise NotImplementedError
+
+    def _run(self, runner: Any, img: torch.Tensor) -> torch.Tensor:
+        raise NotImplementedError
+
+    def artifact_path(self, key: Tuple[int, ...], suffix: str) -> str:
+        stem, _ = os.path.splitext(self.weight_path)
+        dims = "x".join(str(d) for d in key)
+        precision = ".half" if self.half else ""
+        return f"{stem}.{self.digest}.{dims}{precision}.{suffix}"
+
+    def __call__(self, img: torch.Tensor) -> Tuple[torch.Tensor, ...]:
+        key = self._key(tuple(img.shape))
+        runner = self._runners.get(key)
+        if runner is None:
+            runner = self._prepare_shape(key, img)
+        if runner is self.eager:
+            return self.eager(img)
+        return (self._run(runner, img),)
+
+    def _prepare_shape(self, key: Tuple[int, ...], img: torch.Tensor) -> Any:
+        with self._lock:
+            if key in self._runners:
+                return self._runners[key]
+            try:
+                runner = self._build(key, img)
+                if (
+                    runner is not self.eager
+                    and cfg.INFERENCE_PARITY_CHECK
+                    and not self._parity_ok(runner, img)
+                ):
+                    cfg.logger.warning(
+                        "%s parity check failed for shape %s; using eager for this shape",
+                        self.backend,
+                        key,
+                    )
+                    runner = self.eager
+            except Exception as e:
+                cfg.logger.exception(
+                    "%s build failed for shape %s; using eager: %s", self.backend, key, e
+                )
+                runner = self.eager
+            self._runners[key] = runner
+            return runner
+
+    def _parity_ok(self, runner: Any, img: torch.Tensor) -> bool:
+        conf, iou = float(cfg.MODEL_CONF), float(cfg.MODEL_IOU)
+        ref = non_max_suppression(self.eager(img)[0], conf, iou)
+        test = non_max_suppression(self._run(runner, img).float(), conf, iou)
+        ok = all(boxes_match(r, t, cfg.INFERENCE_PARITY_IOU) for r, t in zip(ref, test))
+        cfg.perf_logger.info(
+            "parity_check backend=%s shape=%s boxes_ref=%d boxes_test=%d ok=%s",
+            self.backend,
+            tuple(img.shape),
+            sum(0 if r is None else len(r) for r in ref),
+            sum(0 if t is None else len(t) for t in test),
+            ok,
+        )
+        return ok
+
+
+class TorchScriptEngine(_CompiledEngine):
+    """torch.jit.trace per (B, H, W); the Detect grid is baked into each trace."""
+
+    backend = "torchscript"
+
+    def _key(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return (shape[0], shape[2], shape[3])
+
+    def _build(self, key: Tuple[int, ...], img: torch.Tensor) -> Any:
+        path = self.artifact_path(("b%d" % key[0],) + key[1:], "torchscript.pt")
+        if os.path.exists(path):
+            cfg.logger.info("Loading cached TorchScript module: %s", path)
+            return torch.jit.load(path, map_location=self.device)
+        cfg.logger.info("Tracing TorchScript module for shape %s -> %s", key, path)
+        model = _prepare_for_export(self.eager.model)
+        example = img.half() if self.half else img.float()
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example, strict=False)
+        traced = torch.jit.freeze(traced.eval()) if hasattr(torch.jit, "freeze") else traced
+        traced.save(path)
+        return traced
+
+    def _run(self, runner: Any, img: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            out = runner(img.half() if self.half else img.float())
+        return out[0].float()
+
+
+class OnnxRuntimeEngine(_CompiledEngine):
+    """ONNX Runtime (CPU provider); one export per (H, W), dynamic batch axis."""
+
+    backend = "onnxruntime"
+
+    def __init__(self, eager: EagerEngine, weight_path: str):
+        import onnxruntime  # noqa: F401  (fail early when the optional dependency is missing)
+
+        super().__init__(eager, weight_path)
+        self.half = False  # fp16 is not supported on the CPU provider
+
+    def _key(self, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        return (shape[2], shape[3])
+
+    def _export(self, key: Tuple[int, ...], img: torch.Tensor, opset: int = 12) -> str:
+        suffix = "onnx" if opset == 12 else f"opset{opset}.onnx"
+        path = self.artifact_path(key, suffix)
+        if not os.path.exists(path):
+            cfg.logger.info("Exporting ONNX model for shape %s -> %s", key, path)
+            model = _prepare_for_export(self.eager.model).float()
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    img[:1].float(),
+                    path,
+                    verbose=False,
+                    opset_version=opset,
+                    input_names=["images"],
+                    output_names=["output"],
+                    dynamic_axes={"images": {0: "batch"}, "output": {0: "batch"}},
+                )
+        else:
+            cfg.logger.info("Loading cached ONNX model: %s", path)
+        return path
+
+    def _session(self, path: str) -> Any:
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if cfg.INFERENCE_THREADS > 0:
+            options.intra_op_num_threads = cfg.INFERENCE_THREADS
+        return onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def _build(self, key: Tuple[int, ...], img: torch.Tensor) -> Any:
+        return self._session(self._export(key, img))
+
+    def _run(self, runner: Any, img: torch.Tensor) -> torch.Tensor:
+        feed = {runner.get_inputs()[0].name: img.float().cpu().numpy()}
+        out = runner.run([runner.get_outputs()[0].name], feed)[0]
+        return torch.from_numpy(out).to(img.device)
+
+
+class Int8OnnxRuntimeEngine(OnnxRuntimeEngine):
+    """ONNX Runtime INT8 (static or dynamic); accepted per shape by the mAP guardrail."""
+
+    backend = "onnxruntime_int8"
+
+    def _build(self, key: Tuple[int, ...], img: torch.Tensor) -> Any:
+        from common import quantization  # only this backend needs the calibration/metrics stack
+
+        mode = cfg.INFERENCE_INT8_MODE
+        int8_path = self.artifact_path(key, f"int8-{mode}.onnx")
+        report_path = quantization.report_path(int8_path)
+        report = quantization.load_report(report_path)
+        if report is None or "error" in report or not os.path.exists(int8_path):
+            # QDQ with per-channel scales needs opset 13
+            fp32_path = self._export(key, img, opset=13)
+            calib_paths, eval_paths = quantization.split_frames(
+                quantization.frame_paths(cfg.INFERENCE_INT8_CALIBRATION),
+                cfg.INFERENCE_INT8_CALIBRATION_SIZE,
+                cfg.INFERENCE_INT8_EVAL_SIZE,
+            )
+            report = {
+                "weights": self.weight_path,
+                "digest": self.digest,
+                "shape": list(key),
+                "mode": mode,
+                "calibration_frames": len(calib_paths),
+            }
+            try:
+                quantization.quantize(
+                    fp32_path, int8_path, mode, quantization.load_frames(calib_paths, key)
+                )
+                report.update(
+                    quantization.evaluate(
+                        self.eager,
+                        self._session(fp32_path),
+                        self._session(int8_path),
+                        quantization.load_frames(eval_paths, key),
+                    )
+                )
+            except Exception as e:
+                report["error"] = str(e)
+
+        # Re-judged on every load, so changing the threshold needs no re-quantization
+        report["max_map_drop"] = cfg.INFERENCE_INT8_MAX_MAP_DROP
+        report["accepted"] = quantization.accepted(report, cfg.INFERENCE_INT8_MAX_MAP_DROP)
+        quantization.save_report(report_path, report)
+        quantization.log_report(report)
+        if not report["accepted"]:
+            cfg.logger.warning(
+                "INT8 model refused for shape %s (map50_drop=%s, max=%s, error=%s); using eager fp32",
+                key,
+                report.get("map50_drop"),
+                cfg.INFERENCE_INT8_MAX_MAP_DROP,
+                report.get("error"),
+            )
+            return self.eager
+        return self._session(int8_path)
+
+    def _parity_ok(self, runner: Any, img: torch.Tensor) -> bool:
+        # Box-exact parity is too strict for int8; the mAP guardrail in _build replaces it
+        return True
+
+
+_ENGINES = {
+    "torchscript": TorchScriptEngine,
+    "onnxruntime": OnnxRuntimeEngine,
+    "onnx": OnnxRuntimeEngine,
+    "onnxruntime_int8": Int8OnnxRuntimeEngine,
+    "int8": Int8OnnxRuntimeEngine,
+}
+
+
+def _sample_tensors(device: torch.device) -> List[torch.Tensor]:
+    """Letterboxed INFERENCE_PARITY_SAMPLES images, for load-time warm-up and parity."""
+    pattern = cfg.INFERENCE_PARITY_SAMPLES
+    if not pattern:
+        return []
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.jpg")
+    tensors = []
+    for path in sorted(glob.glob(pattern))[:8]:
+        img0 = cv2.imread(path)
+        if img0 is None:
+            continue
+        img = preprocess.letterbox_frame(img0, int(cfg.IMAGE_SIZE))[0]
+        # batch_tensor returns a reused buffer; samples are kept, so copy out
+        tensors.append(preprocess.batch_tensor([img], device).clone())
+    return tensors
+
+
+def create_engine(
+    model: nn.Module,
+    weight_path: str,
+    device: torch.device,
+    backend: str = "eager",
+    half: bool = False,
+):
+    """Wrap a loaded model in the requested backend, falling back to eager on error."""
+    backend = (backend or "eager").strip().lower()
+    if half and device.type == "cpu":
+        cfg.logger.info("INFERENCE_HALF ignored on CPU; running fp32")
+    if cfg.INFERENCE_THREADS > 0 and device.type == "cpu":
+        torch.set_num_threads(cfg.INFERENCE_THREADS)
+
+    eager = EagerEngine(model, device, half=half)
+    engine_cls = _ENGINES.get(backend)
+    if engine_cls is None:
+        if backend != "eager":
+            cfg.logger.warning("Unknown INFERENCE_BACKEND=%s; using eager", backend)
+        cfg.logger.info("Inference backend: eager (half=%s)", eager.half)
+        return eager
+
+    try:
+        engine = engine_cls(eager, weight_path)
+    except Exception as e:
+        cfg.logger.warning("Inference backend %s unavailable (%s); using eager", backend, e)
+        return eager
+
+    # Build/verify the sample shapes up front so the first real frames do not pay for it
+    for sample in _sample_tensors(device):
+        engine(sample)
+    cfg.logger.info(
+        "Inference backend: %s (half=%s, digest=%s)", engine.backend, engine.half, engine.digest
+    )
+    return engine
@@ -0,0 +1,341 @@
+"""Fast frame ingest: local reads and reduced-resolution JPEG decode.
+
+* When the frame's disk path exists (the frames volume is shared with the
+  frames API) it is read directly instead of over HTTP, with one read into a
+  per-thread reusable buffer or through mmap (INGEST_READ_MODE). HTTP is used
+  when the file is not local; disk stays the fallback when HTTP fails.
+* JPEG frames are decoded at 1/2, 1/4 or 1/8 scale (IMREAD_REDUCED_COLOR_*,
+  i.e. libjpeg DCT scaling) whenever the reduced frame is still at least
+  IMAGE_SIZE on its long side, so the letterbox still only downsamples. The
+  source size comes from the JPEG SOF header, before anything is decoded.
+
+A loaded frame carries `scale` (original pixels per decoded pixel), `shape`
+(original h, w, c) and the cached letterbox `geometry` (see preprocess.py).
+Detectors rescale boxes through the geometry to `shape`, so boxes, ROIs and
+stored results stay in original-frame coordinates; code that draws on the
+frame at full resolution uses `full_frame(ctx)`.
+
+Mappings that select ROI-cropped inference (`crop_selected`) load with their
+ROI boxes/polygons: the frame is then letterboxed as one crop per ROI region
+(preprocess.crop_regions / letterbox_tiles) and `img` / `geometry` are lists,
+one entry per crop. The crops share ROI_CROP_PIXEL_BUDGET times the model
+pixels of the full-frame letterbox, at no less than its resolution, and the
+JPEG reduction is chosen so the crops keep that resolution.
+
+Model inputs are rectangular, stride-aligned shapes fitted to each camera's
+aspect ratio (preprocess.py; INFERENCE_RECT=0 pads to a square instead).
+`attach` remembers each camera's input shape, logging it with its padding
+share when it first appears or changes, and `by_input_shape` orders a cycle's
+frame contexts by that shape, so pipeline batches mostly hold frames of one
+shape and run as one forward pass.
+"""
+
+import mmap
+import os
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+import config as cfg
+from common import preprocess
+from common.http_client import get_client
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# SOFn markers carry the frame size; C4 (DHT), C8 (JPG) and CC (DAC) do not
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+_local = threading.local()
+
+# camera id -> model input shape(s) of its latest frame
+_input_shapes: Dict[Any, Tuple[Tuple[int, int], ...]] = {}
+_input_shapes_lock = threading.Lock()
+
+# (ROI boxes, ROI polygons) in original-frame pixels, either may be empty
+CropRois = Tuple[Sequence[Sequence[float]], Sequence[Sequence[Sequence[float]]]]
+
+
+class LoadedFrame(NamedTuple):
+    img: Union[np.ndarray, List[np.ndarray]]  # letterboxed HWC BGR model input, or one per ROI crop
+    img0: np.ndarray  # decoded BGR frame, possibly reduced
+    scale: float  # original pixels per decoded pixel
+    shape: Tuple[int, int, int]  # original (h, w, c)
+    source: Tuple[str, str]  # ("disk", path) or ("http", url)
+    geometry: Union[preprocess.Geometry, List[preprocess.Geometry]]  # for rescaling boxes, per crop if cropped
+
+
+def crop_selected(roi_type: Any) -> bool:
+    """Whether a mapping's `roi_type` selects ROI-cropped inference.
+
+    "crop" and "full" choose explicitly; anything else (usually NULL) follows
+    ROI_CROP_DEFAULT.
+    """
+    mode = str(roi_type or "").strip().lower()
+    if mode not in ("crop", "full"):
+        mode = cfg.ROI_CROP_DEFAULT
+    return mode == "crop"
+
+
+def crop_regions(crop: Optional[CropRois], frame_hw: Tuple[int, int]) -> Optional[List[Tuple[int, int, int, int]]]:
+    """preprocess.crop_regions with the ROI_CROP_* settings (None: infer on the full frame)."""
+    if not crop:
+        return None
+    boxes, polygons = crop
+    return preprocess.crop_regions(
+        boxes, polygons, frame_hw, cfg.ROI_CROP_MARGIN, cfg.ROI_CROP_MAX_AREA, cfg.ROI_CROP_MAX_TILES
+    )
+
+
+# ============================ Reading ============================
+
+
+def _buffer(size: int) -> bytearray:
+    """Per-thread read buffer, grown when a larger frame arrives."""
+    buf = getattr(_local, "buf", None)
+    if buf is None or len(buf) < size:
+        buf = bytearray(max(size, int(len(buf or b"") * 1.5)))
+        _local.buf = buf
+    return buf
+
+
+def _with_local_bytes(path: str, fn: Callable[[np.ndarray], Any]) -> Any:
+    """Call `fn` with the file's bytes as a uint8 array that is only valid during the call."""
+    if cfg.INGEST_READ_MODE == "mmap":
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                return fn(np.frombuffer(mm, dtype=np.uint8))
+            finally:
+                try:
+                    mm.close()
+                except BufferError:
+                    # The array is still referenced (e.g. by the traceback of an
+                    # error raised in `fn`); it unmaps the file when released, and
+                    # that error propagates unchanged
+                    pass
+
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        if size == 0:
+            return None
+        buf = _buffer(size)
+        view = memoryview(buf)
+        got = 0
+        while got < size:
+            n = os.readv(fd, [view[got:size]])
+            if n == 0:
+                break
+            got += n
+        return fn(np.frombuffer(buf, dtype=np.uint8, count=got))
+    finally:
+        os.close(fd)
+
+
+def _with_http_bytes(url: str, fn: Callable[[np.ndarray], Any]) -> Any:
+    response = get_client().get("load_image", url)
+    if response.status_code != 200:
+        cfg.logger.error("Error in load_image :: HTTP %s for %s", response.status_code, url)
+        return None
+    return fn(np.frombuffer(response.content, dtype=np.uint8))
+
+
+def _with_bytes(source: Tuple[str, str], fn: Callable[[np.ndarray], Any]) -> Any:
+    kind, location = source
+    if kind == "disk":
+        return _with_local_bytes(location, fn)
+    return _with_http_bytes(location, fn)
+
+
+# ============================ Decoding ============================
+
+
+def jpeg_size(data: Any) -> Optional[Tuple[int, int]]:
+    """Return (width, height) from a JPEG's SOF header, or None if not a JPEG."""
+    view = memoryview(data)
+    n = len(view)
+    if n < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    i = 2
+    while i + 8 < n:
+        if view[i] != 0xFF:
+            i += 1
+            continue
+        marker = view[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in _SOF_MARKERS:
+            height = (view[i + 5] << 8) | view[i + 6]
+            width = (view[i + 7] << 8) | view[i + 8]
+            return (width, height) if width and height else None
+        if marker == 0xDA:  # start of scan without a frame header
+            return None
+        i += 2 + ((view[i + 2] << 8) | view[i + 3])
+    return None
+
+
+def reduction_for(width: int, height: int, img_size: int, max_reduction: int) -> int:
+    """Largest JPEG reduction whose output still covers `img_size` on the long side."""
+    factor = 1
+    for k in (2, 4, 8):
+        if k <= max_reduction and -(-max(width, height) // k) >= img_size:
+            factor = k
+    return factor
+
+
+def decode(
+    data: np.ndarray, img_size: int, max_reduction: int, crop: Optional[CropRois] = None
+) -> Optional[Tuple[np.ndarray, float, Tuple[int, int, int]]]:
+    """Decode a frame, reduced when possible. Returns (img0, scale, original shape).
+
+    With `crop` the reduction is limited by the resolution the crops are
+    letterboxed at (preprocess.crop_scale) instead of the whole frame.
+    """
+    size = jpeg_size(data) if max_reduction > 1 else None
+    factor = 1
+    if size:
+        width, height = size
+        regions = crop_regions(crop, (height, width))
+        if regions:
+            ratio = preprocess.crop_scale(regions, (height, width), img_size, cfg.ROI_CROP_PIXEL_BUDGET)
+            factor = max(k for k in (1, 2, 4, 8) if k <= max_reduction and k * ratio <= 1)
+        else:
+            factor = reduction_for(width, height, img_size, max_reduction)
+    img0 = cv2.imdecode(data, _REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    if img0 is None:
+        return None
+    if factor == 1:
+        return img0, 1.0, img0.shape
+    width, height = size
+    return img0, width / img0.shape[1], (height, width, img0.shape[2])
+
+
+def letterbox(
+    img0: np.ndarray, scale: float, shape: Tuple[int, int, int], img_size: int, crop: Optional[CropRois] = None
+) -> Tuple[Any, Any]:
+    """Model input for a decoded frame: (canvas, geometry), or lists of them for its ROI crops."""
+    regions = crop_regions(crop, shape[:2])
+    if regions:
+        return preprocess.letterbox_tiles(img0, scale, shape, regions, img_size, cfg.ROI_CROP_PIXEL_BUDGET)
+    return preprocess.letterbox_frame(img0, img_size, shape, square=not cfg.INFERENCE_RECT)
+
+
+def _load(source: Tuple[str, str], img_size: int, crop: Optional[CropRois] = None) -> Optional[LoadedFrame]:
+    decoded = _with_bytes(source, lambda data: decode(data, img_size, cfg.INGEST_MAX_REDUCTION, crop))
+    if decoded is None:
+        return None
+    img0, scale, shape = decoded
+    img, geom = letterbox(img0, scale, shape, img_size, crop)
+    return LoadedFrame(img, img0, scale, shape, source, geom)
+
+
+def load_frame(
+    image_url: str, disk_path: str, img_size: int, crop: Optional[CropRois] = None
+) -> Optional[LoadedFrame]:
+    """Load a frame from the shared volume when it is local, else over HTTP.
+
+    Disk is tried again after an HTTP failure. Returns None when no source
+    could be read and decoded. `crop` (the mapping's ROI boxes and polygons,
+    for mappings where `crop_selected`) letterboxes the ROI crops instead of
+    the whole frame.
+    """
+    sources = []
+    local = bool(disk_path) and os.path.isfile(disk_path)
+    if local and cfg.INGEST_PREFER_LOCAL:
+        sources.append(("disk", disk_path))
+    if image_url:
+        sources.append(("http", image_url))
+    if local and not cfg.INGEST_PREFER_LOCAL:
+        sources.append(("disk", disk_path))
+
+    for source in sources:
+        try:
+            frame = _load(source, img_size, crop)
+        except Exception as e:
+            cfg.logger.error("Error in load_frame | source=%s :: %s", source, e)
+            frame = None
+        if frame is not None:
+            cfg.logger.debug(
+                "Frame loaded | source=%s decoded=%s original=%s scale=%.2f crops=%s",
+                source[0],
+                frame.img0.shape,
+                frame.shape,
+                frame.scale,
+                [g.offset + g.original_shape[1::-1] for g in frame.geometry]
+                if isinstance(frame.geometry, list)
+                else None,
+            )
+            return frame
+        cfg.logger.warning("Image load failed from %s: %s", source[0], source[1])
+    return None
+
+
+def attach(ctx: Dict[str, Any], frame: LoadedFrame) -> Dict[str, Any]:
+    """Store a loaded frame on a frame context."""
+    ctx.update(
+        img=frame.img,
+        img0=frame.img0,
+        frame_scale=frame.scale,
+        frame_shape=frame.shape,
+        frame_source=frame.source,
+        frame_geometry=frame.geometry,
+    )
+    if "camera_id" in ctx:
+        _note_input_shape(ctx["camera_id"], frame)
+    return ctx
+
+
+def _note_input_shape(camera_id: Any, frame: LoadedFrame) -> None:
+    """Remember the camera's input shape; log it when it is new or changed."""
+    geometries = frame.geometry if isinstance(frame.geometry, list) else [frame.geometry]
+    shapes = tuple(g.input_shape for g in geometries)
+    with _input_shapes_lock:
+        if _input_shapes.get(camera_id) == shapes:
+            return
+        _input_shapes[camera_id] = shapes
+    cfg.perf_logger.info(
+        "input_shape camera=%s frame=%dx%d input=%dx%d inputs=%d padding=%.1f%%",
+        camera_id,
+        frame.shape[1],
+        frame.shape[0],
+        shapes[0][1],
+        shapes[0][0],
+        len(shapes),
+        preprocess.padding_ratio(geometries) * 100,
+    )
+
+
+def by_input_shape(contexts: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Frame contexts ordered by their camera's last input shape (stable; unseen cameras first)."""
+    with _input_shapes_lock:
+        shapes = dict(_input_shapes)
+    return sorted(contexts, key=lambda ctx: shapes.get(ctx.get("camera_id"), ()))
+
+
+def full_frame(ctx: Dict[str, Any]) -> np.ndarray:
+    """Frame at original resolution, decoded on first use when img0 is reduced."""
+    if ctx.get("frame_scale", 1.0) == 1.0:
+        return ctx["img0"]
+    full = ctx.get("img0_full")
+    if full is None:
+        try:
+            decoded = _with_bytes(ctx["frame_source"], lambda data: decode(data, 0, 1))
+            full = decoded[0] if decoded is not None else None
+        except Exception as e:
+            cfg.logger.warning("Full-resolution decode failed: %s", e)
+        if full is None:
+            h, w = ctx["frame_shape"][:2]
+            full = cv2.resize(ctx["img0"], (w, h), interpolation=cv2.INTER_LINEAR)
+        ctx["img0_full"] = full
+    return full
@@ -0,0 +1,291 @@
+"""Lease-based camera ownership shared by every replica of a service (CAMERA_LEASES=1).
+
+The hash ring in sharding.py only splits cameras between the processes of one
+host. With leases, replicas on any number of hosts split the cameras through
+two MySQL tables (created on first use when LEASE_CREATE_TABLES is set):
+
+    CREATE TABLE ai_replica (
+        lease_group  VARCHAR(64)  NOT NULL,
+        replica_id   VARCHAR(191) NOT NULL,
+        heartbeat_at DATETIME(3)  NOT NULL,
+        PRIMARY KEY (lease_group, replica_id)
+    );
+    CREATE TABLE ai_camera_lease (
+        lease_group VARCHAR(64)  NOT NULL,
+        camera_id   BIGINT       NOT NULL,
+        owner       VARCHAR(191) NOT NULL DEFAULT '',
+        expires_at  DATETIME(3)  NOT NULL,
+        PRIMARY KEY (lease_group, camera_id)
+    );
+
+* Every replica (WORKER_ID) of a LEASE_GROUP heartbeats its `ai_replica` row and
+  extends its own leases to now + LEASE_TTL_SECONDS from a background thread,
+  every LEASE_HEARTBEAT_SECONDS.
+* Once per cycle `mine(cameras)` counts the replicas that heartbeated within
+  LEASE_TTL_SECONDS and aims for an even share, ceil(cameras / replicas):
+  below its share a replica claims expired or unowned leases, above it
+  (a replica joined) it releases the surplus for the others to claim.
+* A claim is a conditional UPDATE on an expired lease, so two replicas never
+  own the same camera; a replica that dies stops renewing and its cameras are
+  claimed by the others once its leases expire.
+* All times are the database's NOW(3), so host clocks need not agree.
+
+Each replica prefers the cameras ranked highest for it by rendezvous hashing,
+so the same replica tends to get the same cameras back after a rebalance. If
+MySQL cannot be reached, a replica keeps its last cameras only while its
+leases are still valid, then processes nothing until it can renew them.
+"""
+
+import atexit
+import hashlib
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import config as cfg
+from common.db import get_db
+
+
+def _rank(replica_id: str, camera_id: int) -> int:
+    """Rendezvous-hash preference of a replica for a camera (higher is preferred)."""
+    digest = hashlib.blake2b(f"{replica_id}:{camera_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class LeaseManager:
+    """Heartbeats one replica and keeps its share of the camera leases of a group."""
+
+    def __init__(
+        self,
+        group: str,
+        replica_id: str,
+        ttl: float = 60.0,
+        heartbeat: float = 15.0,
+        replica_table: str = "ai_replica",
+        lease_table: str = "ai_camera_lease",
+    ):
+        self.group = group
+        self.replica_id = replica_id
+        self.ttl = float(ttl)
+        self.heartbeat = max(1.0, float(heartbeat))
+        self.replica_table = replica_table
+        self.lease_table = lease_table
+
+        self._db = get_db()
+        self._owned: Set[int] = set()
+        self._renewed_at = 0.0
+        self._started = False
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------ lifecycle
+
+    def start(self) -> None:
+        """Create the tables if configured, heartbeat once and start the renew thread."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if cfg.LEASE_CREATE_TABLES:
+            self._create_tables()
+        try:
+            self._renew()
+        except Exception as e:
+            cfg.logger.error("Lease heartbeat failed :: %s", e)
+        threading.Thread(target=self._renew_loop, name="lease-heartbeat", daemon=True).start()
+        atexit.register(self.release_all)
+        cfg.logger.info(
+            "Camera leases started | group=%s replica=%s ttl=%.0fs heartbeat=%.0fs",
+            self.group,
+            self.replica_id,
+            self.ttl,
+            self.heartbeat,
+        )
+
+    def _create_tables(self) -> None:
+        try:
+            self._db.execute(
+                "lease_create_replicas",
+                f"CREATE TABLE IF NOT EXISTS {self.replica_table} ("
+                "lease_group VARCHAR(64) NOT NULL, replica_id VARCHAR(191) NOT NULL, "
+                "heartbeat_at DATETIME(3) NOT NULL, PRIMARY KEY (lease_group, replica_id))",
+                prepared=False,
+            )
+            self._db.execute(
+                "lease_create_leases",
+                f"CREATE TABLE IF NOT EXISTS {self.lease_table} ("
+                "lease_group VARCHAR(64) NOT NULL, camera_id BIGINT NOT NULL, "
+                "owner VARCHAR(191) NOT NULL DEFAULT '', expires_at DATETIME(3) NOT NULL, "
+                "PRIMARY KEY (lease_group, camera_id))",
+                prepared=False,
+            )
+        except Exception as e:
+            cfg.logger.warning("Could not create the lease tables (create them by hand, see leases.py) :: %s", e)
+
+    def _renew_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat):
+            try:
+                self._renew()
+            except Exception as e:
+                cfg.logger.warning("Lease heartbeat failed :: %s", e)
+
+    def _renew(self) -> None:
+        """Heartbeat the replica row and extend every lease this replica holds."""
+        started = time.monotonic()
+        self._db.execute(
+            "lease_heartbeat",
+            f"INSERT INTO {self.replica_table} (lease_group, replica_id, heartbeat_at) VALUES (%s, %s, NOW(3)) "
+            "ON DUPLICATE KEY UPDATE heartbeat_at = NOW(3)",
+            (self.group, self.replica_id),
+            retry=True,
+        )
+        self._db.execute(
+            "lease_renew",
+            f"UPDATE {self.lease_table} SET expires_at = NOW(3) + INTERVAL %s SECOND "
+            "WHERE lease_group = %s AND owner = %s",
+            (self.ttl, self.group, self.replica_id),
+            retry=True,
+        )
+        self._renewed_at = started
+
+    def release_all(self) -> None:
+        """Hand every lease back and drop the replica row (on a clean exit)."""
+        self._stop.set()
+        try:
+            self._db.execute(
+                "lease_release_all",
+                f"UPDATE {self.lease_table} SET owner = '', expires_at = NOW(3) WHERE lease_group = %s AND owner = %s",
+                (self.group, self.replica_id),
+            )
+            self._db.execute(
+                "lease_leave",
+                f"DELETE FROM {self.replica_table} WHERE lease_group = %s AND replica_id = %s",
+                (self.group, self.replica_id),
+            )
+            cfg.logger.info("Released camera leases | group=%s replica=%s", self.group, self.replica_id)
+        except Exception as e:
+            cfg.logger.warning("Could not release camera leases :: %s", e)
+
+    # -------------------------------------------------------------- balance
+
+    def mine(self, cameras: Iterable[Dict[str, Any]], key: str = "id") -> List[Dict[str, Any]]:
+        """The cameras (rows with an `id`) whose leases this replica holds after rebalancing."""
+        self.start()
+        cameras = list(cameras)
+        ids = sorted({int(c[key]) for c in cameras if c.get(key) is not None})
+        try:
+            owned, replicas = self._balance(ids)
+        except Exception as e:
+            cfg.logger.error("Camera lease balance failed :: %s", e)
+            # Keep the last cameras only while their leases cannot have expired
+            valid = time.monotonic() - self._renewed_at < self.ttl
+            owned, replicas = (self._owned if valid else set()), 0
+        self._log_changes(owned, len(ids), replicas)
+        return [c for c in cameras if c.get(key) is not None and int(c[key]) in owned]
+
+    def _balance(self, ids: List[int]) -> Tuple[Set[int], int]:
+        db = self._db
+        # Forget replicas that stopped long ago (a restarted process gets a new WORKER_ID)
+        db.execute(
+            "lease_forget_replicas",
+            f"DELETE FROM {self.replica_table} WHERE lease_group = %s AND heartbeat_at < NOW(3) - INTERVAL %s SECOND",
+            (self.group, self.ttl * 10),
+        )
+        row = db.query_one(
+            "lease_replicas",
+            f"SELECT COUNT(*) AS n FROM {self.replica_table} "
+            "WHERE lease_group = %s AND heartbeat_at > NOW(3) - INTERVAL %s SECOND",
+            (self.group, self.ttl),
+        )
+        replicas = max(1, int(row["n"]) if row else 1)
+        rows = db.query(
+            "lease_rows",
+            f"SELECT camera_id, owner, expires_at > NOW(3) AS live FROM {self.lease_table} WHERE lease_group = %s",
+            (self.group,),
+        )
+        leases = {int(r["camera_id"]): (r["owner"], bool(r["live"])) for r in rows}
+
+        missing = [c for c in ids if c not in leases]
+        if missing:
+            # One multi-row statement per new batch of cameras, so not prepared
+            db.execute(
+                "lease_add_cameras",
+                f"INSERT IGNORE INTO {self.lease_table} (lease_group, camera_id, owner, expires_at) VALUES "
+                + ", ".join(["(%s, %s, '', NOW(3))"] * len(missing)),
+                [v for c in missing for v in (self.group, c)],
+                prepared=False,
+            )
+            leases.update({c: ("", False) for c in missing})
+
+        owned = {c for c in ids if leases[c] == (self.replica_id, True)}
+        target = math.ceil(len(ids) / replicas) if ids else 0
+        if len(owned) < target:
+            free = sorted((c for c in ids if not leases[c][1]), key=lambda c: _rank(self.replica_id, c), reverse=True)
+            for camera_id in free:
+                if len(owned) >= target:
+                    break
+                if self._claim(camera_id):
+                    owned.add(camera_id)
+        elif len(owned) > target:
+            surplus = sorted(owned, key=lambda c: _rank(self.replica_id, c))[: len(owned) - target]
+            for camera_id in surplus:
+                self._release(camera_id)
+                owned.discard(camera_id)
+        return owned, replicas
+
+    def _claim(self, camera_id: int) -> bool:
+        """Take an expired lease; False when another replica got it first."""
+        return (
+            self._db.execute(
+                "lease_claim",
+                f"UPDATE {self.lease_table} SET owner = %s, expires_at = NOW(3) + INTERVAL %s SECOND "
+                "WHERE lease_group = %s AND camera_id = %s AND expires_at <= NOW(3)",
+                (self.replica_id, self.ttl, self.group, camera_id),
+            )
+            == 1
+        )
+
+    def _release(self, camera_id: int) -> None:
+        self._db.execute(
+            "lease_release",
+            f"UPDATE {self.lease_table} SET owner = '', expires_at = NOW(3) "
+            "WHERE lease_group = %s AND camera_id = %s AND owner = %s",
+            (self.group, camera_id, self.replica_id),
+        )
+
+    def _log_changes(self, owned: Set[int], total: int, replicas: int) -> None:
+        with self._lock:
+            previous, self._owned = self._owned, owned
+        if previous == owned:
+            return
+        cfg.logger.info(
+            "Replica %s leases %d of %d cameras (%d live replicas) | gained=%s lost=%s",
+            self.replica_id,
+            len(owned),
+            total,
+            replicas,
+            sorted(owned - previous),
+            sorted(previous - owned),
+        )
+
+
+_manager: Optional[LeaseManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> LeaseManager:
+    """Return the process-wide LeaseManager, created from config on first use."""
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                _manager = LeaseManager(
+                    group=cfg.LEASE_GROUP,
+                    replica_id=cfg.WORKER_ID,
+                    ttl=cfg.LEASE_TTL_SECONDS,
+                    heartbeat=cfg.LEASE_HEARTBEAT_SECONDS,
+                    replica_table=cfg.LEASE_REPLICA_TABLE,
+                    lease_table=cfg.LEASE_TABLE,
+                )
+    return _manager
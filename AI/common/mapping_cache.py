@@ -0,0 +1,218 @@
+"""Versioned in-process cache for the camera and usecase-mapping tables.
+
+The whole camera table and every usecase mapping are loaded in one bulk query
+each. Rows are indexed by (usecase_id, camera_id) and pre-parsed once per load
+through the `prepare` hook, so lookups during a cycle never touch MySQL. The
+active time window (status = 1, start_time_utc <= now <= end_time_utc) is
+evaluated in-process with the same semantics as the old per-camera SQL.
+
+`refresh()` is called once per cycle. At most every MAPPING_CACHE_CHECK_INTERVAL
+seconds it runs a single aggregate query over each table (the change token);
+tables are reloaded only when a token moves or the snapshot is older than
+MAPPING_CACHE_MAX_AGE. With MAPPING_CACHE_ENABLED=0 every refresh reloads.
+"""
+
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config as cfg
+
+
+def decode_labels(labels_field: Any) -> Any:
+    """Decode a mapping's `labels` column (JSON list/dict or comma-separated)."""
+    if not labels_field:
+        return []
+    try:
+        return json.loads(labels_field) if isinstance(labels_field, str) else labels_field
+    except Exception:
+        return [s.strip() for s in str(labels_field).split(",") if s.strip()]
+
+
+def _window_bound(value: Any, now: datetime) -> Optional[Any]:
+    """Return `value` in a form comparable with the matching view of `now`.
+
+    TIME columns come back as timedelta and are compared with the time of day,
+    which is how MySQL compares a TIME with UTC_TIMESTAMP(); DATETIME columns
+    are compared with the full timestamp.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (datetime, timedelta)):
+        return value
+    text = str(value).strip()
+    try:
+        return datetime.fromisoformat(text)
+    except ValueError:
+        pass
+    try:
+        h, m, s = (text.split(":") + ["0", "0"])[:3]
+        return timedelta(hours=int(h), minutes=int(m), seconds=float(s))
+    except ValueError:
+        return None
+
+
+def is_active(row: Dict[str, Any], now: Optional[datetime] = None) -> bool:
+    """True when the mapping is enabled and `now` (naive UTC) is inside its window."""
+    if row.get("status") != 1:
+        return False
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    start = _window_bound(row.get("start_time_utc"), now)
+    end = _window_bound(row.get("end_time_utc"), now)
+    if start is None or end is None:
+        # NULL bounds never satisfy the SQL comparison either
+        return False
+    time_of_day = now - now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_cmp = time_of_day if isinstance(start, timedelta) else now
+    end_cmp = time_of_day if isinstance(end, timedelta) else now
+    return start <= start_cmp and end >= end_cmp
+
+
+class MappingCache:
+    """Snapshot of the camera and mapping tables, refreshed on change.
+
+    `db` is the pooled `db.Database`; `prepare` is called on every mapping row
+    after a load so the service can attach its pre-parsed fields. Refreshes
+    and lookups happen on the main loop.
+    """
+
+    def __init__(
+        self,
+        db: Any,
+        prepare: Optional[Callable[[Dict[str, Any]], None]] = None,
+        enabled: bool = True,
+        check_interval: float = 10.0,
+        max_age: float = 300.0,
+    ):
+        self._db = db
+        self._prepare = prepare
+        self.enabled = enabled
+        self.check_interval = check_interval
+        self.max_age = max_age
+
+        self._cameras: List[Dict[str, Any]] = []
+        self._camera_by_id: Dict[int, Dict[str, Any]] = {}
+        # (usecase_id, camera_id) -> rows, newest id first
+        self._mappings: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        self._camera_token: Any = None
+        self._mapping_token: Any = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+
+    # ------------------------------------------------------------------ queries
+    def _tokens(self) -> Tuple[Any, Any]:
+        camera_row = self._db.query_one(
+            "camera_token",
+            f"SELECT COUNT(*) AS n, MAX(id) AS max_id FROM {cfg.CAMERA_TABLE_NAME}",
+        )
+        # The mapping table has no updated_at column, so in-place edits are
+        # caught with a checksum over the columns the workers read.
+        mapping_row = self._db.query_one(
+            "mapping_token",
+            "SELECT COUNT(*) AS n, MAX(id) AS max_id, "
+            "SUM(CRC32(CONCAT_WS('|', id, camera_id, usecase_id, status, "
+            "start_time_utc, end_time_utc, roi, line_roi, labels, roi_type, tracker))) AS checksum "
+            f"FROM {cfg.RESULT_MAPPING_TABLE_NAME}",
+        )
+        return (
+            (camera_row.get("n"), camera_row.get("max_id")),
+            (mapping_row.get("n"), mapping_row.get("max_id"), mapping_row.get("checksum")),
+        )
+
+    def _load(self) -> None:
+        t_start = time.time()
+        cameras = self._db.query(
+            "cameras_all", f"SELECT * FROM {cfg.CAMERA_TABLE_NAME}", prepared=False
+        )
+        rows = self._db.query(
+            "mappings_all",
+            f"SELECT * FROM {cfg.RESULT_MAPPING_TABLE_NAME} ORDER BY id DESC",
+            prepared=False,
+        )
+
+        mappings: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for row in rows:
+            try:
+                key = (int(row["usecase_id"]), int(row["camera_id"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+            if self._prepare is not None:
+                try:
+                    self._prepare(row)
+                except Exception as e:
+                    cfg.logger.warning("Failed to prepare mapping id=%s: %s", row.get("id"), e)
+            mappings.setdefault(key, []).append(row)
+
+        camera_by_id = {}
+        for camera in cameras:
+            try:
+                camera_by_id[int(camera["id"])] = camera
+            except (KeyError, TypeError, ValueError):
+                continue
+
+        self._cameras = cameras
+        self._camera_by_id = camera_by_id
+        self._mappings = mappings
+        self._loaded_at = time.time()
+        cfg.perf_logger.info(
+            "mapping_cache_load latency_ms=%.2f cameras=%d mappings=%d",
+            (self._loaded_at - t_start) * 1000,
+            len(cameras),
+            len(rows),
+        )
+
+    # ------------------------------------------------------------------ refresh
+    def refresh(self) -> None:
+        """Reload the snapshot if the tables changed. Errors keep the old snapshot."""
+        now = time.time()
+        if self.enabled and self._loaded_at and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            tokens = self._tokens()
+            stale = (
+                not self.enabled
+                or not self._loaded_at
+                or now - self._loaded_at >= self.max_age
+                or tokens != (self._camera_token, self._mapping_token)
+            )
+            if not stale:
+                return
+            self._load()
+            self._camera_token, self._mapping_token = tokens
+            cfg.logger.debug("Mapping cache reloaded | tokens=%s", tokens)
+        except Exception as e:
+            cfg.logger.error("Mapping cache refresh failed; using previous snapshot :: %s", e)
+
+    # ------------------------------------------------------------------ lookups
+    def cameras(self) -> List[Dict[str, Any]]:
+        return list(self._cameras)
+
+    def camera(self, camera_id: Any) -> Optional[Dict[str, Any]]:
+        return self._camera_by_id.get(int(camera_id))
+
+    def latest_mapping(self, usecase_id: Any, camera_id: Any) -> Optional[Dict[str, Any]]:
+        """Newest mapping row for the pair regardless of status/window (for logging)."""
+        rows = self._mappings.get((int(usecase_id), int(camera_id)))
+        return rows[0] if rows else None
+
+    def active_mapping(
+        self, usecase_id: Any, camera_id: Any, now: Optional[datetime] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Newest active mapping for the pair, as a shallow copy, or None."""
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        for row in self._mappings.get((int(usecase_id), int(camera_id)), []):
+            if is_active(row, now):
+                return dict(row)
+        return None
+
+    def active_camera_ids(self, usecase_id: Any, now: Optional[datetime] = None) -> List[int]:
+        """Camera ids that have an active mapping for `usecase_id`."""
+        now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        usecase_id = int(usecase_id)
+        return sorted(
+            camera_id
+            for (uc, camera_id), rows in self._mappings.items()
+            if uc == usecase_id and any(is_active(row, now) for row in rows)
+        )
@@ -0,0 +1,225 @@
+"""Per-camera change detection that skips inference on static frames.
+
+Most fixed cameras show the same empty scene for hours. Before a frame goes to
+the detector, `MotionGate.check` compares a small blurred grayscale copy of it
+(MOTION_GATE_WIDTH pixels wide) with the camera's rolling background, an
+exponential average of its earlier frames (MOTION_GATE_ALPHA). When the camera
+has ROI boxes or polygons, only pixels inside them count. A pixel has changed
+when it differs from the background by more than MOTION_GATE_PIXEL_THRESHOLD
+grey levels, and the frame is static when fewer than MOTION_GATE_MIN_CHANGED
+(a fraction) of the counted pixels changed.
+
+A static frame skips the detector, unless the camera has no result to stand in
+for it yet or MOTION_GATE_RECHECK_SECONDS have passed since its last detector
+run (a forced re-check, so results never go staler than that). The caller
+publishes `static_result` instead: the camera's last remembered result
+(MOTION_GATE_STATIC_RESULT=reuse) or an empty one (empty).
+
+`log_stats` writes one performance line per camera: frames seen, frames
+skipped and forced re-checks since the previous line, plus the skip ratio for
+that window and since start-up.
+"""
+
+import copy
+import math
+import threading
+import time
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+import config as cfg
+
+
+class _CameraState:
+    def __init__(self):
+        self.background: Optional[np.ndarray] = None
+        self.mask: Optional[np.ndarray] = None
+        self.mask_key: Any = None
+        self.last_run = 0.0
+        self.has_result = False
+        self.result: Any = None
+        self.frames = 0
+        self.skipped = 0
+        self.forced = 0
+        self.total_frames = 0
+        self.total_skipped = 0
+
+
+class MotionGate:
+    """Decide per camera whether a frame changed enough to run the detector."""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        width: int = 160,
+        pixel_threshold: float = 25.0,
+        min_changed: float = 0.005,
+        alpha: float = 0.1,
+        recheck_seconds: float = 900.0,
+        static_result: str = "reuse",
+    ):
+        self.enabled = enabled
+        self.width = max(8, int(width))
+        self.pixel_threshold = float(pixel_threshold)
+        self.min_changed = float(min_changed)
+        self.alpha = min(max(float(alpha), 0.0), 1.0)
+        self.recheck_seconds = float(recheck_seconds)
+        self.reuse = static_result == "reuse"
+        self._cameras: Dict[Hashable, _CameraState] = {}
+        self._lock = threading.Lock()
+
+    def _small(self, img0: np.ndarray) -> np.ndarray:
+        h, w = img0.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        small = cv2.resize(img0, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0).astype(np.float32)
+
+    @staticmethod
+    def _mask(
+        state: _CameraState,
+        small_shape: Tuple[int, int],
+        frame_shape: Sequence[int],
+        boxes: Optional[List[List[int]]],
+        polygons: Optional[List[List[Tuple[int, int]]]],
+    ) -> Optional[np.ndarray]:
+        """ROI mask on the small grid (None: whole frame), rebuilt only when the ROI changes."""
+        key = (
+            small_shape,
+            tuple(frame_shape[:2]),
+            tuple(tuple(b) for b in boxes or []),
+            tuple(tuple(tuple(p) for p in poly) for poly in polygons or []),
+        )
+        if state.mask_key == key:
+            return state.mask
+        mask = None
+        if boxes or polygons:
+            sh, sw = small_shape
+            sx, sy = sw / frame_shape[1], sh / frame_shape[0]
+            grid = np.zeros(small_shape, dtype=np.uint8)
+            for x1, y1, x2, y2 in boxes or []:
+                cv2.rectangle(
+                    grid,
+                    (int(x1 * sx), int(y1 * sy)),
+                    (math.ceil(x2 * sx), math.ceil(y2 * sy)),
+                    1,
+                    -1,
+                )
+            for poly in polygons or []:
+                if len(poly) >= 3:
+                    pts = np.round(np.asarray(poly, dtype=np.float64) * (sx, sy)).astype(np.int32)
+                    cv2.fillPoly(grid, [pts], 1)
+            mask = grid.astype(bool) if grid.any() else None
+        state.mask_key, state.mask = key, mask
+        return mask
+
+    def check(
+        self,
+        camera: Hashable,
+        img0: np.ndarray,
+        frame_shape: Sequence[int],
+        boxes: Optional[List[List[int]]] = None,
+        polygons: Optional[List[List[Tuple[int, int]]]] = None,
+    ) -> bool:
+        """True when the frame has to go through the detector.
+
+        `boxes` / `polygons` are the camera's ROI in original-frame pixels
+        (`frame_shape`); `img0` may be decoded at reduced resolution.
+        """
+        if not self.enabled:
+            return True
+        small = self._small(img0)
+        now = time.monotonic()
+        with self._lock:
+            state = self._cameras.setdefault(camera, _CameraState())
+            state.frames += 1
+            state.total_frames += 1
+            if state.background is None or state.background.shape != small.shape:
+                state.background = small
+                run = True
+            else:
+                changed = cv2.absdiff(small, state.background) > self.pixel_threshold
+                mask = self._mask(state, small.shape, frame_shape, boxes, polygons)
+                ratio = float(changed[mask].mean() if mask is not None else changed.mean())
+                cv2.accumulateWeighted(small, state.background, self.alpha)
+                run = ratio >= self.min_changed or not state.has_result
+                if not run and now - state.last_run >= self.recheck_seconds:
+                    run = True
+                    state.forced += 1
+                cfg.logger.debug(
+                    "motion_gate camera=%s changed_ratio=%.4f run=%s", camera, ratio, run
+                )
+            if run:
+                state.last_run = now
+            else:
+                state.skipped += 1
+                state.total_skipped += 1
+            return run
+
+    def remember(self, camera: Hashable, result: Any) -> None:
+        """Store the detector's result for the camera; None (failed) forces the next run.
+
+        A copy is kept, since publishing may filter or relabel the result in place.
+        """
+        if not self.enabled:
+            return
+        stored = copy.deepcopy(result) if self.reuse else None
+        with self._lock:
+            state = self._cameras.setdefault(camera, _CameraState())
+            state.has_result = result is not None
+            state.result = stored
+
+    def static_result(self, camera: Hashable, empty: Any) -> Any:
+        """What a skipped frame publishes: a copy of the last result, or `empty`."""
+        with self._lock:
+            state = self._cameras.get(camera)
+            result = state.result if state is not None else None
+        return copy.deepcopy(result) if self.reuse and result is not None else empty
+
+    def log_stats(self) -> None:
+        """One performance line per camera seen since the previous call, then reset."""
+        if not self.enabled:
+            return
+        with self._lock:
+            rows = []
+            for camera, state in self._cameras.items():
+                if state.frames:
+                    rows.append(
+                        (camera, state.frames, state.skipped, state.forced, state.total_frames, state.total_skipped)
+                    )
+                    state.frames = state.skipped = state.forced = 0
+        for camera, frames, skipped, forced, total_frames, total_skipped in rows:
+            cfg.perf_logger.info(
+                "motion_gate camera=%s frames=%d skipped=%d forced=%d skip_ratio=%.2f total_skip_ratio=%.2f",
+                camera,
+                frames,
+                skipped,
+                forced,
+                skipped / frames,
+                total_skipped / total_frames,
+            )
+
+
+_gate: Optional[MotionGate] = None
+_gate_lock = threading.Lock()
+
+
+def get_gate() -> MotionGate:
+    """Return the process-wide MotionGate, created from config on first use."""
+    global _gate
+    if _gate is None:
+        with _gate_lock:
+            if _gate is None:
+                _gate = MotionGate(
+                    enabled=cfg.MOTION_GATE_ENABLED,
+                    width=cfg.MOTION_GATE_WIDTH,
+                    pixel_threshold=cfg.MOTION_GATE_PIXEL_THRESHOLD,
+                    min_changed=cfg.MOTION_GATE_MIN_CHANGED,
+                    alpha=cfg.MOTION_GATE_ALPHA,
+                    recheck_seconds=cfg.MOTION_GATE_RECHECK_SECONDS,
+                    static_result=cfg.MOTION_GATE_STATIC_RESULT,
+                )
+    return _gate
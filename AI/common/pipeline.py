@@ -0,0 +1,243 @@
+"""Staged concurrent runner for the detection loops.
+
+A cycle flows through three stages connected by bounded queues:
+
+    prepare (thread pool) -> infer (single worker) -> publish (worker threads)
+
+* prepare: frame lookup + JPEG decode/letterbox, network and CPU bound.
+* infer:   the only thread touching the model; drains up to `batch_size`
+           prepared frames per forward pass.
+* publish: copy/store/status HTTP calls.
+
+Bounded queues give back-pressure: when inference falls behind, prepare
+workers block on `put` instead of piling decoded frames up in memory. Queue
+depths are sampled on every inference batch and summarised per cycle on the
+performance logger so the bottleneck stage is visible.
+
+Prepare workers finish in any order, so frames reach the infer stage (and are
+split into its batches) in completion order. Order-sensitive callers, such as
+trackers fed several frames of one camera per cycle, pass `serial_key`: the
+frames sharing a key are then prepared one after the other by a single
+prepare task, and reach the infer stage in the order given to `run_cycle`.
+
+Mappings are resolved before `run_cycle`, on the caller's thread: that is
+where the mapping cache (mapping_cache.py) is refreshed, once per cycle and
+without a lock, so every frame of a cycle is resolved against one snapshot
+and the stages never query MySQL.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+import config as cfg
+
+
+class PipelineRunner:
+    """Run frame contexts through prepare -> infer -> publish stages.
+
+    Args:
+        name: Used for thread names and metric lines.
+        prepare_fn: ``ctx -> ctx | None``. Returns None when the frame should
+            be dropped (status updates for the drop are its responsibility).
+        infer_fn: ``[ctx, ...] -> [result, ...]`` aligned with its input.
+        publish_fn: ``(ctx, result) -> None``.
+        fetch_workers: Size of the prepare thread pool.
+        publish_workers: Number of publisher threads.
+        queue_size: Capacity of each inter-stage queue.
+        batch_size: Maximum number of frames handed to `infer_fn` at once.
+        serial_key: ``ctx -> key``. Contexts of a cycle with the same key are
+            prepared sequentially, in input order, and queued for inference in
+            that order (e.g. the frames of one camera for its tracker).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prepare_fn: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]],
+        infer_fn: Callable[[List[Dict[str, Any]]], List[Any]],
+        publish_fn: Callable[[Dict[str, Any], Any], None],
+        fetch_workers: int = 4,
+        publish_workers: int = 2,
+        queue_size: int = 16,
+        batch_size: int = 8,
+        serial_key: Optional[Callable[[Dict[str, Any]], Hashable]] = None,
+    ):
+        self.name = name
+        self.prepare_fn = prepare_fn
+        self.infer_fn = infer_fn
+        self.publish_fn = publish_fn
+        self.batch_size = max(1, int(batch_size))
+        self.serial_key = serial_key
+
+        self._infer_q: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._publish_q: "queue.Queue[tuple]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._fetch_pool = ThreadPoolExecutor(
+            max_workers=max(1, int(fetch_workers)), thread_name_prefix=f"{name}-prepare"
+        )
+
+        self._cond = threading.Condition()
+        self._pending = 0
+        self._prepare_inflight = 0
+        self._stats: Dict[str, float] = {}
+        self._reset_stats()
+
+        threading.Thread(target=self._infer_loop, name=f"{name}-infer", daemon=True).start()
+        for i in range(max(1, int(publish_workers))):
+            threading.Thread(
+                target=self._publish_loop, name=f"{name}-publish-{i}", daemon=True
+            ).start()
+
+        cfg.logger.info(
+            "Pipeline '%s' started | fetch_workers=%s publish_workers=%s queue_size=%s batch_size=%s serial=%s",
+            name,
+            fetch_workers,
+            publish_workers,
+            queue_size,
+            self.batch_size,
+            serial_key is not None,
+        )
+
+    # ------------------------------------------------------------------ API
+
+    def run_cycle(self, contexts: Iterable[Dict[str, Any]]) -> None:
+        """Push every context through the pipeline and block until all are published."""
+        contexts = list(contexts)
+        if not contexts:
+            return
+        t_start = time.time()
+        with self._cond:
+            self._reset_stats()
+            self._pending += len(contexts)
+        if self.serial_key is None:
+            for ctx in contexts:
+                self._fetch_pool.submit(self._prepare, ctx)
+        else:
+            groups: Dict[Hashable, List[Dict[str, Any]]] = {}
+            for ctx in contexts:
+                groups.setdefault(self.serial_key(ctx), []).append(ctx)
+            for group in groups.values():
+                self._fetch_pool.submit(self._prepare_serial, group)
+
+        with self._cond:
+            while self._pending > 0:
+                self._cond.wait()
+            stats = dict(self._stats)
+
+        cfg.perf_logger.info(
+            "pipeline_cycle name=%s frames=%d dropped=%d wall_ms=%.2f prepare_ms=%.2f infer_ms=%.2f "
+            "publish_ms=%.2f batches=%d infer_q_max=%d publish_q_max=%d",
+            self.name,
+            len(contexts),
+            stats["dropped"],
+            (time.time() - t_start) * 1000,
+            stats["prepare_ms"],
+            stats["infer_ms"],
+            stats["publish_ms"],
+            stats["batches"],
+            stats["infer_q_max"],
+            stats["publish_q_max"],
+        )
+
+    # -------------------------------------------------------------- stages
+
+    def _prepare(self, ctx: Dict[str, Any]) -> None:
+        with self._cond:
+            self._prepare_inflight += 1
+        t0 = time.time()
+        try:
+            ctx = self.prepare_fn(ctx)
+        except Exception as e:
+            cfg.logger.exception("Pipeline '%s' prepare stage failed: %s", self.name, e)
+            ctx = None
+        with self._cond:
+            self._prepare_inflight -= 1
+            self._stats["prepare_ms"] += (time.time() - t0) * 1000
+        if ctx is None:
+            with self._cond:
+                self._stats["dropped"] += 1
+            self._task_done()
+            return
+        # Blocks while the inference stage is saturated
+        self._infer_q.put(ctx)
+
+    def _prepare_serial(self, contexts: List[Dict[str, Any]]) -> None:
+        # Each frame is queued for inference before the next one is prepared
+        for ctx in contexts:
+            self._prepare(ctx)
+
+    def _infer_loop(self) -> None:
+        while True:
+            batch = [self._infer_q.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._infer_q.get_nowait())
+                except queue.Empty:
+                    break
+            self._sample_depths(len(batch))
+
+            t0 = time.time()
+            try:
+                results = self.infer_fn(batch)
+            except Exception as e:
+                cfg.logger.exception("Pipeline '%s' infer stage failed: %s", self.name, e)
+                results = None
+            if not results or len(results) != len(batch):
+                results = [None] * len(batch)
+            with self._cond:
+                self._stats["infer_ms"] += (time.time() - t0) * 1000
+                self._stats["batches"] += 1
+
+            for ctx, result in zip(batch, results):
+                self._publish_q.put((ctx, result))
+
+    def _publish_loop(self) -> None:
+        while True:
+            ctx, result = self._publish_q.get()
+            t0 = time.time()
+            try:
+                self.publish_fn(ctx, result)
+            except Exception as e:
+                cfg.logger.exception("Pipeline '%s' publish stage failed: %s", self.name, e)
+            finally:
+                with self._cond:
+                    self._stats["publish_ms"] += (time.time() - t0) * 1000
+                self._task_done()
+
+    # ------------------------------------------------------------- helpers
+
+    def _task_done(self) -> None:
+        with self._cond:
+            self._pending -= 1
+            if self._pending <= 0:
+                self._pending = 0
+                self._cond.notify_all()
+
+    def _sample_depths(self, batch_len: int) -> None:
+        infer_depth = self._infer_q.qsize()
+        publish_depth = self._publish_q.qsize()
+        with self._cond:
+            inflight = self._prepare_inflight
+            self._stats["infer_q_max"] = max(self._stats["infer_q_max"], infer_depth)
+            self._stats["publish_q_max"] = max(self._stats["publish_q_max"], publish_depth)
+        cfg.perf_logger.info(
+            "pipeline_depth name=%s prepare_inflight=%d infer_q=%d publish_q=%d batch=%d",
+            self.name,
+            inflight,
+            infer_depth,
+            publish_depth,
+            batch_len,
+        )
+
+    def _reset_stats(self) -> None:
+        self._stats = {
+            "prepare_ms": 0.0,
+            "infer_ms": 0.0,
+            "publish_ms": 0.0,
+            "batches": 0,
+            "dropped": 0,
+            "infer_q_max": 0,
+            "publish_q_max": 0,
+        }
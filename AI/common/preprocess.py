@@ -0,0 +1,338 @@
+"""Model-input preprocessing with cached letterbox geometry and reusable tensors.
+
+* `letterbox_frame` resizes a decoded frame straight into a padded canvas
+  (HWC BGR uint8), with exactly the geometry of `utils.datasets.letterbox`
+  (auto=True, scaleup=False): one resize, no border copy, no transpose copy.
+* Inputs are rectangular: the long side is fitted to IMAGE_SIZE and the short
+  side is only padded up to the next multiple of the stride, as YOLOv5's
+  rect mode does (a 16:9 frame becomes 384x640, not 640x640). With
+  `square=True` the frame is padded to IMAGE_SIZE x IMAGE_SIZE instead
+  (INFERENCE_RECT=0, e.g. for a single fixed-shape compiled model).
+  `padding_ratio` reports the share of the input that is padding.
+* The letterbox geometry, including the `scale_coords` gain and padding back
+  to the original frame, is computed once per (decoded size, original size,
+  IMAGE_SIZE) and cached, so every camera resolution pays for it once.
+* `crop_regions` / `letterbox_tiles` are the ROI-cropped variant: the
+  union of a mapping's ROI boxes and polygons (plus a margin) is cut out of
+  the frame, one crop per disjoint region, and every crop of a frame is
+  resized by one common scale (`crop_scale`) into a canvas of the same
+  shape, so they go through the model as one batch. A crop's geometry
+  carries its offset, and `to_original` maps its boxes back to full-frame
+  coordinates.
+* `batch_tensor` converts a group of same-shape canvases into a float
+  (N, 3, H, W) tensor in [0, 1], doing BGR->RGB, HWC->CHW, uint8->float and
+  /255 in one op per channel, written straight into the frame's slot of a
+  reusable per-thread, per-shape batch buffer. On CUDA the uint8 canvases are
+  staged and copied over, and the conversion runs on the device.
+
+The tensor returned by `batch_tensor` is a view of that buffer: it is only
+valid until the next call on the same thread with the same shape.
+"""
+
+import math
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+from utils.general import scale_coords
+
+PAD_VALUE = 114
+
+_local = threading.local()
+
+
+class Geometry(NamedTuple):
+    """Letterbox parameters for one (decoded size, original size, IMAGE_SIZE)."""
+
+    resized: Tuple[int, int]  # (w, h) the decoded frame is resized to
+    pad: Tuple[int, int, int, int]  # (top, bottom, left, right) border in pixels
+    input_shape: Tuple[int, int]  # (h, w) of the model input
+    original_shape: Tuple[int, int, int]  # (h, w, c) boxes are rescaled to
+    ratio_pad: Tuple[Tuple[float, float], Tuple[float, float]]  # for scale_coords
+    offset: Tuple[int, int] = (0, 0)  # (x, y) of a crop in the full frame
+
+
+@lru_cache(maxsize=256)
+def geometry(
+    decoded_hw: Tuple[int, int],
+    img_size: int,
+    original_shape: Optional[Tuple[int, int, int]] = None,
+    stride: int = 32,
+    canvas: Optional[Tuple[int, int]] = None,
+) -> Geometry:
+    """Letterbox geometry for a decoded frame size, as `letterbox(..., scaleup=False)` computes it.
+
+    With `canvas` (h, w) the resized frame is centred in a canvas of that
+    shape instead of the stride-rounded one (see `letterbox_tiles`).
+    """
+    h, w = decoded_hw
+    r = min(img_size / h, img_size / w, 1.0)
+    new_w, new_h = int(round(w * r)), int(round(h * r))
+    if canvas:
+        dw, dh = (canvas[1] - new_w) / 2, (canvas[0] - new_h) / 2
+    else:
+        dw = np.mod(img_size - new_w, stride) / 2
+        dh = np.mod(img_size - new_h, stride) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    input_shape = (new_h + top + bottom, new_w + left + right)
+
+    original_shape = tuple(original_shape) if original_shape else (h, w, 3)
+    if canvas:
+        # The frame sits at (left, top), not centred by scale_coords' own rule
+        gain = min(new_h / original_shape[0], new_w / original_shape[1])
+        pad_x = left + (new_w - original_shape[1] * gain) / 2
+        pad_y = top + (new_h - original_shape[0] * gain) / 2
+    else:
+        # Same gain/padding scale_coords derives from (input shape, original shape)
+        gain = min(input_shape[0] / original_shape[0], input_shape[1] / original_shape[1])
+        pad_x = (input_shape[1] - original_shape[1] * gain) / 2
+        pad_y = (input_shape[0] - original_shape[0] * gain) / 2
+    return Geometry(
+        (new_w, new_h),
+        (top, bottom, left, right),
+        input_shape,
+        original_shape,
+        ((gain, gain), (pad_x, pad_y)),
+    )
+
+
+def letterbox_frame(
+    img0: np.ndarray,
+    img_size: int,
+    original_shape: Optional[Tuple[int, int, int]] = None,
+    stride: int = 32,
+    square: bool = False,
+) -> Tuple[np.ndarray, Geometry]:
+    """Resize and pad `img0` into a new HWC BGR canvas. Returns (canvas, geometry).
+
+    The canvas is the minimal stride-aligned rectangle, or `img_size` square
+    with `square`.
+    """
+    img_size = int(img_size)
+    canvas = (img_size, img_size) if square else None
+    geom = geometry(img0.shape[:2], img_size, original_shape, stride, canvas)
+    return _fill_canvas(img0, geom), geom
+
+
+def _fill_canvas(img0: np.ndarray, geom: Geometry) -> np.ndarray:
+    """Resize `img0` into a new padded canvas laid out by `geom`."""
+    top, bottom, left, right = geom.pad
+    new_w, new_h = geom.resized
+    canvas = np.empty(geom.input_shape + (3,), dtype=np.uint8)
+    if top:
+        canvas[:top] = PAD_VALUE
+    if bottom:
+        canvas[top + new_h :] = PAD_VALUE
+    if left:
+        canvas[top : top + new_h, :left] = PAD_VALUE
+    if right:
+        canvas[top : top + new_h, left + new_w :] = PAD_VALUE
+
+    region = canvas[top : top + new_h, left : left + new_w]
+    if (new_w, new_h) == (img0.shape[1], img0.shape[0]):
+        region[...] = img0
+    else:
+        out = cv2.resize(img0, (new_w, new_h), dst=region, interpolation=cv2.INTER_LINEAR)
+        if not np.shares_memory(out, canvas):
+            # OpenCV builds without in-place ROI output return a new array
+            region[...] = out
+    return canvas
+
+
+def padding_ratio(geometries: Sequence[Geometry]) -> float:
+    """Share of the model-input pixels of `geometries` that are padding."""
+    total = sum(g.input_shape[0] * g.input_shape[1] for g in geometries)
+    image = sum(g.resized[0] * g.resized[1] for g in geometries)
+    return 1.0 - image / total if total else 0.0
+
+
+def to_original(boxes: torch.Tensor, geom: Geometry) -> torch.Tensor:
+    """Rescale xyxy boxes in place from the model input to the original frame."""
+    boxes = scale_coords(geom.input_shape, boxes, geom.original_shape, ratio_pad=geom.ratio_pad)
+    if geom.offset != (0, 0):
+        boxes[:, [0, 2]] += geom.offset[0]
+        boxes[:, [1, 3]] += geom.offset[1]
+    return boxes
+
+
+# ============================ ROI crops ============================
+
+
+def _overlap(a: List[int], b: List[int]) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def crop_regions(
+    boxes: Optional[Sequence[Sequence[float]]],
+    polygons: Optional[Sequence[Sequence[Sequence[float]]]],
+    frame_hw: Tuple[int, int],
+    margin: float = 0.2,
+    max_area: float = 0.6,
+    max_tiles: int = 4,
+) -> Optional[List[Tuple[int, int, int, int]]]:
+    """Crop regions (x1, y1, x2, y2) covering ROI boxes and polygons, in frame pixels.
+
+    Each ROI's bounding box grows by `margin` of its longer side (so objects
+    centred inside it are not cut off) and is clipped to the frame. Regions
+    that overlap are merged; more than `max_tiles` of them collapse into one
+    bounding region. Returns None when there is no ROI, or when the regions
+    cover more than `max_area` of the frame and cropping would gain little.
+    """
+    h, w = int(frame_hw[0]), int(frame_hw[1])
+    rects = [list(b[:4]) for b in boxes or [] if len(b) >= 4]
+    for poly in polygons or []:
+        if len(poly) >= 3:
+            xs, ys = [p[0] for p in poly], [p[1] for p in poly]
+            rects.append([min(xs), min(ys), max(xs), max(ys)])
+
+    regions = []
+    for x1, y1, x2, y2 in rects:
+        m = margin * max(x2 - x1, y2 - y1)
+        r = [
+            max(0, math.floor(x1 - m)),
+            max(0, math.floor(y1 - m)),
+            min(w, math.ceil(x2 + m)),
+            min(h, math.ceil(y2 + m)),
+        ]
+        if r[2] > r[0] and r[3] > r[1]:
+            regions.append(r)
+    if not regions:
+        return None
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                a, b = regions[i], regions[j]
+                if _overlap(a, b):
+                    regions[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    if len(regions) > max(1, max_tiles):
+        regions = [[
+            min(r[0] for r in regions),
+            min(r[1] for r in regions),
+            max(r[2] for r in regions),
+            max(r[3] for r in regions),
+        ]]
+
+    area = sum((r[2] - r[0]) * (r[3] - r[1]) for r in regions)
+    if area > max_area * w * h:
+        return None
+    return sorted(tuple(r) for r in regions)
+
+
+def crop_scale(
+    regions: Sequence[Tuple[int, int, int, int]],
+    frame_hw: Tuple[int, int],
+    img_size: int,
+    pixel_budget: float = 0.5,
+) -> float:
+    """Model-input pixels per frame pixel for a frame's crops.
+
+    Together the crops get `pixel_budget` times the pixels of the full-frame
+    letterbox, but never less resolution than the full frame gets, more than
+    the frame's own, or more than `img_size` on the longest crop side.
+    """
+    h, w = frame_hw
+    full = min(img_size / h, img_size / w, 1.0)
+    area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+    longest = max(max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in regions)
+    budget = math.sqrt(pixel_budget * full * full * h * w / area)
+    return min(1.0, img_size / longest, max(full, budget))
+
+
+def letterbox_tiles(
+    img0: np.ndarray,
+    scale: float,
+    original_shape: Tuple[int, int, int],
+    regions: Sequence[Tuple[int, int, int, int]],
+    img_size: int,
+    pixel_budget: float = 0.5,
+    stride: int = 32,
+) -> Tuple[List[np.ndarray], List[Geometry]]:
+    """Letterbox one crop of `img0` per region into same-shape canvases.
+
+    `regions` are in original-frame pixels and `img0` may be decoded at
+    reduced resolution (`scale` original pixels per decoded pixel). Every
+    crop is resized by `crop_scale` (never upscaled) and centred in a canvas
+    fitting the largest crop, rounded up to `stride`. Returns (canvases,
+    geometries); the geometries map boxes back to the full frame.
+    """
+    img_size = int(img_size)
+    ratio = min(crop_scale(regions, original_shape[:2], img_size, pixel_budget) * scale, 1.0)
+    dh, dw = img0.shape[:2]
+    oh, ow = original_shape[:2]
+    crops = []
+    for x1, y1, x2, y2 in regions:
+        cx1, cy1 = int(x1 / scale), int(y1 / scale)
+        cx2, cy2 = min(dw, math.ceil(x2 / scale)), min(dh, math.ceil(y2 / scale))
+        ox, oy = int(round(cx1 * scale)), int(round(cy1 * scale))
+        shape = (min(oh, int(round(cy2 * scale))) - oy, min(ow, int(round(cx2 * scale))) - ox, original_shape[2])
+        crop = img0[cy1:cy2, cx1:cx2]
+        # geometry() fits the long side to this size, i.e. resizes by `ratio`
+        size = max(1, int(round(max(crop.shape[:2]) * ratio)))
+        crops.append((crop, size, shape, (ox, oy)))
+
+    fitted = [geometry(crop.shape[:2], size, shape, stride).resized for crop, size, shape, _ in crops]
+    canvas = (
+        -(-max(h for _, h in fitted) // stride) * stride,
+        -(-max(w for w, _ in fitted) // stride) * stride,
+    )
+    canvases, geometries = [], []
+    for crop, size, shape, offset in crops:
+        geom = geometry(crop.shape[:2], size, shape, stride, canvas)._replace(offset=offset)
+        canvases.append(_fill_canvas(crop, geom))
+        geometries.append(geom)
+    return canvases, geometries
+
+
+# ============================ Batch tensors ============================
+
+
+def _buffer(kind: str, shape: Tuple[int, ...], dtype: torch.dtype, device: torch.device) -> torch.Tensor:
+    """Per-thread reusable tensor with room for at least shape[0] frames."""
+    buffers: Dict[Any, torch.Tensor] = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    key = (kind, shape[1:], dtype, str(device))
+    buf = buffers.get(key)
+    if buf is None or buf.shape[0] < shape[0]:
+        pin = kind == "staging" and torch.cuda.is_available()
+        buf = torch.empty(shape, dtype=dtype, device=device, pin_memory=pin)
+        buffers[key] = buf
+    return buf
+
+
+def _fill(dst: torch.Tensor, src: torch.Tensor) -> None:
+    """dst (N, 3, H, W) float <- src (N, H, W, 3) uint8 BGR, flipped, transposed and scaled."""
+    for c in range(3):
+        torch.div(src[..., 2 - c], 255.0, out=dst[:, c])
+
+
+def batch_tensor(imgs: Sequence[np.ndarray], device: torch.device) -> torch.Tensor:
+    """(N, 3, H, W) float32 RGB tensor in [0, 1] from same-shape letterboxed canvases."""
+    n = len(imgs)
+    h, w = imgs[0].shape[:2]
+    out = _buffer("input", (n, 3, h, w), torch.float32, device)[:n]
+    if device.type == "cpu":
+        for i, img in enumerate(imgs):
+            _fill(out[i : i + 1], torch.from_numpy(img).unsqueeze(0))
+        return out
+
+    staging = _buffer("staging", (n, h, w, 3), torch.uint8, torch.device("cpu"))[:n]
+    for i, img in enumerate(imgs):
+        staging[i].copy_(torch.from_numpy(img))
+    on_device = _buffer("device", (n, h, w, 3), torch.uint8, device)[:n]
+    on_device.copy_(staging)
+    _fill(out, on_device)
+    return out
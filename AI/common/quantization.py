@@ -0,0 +1,328 @@
+"""INT8 quantization of the detectors for CPU inference, with an accuracy guardrail.
+
+Used by the ``onnxruntime_int8`` backend (see inference_engine.py), so it is
+selected and built through the normal model-init path:
+
+1. The fp32 ONNX export for the input shape is quantized with ONNX Runtime,
+   either statically (INFERENCE_INT8_MODE=static: QDQ, per-channel int8
+   weights, uint8 activations calibrated on stored raw frames) or
+   dynamically (INFERENCE_INT8_MODE=dynamic: int8 weights, activation
+   ranges computed per call). Only Conv layers are quantized; the Detect
+   head's grid/anchor arithmetic stays in fp32.
+2. Calibration and evaluation frames are drawn from INFERENCE_INT8_CALIBRATION
+   (a directory of stored raw frames or a glob), spread evenly over the
+   sorted file list and split into disjoint calibration/evaluation sets.
+3. The int8 model and the eager fp32 model are scored on the evaluation
+   frames with `utils.metrics.ap_per_class` (mAP@0.5 and mAP@0.5:0.95). When
+   every evaluation frame has a YOLO label file next to it (same stem,
+   ``.txt``) those labels are the ground truth; otherwise fp32 detections at
+   MODEL_CONF are. Per-frame latency of eager fp32, ONNX fp32 and ONNX int8
+   is measured on the same frames.
+4. The report is written next to the artifact (``*.report.json``) and to the
+   performance log. The int8 model is only activated when the mAP@0.5 drop is
+   at most INFERENCE_INT8_MAX_MAP_DROP; otherwise that shape runs eager fp32.
+
+Delete the ``*.int8-*`` artifacts next to the weights to re-quantize after
+changing the calibration frames.
+
+``python -m common.quantization <weights.pt>`` (from the service directory) builds (or loads) the int8 model for
+the shape the first calibration frame letterboxes to and prints the report.
+"""
+
+import glob
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+import config as cfg
+from utils.datasets import letterbox
+from utils.general import box_iou, non_max_suppression, xywh2xyxy
+from utils.metrics import ap_per_class
+
+# IoU thresholds for mAP@0.5:0.95, as in YOLOv5's test.py
+IOUV = torch.linspace(0.5, 0.95, 10)
+# Confidence threshold for scored predictions (as in test.py) and latency warm-up runs
+EVAL_CONF = 0.001
+WARMUP_RUNS = 2
+
+
+class EvalFrame:
+    """A letterboxed frame at the export shape, plus its label file if present."""
+
+    def __init__(self, path: str, img0: np.ndarray, hw: Tuple[int, int]):
+        img, ratio, (dw, dh) = letterbox(img0, new_shape=hw, auto=False, scaleup=False)
+        self.path = path
+        self.input = np.ascontiguousarray(img[:, :, ::-1].transpose(2, 0, 1))[None].astype(np.float32) / 255.0
+        self.labels = self._read_labels(path, img0.shape[:2], ratio, (dw, dh))
+
+    @staticmethod
+    def _read_labels(path, hw0, ratio, pad) -> Optional[torch.Tensor]:
+        """YOLO labels (cls cx cy w h, normalised) as (m, 5) cls + input-pixel xyxy."""
+        label_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.isfile(label_path):
+            return None
+        rows = np.loadtxt(label_path, ndmin=2, dtype=np.float32).reshape(-1, 5)
+        labels = torch.from_numpy(rows)
+        boxes = xywh2xyxy(labels[:, 1:5])
+        boxes[:, [0, 2]] = boxes[:, [0, 2]] * hw0[1] * ratio[0] + pad[0]
+        boxes[:, [1, 3]] = boxes[:, [1, 3]] * hw0[0] * ratio[1] + pad[1]
+        labels[:, 1:5] = boxes
+        return labels
+
+
+def frame_paths(pattern: str) -> List[str]:
+    """Sorted frame files for a directory (searched recursively) or glob."""
+    if not pattern:
+        return []
+    if os.path.isdir(pattern):
+        paths = [
+            p
+            for ext in ("jpg", "jpeg", "png")
+            for p in glob.glob(os.path.join(pattern, "**", f"*.{ext}"), recursive=True)
+        ]
+    else:
+        paths = glob.glob(pattern, recursive=True)
+    return sorted(paths)
+
+
+def split_frames(paths: Sequence[str], n_calib: int, n_eval: int) -> Tuple[List[str], List[str]]:
+    """Evenly spaced, disjoint calibration and evaluation subsets of `paths`."""
+    wanted = n_calib + n_eval
+    if len(paths) > wanted:
+        step = len(paths) / wanted
+        paths = [paths[int(i * step)] for i in range(wanted)]
+    calib = list(paths[0::2])[:n_calib]
+    evals = list(paths[1::2])[:n_eval]
+    return calib, evals
+
+
+def load_frames(paths: Sequence[str], hw: Tuple[int, int]) -> List[EvalFrame]:
+    frames = []
+    for path in paths:
+        img0 = cv2.imread(path)
+        if img0 is None:
+            cfg.logger.warning("Skipping unreadable frame %s", path)
+            continue
+        frames.append(EvalFrame(path, img0, hw))
+    return frames
+
+
+# ============================ Quantization ============================
+
+
+def _calibration_reader(frames: List[EvalFrame], input_name: str):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._feeds = iter([{input_name: f.input} for f in frames])
+
+        def get_next(self):
+            return next(self._feeds, None)
+
+    return _Reader()
+
+
+def quantize(fp32_path: str, int8_path: str, mode: str, calib_frames: List[EvalFrame]) -> None:
+    """Write an int8 copy of the fp32 ONNX model (static QDQ or dynamic)."""
+    import onnxruntime
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+    t0 = time.time()
+    if mode == "dynamic":
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QUInt8, op_types_to_quantize=["Conv"])
+    else:
+        if not calib_frames:
+            raise ValueError("static INT8 quantization needs calibration frames (INFERENCE_INT8_CALIBRATION)")
+        input_name = onnxruntime.InferenceSession(
+            fp32_path, providers=["CPUExecutionProvider"]
+        ).get_inputs()[0].name
+        quantize_static(
+            fp32_path,
+            int8_path,
+            _calibration_reader(calib_frames, input_name),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=["Conv"],
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    cfg.logger.info(
+        "INT8 %s quantization done in %.1fs (%d calibration frames) -> %s",
+        mode,
+        time.time() - t0,
+        len(calib_frames),
+        int8_path,
+    )
+
+
+# ============================ Evaluation ============================
+
+
+def _correct(pred: torch.Tensor, labels: torch.Tensor) -> torch.Tensor:
+    """(n, 10) bool: prediction matches an unmatched label at each IoU threshold."""
+    correct = torch.zeros(len(pred), len(IOUV), dtype=torch.bool)
+    if not len(pred) or not len(labels):
+        return correct
+    detected = set()
+    for cls in torch.unique(labels[:, 0]):
+        ti = (labels[:, 0] == cls).nonzero(as_tuple=False).view(-1)
+        pi = (pred[:, 5] == cls).nonzero(as_tuple=False).view(-1)
+        if not len(pi):
+            continue
+        ious, best = box_iou(pred[pi, :4], labels[ti, 1:5]).max(1)
+        for j in (ious > IOUV[0]).nonzero(as_tuple=False).view(-1):
+            d = int(ti[best[j]])
+            if d not in detected:
+                detected.add(d)
+                correct[pi[j]] = ious[j] > IOUV
+                if len(detected) == len(labels):
+                    return correct
+    return correct
+
+
+def map_scores(preds: List[torch.Tensor], targets: List[torch.Tensor]) -> Tuple[float, float]:
+    """(mAP@0.5, mAP@0.5:0.95) of per-frame predictions against per-frame targets."""
+    stats = []
+    for pred, labels in zip(preds, targets):
+        stats.append(
+            (_correct(pred, labels), pred[:, 4], pred[:, 5], labels[:, 0])
+        )
+    correct, conf, pred_cls, target_cls = [torch.cat(x, 0).numpy() for x in zip(*stats)]
+    if not len(target_cls):
+        raise ValueError("no reference boxes in the evaluation frames")
+    if not len(conf):
+        return 0.0, 0.0
+    _, _, ap, _, _ = ap_per_class(correct, conf, pred_cls, target_cls)
+    return float(ap[:, 0].mean()), float(ap.mean())
+
+
+def _timed(fn, frames: List[EvalFrame]) -> Tuple[List[torch.Tensor], float]:
+    """Run `fn` on every frame; returns its outputs and the mean latency in ms."""
+    for frame in frames[:WARMUP_RUNS]:
+        fn(frame)
+    outputs, t0 = [], time.perf_counter()
+    for frame in frames:
+        outputs.append(fn(frame))
+    return outputs, (time.perf_counter() - t0) * 1000 / max(len(frames), 1)
+
+
+def evaluate(
+    eager: Any, fp32_session: Any, int8_session: Any, frames: List[EvalFrame]
+) -> Dict[str, Any]:
+    """Score eager fp32 and int8 on `frames` and time eager, ONNX fp32 and ONNX int8."""
+    conf, iou = float(cfg.MODEL_CONF), float(cfg.MODEL_IOU)
+
+    def run_eager(frame):
+        return eager(torch.from_numpy(frame.input).to(eager.device))[0].float().cpu()
+
+    def run_session(session):
+        name = session.get_inputs()[0].name
+        return lambda frame: torch.from_numpy(session.run(None, {name: frame.input})[0])
+
+    raw_fp32, eager_ms = _timed(run_eager, frames)
+    _, onnx_fp32_ms = _timed(run_session(fp32_session), frames)
+    raw_int8, onnx_int8_ms = _timed(run_session(int8_session), frames)
+
+    def nms(raw, conf_thres):
+        return [non_max_suppression(r, conf_thres, iou)[0] for r in raw]
+
+    labelled = bool(frames) and all(f.labels is not None for f in frames)
+    if labelled:
+        targets = [f.labels for f in frames]
+    else:
+        # No ground truth: fp32 detections at the production threshold are the reference
+        targets = [torch.cat((d[:, 5:6], d[:, :4]), 1) for d in nms(raw_fp32, conf)]
+    map50_fp32, map_fp32 = map_scores(nms(raw_fp32, EVAL_CONF), targets)
+    map50_int8, map_int8 = map_scores(nms(raw_int8, EVAL_CONF), targets)
+    return {
+        "eval_frames": len(frames),
+        "reference": "labels" if labelled else "fp32_detections",
+        "reference_boxes": int(sum(len(t) for t in targets)),
+        "map50_fp32": round(map50_fp32, 4),
+        "map50_int8": round(map50_int8, 4),
+        "map_fp32": round(map_fp32, 4),
+        "map_int8": round(map_int8, 4),
+        "map50_drop": round(map50_fp32 - map50_int8, 4),
+        "latency_ms": {
+            "eager_fp32": round(eager_ms, 2),
+            "onnx_fp32": round(onnx_fp32_ms, 2),
+            "onnx_int8": round(onnx_int8_ms, 2),
+        },
+    }
+
+
+# ============================ Reports ============================
+
+
+def report_path(int8_path: str) -> str:
+    return os.path.splitext(int8_path)[0] + ".report.json"
+
+
+def load_report(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_report(path: str, report: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def accepted(report: Dict[str, Any], max_drop: float) -> bool:
+    """True when the report is complete and its mAP@0.5 drop is within `max_drop`."""
+    drop = report.get("map50_drop")
+    return drop is not None and drop <= max_drop
+
+
+def log_report(report: Dict[str, Any]) -> None:
+    latency = report.get("latency_ms", {})
+    cfg.perf_logger.info(
+        "int8_report weights=%s shape=%s mode=%s reference=%s eval_frames=%s map50_fp32=%s map50_int8=%s "
+        "map_fp32=%s map_int8=%s map50_drop=%s max_drop=%s eager_fp32_ms=%s onnx_fp32_ms=%s onnx_int8_ms=%s accepted=%s",
+        report.get("weights"),
+        report.get("shape"),
+        report.get("mode"),
+        report.get("reference"),
+        report.get("eval_frames"),
+        report.get("map50_fp32"),
+        report.get("map50_int8"),
+        report.get("map_fp32"),
+        report.get("map_int8"),
+        report.get("map50_drop"),
+        report.get("max_map_drop"),
+        latency.get("eager_fp32"),
+        latency.get("onnx_fp32"),
+        latency.get("onnx_int8"),
+        report.get("accepted"),
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python -m common.quantization <weights.pt>")
+    from common import preprocess
+    from common.inference_engine import create_engine
+    from my_utils import get_device, load_model
+
+    weights = sys.argv[1]
+    device = get_device()
+    engine = create_engine(load_model(weights, device), weights, device, backend="onnxruntime_int8")
+    # Build for the input shape production frames letterbox to
+    paths = frame_paths(cfg.INFERENCE_INT8_CALIBRATION)
+    img0 = cv2.imread(paths[0]) if paths else None
+    if img0 is None:
+        sys.exit("INFERENCE_INT8_CALIBRATION has no readable frames")
+    canvas, geom = preprocess.letterbox_frame(img0, int(cfg.IMAGE_SIZE))
+    engine(preprocess.batch_tensor([canvas], device))
+    int8_path = engine.artifact_path(geom.input_shape, f"int8-{cfg.INFERENCE_INT8_MODE}.onnx")
+    print(json.dumps(load_report(report_path(int8_path)), indent=2))
@@ -0,0 +1,85 @@
+"""One ReID feature extractor shared by the DeepSort trackers of every camera.
+
+Each camera keeps its own DeepSort (tracks and appearance gallery), but all of
+them embed their crops through the process-wide `ReIDService`, so the ReID
+checkpoint is loaded once however many cameras are tracked.
+
+The people-counting stage first detects heads on every frame of a batch and
+collects each frame's crops (`DeepSort.crops`), then `embed_many` runs all of
+them through the ReID net together, REID_BATCH_SIZE crops per forward pass,
+and hands each frame its own features for `DeepSort.update(..., features=)`.
+One perf line per batch reports the frames, crops and forward passes.
+"""
+
+import threading
+import time
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+import config as cfg
+from common import startup
+from tracking.deep_sort_pytorch.deep_sort.deep.feature_extractor import Extractor
+
+# Width of the ReID net's feature vector (deep_sort/deep/model.py, reid=True)
+FEATURE_DIM = 512
+
+
+class ReIDService:
+    """A single ReID Extractor that batches the crops of many frames."""
+
+    def __init__(self, model_path: str, use_cuda: bool = True, batch_size: int = 64):
+        self.extractor = Extractor(model_path, use_cuda=use_cuda)
+        self.batch_size = max(1, int(batch_size))
+        self._lock = threading.Lock()
+
+    def __call__(self, im_crops: Sequence[np.ndarray]) -> np.ndarray:
+        """Features for one frame's crops; lets DeepSort use the service as its extractor."""
+        return self.embed_many([im_crops])[0]
+
+    def embed_many(self, crop_lists: Sequence[Sequence[np.ndarray]]) -> List[np.ndarray]:
+        """Features for several frames' crops at once, one (n, FEATURE_DIM) array per frame."""
+        crops = [im for frame_crops in crop_lists for im in frame_crops]
+        if not crops:
+            return [np.zeros((0, FEATURE_DIM), dtype=np.float32) for _ in crop_lists]
+
+        t0 = time.time()
+        chunks = []
+        with self._lock:
+            for start in range(0, len(crops), self.batch_size):
+                chunks.append(self.extractor(crops[start : start + self.batch_size]))
+        features = np.concatenate(chunks, axis=0)
+        cfg.perf_logger.info(
+            "reid latency_ms=%.2f frames=%d crops=%d batches=%d",
+            (time.time() - t0) * 1000,
+            len(crop_lists),
+            len(crops),
+            len(chunks),
+        )
+
+        out, start = [], 0
+        for frame_crops in crop_lists:
+            out.append(features[start : start + len(frame_crops)])
+            start += len(frame_crops)
+        return out
+
+
+_service: Optional[ReIDService] = None
+_service_lock = threading.Lock()
+
+
+def get_reid() -> ReIDService:
+    """Return the process-wide ReIDService, loading REID_CKPT on first use."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                with startup.phase("reid_load"):
+                    _service = ReIDService(cfg.REID_CKPT, use_cuda=True, batch_size=cfg.REID_BATCH_SIZE)
+                cfg.logger.info(
+                    "Shared ReID extractor loaded | ckpt=%s device=%s batch_size=%d",
+                    cfg.REID_CKPT,
+                    _service.extractor.device,
+                    _service.batch_size,
+                )
+    return _service
@@ -0,0 +1,99 @@
+"""Consistent-hash assignment of cameras to the worker processes of one host.
+
+`supervisor.py` starts SHARD_COUNT copies of the service, each with its own
+SHARD_INDEX. Every process sees the whole camera table and keeps the cameras
+the hash ring assigns to its index (`mine`), so no coordination is needed:
+
+* Each shard owns SHARD_VNODES points on a ring of 64-bit hashes; a camera
+  belongs to the shard owning the first point at or after the hash of its id.
+* Adding or removing a camera moves only that camera. Changing SHARD_COUNT
+  moves about 1/SHARD_COUNT of the cameras, and only to or from the shards
+  that were added or removed.
+* A camera stays in the same process from cycle to cycle, so per-camera
+  state (motion gate background, trackers) stays where it was.
+
+With SHARD_COUNT=1 (the default) `mine` returns the camera list unchanged.
+Each process logs the cameras it gains and loses when its share changes.
+
+With CAMERA_LEASES=1 cameras are split through MySQL leases instead
+(leases.py), between every replica of the service on any host; each process
+started by the supervisor is then one replica.
+"""
+
+import bisect
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import config as cfg
+from common import leases
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring over shard indices 0..count-1."""
+
+    def __init__(self, count: int, vnodes: int = 256):
+        self.count = max(1, int(count))
+        points = sorted(
+            (_hash(f"shard-{shard}-{v}"), shard) for shard in range(self.count) for v in range(max(1, int(vnodes)))
+        )
+        self._hashes = [h for h, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_of(self, key: Any) -> int:
+        """The shard index that owns `key` (a camera id)."""
+        if self.count == 1:
+            return 0
+        i = bisect.bisect_left(self._hashes, _hash(str(key)))
+        return self._shards[i % len(self._shards)]
+
+
+_ring: Optional[HashRing] = None
+_owned: Optional[Set[Any]] = None
+_lock = threading.Lock()
+
+
+def ring() -> HashRing:
+    """The process-wide ring for SHARD_COUNT, created on first use."""
+    global _ring
+    if _ring is None:
+        with _lock:
+            if _ring is None:
+                _ring = HashRing(cfg.SHARD_COUNT, cfg.SHARD_VNODES)
+    return _ring
+
+
+def mine(cameras: Iterable[Dict[str, Any]], key: str = "id") -> List[Dict[str, Any]]:
+    """The cameras (rows with an `id`) assigned to this process's SHARD_INDEX (or leased by it)."""
+    if cfg.CAMERA_LEASES:
+        return leases.get_manager().mine(cameras, key)
+    cameras = list(cameras)
+    if cfg.SHARD_COUNT <= 1:
+        return cameras
+    r = ring()
+    kept = [c for c in cameras if r.shard_of(c.get(key)) == cfg.SHARD_INDEX]
+    _log_changes({c.get(key) for c in kept}, len(cameras))
+    return kept
+
+
+def _log_changes(owned: Set[Any], total: int) -> None:
+    global _owned
+    with _lock:
+        previous, _owned = _owned, owned
+    if previous == owned:
+        return
+    gained = sorted(owned - (previous or set()), key=str)
+    lost = sorted((previous or set()) - owned, key=str)
+    cfg.logger.info(
+        "Shard %d/%d owns %d of %d cameras | gained=%s lost=%s",
+        cfg.SHARD_INDEX,
+        cfg.SHARD_COUNT,
+        len(owned),
+        total,
+        gained,
+        lost,
+    )
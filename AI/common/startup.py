@@ -0,0 +1,93 @@
+"""Start-up phase timing for the AI services.
+
+`app.py` imports this module before anything else, so the clock starts with
+the service's own imports. Phases are recorded as the service comes up:
+
+* `mark(name)` closes a phase that ran since the previous mark (or since
+  start), e.g. ``mark("imports")`` after the import block;
+* `phase(name)` times a ``with`` block; repeated phases (one model load per
+  weight file) add up;
+* `note(key, value)` attaches a detail such as the fused-model cache result.
+
+`log_summary()` writes one performance line once the service is ready to
+serve, e.g.::
+
+    startup total=3.12s imports=1.80s model_load=0.95s engine=0.30s fused_cache=hit
+
+`watch_db(db)` adds one more line for the first MySQL query, which is when
+the lazily opened connection pool actually connects.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+import config as cfg
+
+_START = time.perf_counter()
+_last = _START
+_phases: Dict[str, float] = {}
+_notes: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def mark(name: str) -> None:
+    """Record the time since the previous mark (or start) as phase `name`."""
+    global _last
+    now = time.perf_counter()
+    with _lock:
+        _phases[name] = _phases.get(name, 0.0) + now - _last
+        _last = now
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Time the enclosed block as phase `name` (added to earlier runs of it)."""
+    global _last
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        with _lock:
+            _phases[name] = _phases.get(name, 0.0) + now - t0
+            _last = now
+
+
+def note(key: str, value: Any) -> None:
+    """Attach a detail to the summary line; repeated notes are joined with '+'."""
+    with _lock:
+        _notes[key] = f"{_notes[key]}+{value}" if key in _notes else value
+
+
+def elapsed() -> float:
+    """Seconds since this module was imported."""
+    return time.perf_counter() - _START
+
+
+def log_summary() -> None:
+    """One performance line with the total and every phase recorded so far."""
+    with _lock:
+        parts = [f"{name}={seconds:.2f}s" for name, seconds in _phases.items()]
+        parts += [f"{key}={value}" for key, value in _notes.items()]
+    cfg.perf_logger.info("startup total=%.2fs %s", elapsed(), " ".join(parts))
+
+
+def watch_db(db: Any) -> None:
+    """Log the first query on `db` (the pool's first connect) relative to start."""
+    seen = threading.Event()
+
+    def _hook(name: str, latency_ms: float, rows: int, error: Any) -> None:
+        if seen.is_set():
+            return
+        seen.set()
+        cfg.perf_logger.info(
+            "startup first_db_query name=%s latency_ms=%.1f since_start=%.2fs ok=%s",
+            name,
+            latency_ms,
+            elapsed(),
+            error is None,
+        )
+
+    db.add_query_hook(_hook)
@@ -0,0 +1,183 @@
+"""Run the service as several sharded worker processes on one host.
+
+    python -m common.supervisor   # instead of `python app.py`, from the service directory
+
+One Python process cannot use a large host well, so the supervisor starts
+SHARD_COUNT copies of `app.py`, each with its own SHARD_INDEX:
+
+* Cameras: every worker keeps the cameras the consistent-hash ring assigns to
+  its index (sharding.py), so adding or removing a camera only moves that one.
+* CPUs: the CPUs the supervisor may run on are split into SHARD_COUNT
+  contiguous slices. With SHARD_PIN_CPUS each worker is pinned to its slice
+  and runs torch with one intra-op thread per CPU of it (or SHARD_THREADS)
+  and SHARD_INTEROP_THREADS inter-op threads; INFERENCE_THREADS is set to
+  the same count for ONNX Runtime.
+* Weights: on CPU the supervisor loads each SHARD_WEIGHTS file once (the
+  fused model, see inference_engine.load_fused_model), moves its tensors to
+  shared memory and hands it to every worker (model_init.preload), so the
+  host holds one copy of the weights instead of one per worker. Each worker
+  builds its own inference engine around it. On CUDA every worker loads its
+  own copy.
+* A worker that exits is started again with the same shard index after
+  SHARD_RESTART_DELAY seconds. SIGTERM / SIGINT stop all workers.
+"""
+
+import os
+import runpy
+import signal
+import time
+from typing import Any, Dict, List
+
+import torch
+import torch.multiprocessing as mp
+
+import config as cfg
+
+# The service the supervisor was started for: it runs from the service directory
+APP_PATH = os.path.join(os.getcwd(), "app.py")
+
+
+def cpu_slices(count: int) -> List[List[int]]:
+    """Split the CPUs this process may use into `count` contiguous slices.
+
+    With more workers than CPUs, workers share CPUs round-robin.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    count = max(1, int(count))
+    per, extra = divmod(len(cpus), count)
+    slices, start = [], 0
+    for i in range(count):
+        n = per + (1 if i < extra else 0)
+        slices.append(cpus[start : start + n] if n else [cpus[i % len(cpus)]])
+        start += n
+    return slices
+
+
+def shared_models() -> Dict[str, Any]:
+    """Load each SHARD_WEIGHTS file once and move it to shared memory (CPU only)."""
+    from my_utils import get_device, load_model
+
+    device = get_device()
+    if device.type != "cpu":
+        cfg.logger.info("Device is %s; every worker loads its own weights", device)
+        return {}
+    models = {}
+    for path in cfg.SHARD_WEIGHTS:
+        try:
+            models[path] = load_model(path, device).share_memory()
+            cfg.logger.info("Shared weights for all workers: %s", path)
+        except Exception as e:
+            cfg.logger.warning("Could not share weights %s (%s); workers load their own", path, e)
+    return models
+
+
+def _run_worker(index: int, cpus: List[int], threads: int, models: Dict[str, Any]) -> None:
+    """Worker process body: pin CPUs and threads, adopt the shared models, run app.py."""
+    if cfg.SHARD_PIN_CPUS and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(max(1, cfg.SHARD_INTEROP_THREADS))
+
+    import model_init
+
+    for path, model in models.items():
+        model_init.preload(path, model)
+    cfg.logger.info(
+        "Shard %d/%d started | pid=%d cpus=%s threads=%d shared_models=%s",
+        index,
+        cfg.SHARD_COUNT,
+        os.getpid(),
+        cpus if cfg.SHARD_PIN_CPUS else "all",
+        threads,
+        list(models),
+    )
+    runpy.run_path(APP_PATH, run_name="__main__")
+
+
+class Supervisor:
+    """Start, watch and restart the shard workers."""
+
+    def __init__(self, count: int):
+        self.count = max(1, int(count))
+        self.slices = cpu_slices(self.count)
+        self.models = shared_models()
+        self.ctx = mp.get_context("spawn")
+        self.procs: Dict[int, Any] = {}
+        self.exited_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def _start(self, index: int) -> None:
+        cpus = self.slices[index]
+        if cfg.SHARD_THREADS:
+            threads = cfg.SHARD_THREADS
+        elif cfg.SHARD_PIN_CPUS:
+            threads = len(cpus)
+        else:
+            threads = max(1, (os.cpu_count() or 1) // self.count)
+        # Spawned workers read their settings from the environment when they import config
+        os.environ.update(
+            SHARD_INDEX=str(index),
+            SHARD_COUNT=str(self.count),
+            WORKER_ID=f"{cfg.WORKER_ID}-shard{index}",
+        )
+        if not cfg.INFERENCE_THREADS:
+            os.environ["INFERENCE_THREADS"] = str(threads)
+        proc = self.ctx.Process(
+            target=_run_worker,
+            args=(index, cpus, threads, self.models),
+            name=f"shard-{index}",
+            daemon=False,
+        )
+        proc.start()
+        self.procs[index] = proc
+        self.exited_at.pop(index, None)
+
+    def _stop(self, signum: int, _frame: Any) -> None:
+        cfg.logger.info("Supervisor received signal %d; stopping %d workers", signum, len(self.procs))
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        cfg.logger.info(
+            "Supervisor starting %d workers | cpus=%s shared=%s", self.count, self.slices, list(self.models)
+        )
+        for index in range(self.count):
+            self._start(index)
+        while not self.stopping:
+            now = time.monotonic()
+            for index, proc in list(self.procs.items()):
+                if proc.is_alive():
+                    continue
+                if index not in self.exited_at:
+                    self.exited_at[index] = now
+                    cfg.logger.warning(
+                        "Shard %d (pid %s) exited with code %s; restarting in %.0fs",
+                        index,
+                        proc.pid,
+                        proc.exitcode,
+                        cfg.SHARD_RESTART_DELAY,
+                    )
+                elif now - self.exited_at[index] >= cfg.SHARD_RESTART_DELAY:
+                    self._start(index)
+            time.sleep(1.0)
+        self.shutdown()
+
+    def shutdown(self, timeout: float = 30.0) -> None:
+        for proc in self.procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + timeout
+        for proc in self.procs.values():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                proc.kill()
+                proc.join()
+        cfg.logger.info("Supervisor stopped")
+
+
+if __name__ == "__main__":
+    Supervisor(cfg.SHARD_COUNT).run()
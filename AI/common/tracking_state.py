@@ -0,0 +1,275 @@
+"""Per-camera tracking state for people counting: bounded, expiring and persisted.
+
+Each camera has a tracker (tracking/strategies.py) and the line-crossing state
+of its tracks (TrackableObject by track id). `TrackingState` owns both, picks
+the tracker of each camera and keeps them from growing without bound:
+
+* The tracker mode comes from the camera's mapping (its `tracker` column),
+  else TRACKER_MODE: deepsort, sort, centroid or auto. auto follows the
+  average heads per frame over the last TRACKER_AUTO_WINDOW frames: above
+  TRACKER_AUTO_MAX_PEOPLE it uses deepsort, at half of it or less it uses
+  TRACKER_AUTO_LIGHT (sort or centroid). It moves to deepsort at once, but
+  back to the light tracker only while no track is live. A new tracker is
+  seeded with the tracks of the one it replaces and continues its track ids,
+  so the people in view keep their ids and TrackableObjects (a person already
+  counted is not counted again). deepsort and sort share their Kalman tracks
+  as they are; centroid tracks become Kalman tracks at rest and back.
+* An object not seen for TRACK_STATE_TTL_SECONDS is evicted, and only the
+  last TRAJECTORY_POINTS centroids of an object are kept.
+* A camera is dropped when it is no longer in the camera list of the cycle,
+  or when it has not been tracked for TRACK_STATE_TTL_SECONDS. An empty list
+  (e.g. the mapping query failed) drops nothing; idle cameras still expire.
+
+Every TRACK_SNAPSHOT_SECONDS the cameras tracked since the last snapshot are
+written to TRACK_SNAPSHOT_DIR, one pickle per camera: the tracker mode, its
+tracks and next track id (for deepsort also the appearance samples of
+`NearestNeighborDistanceMetric`) and the TrackableObjects (so objects already
+counted are not counted again). When a camera's tracker is created, a snapshot
+younger than TRACK_STATE_TTL_SECONDS is restored into it, so a restarted
+process (or another shard on the same host taking the camera over) resumes
+counting where the snapshot left off.
+
+The state is not locked: `housekeep` must run between cycles, on the thread
+that drives them, never while a batch is being tracked.
+"""
+
+import atexit
+import os
+import pickle
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import config as cfg
+from tracking.strategies import MODES, TrackerStrategy
+from tracking.trackbleobject import TrackableObject
+
+# Centroids kept per object: the previous one for line crossing, the rest for visualization
+TRAJECTORY_POINTS = 30
+
+
+class CameraTracking:
+    """One camera's tracker and the line-crossing state of its tracks."""
+
+    def __init__(self, tracker: TrackerStrategy, density: float = 0.0):
+        self.tracker = tracker
+        self.trackables: Dict[int, TrackableObject] = {}
+        self.last_used = time.time()
+        # Average heads per frame over the recent frames (for TRACKER_MODE=auto)
+        self.density = density
+
+
+class TrackingState:
+    """Trackers and TrackableObjects of every camera of this process.
+
+    `factory(mode, next_id)` builds a tracker of one of strategies.MODES whose
+    track ids start at `next_id` (None: the tracker's own default).
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str, Optional[int]], TrackerStrategy],
+        mode: str = "deepsort",
+        auto_light: str = "sort",
+        auto_max_people: float = 2.0,
+        auto_window: int = 30,
+        ttl: float = 300.0,
+        snapshot_dir: str = "",
+        snapshot_interval: float = 30.0,
+    ):
+        self.factory = factory
+        self.mode = mode if mode in MODES or mode == "auto" else "deepsort"
+        self.auto_light = auto_light if auto_light in MODES else "sort"
+        self.auto_max_people = float(auto_max_people)
+        self.auto_window = max(1, int(auto_window))
+        self.ttl = float(ttl)
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_interval = float(snapshot_interval)
+        self._cameras: Dict[int, CameraTracking] = {}
+        self._snapshot_at = time.time()
+        if self.snapshot_dir and self.snapshot_interval > 0:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            atexit.register(self.snapshot)
+
+    @property
+    def snapshots_enabled(self) -> bool:
+        return bool(self.snapshot_dir) and self.snapshot_interval > 0
+
+    # --------------------------------------------------------------- access
+
+    def _camera(self, camera_id: int, mode: str = "", density: float = 0.0) -> CameraTracking:
+        camera = self._cameras.get(camera_id)
+        if camera is None:
+            mode = self._wanted(mode or self.mode, density, None)
+            cfg.logger.info("Initializing %s tracker for camera_id=%s", mode, camera_id)
+            camera = CameraTracking(self.factory(mode, None), density)
+            if self.snapshots_enabled:
+                self._restore(camera_id, camera)
+            self._cameras[camera_id] = camera
+        camera.last_used = time.time()
+        return camera
+
+    def tracker(self, camera_id: int) -> TrackerStrategy:
+        """The camera's tracker, created (and restored from its snapshot) on first use."""
+        return self._camera(camera_id).tracker
+
+    def observe(self, camera_id: int, mode: Optional[str], detections: int) -> TrackerStrategy:
+        """Record a frame's head count and switch the camera's tracker if its
+        mode (the mapping's, or None for TRACKER_MODE) asks for another one.
+        Call once per tracked frame, in frame-time order, before `tracker`.
+        A new tracker takes over the live tracks of the old one, ids included."""
+        mode = (mode or "").strip().lower() or self.mode
+        if mode not in MODES and mode != "auto":
+            cfg.logger.warning("Unknown tracker mode %r for camera_id=%s; using %s", mode, camera_id, self.mode)
+            mode = self.mode
+        camera = self._camera(camera_id, mode, float(detections))
+        camera.density += (detections - camera.density) / self.auto_window
+        current = camera.tracker
+        wanted = self._wanted(mode, camera.density, current)
+        if wanted != current.name:
+            camera.tracker = self.factory(wanted, current.next_id)
+            camera.tracker.seed(current.kalman_tracks())
+            cfg.logger.info(
+                "Tracker of camera_id=%s switched %s -> %s | mode=%s heads_per_frame=%.2f live_tracks=%d",
+                camera_id,
+                current.name,
+                wanted,
+                mode,
+                camera.density,
+                camera.tracker.live_tracks(),
+            )
+        return camera.tracker
+
+    def _wanted(self, mode: str, density: float, current: Optional[TrackerStrategy]) -> str:
+        if mode != "auto":
+            return mode
+        if density > self.auto_max_people:
+            return "deepsort"
+        if density <= self.auto_max_people / 2 and (current is None or current.live_tracks() == 0):
+            return self.auto_light
+        return current.name if current is not None else "deepsort"
+
+    def trackables(self, camera_id: int) -> Dict[int, TrackableObject]:
+        """The camera's TrackableObjects by track id; set `last_seen` on the ones updated."""
+        return self._camera(camera_id).trackables
+
+    def get_trackables(self, camera_id: int) -> Dict[int, TrackableObject]:
+        """Like `trackables`, without creating the camera or marking it used."""
+        camera = self._cameras.get(camera_id)
+        return camera.trackables if camera is not None else {}
+
+    # ---------------------------------------------------------- housekeeping
+
+    def housekeep(self, camera_ids: Iterable[Any], now: Optional[float] = None) -> None:
+        """Drop cameras that are gone or idle, evict stale objects and snapshot when due."""
+        now = time.time() if now is None else now
+        current = {int(c) for c in camera_ids}
+        evicted = 0
+        for camera_id in list(self._cameras):
+            camera = self._cameras[camera_id]
+            if current and camera_id not in current:
+                # Leave the snapshot: another shard on this host may take the camera over
+                self._drop(camera_id, "no longer assigned", remove_snapshot=False)
+            elif now - camera.last_used > self.ttl:
+                self._drop(camera_id, "idle", remove_snapshot=True)
+            else:
+                evicted += self._expire(camera, now)
+        if evicted:
+            cfg.logger.info("Evicted %d tracked objects idle for more than %.0fs", evicted, self.ttl)
+        if self.snapshots_enabled and now - self._snapshot_at >= self.snapshot_interval:
+            self.snapshot(now)
+
+    def _expire(self, camera: CameraTracking, now: float) -> int:
+        stale = [tid for tid, to in camera.trackables.items() if now - getattr(to, "last_seen", 0.0) > self.ttl]
+        for tid in stale:
+            del camera.trackables[tid]
+        for to in camera.trackables.values():
+            if len(to.centroids) > TRAJECTORY_POINTS:
+                del to.centroids[:-TRAJECTORY_POINTS]
+        return len(stale)
+
+    def _drop(self, camera_id: int, reason: str, remove_snapshot: bool) -> None:
+        camera = self._cameras.pop(camera_id)
+        cfg.logger.info(
+            "Dropped tracking state of camera_id=%s (%s) | live_tracks=%d objects=%d",
+            camera_id,
+            reason,
+            camera.tracker.live_tracks(),
+            len(camera.trackables),
+        )
+        if remove_snapshot and self.snapshots_enabled:
+            try:
+                os.remove(self._snapshot_path(camera_id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                cfg.logger.warning("Could not remove tracking snapshot of camera_id=%s :: %s", camera_id, e)
+
+    # ------------------------------------------------------------- snapshots
+
+    def _snapshot_path(self, camera_id: int) -> str:
+        return os.path.join(self.snapshot_dir, f"camera_{camera_id}.pkl")
+
+    def snapshot(self, now: Optional[float] = None) -> None:
+        """Write the state of every camera tracked since the last snapshot."""
+        if not self.snapshots_enabled:
+            return
+        now = time.time() if now is None else now
+        t0 = time.time()
+        written = 0
+        for camera_id, camera in list(self._cameras.items()):
+            if camera.last_used < self._snapshot_at:
+                continue
+            state = {
+                "camera_id": camera_id,
+                "saved_at": now,
+                "mode": camera.tracker.name,
+                "tracker": camera.tracker.get_state(),
+                "density": camera.density,
+                "trackables": camera.trackables,
+            }
+            path = self._snapshot_path(camera_id)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp, path)
+                written += 1
+            except Exception as e:
+                cfg.logger.warning("Tracking snapshot failed for camera_id=%s :: %s", camera_id, e)
+        self._snapshot_at = now
+        if written:
+            cfg.perf_logger.info(
+                "tracking_snapshot latency_ms=%.2f cameras=%d", (time.time() - t0) * 1000, written
+            )
+
+    def _restore(self, camera_id: int, camera: CameraTracking) -> None:
+        path = self._snapshot_path(camera_id)
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            cfg.logger.warning("Ignoring unreadable tracking snapshot %s :: %s", path, e)
+            return
+        age = time.time() - float(state.get("saved_at", 0.0))
+        if age > self.ttl:
+            cfg.logger.info("Ignoring tracking snapshot of camera_id=%s, %.0fs old", camera_id, age)
+            return
+        try:
+            if state["mode"] != camera.tracker.name:
+                camera.tracker = self.factory(state["mode"], None)
+            camera.tracker.set_state(state["tracker"])
+            camera.trackables = state["trackables"]
+            camera.density = float(state.get("density", camera.density))
+        except Exception as e:
+            cfg.logger.warning("Ignoring incompatible tracking snapshot %s :: %s", path, e)
+            return
+        cfg.logger.info(
+            "Restored %s tracking state of camera_id=%s from a %.0fs old snapshot | live_tracks=%d objects=%d",
+            camera.tracker.name,
+            camera_id,
+            age,
+            camera.tracker.live_tracks(),
+            len(camera.trackables),
+        )
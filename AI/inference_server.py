@@ -0,0 +1,282 @@
+"""Deadline-based micro-batching detection server shared by the camera workers.
+
+One server for every service: run it from the directory of the service whose
+config, weights and YOLO code it should use, with AI/ on PYTHONPATH
+(`dev_envs` sets it; the Docker images copy this file next to `app.py`)::
+
+    python -m inference_server
+
+It loads every weights file in INFERENCE_SERVER_WEIGHTS once and serves them
+over HTTP on INFERENCE_SERVER_HOST:INFERENCE_SERVER_PORT. Each model has a
+`MicroBatcher`: requests wait in a queue, and a dispatcher thread runs a batch
+as soon as it holds INFERENCE_SERVER_MAX_BATCH frames or the oldest frame has
+waited INFERENCE_SERVER_MAX_WAIT_MS, whichever comes first. Frames are grouped
+by (input shape, conf, iou, classes) and run through `my_utils.run_detector`
+(forward pass + `non_max_suppression`); each request gets its own detections
+back. The services talk to it through `common.inference_client.RemoteDetector`
+(INFERENCE_SERVER_URL).
+
+Endpoints:
+
+* ``POST /v1/detect/<model>?conf=&iou=[&classes=0,2]`` body: raw uint8 frames, header
+  ``X-Shape: n,h,w,3``. Returns ``{"detections": [[[x1, y1, x2, y2, conf,
+  cls], ...], ...]}``, one list per frame. ``<model>`` is the weights file name;
+  ``classes`` (class indices) keeps only those classes inside NMS.
+* ``GET /v1/models``: class names per model.
+* ``GET /v1/stats``: per-model counters since the last stats log line.
+
+Per model, every INFERENCE_SERVER_STATS_INTERVAL seconds the performance log
+gets queue latency (submit to batch start), batch fill ratio (frames per batch
+over INFERENCE_SERVER_MAX_BATCH) and throughput.
+"""
+
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import torch
+
+import config as cfg
+import my_utils as mu
+from common.http_client import LatencyHistogram
+from common.inference_client import model_key
+from model_init import get_model_device, load_model_from_path
+
+
+class _Request(NamedTuple):
+    img: np.ndarray
+    conf: float
+    iou: float
+    classes: Optional[Tuple[int, ...]]
+    future: Future
+    submitted: float
+
+
+class MicroBatcher:
+    """Queue plus dispatcher thread that batches detection requests for one model."""
+
+    def __init__(
+        self,
+        name: str,
+        model: Any,
+        device: torch.device,
+        max_batch: int = 16,
+        max_wait_ms: float = 20.0,
+        queue_size: int = 256,
+    ):
+        self.name = name
+        self.model = model
+        self.device = device
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._queue_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._reset_counters()
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def _reset_counters(self) -> None:
+        self._frames = 0
+        self._batches = 0
+        self._busy = 0.0
+        self._since = time.time()
+
+    def submit(
+        self, img: np.ndarray, conf: float, iou: float, classes: Optional[List[int]] = None
+    ) -> Future:
+        """Queue one letterboxed frame; the future resolves to its (n, 6) CPU detections."""
+        future: Future = Future()
+        key = None if classes is None else tuple(int(c) for c in classes)
+        self._queue.put(_Request(img, float(conf), float(iou), key, future, time.monotonic()))
+        return future
+
+    def _collect(self) -> List[_Request]:
+        first = self._queue.get()
+        batch = [first]
+        deadline = first.submitted + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(
+                    self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            for req in batch:
+                self._queue_latency.record((started - req.submitted) * 1000)
+
+            groups: Dict[Tuple[Any, ...], List[_Request]] = defaultdict(list)
+            for req in batch:
+                groups[(req.img.shape, req.conf, req.iou, req.classes)].append(req)
+            for (_, conf, iou, classes), reqs in groups.items():
+                try:
+                    pred = mu.run_detector(
+                        self.model,
+                        [r.img for r in reqs],
+                        self.device,
+                        conf,
+                        iou,
+                        None if classes is None else list(classes),
+                    )
+                    for req, det in zip(reqs, pred):
+                        req.future.set_result(torch.zeros((0, 6)) if det is None else det.cpu())
+                except Exception as e:
+                    cfg.logger.error("Inference server batch failed | model=%s frames=%d :: %s", self.name, len(reqs), e)
+                    for req in reqs:
+                        req.future.set_exception(e)
+
+            with self._lock:
+                self._frames += len(batch)
+                self._batches += 1
+                self._busy += time.monotonic() - started
+
+    def stats(self, reset: bool = False) -> Dict[str, Any]:
+        """Counters since the last reset: frames, batches, fill ratio, fps, queue latency."""
+        with self._lock:
+            elapsed = max(time.time() - self._since, 1e-6)
+            stats = {
+                "frames": self._frames,
+                "batches": self._batches,
+                "fill_ratio": self._frames / (self._batches * self.max_batch) if self._batches else 0.0,
+                "fps": self._frames / elapsed,
+                "busy_ratio": self._busy / elapsed,
+                "queue_depth": self._queue.qsize(),
+            }
+            if reset:
+                self._reset_counters()
+        latency = self._queue_latency.snapshot(reset=reset)
+        stats.update(queue_p50_ms=latency["p50_ms"], queue_p95_ms=latency["p95_ms"], queue_max_ms=latency["max_ms"])
+        return stats
+
+    def log_stats(self) -> None:
+        stats = self.stats(reset=True)
+        cfg.perf_logger.info(
+            "inference_server model=%s frames=%d batches=%d fill_ratio=%.2f fps=%.1f busy=%.2f "
+            "queue_depth=%d queue_p50_ms<=%.0f queue_p95_ms<=%.0f queue_max_ms=%.2f",
+            self.name,
+            stats["frames"],
+            stats["batches"],
+            stats["fill_ratio"],
+            stats["fps"],
+            stats["busy_ratio"],
+            stats["queue_depth"],
+            stats["queue_p50_ms"],
+            stats["queue_p95_ms"],
+            stats["queue_max_ms"],
+        )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "InferenceServer/1.0"
+    batchers: Dict[str, MicroBatcher] = {}
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/v1/models":
+            self._send_json(200, {key: {"names": list(b.model.names)} for key, b in self.batchers.items()})
+        elif path == "/v1/stats":
+            self._send_json(200, {key: b.stats() for key, b in self.batchers.items()})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self) -> None:
+        url = urlparse(self.path)
+        key = url.path.rsplit("/", 1)[-1]
+        batcher = self.batchers.get(key) if url.path.startswith("/v1/detect/") else None
+        if batcher is None:
+            self._send_json(404, {"error": f"unknown model {key}"})
+            return
+        try:
+            params = parse_qs(url.query, keep_blank_values=True)
+            conf = float(params.get("conf", [cfg.MODEL_CONF])[0])
+            iou = float(params.get("iou", [cfg.MODEL_IOU])[0])
+            classes = (
+                [int(c) for c in params["classes"][0].split(",") if c] if "classes" in params else None
+            )
+            shape = tuple(int(d) for d in self.headers["X-Shape"].split(","))
+            # Writable buffer, so torch.from_numpy can wrap the frames without a copy
+            data = bytearray(int(self.headers["Content-Length"]))
+            if self.rfile.readinto(data) != len(data):
+                raise ValueError("truncated body")
+            frames = np.frombuffer(data, dtype=np.uint8).reshape(shape)
+        except Exception as e:
+            self._send_json(400, {"error": f"bad request: {e}"})
+            return
+        try:
+            futures = [batcher.submit(frame, conf, iou, classes) for frame in frames]
+            dets = [f.result().tolist() for f in futures]
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"detections": dets})
+
+    def log_message(self, format: str, *args: Any) -> None:
+        cfg.logger.debug("inference_server %s", format % args)
+
+
+def serve() -> None:
+    """Load INFERENCE_SERVER_WEIGHTS and serve them until interrupted."""
+    if not cfg.INFERENCE_SERVER_WEIGHTS:
+        raise EnvironmentError("INFERENCE_SERVER_WEIGHTS is not set.")
+    device = get_model_device()
+    batchers = {}
+    for weight_path in cfg.INFERENCE_SERVER_WEIGHTS:
+        model = load_model_from_path(weight_path, local=True)
+        batchers[model_key(weight_path)] = MicroBatcher(
+            model_key(weight_path),
+            model,
+            device,
+            max_batch=cfg.INFERENCE_SERVER_MAX_BATCH,
+            max_wait_ms=cfg.INFERENCE_SERVER_MAX_WAIT_MS,
+            queue_size=cfg.INFERENCE_SERVER_QUEUE_SIZE,
+        )
+    _Handler.batchers = batchers
+
+    def _log_stats() -> None:
+        while True:
+            time.sleep(cfg.INFERENCE_SERVER_STATS_INTERVAL)
+            for batcher in batchers.values():
+                batcher.log_stats()
+
+    threading.Thread(target=_log_stats, name="inference-server-stats", daemon=True).start()
+    httpd = ThreadingHTTPServer((cfg.INFERENCE_SERVER_HOST, cfg.INFERENCE_SERVER_PORT), _Handler)
+    httpd.daemon_threads = True
+    cfg.logger.info(
+        "Inference server listening on %s:%s | models=%s device=%s max_batch=%s max_wait_ms=%s",
+        cfg.INFERENCE_SERVER_HOST,
+        cfg.INFERENCE_SERVER_PORT,
+        list(batchers),
+        device,
+        cfg.INFERENCE_SERVER_MAX_BATCH,
+        cfg.INFERENCE_SERVER_MAX_WAIT_MS,
+    )
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,23 +1,32 @@
+from common import startup  # first, so the start-up timing covers the imports below
 import os
 import my_utils as mu
 import config as cfg
-import requests
+from common.http_client import get_client
 from model_init import get_model_device, load_model_from_path
 from datetime import datetime, timezone, timedelta
 import json
 import time
 import cv2
+from common.pipeline import PipelineRunner
+from common import frame_queue, ingest, motion_gate, sharding
+from typing import Any, Dict, List, Optional
+
+startup.mark("imports")
 
 PERSON_WEIGHT_PATH = cfg.PERSON_WEIGHT_PATH
 PERSON_MODEL = load_model_from_path(PERSON_WEIGHT_PATH)
 
 DEVICE = get_model_device()
+GATE = motion_gate.get_gate()
 
 frame_status_url = cfg.FRAME_STATUS_URL
 get_frame_url = cfg.GET_FRAME_URL
 COPY_IMAGES_URL = cfg.COPY_IMAGES_URL
 DELETE_SOURCE_IMAGE_URL = cfg.DELETE_SOURCE_IMAGE_URL
 
+USECASE = "intrusion_detection"
+
 # ==================================================================================
 # Optional visualization toggle: set to True to save detection overlays
 # You can also comment out the entire block below where this flag is used
@@ -37,7 +46,10 @@ def set_response_schema(current_time: datetime, frame_status: str, camera_id: in
     cfg.logger.debug(
         "Posting frame status | url=%s payload=%s", frame_status_url, payload
     )
-    requests.post(frame_status_url, json=payload)
+    if cfg.HTTP_ASYNC_STATUS:
+        get_client().post_async("frame_status", frame_status_url, json=payload)
+    else:
+        get_client().post("frame_status", frame_status_url, json=payload)
 
 
 def _build_image_url(local_path: str) -> str:
@@ -68,430 +80,663 @@ def _build_image_url(local_path: str) -> str:
         return local_path
 
 
-if __name__ == "__main__":
-    cfg.logger.info("Intrusion Detection service starting up")
-    cfg.logger.info("Model weights: %s | Device: %s", PERSON_WEIGHT_PATH, DEVICE)
-    while True:
+# ============================ Per-camera stages ============================
+# A camera goes through resolve -> fetch -> load -> inference -> publish. Each
+# stage receives the frame context built by the previous one and returns None
+# when the camera has nothing more to do this cycle.
+
+
+def resolve_camera(camera: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Look up the active intrusion mapping for a camera.
+
+    Returns a frame context holding the camera id and mapping row, or None when
+    the camera has no active intrusion mapping.
+    """
+    camera_id = int(camera["id"])
+    cfg.logger.info(f"Running AI on camera_id :: {camera_id}")
+
+    cfg.logger.debug(f"Configured Result type id :: {cfg.RESULT_TYPE_ID}")
+    roi_details = mu.get_roi_by_result_type_id_and_camera_rtsp_id(
+        cfg.RESULT_TYPE_ID, camera_id
+    )
+    cfg.logger.info(
+        f"ROI DETAILS for RESULT_TYPE_ID :: {cfg.RESULT_TYPE_ID} and camera_id :: {camera_id} are \n {roi_details}"
+    )
+    if not roi_details:
+        return None
+
+    cfg.logger.debug("Parsed ROI polygons (len=%d)", len(roi_details.get("roi_polygons") or []))
+    return {"camera_id": camera_id, "roi_details": roi_details}
+
+
+def fetch_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ask the frames API for the camera's frame from one minute ago.
+
+    Adds the frame time and the frame's disk path/URL to the context.
+    """
+    camera_id = ctx["camera_id"]
+    # Use current UTC time minus 1 minute for frame fetching
+    dt_utc_minus_1 = datetime.now(timezone.utc) - timedelta(minutes=1)
+    # Preserve exact seconds (do not round to 00)
+    current_time = dt_utc_minus_1.strftime("%Y-%m-%d %H:%M:%S")
+    params = {
+        "frame_time": current_time,  # Exact UTC timestamp with seconds
+        "camera_id": int(camera_id),
+    }
+    cfg.logger.info(f"Fetching frame | url={get_frame_url} params={params}")
+
+    t_get_start = time.time()
+    response = get_client().get("get_frame", get_frame_url, params=params)
+    t_get_end = time.time()
+    cfg.perf_logger.info(
+        "get_frame latency_ms=%.2f camera_id=%s",
+        (t_get_end - t_get_start) * 1000,
+        camera_id,
+    )
+
+    if response.status_code == 200:
+        cfg.logger.info(f"Frame API Response :: {response.status_code}")
+
+    else:
+        cfg.logger.error(f"Error: {response.status_code}, {response.text}")
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="started",
+        camera_id=int(camera_id),
+    )
+    response = response.json()
+    image_path = response.get("frame_data")
+    cfg.logger.info(f"Image get from api :: {image_path}")
+    if not image_path:
+        return None
+
+    ctx["camera_id"] = int(image_path.split("/")[-2])
+    cfg.logger.info(f"Proceeding with Camera ID :: {ctx['camera_id']} ")
+    return attach_frame(ctx, image_path, current_time)
+
+
+def attach_frame(ctx: Dict[str, Any], image_path: str, current_time: str) -> Dict[str, Any]:
+    """Record the frame's disk path/URL and time on the context and mark it processing."""
+    cfg.logger.debug(f"cfg.ROOT_PATH :: {cfg.ROOT_PATH}")
+    cfg.logger.debug(f"cfg.ROOT_URL :: {cfg.ROOT_URL}")
+    image_path_url = _build_image_url(image_path)
+    cfg.logger.debug(f"Converted image_path_url: {image_path_url}")
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="processing",
+        camera_id=int(ctx["camera_id"]),
+    )
+
+    ctx.update(
+        current_time=current_time,
+        main_image_path=image_path,
+        image_path_url=image_path_url,
+    )
+    return ctx
+
+
+def claim_contexts(camera_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resolve the cameras' mappings and lease their next unprocessed frames.
+
+    Used when FRAME_SOURCE=claim. Returns one context per claimed frame, ready
+    for `load_frame`.
+    """
+    resolved = {}
+    for camera in camera_list:
+        ctx = resolve_camera(camera)
+        if ctx:
+            resolved[ctx["camera_id"]] = ctx
+
+    contexts = []
+    for frame in frame_queue.claim_frames(USECASE, list(resolved)):
+        base = resolved.get(int(frame["camera_id"]))
+        if base is None:
+            continue
+        ctx = dict(base, frame_id=frame["id"], lease_token=frame["lease_token"])
+        set_response_schema(
+            current_time=frame["frame_time"],
+            frame_status="started",
+            camera_id=int(ctx["camera_id"]),
+        )
+        contexts.append(attach_frame(ctx, frame["frame_data"], frame["frame_time"]))
+    return contexts
+
+
+def crop_rois(ctx: Dict[str, Any]) -> Optional[ingest.CropRois]:
+    """The camera's ROI polygons when its mapping selects ROI-cropped inference
+    (roi_type, see ingest.crop_selected), else None."""
+    roi_details = ctx["roi_details"]
+    polygons = roi_details.get("roi_polygons") or []
+    return ([], polygons) if polygons and ingest.crop_selected(roi_details.get("roi_type")) else None
+
+
+def load_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Read and decode the frame (see common/ingest.py), preferring the local frames volume.
+
+    Adds `img` (letterboxed CHW array, or one per ROI crop when the mapping
+    selects cropped inference), `img0` (decoded BGR frame, possibly reduced)
+    and the frame's original shape/scale to the context. A frame
+    that cannot be read is marked completed so it does not block downstream
+    consumers.
+    """
+    camera_id = ctx["camera_id"]
+    image_path_url = ctx["image_path_url"]
+
+    cfg.logger.info(f"Proceeding with Image Size :: {cfg.IMAGE_SIZE} ")
+    t_load_start = time.time()
+    frame = ingest.load_frame(image_path_url, ctx["main_image_path"], int(cfg.IMAGE_SIZE), crop=crop_rois(ctx))
+    t_load_end = time.time()
+    cfg.perf_logger.info(
+        "load_image latency_ms=%.2f camera_id=%s path=%s source=%s scale=%.2f crops=%d",
+        (t_load_end - t_load_start) * 1000,
+        camera_id,
+        image_path_url,
+        frame.source[0] if frame else "none",
+        frame.scale if frame else 0.0,
+        len(frame.img) if frame and isinstance(frame.img, list) else 0,
+    )
+    if frame is None:
+        cfg.logger.error(
+            "Failed to load image (skipping). url=%s", image_path_url
+        )
+        # Mark as completed for this frame to avoid blocking downstream
+        set_response_schema(
+            current_time=ctx["current_time"],
+            frame_status="completed",
+            camera_id=int(camera_id),
+        )
+        frame_queue.complete_frame(USECASE, ctx, "FAILED")
+        return None
+
+    return ingest.attach(ctx, frame)
+
+
+def frame_changed(ctx: Dict[str, Any]) -> bool:
+    """Motion gate: whether the frame changed inside the camera's ROI polygons."""
+    return GATE.check(
+        ctx["camera_id"],
+        ctx["img0"],
+        ctx["frame_shape"],
+        polygons=ctx["roi_details"].get("roi_polygons"),
+    )
+
+
+def static_result(ctx: Dict[str, Any]) -> Dict[str, Any]:
+    """Result for a frame the motion gate skipped."""
+    cfg.logger.info("Frame unchanged; skipping inference | camera_id=%s", ctx["camera_id"])
+    return GATE.static_result(ctx["camera_id"], {"detection": [], "inference_time": 0.0})
+
+
+def run_inference(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the person detector on a single loaded frame (person class only).
+    Unchanged frames skip the detector (see common/motion_gate.py)."""
+    camera_id = ctx["camera_id"]
+    cfg.logger.info(f"Usecase Selected :: {USECASE}")
+    cfg.logger.info("intrusion_detection usecase detected")
+    if not frame_changed(ctx):
+        return static_result(ctx)
+
+    t_inf_start = time.time()
+    result = mu.predict(
+        PERSON_MODEL,
+        ctx["img"],
+        ctx["frame_geometry"],
+        DEVICE,
+        float(cfg.MODEL_CONF),
+        float(cfg.MODEL_IOU),
+        USECASE,
+        str(camera_id),
+        labels=["person"],
+    )
+    t_inf_end = time.time()
+    cfg.perf_logger.info(
+        "inference latency_ms=%.2f camera_id=%s detections=%s",
+        (t_inf_end - t_inf_start) * 1000,
+        camera_id,
+        (len(result.get("detection", [])) if isinstance(result, dict) else -1),
+    )
+    GATE.remember(camera_id, result)
+    return result
+
+
+def publish_result(ctx: Dict[str, Any], result: Optional[Dict[str, Any]]) -> None:
+    """Relabel persons inside the ROI as intrusions, copy the event image,
+    store the result and mark the frame completed."""
+    camera_id = ctx["camera_id"]
+    roi_details = ctx["roi_details"]
+    current_time = ctx["current_time"]
+    image_path_url = ctx["image_path_url"]
+    main_image_path = ctx["main_image_path"]
+
+    cfg.logger.info(f"Raw detection result::{result}")
+
+    # Only person detections reach here: predict() keeps the person class inside NMS
+
+    # ROI polygons were parsed when the mapping cache loaded (empty -> full frame)
+    roi_polys = roi_details.get("roi_polygons") or []
+    # Relabel intrusions if center lies inside ROI
+    if isinstance(result, dict):
+        H, W = ctx["frame_shape"][:2]
+        result = mu.relabel_intrusions(result, roi_polys, (W, H))
+        # Keep only intrusions; drop non-intrusion detections (i.e., outside ROI)
         try:
-            start_cycle_ts = time.time()
-            camera_list = mu.get_all_camera()
-            cfg.logger.info(f"camera_list :: {camera_list}")
+            dets = result.get("detection", [])
+            before = len(dets)
+            result["detection"] = [d for d in dets if d.get("label") == "intrusion"]
+            after = len(result.get("detection", []))
+            cfg.logger.info(
+                "Filtered to intrusions post-ROI | before=%s after=%s",
+                before,
+                after,
+            )
+        except Exception as e:
+            cfg.logger.warning(
+                "Failed to filter to intrusions after ROI relabel: %s", e
+            )
 
-            for camera in camera_list:
-                camera_id = int(camera["id"])
-                cfg.logger.info(f"Running AI on camera_id :: {camera_id}")
-                cam_start_ts = time.time()
+    # If ROI(s) are provided, prepare an overlay image in memory. We'll write it
+    # to the destination (events) image after COPY succeeds, leaving source intact.
+    # COPY only happens for frames with intrusions, so skip the overlay otherwise.
+    roi_overlay_img = None
+    try:
+        if roi_polys and result and result.get("detection"):
+            roi_overlay_img = ingest.full_frame(ctx).copy()
+            for poly in roi_polys:
+                pts = [(int(x), int(y)) for x, y in poly]
+                # Draw closed polygon for ROI
+                for i in range(len(pts)):
+                    cv2.line(
+                        roi_overlay_img,
+                        pts[i],
+                        pts[(i + 1) % len(pts)],
+                        (255, 0, 0), 2,
+                    )
+                # Mark the ROI text near the first vertex
+                cv2.putText(
+                    roi_overlay_img,
+                    "Intrusion ROI",
+                    pts[0],
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7,
+                    (255, 0, 0),
+                    2,
+                    cv2.LINE_AA,
+                )
+    except Exception as e:
+        cfg.logger.warning("Failed to generate ROI overlay: %s", e)
 
-                cfg.logger.debug(f"Configured Result type id :: {cfg.RESULT_TYPE_ID}")
-                roi_details = mu.get_roi_by_result_type_id_and_camera_rtsp_id(
-                    cfg.RESULT_TYPE_ID, camera_id
+    # ==================================================================================
+    # Optional visualization block (can be commented out)
+    if VISUALIZE_OUTPUTS and result and result.get("detection") is not None:
+        try:
+            vis_img = ingest.full_frame(ctx).copy()
+            # Draw ROI polygons
+            if roi_polys:
+                for poly in roi_polys:
+                    pts = [(int(x), int(y)) for x, y in poly]
+                    for i in range(len(pts)):
+                        cv2.line(
+                            vis_img,
+                            pts[i],
+                            pts[(i + 1) % len(pts)],
+                            (255, 0, 0),
+                            2,
+                        )
+                    cv2.putText(
+                        vis_img,
+                        "Intrusion ROI",
+                        pts[0],
+                        cv2.FONT_HERSHEY_SIMPLEX,
+                        0.6,
+                        (255, 0, 0),
+                        2,
+                        cv2.LINE_AA,
+                    )
+            else:
+                # indicate full-frame ROI
+                cv2.rectangle(
+                    vis_img,
+                    (0, 0),
+                    (vis_img.shape[1] - 1, vis_img.shape[0] - 1),
+                    (255, 0, 0),
+                    2,
                 )
-                cfg.logger.info(
-                    f"ROI DETAILS for RESULT_TYPE_ID :: {cfg.RESULT_TYPE_ID} and camera_id :: {camera_id} are \n {roi_details}"
+                cv2.putText(
+                    vis_img,
+                    "ROI(full)",
+                    (10, 25),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7,
+                    (255, 0, 0),
+                    2,
+                    cv2.LINE_AA,
+                )
+            # Draw detections: highlight intrusions
+            for det in result.get("detection", []):
+                x1, y1, x2, y2 = det.get("location", [0, 0, 0, 0])
+                label = det.get("label", "")
+                color = (0,0,255) if label == "intrusion" else (0,255,0)
+                cv2.rectangle(
+                    vis_img,
+                    (int(x1), int(y1)),
+                    (int(x2), int(y2)),
+                    color,
+                    2,
+                )
+                cv2.putText(
+                    vis_img,
+                    str(label),
+                    (int(x1), max(0, int(y1) - 5)),
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.6,
+                    color,
+                    2,
+                    cv2.LINE_AA,
                 )
 
-                if roi_details:
-                    roi_raw = (
-                        roi_details.get("roi")
-                        if isinstance(roi_details, dict)
-                        else None
-                    )
-                    roi_list = []
-                    if roi_raw:
-                        try:
-                            roi_list = json.loads(roi_raw)
-                        except Exception as e:
-                            cfg.logger.warning(
-                                "Failed to parse ROI JSON; proceeding without ROI | error=%s roi_raw=%s",
-                                e,
-                                str(roi_raw)[:200],
-                            )
-                    cfg.logger.debug(
-                        "Parsed ROI list (len=%d)",
-                        len(roi_list) if isinstance(roi_list, list) else 0,
-                    )
-                    # Use current UTC time minus 1 minute for frame fetching
-                    dt_utc_minus_1 = datetime.now(timezone.utc) - timedelta(minutes=1)
-                    # Preserve exact seconds (do not round to 00)
-                    current_time = dt_utc_minus_1.strftime("%Y-%m-%d %H:%M:%S")
-                    params = {
-                        "frame_time": current_time,  # Exact UTC timestamp with seconds
-                        "camera_id": int(camera_id),
-                    }
+            # Resize to 640x640 for output visualization
+            vis_img = cv2.resize(vis_img, (640, 640))
+
+            os.makedirs("intrusion_outputs", exist_ok=True)
+            out_name = image_path_url.split("/")[-1]
+            out_path = os.path.join("intrusion_outputs", out_name)
+            cv2.imwrite(out_path, vis_img)
+            cfg.logger.info("Saved visualization image: %s", out_path)
+        except Exception as e:
+            cfg.logger.warning("Failed to generate visualization: %s", e)
+    # ==================================================================================
+
+    # Proceed only if we have at least one detection (person or intrusion)
+    if result and result.get("detection"):
+        params = {
+            "image_source_url": image_path_url,
+            "image_des_url": image_path_url.replace("raw_frames", "events"),
+            "image_size": cfg.IMAGE_SIZE,
+        }
+        cfg.logger.info(f"copy output image :: {params}")
+
+        t_copy_start = time.time()
+        response = get_client().post("copy_image", COPY_IMAGES_URL, params=params)
+        t_copy_end = time.time()
+        cfg.perf_logger.info(
+            "copy_image latency_ms=%.2f camera_id=%s status=%s",
+            (t_copy_end - t_copy_start) * 1000,
+            camera_id,
+            response.status_code,
+        )
+
+        if response.status_code == 200:
+            cfg.logger.info("Copy API succeeded, persisting results to backend DB")
+            # If we have an ROI overlay image prepared, write it to destination
+            # file path so the saved (events) image contains the ROI outline.
+            try:
+                if roi_overlay_img is not None:
+                    dest_local_path = main_image_path.replace("raw_frames", "events")
+                    cv2.imwrite(dest_local_path, roi_overlay_img)
                     cfg.logger.info(
-                        f"Fetching frame | url={get_frame_url} params={params}"
+                        "ROI overlay written to destination image: %s", dest_local_path
                     )
+            except Exception as e:
+                cfg.logger.warning(
+                    "Failed to write ROI overlay to destination image: %s", e
+                )
+            mu.store_result(
+                file_name=image_path_url.split("/")[-1],
+                file_path=os.path.dirname(
+                    main_image_path.replace("raw_frames", "events")
+                ),
+                file_url=image_path_url.replace("raw_frames", "events"),
+                bounding_box=result,
+                frame_time=current_time,
+                camera_id=int(camera_id),
+            )
 
-                    t_get_start = time.time()
-                    response = requests.get(get_frame_url, params=params)
-                    t_get_end = time.time()
-                    cfg.perf_logger.info(
-                        "get_frame latency_ms=%.2f camera_id=%s",
-                        (t_get_end - t_get_start) * 1000,
-                        camera_id,
-                    )
+            cfg.logger.debug(f"Result Added into database successfully ....")
+        else:
+            cfg.logger.error(
+                "Copy API failed | status=%s body=%s",
+                response.status_code,
+                getattr(response, "text", ""),
+            )
+    else:
+        cfg.logger.info(
+            "No detections after label filtering; skipping copy/store for camera_id=%s",
+            camera_id,
+        )
+
+    set_response_schema(
+        current_time=current_time,
+        frame_status="completed",
+        camera_id=int(camera_id),
+    )
+    frame_queue.complete_frame(USECASE, ctx, "DONE")
+
+    # # Call API to delete source image after processing
+    # delete_params = {"image_source_url": image_path_url}
+    # cfg.logger.info(
+    #     f"Calling DELETE_SOURCE_IMAGE_URL API with: {delete_params}"
+    # )
+    # cfg.logger.debug(f"Delete API :: {DELETE_SOURCE_IMAGE_URL}")
+    #
+    # t_del_start = time.time()
+    # delete_response = get_client().delete(
+    #     "delete_image", DELETE_SOURCE_IMAGE_URL, params=delete_params
+    # )
+    # t_del_end = time.time()
+    # cfg.perf_logger.info(
+    #     "delete_image latency_ms=%.2f camera_id=%s status=%s",
+    #     (t_del_end - t_del_start) * 1000,
+    #     camera_id,
+    #     delete_response.status_code,
+    # )
+    # cfg.logger.info(
+    #     f"Source image deleted successfully: {delete_response.status_code}"
+    # )
+
+
+def fetch_and_load(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the fetch and load stages for a resolved camera."""
+    # Claimed frames arrive with their path already attached
+    if "main_image_path" not in ctx:
+        ctx = fetch_frame(ctx)
+    if ctx:
+        ctx = load_frame(ctx)
+    return ctx
+
+
+def prepare_camera(camera: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the resolve, fetch and load stages for a camera."""
+    ctx = resolve_camera(camera)
+    if ctx:
+        ctx = fetch_and_load(ctx)
+    return ctx
+
+
+def infer_batch(contexts: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """Run the detector over several loaded frames, BATCH_SIZE frames per pass.
+    Frames the motion gate finds unchanged are left out of the batch."""
+    t_inf_start = time.time()
+    changed = [frame_changed(ctx) for ctx in contexts]
+    active = [ctx for ctx, moved in zip(contexts, changed) if moved]
+    detected = iter(
+        mu.predict_batch(
+            PERSON_MODEL,
+            [ctx["img"] for ctx in active],
+            [ctx["frame_geometry"] for ctx in active],
+            DEVICE,
+            float(cfg.MODEL_CONF),
+            float(cfg.MODEL_IOU),
+            cfg.BATCH_SIZE,
+            labels_list=[["person"]] * len(active),
+        )
+    )
+    cfg.perf_logger.info(
+        "batch_inference latency_ms=%.2f frames=%d skipped=%d",
+        (time.time() - t_inf_start) * 1000,
+        len(active),
+        len(contexts) - len(active),
+    )
+    # In frame order, so a skipped frame reuses its camera's latest result
+    results = []
+    for ctx, moved in zip(contexts, changed):
+        if moved:
+            result = next(detected)
+            GATE.remember(ctx["camera_id"], result)
+        else:
+            result = static_result(ctx)
+        results.append(result)
+    return results
+
+
+# ============================ Cycle runners ============================
+
+
+def run_sequential_cycle(camera_list: List[Dict[str, Any]]) -> None:
+    """Process cameras one at a time, one forward pass per camera."""
+    for camera in camera_list:
+        cam_start_ts = time.time()
+        ctx = prepare_camera(camera)
+        if ctx:
+            result = run_inference(ctx)
+            publish_result(ctx, result)
+
+        cfg.logger.info(
+            "AI Processing Ended - **************************************************"
+        )
+        cfg.perf_logger.info(
+            "camera_cycle_total_ms=%.2f camera_id=%s",
+            (time.time() - cam_start_ts) * 1000,
+            camera["id"],
+        )
+
+
+def run_batched_cycle(camera_list: List[Dict[str, Any]]) -> None:
+    """Load every active camera's frame first, then run the detector over all
+    of them in batches of at most BATCH_SIZE frames."""
+    t_prepare_start = time.time()
+    contexts = []
+    for camera in camera_list:
+        ctx = prepare_camera(camera)
+        if ctx:
+            contexts.append(ctx)
+    cfg.perf_logger.info(
+        "batch_prepare latency_ms=%.2f cameras=%d frames=%d",
+        (time.time() - t_prepare_start) * 1000,
+        len(camera_list),
+        len(contexts),
+    )
+    if not contexts:
+        return
 
-                    if response.status_code == 200:
-                        cfg.logger.info(f"Frame API Response :: {response.status_code}")
+    process_batch(contexts)
 
-                    else:
-                        cfg.logger.error(
-                            f"Error: {response.status_code}, {response.text}"
-                        )
 
-                    set_response_schema(
-                        current_time=current_time,
-                        frame_status="started",
-                        camera_id=int(camera_id),
-                    )
-                    response = response.json()
-                    image_path = response.get("frame_data")
-                    main_image_path = image_path
-                    cfg.logger.info(f"Image get from api :: {image_path}")
-
-                    if image_path:
-                        cfg.logger.debug(f"cfg.ROOT_PATH :: {cfg.ROOT_PATH}")
-                        cfg.logger.debug(f"cfg.ROOT_URL :: {cfg.ROOT_URL}")
-                        image_path_url = _build_image_url(image_path)
-                        cfg.logger.debug(f"Converted image_path_url: {image_path_url}")
-
-                        camera_id = int(image_path.split("/")[-2])
-                        cfg.logger.info(f"Proceeding with Camera ID :: {camera_id} ")
-
-                        set_response_schema(
-                            current_time=current_time,
-                            frame_status="processing",
-                            camera_id=int(camera_id),
-                        )
+def process_batch(contexts: List[Dict[str, Any]]) -> None:
+    """Run batched inference over loaded frames and publish each result."""
+    cfg.logger.info(
+        "Running batched inference | usecase=%s frames=%d batch_size=%d",
+        USECASE,
+        len(contexts),
+        cfg.BATCH_SIZE,
+    )
+    results = infer_batch(contexts)
+
+    for ctx, result in zip(contexts, results):
+        publish_result(ctx, result)
+        cfg.logger.info(
+            "AI Processing Ended - **************************************************"
+        )
+
+
+def run_pipeline_cycle(runner: PipelineRunner, camera_list: List[Dict[str, Any]]) -> None:
+    """Resolve mappings on this thread, against the mapping-cache snapshot
+    refreshed once per cycle, then hand the active cameras to the staged pipeline."""
+    contexts = []
+    for camera in camera_list:
+        ctx = resolve_camera(camera)
+        if ctx:
+            contexts.append(ctx)
+    runner.run_cycle(ingest.by_input_shape(contexts))
+
+
+def run_claim_cycle(runner: Optional[PipelineRunner], camera_list: List[Dict[str, Any]]) -> int:
+    """Lease the next frames from the claim queue and process them in the
+    configured RUN_MODE. Returns the number of frames claimed."""
+    contexts = claim_contexts(camera_list)
+    if not contexts:
+        return 0
+    if runner is not None:
+        runner.run_cycle(ingest.by_input_shape(contexts))
+    elif cfg.RUN_MODE == "batch":
+        loaded = [ctx for ctx in (load_frame(c) for c in contexts) if ctx]
+        if loaded:
+            process_batch(loaded)
+    else:
+        for ctx in contexts:
+            ctx = load_frame(ctx)
+            if ctx:
+                _publish_and_log(ctx, run_inference(ctx))
+    return len(contexts)
+
+
+def _publish_and_log(ctx: Dict[str, Any], result: Optional[Dict[str, Any]]) -> None:
+    publish_result(ctx, result)
+    cfg.logger.info(
+        "AI Processing Ended - **************************************************"
+    )
 
-                        cfg.logger.info(
-                            f"Proceeding with Image Size :: {cfg.IMAGE_SIZE} "
-                        )
-                        t_load_start = time.time()
-                        load_res = mu.load_image_from_url(
-                            image_path_url, int(cfg.IMAGE_SIZE)
-                        )
-                        t_load_end = time.time()
-                        cfg.perf_logger.info(
-                            "load_image latency_ms=%.2f camera_id=%s path=%s",
-                            (t_load_end - t_load_start) * 1000,
-                            camera_id,
-                            image_path_url,
-                        )
-                        if not load_res or load_res is False or not isinstance(load_res, tuple) or len(load_res) != 3:
-                            cfg.logger.error(
-                                "Failed to load image from URL (skipping). url=%s", image_path_url
-                            )
-                            # Mark as completed for this frame to avoid blocking downstream
-                            set_response_schema(
-                                current_time=current_time,
-                                frame_status="completed",
-                                camera_id=int(camera_id),
-                            )
-                            continue
-                        img, img0, image_path = load_res
-
-                        usecase = "intrusion_detection"
-
-                        cfg.logger.info(f"Usecase Selected :: {usecase}")
-                        cfg.logger.info("intrusion_detection usecase detected")
-
-                        t_inf_start = time.time()
-                        result = mu.predict(
-                            PERSON_MODEL,
-                            img,
-                            img0,
-                            DEVICE,
-                            float(cfg.MODEL_CONF),
-                            float(cfg.MODEL_IOU),
-                            usecase,
-                            str(camera_id),
-                        )
-                        t_inf_end = time.time()
-                        cfg.perf_logger.info(
-                            "inference latency_ms=%.2f camera_id=%s detections=%s",
-                            (t_inf_end - t_inf_start) * 1000,
-                            camera_id,
-                            (
-                                len(result.get("detection", []))
-                                if isinstance(result, dict)
-                                else -1
-                            ),
-                        )
 
-                        cfg.logger.info(f"Raw detection result::{result}")
-
-                        # Keep only person detections for intrusion logic
-                        if isinstance(result, dict):
-                            dets = result.get("detection", [])
-                            before = len(dets)
-                            result["detection"] = [
-                                d for d in dets if d.get("label") == "person"
-                            ]
-                            after = len(result.get("detection", []))
-                            cfg.logger.info(
-                                "Filtered to person class | before=%s after=%s",
-                                before,
-                                after,
-                            )
-
-                        # Parse ROI polygons (empty -> full frame)
-                        roi_polys = []
-                        roi_raw = (
-                            roi_details.get("roi")
-                            if isinstance(roi_details, dict)
-                            else None
-                        )
-                        if roi_raw:
-                            roi_polys = mu._parse_roi_list(roi_raw)
-                        # Relabel intrusions if center lies inside ROI
-                        if isinstance(result, dict):
-                            H, W = img0.shape[:2]
-                            result = mu.relabel_intrusions(result, roi_polys, (W, H))
-                            # Keep only intrusions; drop non-intrusion detections (i.e., outside ROI)
-                            try:
-                                dets = result.get("detection", [])
-                                before = len(dets)
-                                result["detection"] = [
-                                    d for d in dets if d.get("label") == "intrusion"
-                                ]
-                                after = len(result.get("detection", []))
-                                cfg.logger.info(
-                                    "Filtered to intrusions post-ROI | before=%s after=%s",
-                                    before,
-                                    after,
-                                )
-                            except Exception as e:
-                                cfg.logger.warning(
-                                    "Failed to filter to intrusions after ROI relabel: %s", e
-                                )
-
-                        # If ROI(s) are provided, prepare an overlay image in memory. We'll write it
-                        # to the destination (events) image after COPY succeeds, leaving source intact.
-                        roi_overlay_img = None
-                        try:
-                            if roi_polys and isinstance(roi_polys, list) and len(roi_polys) > 0:
-                                roi_overlay_img = img0.copy()
-                                for poly in roi_polys:
-                                    pts = [(int(x), int(y)) for x, y in poly]
-                                    # Draw closed polygon for ROI
-                                    for i in range(len(pts)):
-                                        cv2.line(
-                                            roi_overlay_img,
-                                            pts[i],
-                                            pts[(i + 1) % len(pts)],
-                                            (255, 0, 0), 2,
-                                        )
-                                    # Mark the ROI text near the first vertex
-                                    cv2.putText(
-                                        roi_overlay_img,
-                                        "Intrusion ROI",
-                                        pts[0],
-                                        cv2.FONT_HERSHEY_SIMPLEX,
-                                        0.7,
-                                        (255, 0, 0),
-                                        2,
-                                        cv2.LINE_AA,
-                                    )
-                        except Exception as e:
-                            cfg.logger.warning("Failed to generate ROI overlay: %s", e)
-
-                        # ==================================================================================
-                        # Optional visualization block (can be commented out)
-                        if (
-                            VISUALIZE_OUTPUTS
-                            and result
-                            and result.get("detection") is not None
-                        ):
-                            try:
-                                vis_img = img0.copy()
-                                # Draw ROI polygons
-                                if roi_polys:
-                                    for poly in roi_polys:
-                                        pts = [(int(x), int(y)) for x, y in poly]
-                                        for i in range(len(pts)):
-                                            cv2.line(
-                                                vis_img,
-                                                pts[i],
-                                                pts[(i + 1) % len(pts)],
-                                                (255, 0, 0),
-                                                2,
-                                            )
-                                        cv2.putText(
-                                            vis_img,
-                                            "Intrusion ROI",
-                                            pts[0],
-                                            cv2.FONT_HERSHEY_SIMPLEX,
-                                            0.6,
-                                            (255, 0, 0),
-                                            2,
-                                            cv2.LINE_AA,
-                                        )
-                                else:
-                                    # indicate full-frame ROI
-                                    cv2.rectangle(
-                                        vis_img,
-                                        (0, 0),
-                                        (vis_img.shape[1] - 1, vis_img.shape[0] - 1),
-                                        (255, 0, 0),
-                                        2,
-                                    )
-                                    cv2.putText(
-                                        vis_img,
-                                        "ROI(full)",
-                                        (10, 25),
-                                        cv2.FONT_HERSHEY_SIMPLEX,
-                                        0.7,
-                                        (255, 0, 0),
-                                        2,
-                                        cv2.LINE_AA,
-                                    )
-                                # Draw detections: highlight intrusions
-                                for det in result.get("detection", []):
-                                    x1, y1, x2, y2 = det.get("location", [0, 0, 0, 0])
-                                    label = det.get("label", "")
-                                    color = (0,0,255) if label == "intrusion" else (0,255,0)
-                                    cv2.rectangle(
-                                        vis_img,
-                                        (int(x1), int(y1)),
-                                        (int(x2), int(y2)),
-                                        color,
-                                        2,
-                                    )
-                                    cv2.putText(
-                                        vis_img,
-                                        str(label),
-                                        (int(x1), max(0, int(y1) - 5)),
-                                        cv2.FONT_HERSHEY_SIMPLEX,
-                                        0.6,
-                                        color,
-                                        2,
-                                        cv2.LINE_AA,
-                                    )
-
-                                # Resize to 640x640 for output visualization
-                                vis_img = cv2.resize(vis_img, (640, 640))
-
-                                os.makedirs("intrusion_outputs", exist_ok=True)
-                                out_name = image_path_url.split("/")[-1]
-                                out_path = os.path.join("intrusion_outputs", out_name)
-                                cv2.imwrite(out_path, vis_img)
-                                cfg.logger.info(
-                                    "Saved visualization image: %s", out_path
-                                )
-                            except Exception as e:
-                                cfg.logger.warning(
-                                    "Failed to generate visualization: %s", e
-                                )
-                        # ==================================================================================
-
-                        # Proceed only if we have at least one detection (person or intrusion)
-                        if result and result.get("detection"):
-                            params = {
-                                "image_source_url": image_path_url,
-                                "image_des_url": image_path_url.replace(
-                                    "raw_frames", "events"
-                                ),
-                                "image_size": cfg.IMAGE_SIZE,
-                            }
-                            cfg.logger.info(f"copy output image :: {params}")
-
-                            t_copy_start = time.time()
-                            response = requests.post(COPY_IMAGES_URL, params=params)
-                            t_copy_end = time.time()
-                            cfg.perf_logger.info(
-                                "copy_image latency_ms=%.2f camera_id=%s status=%s",
-                                (t_copy_end - t_copy_start) * 1000,
-                                camera_id,
-                                response.status_code,
-                            )
-
-                            if response.status_code == 200:
-                                cfg.logger.info(
-                                    "Copy API succeeded, persisting results to backend DB"
-                                )
-                                # If we have an ROI overlay image prepared, write it to destination
-                                # file path so the saved (events) image contains the ROI outline.
-                                try:
-                                    if roi_overlay_img is not None:
-                                        dest_local_path = main_image_path.replace("raw_frames", "events")
-                                        cv2.imwrite(dest_local_path, roi_overlay_img)
-                                        cfg.logger.info(
-                                            "ROI overlay written to destination image: %s", dest_local_path
-                                        )
-                                except Exception as e:
-                                    cfg.logger.warning(
-                                        "Failed to write ROI overlay to destination image: %s", e
-                                    )
-                                mu.store_result(
-                                    file_name=image_path_url.split("/")[-1],
-                                    file_path=os.path.dirname(
-                                        main_image_path.replace("raw_frames", "events")
-                                    ),
-                                    file_url=image_path_url.replace(
-                                        "raw_frames", "events"
-                                    ),
-                                    bounding_box=result,
-                                    frame_time=current_time,
-                                    camera_id=int(camera_id),
-                                )
-
-                                cfg.logger.debug(
-                                    f"Result Added into database successfully ...."
-                                )
-                            else:
-                                cfg.logger.error(
-                                    "Copy API failed | status=%s body=%s",
-                                    response.status_code,
-                                    getattr(response, "text", ""),
-                                )
-                        else:
-                            cfg.logger.info(
-                                "No detections after label filtering; skipping copy/store for camera_id=%s",
-                                camera_id,
-                            )
-
-                        set_response_schema(
-                            current_time=current_time,
-                            frame_status="completed",
-                            camera_id=int(camera_id),
-                        )
+if __name__ == "__main__":
+    cfg.logger.info("Intrusion Detection service starting up")
+    cfg.logger.info("Model weights: %s | Device: %s", PERSON_WEIGHT_PATH, DEVICE)
+    cfg.logger.info("Run mode: %s | Batch size: %s", cfg.RUN_MODE, cfg.BATCH_SIZE)
+    cfg.logger.info("Frame source: %s | Worker: %s", cfg.FRAME_SOURCE, cfg.WORKER_ID)
+    runner = None
+    if cfg.RUN_MODE == "pipeline":
+        runner = PipelineRunner(
+            USECASE,
+            prepare_fn=fetch_and_load,
+            infer_fn=infer_batch,
+            publish_fn=_publish_and_log,
+            fetch_workers=cfg.PIPELINE_FETCH_WORKERS,
+            publish_workers=cfg.PIPELINE_PUBLISH_WORKERS,
+            queue_size=cfg.PIPELINE_QUEUE_SIZE,
+            batch_size=cfg.BATCH_SIZE,
+        )
+    startup.watch_db(mu.db)
+    startup.mark("init")
+    startup.log_summary()
+    while True:
+        try:
+            start_cycle_ts = time.time()
+            camera_list = sharding.mine(mu.get_all_camera())
+            cfg.logger.info(f"camera_list :: {camera_list}")
+
+            claimed = 0
+            if cfg.FRAME_SOURCE == "claim":
+                claimed = run_claim_cycle(runner, camera_list)
+            elif runner is not None:
+                run_pipeline_cycle(runner, camera_list)
+            elif cfg.RUN_MODE == "batch":
+                run_batched_cycle(camera_list)
+            else:
+                run_sequential_cycle(camera_list)
 
-                        # # Call API to delete source image after processing
-                        # delete_params = {"image_source_url": image_path_url}
-                        # cfg.logger.info(
-                        #     f"Calling DELETE_SOURCE_IMAGE_URL API with: {delete_params}"
-                        # )
-                        # cfg.logger.debug(f"Delete API :: {DELETE_SOURCE_IMAGE_URL}")
-                        #
-                        # t_del_start = time.time()
-                        # delete_response = requests.delete(
-                        #     DELETE_SOURCE_IMAGE_URL, params=delete_params
-                        # )
-                        # t_del_end = time.time()
-                        # cfg.perf_logger.info(
-                        #     "delete_image latency_ms=%.2f camera_id=%s status=%s",
-                        #     (t_del_end - t_del_start) * 1000,
-                        #     camera_id,
-                        #     delete_response.status_code,
-                        # )
-                        # cfg.logger.info(
-                        #     f"Source image deleted successfully: {delete_response.status_code}"
-                        # )
-
-                cfg.logger.info(
-                    "AI Processing Ended - **************************************************"
-                )
-                cfg.perf_logger.info(
-                    "camera_cycle_total_ms=%.2f camera_id=%s",
-                    (time.time() - cam_start_ts) * 1000,
-                    camera_id,
-                )
-            cfg.logger.info(f"Sleeping for {cfg.SLEEP_TIME} Seconds")
             cfg.perf_logger.info(
                 "iteration_total_ms=%.2f", (time.time() - start_cycle_ts) * 1000
             )
-            time.sleep(cfg.SLEEP_TIME)
+            get_client().log_latency_summary()
+            mu.db.log_latency_summary()
+            GATE.log_stats()
+            if cfg.FRAME_SOURCE == "claim":
+                # Keep draining while the queue has work; back off only when it is empty
+                if not claimed:
+                    time.sleep(cfg.CLAIM_IDLE_SLEEP)
+            else:
+                cfg.logger.info(f"Sleeping for {cfg.SLEEP_TIME} Seconds")
+                time.sleep(cfg.SLEEP_TIME)
 
         except Exception as e:
             cfg.logger.exception("Unhandled exception in main loop: %s", e)
@@ -5,14 +5,10 @@ from copy import copy
 from pathlib import Path
 
 import numpy as np
-import pandas as pd
-import requests
 import torch
 import torch.nn as nn
-from PIL import Image
 from torch.cuda import amp
 
-from utils.datasets import letterbox
 from utils.general import (
     non_max_suppression,
     make_divisible,
@@ -21,7 +17,6 @@ from utils.general import (
     xyxy2xywh,
     save_one_box,
 )
-from utils.plots import colors, plot_one_box
 from utils.torch_utils import time_synchronized
 
 
@@ -293,6 +288,12 @@ class autoShape(nn.Module):
         #   torch:           = torch.zeros(16,3,320,640)  # BCHW (scaled to size=640, 0-1 values)
         #   multiple:        = [Image.open('image1.jpg'), Image.open('image2.jpg'), ...]  # list of images
 
+        # Imported here so inference-only imports of this module stay light
+        import requests
+        from PIL import Image
+
+        from utils.datasets import letterbox
+
         t = [time_synchronized()]
         p = next(self.model.parameters())  # for device and type
         if isinstance(imgs, torch.Tensor):  # torch
@@ -390,6 +391,10 @@ class Detections:
         render=False,
         save_dir=Path(""),
     ):
+        from PIL import Image
+
+        from utils.plots import colors, plot_one_box
+
         for i, (im, pred) in enumerate(zip(self.imgs, self.pred)):
             str = f"image {i + 1}/{len(self.pred)}: {im.shape[0]}x{im.shape[1]} "
             if pred is not None:
@@ -459,6 +464,8 @@ class Detections:
 
     def pandas(self):
         # return detections as pandas DataFrames, i.e. print(results.pandas().xyxy[0])
+        import pandas as pd
+
         new = copy(self)  # return copy
         ca = (
             "xmin",
@@ -1,32 +1,27 @@
-import urllib
 from urllib.parse import urlparse
 import config as cfg
-import requests
-from utils.datasets import *
-from utils.general import *
-from utils.torch_utils import *
+from common.http_client import get_client
+from common.db import get_db
+from common import preprocess
+from common.inference_engine import load_fused_model
+from utils.general import non_max_suppression, scale_coords
+from utils.torch_utils import select_device, time_synchronized
 from datetime import datetime, timezone
 from collections import defaultdict
-import mysql.connector
 import json
+from common.mapping_cache import MappingCache
 import os
 from typing import List, Dict, Any, Optional, Tuple
 import cv2
 import numpy as np
+import torch
 
 format = "%Y-%m-%d %H:%M:%S"
 
 ADD_RESULT_URL = os.getenv("ADD_RESULT_URL")
 
-conn = mysql.connector.connect(
-    host=cfg.MYSQL_HOST,
-    user=cfg.MYSQL_USER,
-    password=cfg.MYSQL_PASS,
-    database=cfg.MYSQL_DB_NAME,
-    port=cfg.MYSQL_PORT,
-)
-
-cfg.logger.info(f"Connected to :: {conn}")
+# Pooled MySQL access (see common/db.py); replaces the single import-time connection
+db = get_db()
 
 
 def store_result(file_name, file_path, file_url, bounding_box, frame_time, camera_id):
@@ -99,7 +94,7 @@ def store_result(file_name, file_path, file_url, bounding_box, frame_time, camer
             list(payload.keys()),
         )
         t_post_start = time_synchronized()
-        response = requests.post(ADD_RESULT_URL, json=payload)
+        response = get_client().post("add_result", ADD_RESULT_URL, json=payload)
         t_post_end = time_synchronized()
         cfg.perf_logger.info(
             "add_result latency_ms=%.2f camera_id=%s status=%s",
@@ -152,23 +147,23 @@ def get_device():
 
 def load_model(weight_path, map_location):
     cfg.logger.info("Load Model")
-    return (
-        torch.load(weight_path, map_location=map_location)["model"]
-        .float()
-        .fuse()
-        .eval()
-    )
+    return load_fused_model(weight_path, map_location)
 
 
 def load_image_from_url(image_path, img_size=640):
     try:
         if image_path:
-            req = urllib.request.urlopen(image_path)
-            arr = np.asarray(bytearray(req.read()), dtype=np.uint8)
+            response = get_client().get("load_image", image_path)
+            if response.status_code != 200:
+                cfg.logger.error(
+                    "Error in load_image_from_url :: HTTP %s for %s",
+                    response.status_code,
+                    image_path,
+                )
+                return False
+            arr = np.frombuffer(response.content, dtype=np.uint8)
             img0 = cv2.imdecode(arr, -1)
-            img = letterbox(img0, new_shape=img_size, scaleup=False)[0]
-            img = img[:, :, ::-1].transpose(2, 0, 1)  # to 3x416x416
-            img = np.ascontiguousarray(img)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
             return img, img0, image_path
         else:
             cfg.logger.error("ERROR: image not found from URL")
@@ -182,9 +177,7 @@ def load_image_from_disk(image_path, img_size=640):
     try:
         if os.path.exists(image_path):
             img0 = cv2.imread(image_path)
-            img = letterbox(img0, new_shape=img_size, scaleup=False)[0]
-            img = img[:, :, ::-1].transpose(2, 0, 1)  # to 3x416x416
-            img = np.ascontiguousarray(img)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
             return img, img0, image_path
         else:
             cfg.logger.error("ERROR: image not found in local")
@@ -193,7 +186,99 @@ def load_image_from_disk(image_path, img_size=640):
         return False
 
 
-def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id):
+def frame_shape(im0) -> Tuple[int, ...]:
+    """Shape boxes are rescaled to: an original frame, or its (h, w, c) when the
+    frame was decoded at reduced resolution (see common/ingest.py)."""
+    return tuple(im0) if isinstance(im0, (tuple, list)) else im0.shape
+
+
+def rescale_boxes(det, input_shape, im0):
+    """Rescale det[:, :4] in place from the model input to original-frame pixels.
+
+    `im0` is the frame's cached `preprocess.Geometry` (a constant-time lookup),
+    or an original frame / (h, w, c) shape for which the gain is recomputed.
+    """
+    if isinstance(im0, preprocess.Geometry):
+        det[:, :4] = preprocess.to_original(det[:, :4], im0).round()
+    else:
+        det[:, :4] = scale_coords(input_shape, det[:, :4], frame_shape(im0)).round()
+    return det
+
+
+def frame_tiles(img, im0s) -> Tuple[List[Any], List[Any]]:
+    """(canvases, geometries) of one frame: its ROI crops when it was loaded
+    cropped (lists, see common/ingest.py), else the single letterboxed frame."""
+    if isinstance(img, list):
+        return img, list(im0s)
+    return [img], [im0s]
+
+
+def run_detector(model, imgs, device, conf_thres, iou_thres, classes=None):
+    """Forward pass + NMS for same-shape letterboxed frames (HWC BGR uint8).
+
+    Returns one (n, 6) xyxy/conf/cls tensor (or None) per frame, in model input
+    pixels. `classes` (class indices, see `label_classes`) drops every other
+    class inside NMS. A `RemoteDetector` (INFERENCE_SERVER_URL, see
+    common/inference_client.py) runs both on the shared inference server instead.
+    """
+    if hasattr(model, "detect"):
+        return model.detect(imgs, conf_thres, iou_thres, classes)
+    # Letterboxed HWC BGR uint8 -> Nx3xHxW float in [0, 1] (see common/preprocess.py)
+    batch = preprocess.batch_tensor(imgs, device)
+    with torch.no_grad():
+        pred = model(batch)[0]
+    return non_max_suppression(pred, conf_thres, iou_thres, classes=classes, agnostic=False)
+
+
+def label_classes(names, labels) -> Optional[List[int]]:
+    """Class indices of `labels` for the `classes` argument of NMS.
+
+    None (keep every class) when no labels are given. Labels the model does not
+    know are ignored, so a list naming none of its classes keeps nothing.
+    """
+    if not labels:
+        return None
+    wanted = set(labels)
+    return [i for i, name in enumerate(names) if name in wanted]
+
+
+def keep_classes(det, classes):
+    """Rows of an (n, 6) detection tensor whose class is in `classes` (None keeps all)."""
+    if classes is None:
+        return det
+    return det[(det[:, 5:6] == det.new_tensor(classes)).any(1)]
+
+
+def roi_mask(det, rois) -> torch.Tensor:
+    """(n,) bool: rows of a rescaled (n, 6) detection tensor whose center lies
+    inside any ROI box [x1, y1, x2, y2].
+
+    Same rule as `filter_detections_by_rois` (integer center of the integer
+    box, bounds inclusive), evaluated for every box/ROI pair at once.
+    """
+    boxes = det[:, :4].trunc()
+    centers = ((boxes[:, :2] + boxes[:, 2:]) / 2).trunc()[:, None, :]
+    r = torch.as_tensor(rois, dtype=det.dtype, device=det.device).reshape(1, -1, 4)
+    return ((centers >= r[..., :2]) & (centers <= r[..., 2:])).all(2).any(1)
+
+
+def format_detections(det, names) -> List[Dict[str, Any]]:
+    """Convert an (n, 6) detection tensor to the [{label, location}] result format.
+
+    Boxes and classes are materialised with a single `.tolist()`.
+    """
+    if det is None or not len(det):
+        return []
+    rows = det[:, [0, 1, 2, 3, 5]].int().tolist()
+    return [{"label": names[row[4]], "location": row[:4]} for row in rows]
+
+
+def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id, labels=None, rois=None):
+    """Detect on one letterboxed frame, or on all ROI crops of a frame in one batch.
+
+    Only `labels` (class names; filtered inside NMS) are kept, and with `rois`
+    only boxes whose center lies inside one of them (see `roi_mask`).
+    """
     try:
         cfg.logger.info("In Prediction")
         cfg.logger.debug(f"Device: {device}")
@@ -201,28 +286,19 @@ def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id)
         cfg.logger.debug(f"IOU Threshold: {iou_thres}")
         cfg.logger.debug(f"Usecase: {usecase}")
         cfg.logger.debug(f"Camera ID: {camera_id}")
-        cfg.logger.debug(f"Original image shape (im0s): {im0s.shape}")
-        cfg.logger.debug(f"Input image shape (img): {img.shape}")
+        cfg.logger.debug(f"Original image shape (im0s): {frame_shape(im0s)}")
+        tiles, geometries = frame_tiles(img, im0s)
+        cfg.logger.debug(f"Input image shape (img): {tiles[0].shape} crops: {len(tiles) if isinstance(img, list) else 0}")
 
         # cfg.logger.info(f"model: {model}")
         names = model.module.names if hasattr(model, "module") else model.names
         cfg.logger.debug(f"Class names: {names}")
+        classes = label_classes(names, labels)
+        cfg.logger.debug(f"Class filter: {classes} ROIs: {len(rois or [])}")
 
-        img = torch.from_numpy(img).to(device)
-        img = img.float()  # uint8 to fp16/32
-        img /= 255.0  # 0 - 255 to 0.0 - 1.0
-
-        if img.ndimension() == 3:
-            img = img.unsqueeze(0)
-
-        # Inference
+        # Inference + NMS for the requested classes (PPE model emits: no_vest, no_hardhat, hardhat, vest)
         t1 = time_synchronized()
-        pred = model(img)[0]
-
-        # Apply NMS for all classes (PPE model emits: no_vest, no_hardhat, hardhat, vest)
-        pred = non_max_suppression(
-            pred, conf_thres, iou_thres, classes=None, agnostic=False
-        )
+        pred = run_detector(model, tiles, device, conf_thres, iou_thres, classes)
         t2 = time_synchronized()
         cfg.logger.debug(f"NMS completed in {t2 - t1:.4f} seconds")
 
@@ -237,22 +313,12 @@ def predict(model, img, im0s, device, conf_thres, iou_thres, usecase, camera_id)
             if det is not None and len(det):
                 cfg.logger.info("{} detections found.".format(len(det)))
 
-                # Rescale boxes from img_size to im0 size
-                det[:, :4] = scale_coords(img.shape[2:], det[:, :4], im0s.shape).round()
-                for *xyxy, conf, cls in det:
-                    tmp_dict = {}
-                    x1 = int(xyxy[0])
-                    y1 = int(xyxy[1])
-                    x2 = int(xyxy[2])
-                    y2 = int(xyxy[3])
-                    tmp_dict["label"] = names[int(cls)]
-                    tmp_dict["location"] = [x1, y1, x2, y2]
-                    result_list.append(tmp_dict)
-
-                    cfg.logger.debug(
-                        f"Detection added - Label: {tmp_dict['label']}, "
-                        f"Box: {tmp_dict['location']}, Conf: {conf:.2f}"
-                    )
+                # Rescale boxes from img_size (of the frame or crop) to im0 size
+                rescale_boxes(det, tiles[i].shape[:2], geometries[i])
+                if rois:
+                    det = det[roi_mask(det, rois)]
+                    cfg.logger.debug(f"{len(det)} detections inside ROIs")
+                result_list.extend(format_detections(det, names))
 
         result_dict["detection"] = result_list
         result_dict["inference_time"] = t2 - t1
@@ -273,58 +339,51 @@ def predict_raw(
     conf_thres: float,
     iou_thres: float,
     target_label: Optional[str] = None,
+    rois: Optional[List[List[int]]] = None,
 ):
     """
     Run inference and return both formatted detections and raw tensors for tracking.
 
     Returns:
     - result_dict: {"detection": [{label, location}], "inference_time": float}
-    - det_tensor: torch.Tensor for the first image after NMS and class filtering (xyxy, conf, cls)
+    - det_tensor: torch.Tensor for the frame after NMS, class and ROI filtering (xyxy, conf, cls)
     - names: list of class names
 
-    If target_label is provided (e.g., "head"), detections are filtered to that class.
+    If target_label is provided (e.g., "head"), only that class is kept (inside NMS).
+    With `rois`, only boxes whose center lies inside one of them are kept (see `roi_mask`).
+    A frame loaded as ROI crops (see common/ingest.py) runs all its crops in one batch,
+    and det_tensor holds the detections of every crop in full-frame coordinates.
     """
     try:
         cfg.logger.info("In predict_raw")
         names = model.module.names if hasattr(model, "module") else model.names
-        target_idx = None
+        classes = None
         if target_label is not None:
-            try:
-                target_idx = names.index(target_label)
-                cfg.logger.debug("Target label '%s' mapped to index %s", target_label, target_idx)
-            except ValueError:
+            classes = label_classes(names, [target_label])
+            if classes:
+                cfg.logger.debug("Target label '%s' mapped to index %s", target_label, classes[0])
+            else:
                 cfg.logger.warning("Target label '%s' not found in model names: %s", target_label, names)
+                classes = None
 
-        img_t = torch.from_numpy(img).to(device)
-        img_t = img_t.float()
-        img_t /= 255.0
-        if img_t.ndimension() == 3:
-            img_t = img_t.unsqueeze(0)
-
+        tiles, geometries = frame_tiles(img, im0s)
         t1 = time_synchronized()
-        pred = model(img_t)[0]
-        pred = non_max_suppression(pred, conf_thres, iou_thres, classes=None, agnostic=False)
+        pred = run_detector(model, tiles, device, conf_thres, iou_thres, classes)
         t2 = time_synchronized()
 
         result_dict: Dict[str, Any] = {"detection": [], "inference_time": t2 - t1}
-        det_tensor = None
+        kept = []
         for i, det in enumerate(pred):
-            if det is not None and len(det):
-                # filter by class if requested
-                if target_idx is not None:
-                    det = det[det[:, -1] == target_idx]
-                if len(det) == 0:
-                    continue
-                det[:, :4] = scale_coords(img_t.shape[2:], det[:, :4], im0s.shape).round()
-                det_tensor = det
-                for *xyxy, conf, cls in det:
-                    x1 = int(xyxy[0])
-                    y1 = int(xyxy[1])
-                    x2 = int(xyxy[2])
-                    y2 = int(xyxy[3])
-                    result_dict["detection"].append(
-                        {"label": names[int(cls)], "location": [x1, y1, x2, y2]}
-                    )
+            if det is None or not len(det):
+                continue
+            rescale_boxes(det, tiles[i].shape[:2], geometries[i])
+            if rois:
+                det = det[roi_mask(det, rois)]
+            if len(det) == 0:
+                continue
+            kept.append(det)
+            result_dict["detection"].extend(format_detections(det, names))
+        det_tensor = torch.cat(kept) if kept else None
         cfg.logger.debug("predict_raw result count=%d", len(result_dict["detection"]))
         return result_dict, det_tensor, names
     except Exception as e:
@@ -377,7 +436,6 @@ def convert_coordinates(orig_coords, orig_size=(1920, 1080), new_size=(640, 640)
 
 def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id):
     try:
-        cursor = conn.cursor(dictionary=True)
         # Use result_type_id as usecase_id and camera_rtsp_id as camera_id based on new schema
         query = (
             f"SELECT * FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
@@ -394,21 +452,16 @@ def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id)
             result_type_id,
             camera_rtsp_id,
         )
-        cursor.execute(query, (result_type_id, camera_rtsp_id))
-        row = cursor.fetchone()
-        cursor.close()
+        row = db.query_one("active_mapping", query, (result_type_id, camera_rtsp_id))
 
         if not row:
             # Try to fetch most recent mapping to print its configured time range for visibility
             try:
-                cursor = conn.cursor(dictionary=True)
                 fallback_q = (
                     f"SELECT id, start_time_utc, end_time_utc, status, labels FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
                     "WHERE usecase_id = %s AND camera_id = %s ORDER BY id DESC LIMIT 1"
                 )
-                cursor.execute(fallback_q, (result_type_id, camera_rtsp_id))
-                latest = cursor.fetchone()
-                cursor.close()
+                latest = db.query_one("latest_mapping", fallback_q, (result_type_id, camera_rtsp_id))
             except Exception:
                 latest = None
 
@@ -502,38 +555,40 @@ def get_roi_by_result_type_id_and_camera_rtsp_id(result_type_id, camera_rtsp_id)
 
 def get_all_camera():
     try:
-        cursor = conn.cursor(dictionary=True)
         query = f"SELECT * FROM {cfg.CAMERA_TABLE_NAME}"
         cfg.logger.debug("Fetching cameras from table: %s", cfg.CAMERA_TABLE_NAME)
-        cursor.execute(
-            query,
-        )
-        result = cursor.fetchall()
-        cursor.close()
-        return result
+        return db.query("cameras_all", query, prepared=False)
     except Exception as e:
         cfg.logger.error("An error occurred in get_all_camera :: %s", str(e))
         # Return empty list to allow the app loop to continue gracefully
         return []
 
 
+def _prepare_mapping(row: Dict[str, Any]) -> None:
+    """Pre-parse a mapping row once per cache load: ROI boxes and counting line."""
+    row["roi_boxes"] = parse_roi_boxes(row.get("roi"))
+    row["line"] = parse_line_points(row.get("line_roi"))
+
+
+MAPPINGS = MappingCache(
+    db,
+    prepare=_prepare_mapping,
+    enabled=cfg.MAPPING_CACHE_ENABLED,
+    check_interval=cfg.MAPPING_CACHE_CHECK_INTERVAL,
+    max_age=cfg.MAPPING_CACHE_MAX_AGE,
+)
+
+
 def get_cameras_for_usecase(usecase_id: Any) -> List[Dict[str, Any]]:
     """Return list of cameras having an active mapping for given usecase_id.
 
     Active means: status=1 and current UTC time within [start_time_utc, end_time_utc].
-    Returns items as {"id": camera_id} for compatibility with app flow.
+    Returns items as {"id": camera_id} for compatibility with app flow. Called
+    once per cycle, so this is where the mapping cache is refreshed.
     """
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = (
-            f"SELECT DISTINCT camera_id FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
-            "WHERE status = 1 AND usecase_id = %s "
-            "AND start_time_utc <= UTC_TIMESTAMP() AND end_time_utc >= UTC_TIMESTAMP()"
-        )
-        cursor.execute(query, (usecase_id,))
-        rows = cursor.fetchall()
-        cursor.close()
-        cameras = [{"id": int(r["camera_id"]) if r.get("camera_id") is not None else r.get("camera_id")} for r in rows]
+        MAPPINGS.refresh()
+        cameras = [{"id": camera_id} for camera_id in MAPPINGS.active_camera_ids(usecase_id)]
         cfg.logger.debug("get_cameras_for_usecase(%s) -> %s", usecase_id, cameras)
         return cameras
     except Exception as e:
@@ -542,13 +597,9 @@ def get_cameras_for_usecase(usecase_id: Any) -> List[Dict[str, Any]]:
 
 
 def get_location_id_by_camera_id(camera_id: int) -> Optional[int]:
-    """Fetch location_id from camera table for the given camera_id."""
+    """Return location_id of the given camera from the cached camera table."""
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = f"SELECT location_id FROM {cfg.CAMERA_TABLE_NAME} WHERE id = %s LIMIT 1"
-        cursor.execute(query, (int(camera_id),))
-        row = cursor.fetchone()
-        cursor.close()
+        row = MAPPINGS.camera(camera_id)
         if row and row.get("location_id") is not None:
             try:
                 return int(row["location_id"])
@@ -561,39 +612,33 @@ def get_location_id_by_camera_id(camera_id: int) -> Optional[int]:
 
 
 def get_people_config(camera_id: int, usecase_id: Any) -> Dict[str, Any]:
-    """Fetch active mapping row for People In/Out from camera_usecase_mapping.
+    """Return the active People In/Out mapping of a camera from the mapping cache.
 
     Returns dict with keys:
       - roi_box: Optional[List[int]] single [x1,y1,x2,y2]
       - line: Optional[Dict[str, List[int]]] -> {"p1": [x,y], "p2": [x,y]}
+      - roi_type: the mapping's inference mode, "crop" / "full" (see ingest.crop_selected)
+      - tracker: the mapping's tracker mode, when the table has a `tracker` column (see common/tracking_state.py)
     """
     cfg.logger.debug(
-        "Fetching people config | table=%s camera_id=%s usecase_id=%s",
+        "Looking up people config | table=%s camera_id=%s usecase_id=%s",
         cfg.RESULT_MAPPING_TABLE_NAME,
         camera_id,
         usecase_id,
     )
-    out: Dict[str, Any] = {"roi_box": None, "line": None}
+    out: Dict[str, Any] = {"roi_box": None, "line": None, "roi_type": None, "tracker": None}
     try:
-        cursor = conn.cursor(dictionary=True)
-        query = (
-            f"SELECT roi, line_roi FROM {cfg.RESULT_MAPPING_TABLE_NAME} "
-            "WHERE status = 1 AND usecase_id = %s AND camera_id = %s "
-            "AND start_time_utc <= UTC_TIMESTAMP() AND end_time_utc >= UTC_TIMESTAMP() "
-            "ORDER BY id DESC LIMIT 1"
-        )
-        cursor.execute(query, (usecase_id, camera_id))
-        row = cursor.fetchone()
-        cursor.close()
+        row = MAPPINGS.active_mapping(usecase_id, camera_id)
         if not row:
             cfg.logger.info("No active mapping (roi/line) found for camera_id=%s", camera_id)
             return out
-        # ROI parse (take first rectangle if multiple)
-        rois = parse_roi_boxes(row.get("roi"))
+        # ROI (take first rectangle if multiple) and line were parsed when the cache loaded
+        rois = row.get("roi_boxes") or []
         if rois:
             out["roi_box"] = rois[0]
-        # Line parse
-        out["line"] = parse_line_points(row.get("line_roi"))
+        out["line"] = row.get("line")
+        out["roi_type"] = row.get("roi_type")
+        out["tracker"] = row.get("tracker")
         cfg.logger.debug("people config parsed | roi=%s line=%s", out["roi_box"], out["line"])
     except Exception as e:
         cfg.logger.error("get_people_config error: %s", e)
@@ -1,5 +1,4 @@
 import torch
-import torchvision.transforms as transforms
 import numpy as np
 import cv2
 import logging
@@ -18,31 +17,33 @@ class Extractor(object):
         logger = logging.getLogger("root.tracker")
         logger.info("Loading weights from {}... Done!".format(model_path))
         self.net.to(self.device)
+        # Inference mode: BatchNorm uses its running statistics, so a crop's
+        # features do not depend on the other crops in the batch
+        self.net.eval()
         self.size = (64, 128)
-        self.norm = transforms.Compose(
-            [
-                transforms.ToTensor(),
-                transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225]),
-            ]
-        )
+        # ImageNet normalisation of 0..255 pixels fused into one multiply-add:
+        # (x / 255 - mean) / std == x * scale + offset
+        mean = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+        std = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+        self.scale = torch.from_numpy(1.0 / (255.0 * std))
+        self.offset = torch.from_numpy(-mean / std)
 
     def _preprocess(self, im_crops):
+        """Resize every crop to (64, 128) as Market1501 did, into one preallocated
+        float32 batch, then normalise the whole batch in place. Returns an NCHW
+        view of that NHWC batch (channels-last strides, which the convolutions
+        take without a copy). Empty crops (degenerate boxes) become black images.
         """
-        TODO:
-            1. to float with scale from 0 to 1
-            2. resize to (64, 128) as Market1501 dataset did
-            3. concatenate to a numpy array
-            3. to torch Tensor
-            4. normalize
-        """
-
-        def _resize(im, size):
-            return cv2.resize(im.astype(np.float32) / 255.0, size)
-
-        im_batch = torch.cat(
-            [self.norm(_resize(im, self.size)).unsqueeze(0) for im in im_crops], dim=0
-        ).float()
-        return im_batch
+        w, h = self.size
+        batch = np.empty((len(im_crops), h, w, 3), dtype=np.float32)
+        for i, im in enumerate(im_crops):
+            if im.size:
+                cv2.resize(im.astype(np.float32), self.size, dst=batch[i])
+            else:
+                batch[i] = 0.0
+        im_batch = torch.from_numpy(batch)
+        torch.addcmul(self.offset, im_batch, self.scale, out=im_batch)
+        return im_batch.permute(0, 3, 1, 2)
 
     def __call__(self, im_crops):
         im_batch = self._preprocess(im_crops)
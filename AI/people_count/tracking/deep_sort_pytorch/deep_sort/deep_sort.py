@@ -601,11 +601,14 @@ class DeepSort(object):
         n_init=3,
         nn_budget=100,
         use_cuda=True,
+        extractor=None,
     ):
         self.min_confidence = min_confidence
         self.nms_max_overlap = nms_max_overlap
 
-        self.extractor = Extractor(model_path, use_cuda=use_cuda)
+        # A shared extractor (any callable: list of crops -> features) avoids
+        # loading the ReID checkpoint once per tracker
+        self.extractor = extractor if extractor is not None else Extractor(model_path, use_cuda=use_cuda)
 
         max_cosine_distance = max_dist
         metric = NearestNeighborDistanceMetric("cosine", max_cosine_distance, nn_budget)
@@ -613,10 +616,13 @@ class DeepSort(object):
             metric, max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init
         )
 
-    def update(self, bbox_xywh, confidences, ori_img):
+    def update(self, bbox_xywh, confidences, ori_img, features=None):
+        """Track one frame. `features` are the ReID features of `crops(bbox_xywh, ori_img)`
+        when the caller embedded them already (e.g. batched with other cameras)."""
         self.height, self.width = ori_img.shape[:2]
         # generate detections
-        features = self._get_features(bbox_xywh, ori_img)
+        if features is None:
+            features = self._get_features(bbox_xywh, ori_img)
         bbox_tlwh = self._xywh_to_tlwh(bbox_xywh)
         detections = [
             Detection(bbox_tlwh[i], conf, features[i])
@@ -697,12 +703,22 @@ class DeepSort(object):
         h = int(y2 - y1)
         return t, l, w, h
 
+    def crops(self, bbox_xywh, ori_img):
+        """The image crops whose ReID features `update` matches, one per box."""
+        self.height, self.width = ori_img.shape[:2]
+        xywh = bbox_xywh.cpu().numpy() if isinstance(bbox_xywh, torch.Tensor) else np.asarray(bbox_xywh)
+        if len(xywh) == 0:
+            return []
+        # _xywh_to_xyxy for every box at once (truncate, then clip to the frame)
+        x, y, w, h = xywh[:, 0], xywh[:, 1], xywh[:, 2], xywh[:, 3]
+        x1 = np.maximum((x - w / 2).astype(np.int64), 0).tolist()
+        x2 = np.minimum((x + w / 2).astype(np.int64), self.width - 1).tolist()
+        y1 = np.maximum((y - h / 2).astype(np.int64), 0).tolist()
+        y2 = np.minimum((y + h / 2).astype(np.int64), self.height - 1).tolist()
+        return [ori_img[t:b, l:r] for l, t, r, b in zip(x1, y1, x2, y2)]
+
     def _get_features(self, bbox_xywh, ori_img):
-        im_crops = []
-        for box in bbox_xywh:
-            x1, y1, x2, y2 = self._xywh_to_xyxy(box)
-            im = ori_img[y1:y2, x1:x2]
-            im_crops.append(im)
+        im_crops = self.crops(bbox_xywh, ori_img)
         if im_crops:
             features = self.extractor(im_crops)
         else:
@@ -43,6 +43,40 @@ def iou(bbox, candidates):
     return area_intersection / (area_bbox + area_candidates - area_intersection)
 
 
+def iou_batch(bboxes, candidates):
+    """Compute intersection over union of every box against every candidate.
+
+    Parameters
+    ----------
+    bboxes : ndarray
+        A matrix of bounding boxes (one per row) in format
+        `(top left x, top left y, width, height)`.
+    candidates : ndarray
+        A matrix of candidate bounding boxes (one per row) in the same format.
+
+    Returns
+    -------
+    ndarray
+        A matrix of shape len(bboxes), len(candidates) where row i equals
+        `iou(bboxes[i], candidates)`.
+
+    """
+    bboxes_tl, bboxes_br = bboxes[:, :2], bboxes[:, :2] + bboxes[:, 2:]
+    candidates_tl = candidates[:, :2]
+    candidates_br = candidates[:, :2] + candidates[:, 2:]
+
+    tl = np.maximum(bboxes_tl[:, np.newaxis, :], candidates_tl[np.newaxis, :, :])
+    br = np.minimum(bboxes_br[:, np.newaxis, :], candidates_br[np.newaxis, :, :])
+    wh = np.maximum(0.0, br - tl)
+
+    area_intersection = wh[..., 0] * wh[..., 1]
+    area_bboxes = bboxes[:, 2] * bboxes[:, 3]
+    area_candidates = candidates[:, 2] * candidates[:, 3]
+    return area_intersection / (
+        area_bboxes[:, np.newaxis] + area_candidates[np.newaxis, :] - area_intersection
+    )
+
+
 def iou_cost(tracks, detections, track_indices=None, detection_indices=None):
     """An intersection over union distance metric.
 
@@ -73,12 +107,11 @@ def iou_cost(tracks, detections, track_indices=None, detection_indices=None):
         detection_indices = np.arange(len(detections))
 
     cost_matrix = np.zeros((len(track_indices), len(detection_indices)))
-    for row, track_idx in enumerate(track_indices):
-        if tracks[track_idx].time_since_update > 1:
-            cost_matrix[row, :] = linear_assignment.INFTY_COST
-            continue
-
-        bbox = tracks[track_idx].to_tlwh()
-        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
-        cost_matrix[row, :] = 1.0 - iou(bbox, candidates)
+    if len(track_indices) == 0 or len(detection_indices) == 0:
+        return cost_matrix
+    bboxes = np.asarray([tracks[i].to_tlwh() for i in track_indices])
+    candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+    cost_matrix[:, :] = 1.0 - iou_batch(bboxes, candidates)
+    stale = np.array([tracks[i].time_since_update > 1 for i in track_indices])
+    cost_matrix[stale, :] = linear_assignment.INFTY_COST
     return cost_matrix
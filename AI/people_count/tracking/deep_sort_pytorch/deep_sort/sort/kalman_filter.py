@@ -240,3 +240,67 @@ class KalmanFilter(object):
         )
         squared_maha = np.sum(z * z, axis=0)
         return squared_maha
+
+    def gating_distance_batch(
+        self, means, covariances, measurements, only_position=False
+    ):
+        """Compute gating distances between many state distributions and
+        measurements at once.
+
+        Same result as calling `gating_distance` for every track, with the
+        projection, Cholesky factorization and triangular solve done as batched
+        array operations over all tracks.
+
+        Parameters
+        ----------
+        means : ndarray
+            A Tx8 dimensional matrix of T state mean vectors.
+        covariances : ndarray
+            A Tx8x8 dimensional array of the matching state covariances.
+        measurements : ndarray
+            An Nx4 dimensional matrix of N measurements, each in
+            format (x, y, a, h) where (x, y) is the bounding box center
+            position, a the aspect ratio, and h the height.
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+
+        Returns
+        -------
+        ndarray
+            Returns a TxN matrix, where element (i, j) contains the squared
+            Mahalanobis distance between (means[i], covariances[i]) and
+            `measurements[j]`.
+
+        """
+        means = np.asarray(means, dtype=np.float64).reshape(-1, 8)
+        covariances = np.asarray(covariances, dtype=np.float64).reshape(-1, 8, 8)
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 4)
+
+        # Batched `project`: H is a selection matrix, so H P H^T is P[:4, :4]
+        std = self._std_weight_position * means[:, 3]
+        innovation_var = np.square(
+            np.stack([std, std, np.full_like(std, 1e-1), std], axis=1)
+        )
+        mean = means[:, :4]
+        covariance = covariances[:, :4, :4].copy()
+        diag = np.arange(4)
+        covariance[:, diag, diag] += innovation_var
+
+        ndim = 4
+        if only_position:
+            ndim = 2
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        cholesky_factor = np.linalg.cholesky(covariance)
+        d = measurements[np.newaxis, :, :] - mean[:, np.newaxis, :]
+        # Forward substitution L z = d, one row of the (small) factor at a time
+        z = np.empty_like(d)
+        for i in range(ndim):
+            acc = d[:, :, i]
+            for k in range(i):
+                acc = acc - cholesky_factor[:, i, k, np.newaxis] * z[:, :, k]
+            z[:, :, i] = acc / cholesky_factor[:, i, i, np.newaxis]
+        squared_maha = np.sum(z * z, axis=2)
+        return squared_maha
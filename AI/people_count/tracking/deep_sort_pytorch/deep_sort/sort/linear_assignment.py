@@ -66,11 +66,12 @@ def min_cost_matching(
     row_indices, col_indices = linear_assignment(cost_matrix)
 
     matches, unmatched_tracks, unmatched_detections = [], [], []
+    assigned_cols, assigned_rows = set(col_indices.tolist()), set(row_indices.tolist())
     for col, detection_idx in enumerate(detection_indices):
-        if col not in col_indices:
+        if col not in assigned_cols:
             unmatched_detections.append(detection_idx)
     for row, track_idx in enumerate(track_indices):
-        if row not in row_indices:
+        if row not in assigned_rows:
             unmatched_tracks.append(track_idx)
     for row, col in zip(row_indices, col_indices):
         track_idx = track_indices[row]
@@ -101,7 +102,10 @@ def matching_cascade(
         a list of N track indices and M detection indices. The metric should
         return the NxM dimensional cost matrix, where element (i, j) is the
         association cost between the i-th track in the given track indices and
-        the j-th detection in the given detection indices.
+        the j-th detection in the given detection indices. It is called once,
+        for the tracks of all cascade levels, and every level solves its
+        sub-matrix, so entry (i, j) must depend on that track and detection
+        only.
     max_distance : float
         Gating threshold. Associations with cost larger than this value are
         disregarded.
@@ -132,27 +136,44 @@ def matching_cascade(
         track_indices = list(range(len(tracks)))
     if detection_indices is None:
         detection_indices = list(range(len(detections)))
-    print()
     unmatched_detections = detection_indices
-    # print("@@@@@@@@@@@@@@@@@@@@@",unmatched_detections)
+
+    # Bucket the tracks by cascade level once (level l holds the tracks with
+    # time_since_update == 1 + l, in `track_indices` order); empty levels
+    # would be skipped anyway.
+    levels = {}
+    for k in track_indices:
+        level = tracks[k].time_since_update - 1
+        if 0 <= level < cascade_depth:
+            levels.setdefault(level, []).append(k)
+    cascade_tracks = [k for level in sorted(levels) for k in levels[level]]
+    if len(cascade_tracks) == 0 or len(detection_indices) == 0:
+        return [], list(set(track_indices)), unmatched_detections
+
+    # Every cost depends on one track and one detection only, so the matrix
+    # is computed once for all levels and each level solves its sub-matrix.
+    cost_matrix = distance_metric(
+        tracks, detections, cascade_tracks, detection_indices
+    )
+    row_of = {k: row for row, k in enumerate(cascade_tracks)}
+    col_of = {k: col for col, k in enumerate(detection_indices)}
+
+    def cached_metric(tracks, dets, track_indices_l, detection_indices_l):
+        rows = [row_of[k] for k in track_indices_l]
+        cols = [col_of[k] for k in detection_indices_l]
+        return cost_matrix[np.ix_(rows, cols)]
+
     matches = []
-    for level in range(cascade_depth):
+    for level in sorted(levels):
         if len(unmatched_detections) == 0:  # No detections left
             break
 
-        track_indices_l = [
-            k for k in track_indices if tracks[k].time_since_update == 1 + level
-        ]
-
-        if len(track_indices_l) == 0:  # Nothing to match at this level
-            continue
-
         matches_l, _, unmatched_detections = min_cost_matching(
-            distance_metric,
+            cached_metric,
             max_distance,
             tracks,
             detections,
-            track_indices_l,
+            levels[level],
             unmatched_detections,
         )
         matches += matches_l
@@ -207,10 +228,10 @@ def gate_cost_matrix(
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([detections[i].to_xyah() for i in detection_indices])
-    for row, track_idx in enumerate(track_indices):
-        track = tracks[track_idx]
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position
-        )
-        cost_matrix[row, gating_distance > gating_threshold] = gated_cost
+    means = np.asarray([tracks[i].mean for i in track_indices])
+    covariances = np.asarray([tracks[i].covariance for i in track_indices])
+    gating_distance = kf.gating_distance_batch(
+        means, covariances, measurements, only_position
+    )
+    cost_matrix[gating_distance > gating_threshold] = gated_cost
     return cost_matrix
@@ -54,48 +54,6 @@ def _cosine_distance(a, b, data_is_normalized=False):
     return 1.0 - np.dot(a, b.T)
 
 
-def _nn_euclidean_distance(x, y):
-    """Helper function for nearest neighbor distance metric (Euclidean).
-
-    Parameters
-    ----------
-    x : ndarray
-        A matrix of N row-vectors (sample points).
-    y : ndarray
-        A matrix of M row-vectors (query points).
-
-    Returns
-    -------
-    ndarray
-        A vector of length M that contains for each entry in `y` the
-        smallest Euclidean distance to a sample in `x`.
-
-    """
-    distances = _pdist(x, y)
-    return np.maximum(0.0, distances.min(axis=0))
-
-
-def _nn_cosine_distance(x, y):
-    """Helper function for nearest neighbor distance metric (cosine).
-
-    Parameters
-    ----------
-    x : ndarray
-        A matrix of N row-vectors (sample points).
-    y : ndarray
-        A matrix of M row-vectors (query points).
-
-    Returns
-    -------
-    ndarray
-        A vector of length M that contains for each entry in `y` the
-        smallest cosine distance to a sample in `x`.
-
-    """
-    distances = _cosine_distance(x, y)
-    return distances.min(axis=0)
-
-
 class NearestNeighborDistanceMetric(object):
     """
     A nearest neighbor distance metric that, for each target, returns
@@ -123,9 +81,9 @@ class NearestNeighborDistanceMetric(object):
     def __init__(self, metric, matching_threshold, budget=None):
 
         if metric == "euclidean":
-            self._metric = _nn_euclidean_distance
+            self._pairwise = _pdist
         elif metric == "cosine":
-            self._metric = _nn_cosine_distance
+            self._pairwise = _cosine_distance
         else:
             raise ValueError("Invalid metric; must be either 'euclidean' or 'cosine'")
         self.matching_threshold = matching_threshold
@@ -149,7 +107,7 @@ class NearestNeighborDistanceMetric(object):
             self.samples.setdefault(target, []).append(feature)
             if self.budget is not None:
                 self.samples[target] = self.samples[target][-self.budget :]
-        self.samples = {k: self.samples[k] for k in active_targets}
+        self.samples = {k: self.samples[k] for k in active_targets if k in self.samples}
 
     def distance(self, features, targets):
         """Compute distance between features and targets.
@@ -170,6 +128,19 @@ class NearestNeighborDistanceMetric(object):
 
         """
         cost_matrix = np.zeros((len(targets), len(features)))
-        for i, target in enumerate(targets):
-            cost_matrix[i, :] = self._metric(self.samples[target], features)
+        if len(targets) == 0 or len(features) == 0:
+            return cost_matrix
+        # A target without samples (a track taken over from a tracker without
+        # appearance features) matches nothing here; IOU matching still can
+        rows = [i for i, target in enumerate(targets) if self.samples.get(target)]
+        cost_matrix[:, :] = np.inf
+        if not rows:
+            return cost_matrix
+        # All targets' samples against all features in one pairwise matrix,
+        # then the nearest sample of each target (its rows are contiguous)
+        samples = [self.samples[targets[i]] for i in rows]
+        counts = np.array([len(s) for s in samples])
+        distances = self._pairwise(np.concatenate(samples), features)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        cost_matrix[rows, :] = np.minimum.reduceat(distances, starts, axis=0)
         return cost_matrix
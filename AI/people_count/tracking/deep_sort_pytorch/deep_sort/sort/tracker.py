@@ -133,15 +133,17 @@ class Tracker:
         )
 
         # Associate remaining tracks together with unconfirmed tracks using IOU.
+        # Tracks without appearance samples yet (taken over from a tracker
+        # without features) stay IOU candidates however long they were missed.
         iou_track_candidates = unconfirmed_tracks + [
-            k for k in unmatched_tracks_a if self.tracks[k].time_since_update == 1
+            k for k in unmatched_tracks_a if self._iou_candidate(self.tracks[k])
         ]
         unmatched_tracks_a = [
-            k for k in unmatched_tracks_a if self.tracks[k].time_since_update != 1
+            k for k in unmatched_tracks_a if not self._iou_candidate(self.tracks[k])
         ]
         matches_b, unmatched_tracks_b, unmatched_detections = (
             linear_assignment.min_cost_matching(
-                iou_matching.iou_cost,
+                self._iou_cost,
                 self.max_iou_distance,
                 self.tracks,
                 detections,
@@ -154,6 +156,19 @@ class Tracker:
         unmatched_tracks = list(set(unmatched_tracks_a + unmatched_tracks_b))
         return matches, unmatched_tracks, unmatched_detections
 
+    def _iou_candidate(self, track):
+        return track.time_since_update == 1 or track.track_id not in self.metric.samples
+
+    def _iou_cost(self, tracks, detections, track_indices, detection_indices):
+        # iou_matching.iou_cost, except that only tracks with appearance
+        # samples are too stale for IOU after more than one missed frame
+        bboxes = np.asarray([tracks[i].to_tlwh() for i in track_indices])
+        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+        cost_matrix = 1.0 - iou_matching.iou_batch(bboxes, candidates)
+        stale = np.array([tracks[i].time_since_update > 1 and tracks[i].track_id in self.metric.samples for i in track_indices])
+        cost_matrix[stale, :] = linear_assignment.INFTY_COST
+        return cost_matrix
+
     def _initiate_track(self, detection):
         mean, covariance = self.kf.initiate(detection.to_xyah())
         self.tracks.append(
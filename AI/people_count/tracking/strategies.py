@@ -0,0 +1,401 @@
+"""Tracker strategies for people counting, chosen per camera.
+
+Every strategy takes the head boxes of one frame (center x, center y, width,
+height in img0 coordinates) and their confidences, and returns what
+`DeepSort.update` returns: an int64 array of `[x1, y1, x2, y2, track_id]`
+rows for the tracks to count, or an empty list.
+
+    deepsort  DeepSort: Kalman filter, ReID appearance features and IoU
+              (needs a ReID forward pass per head, `uses_reid`)
+    sort      SORT: the same Kalman filter and track life cycle, associated
+              by the IoU of the predicted boxes only
+    centroid  no motion model: the nearest head centre within
+              `max_distance` head heights of a track's last box
+
+sort and centroid skip the ReID net, which is most of the tracking cost, at
+the price of identity switches when heads cross or crowd; they suit feeds
+with a few people per minute. `create` builds a strategy by name. A
+replacement continues the track ids of the strategy it replaces (`next_id`)
+and takes over its live tracks (`kalman_tracks` -> `seed`), so the people in
+view keep their ids and their line-crossing state across the switch.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import torch
+
+from tracking.deep_sort_pytorch.deep_sort.deep_sort import DeepSort
+from tracking.deep_sort_pytorch.deep_sort.sort import iou_matching, linear_assignment
+from tracking.deep_sort_pytorch.deep_sort.sort.detection import Detection
+from tracking.deep_sort_pytorch.deep_sort.sort.kalman_filter import KalmanFilter
+from tracking.deep_sort_pytorch.deep_sort.sort.preprocessing import non_max_suppression
+from tracking.deep_sort_pytorch.deep_sort.sort.track import Track, TrackState
+from tracking.deep_sort_pytorch.deep_sort.sort.tracker import Tracker
+
+MODES = ("deepsort", "sort", "centroid")
+
+
+def _to_numpy(values: Any) -> np.ndarray:
+    if isinstance(values, torch.Tensor):
+        values = values.detach().cpu().numpy()
+    return np.asarray(values, dtype=np.float64)
+
+
+def _outputs(boxes_ids: List[Any], width: int, height: int) -> Any:
+    """`DeepSort.update`'s output from (tlwh, track_id) pairs, clipped to the frame."""
+    outputs = []
+    for (x, y, w, h), track_id in boxes_ids:
+        x1 = max(int(x), 0)
+        x2 = min(int(x + w), width - 1)
+        y1 = max(int(y), 0)
+        y2 = min(int(y + h), height - 1)
+        outputs.append(np.array([x1, y1, x2, y2, track_id], dtype=np.int64))
+    if len(outputs) > 0:
+        outputs = np.stack(outputs, axis=0)
+    return outputs
+
+
+class TrackerStrategy:
+    """One camera's tracker."""
+
+    name = ""
+    # True when `update` needs the ReID features of `crops(...)`
+    uses_reid = False
+
+    def __init__(self, min_confidence: float = 0.3, nms_max_overlap: float = 1.0):
+        self.min_confidence = min_confidence
+        self.nms_max_overlap = nms_max_overlap
+
+    def update(self, bbox_xywh, confidences, ori_img, features=None):
+        raise NotImplementedError
+
+    def increment_ages(self) -> None:
+        """Age every track by one frame without detections."""
+
+    @property
+    def next_id(self) -> int:
+        raise NotImplementedError
+
+    @next_id.setter
+    def next_id(self, value: int) -> None:
+        raise NotImplementedError
+
+    def live_tracks(self) -> int:
+        """Tracks that may still be reported (confirmed and not deleted)."""
+        raise NotImplementedError
+
+    def kalman_tracks(self) -> List[Track]:
+        """The current tracks as DeepSort `Track`s, for `seed` of a replacement."""
+        raise NotImplementedError
+
+    def seed(self, tracks: List[Track]) -> None:
+        """Take over the tracks of the tracker this one replaces, ids included."""
+        raise NotImplementedError
+
+    def get_state(self) -> Dict[str, Any]:
+        """Picklable tracker state for snapshots (see common/tracking_state.py)."""
+        raise NotImplementedError
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def _detections(self, bbox_xywh, confidences) -> List[Detection]:
+        """DeepSort's input filtering: confidence threshold, then non-max suppression."""
+        xywh = _to_numpy(bbox_xywh).reshape(-1, 4)
+        confs = _to_numpy(confidences).reshape(-1)
+        tlwh = xywh.copy()
+        tlwh[:, :2] -= xywh[:, 2:] / 2.0
+        detections = [Detection(tlwh[i], conf, ()) for i, conf in enumerate(confs) if conf > self.min_confidence]
+        boxes = np.array([d.tlwh for d in detections])
+        scores = np.array([d.confidence for d in detections])
+        indices = non_max_suppression(boxes, self.nms_max_overlap, scores)
+        return [detections[i] for i in indices]
+
+
+class DeepSortTracker(TrackerStrategy):
+    """DeepSort behind the strategy interface."""
+
+    name = "deepsort"
+    uses_reid = True
+
+    def __init__(self, deepsort: DeepSort):
+        super().__init__(deepsort.min_confidence, deepsort.nms_max_overlap)
+        self.deepsort = deepsort
+
+    def crops(self, bbox_xywh, ori_img):
+        return self.deepsort.crops(bbox_xywh, ori_img)
+
+    def update(self, bbox_xywh, confidences, ori_img, features=None):
+        return self.deepsort.update(bbox_xywh, confidences, ori_img, features=features)
+
+    def increment_ages(self) -> None:
+        self.deepsort.increment_ages()
+
+    @property
+    def next_id(self) -> int:
+        return self.deepsort.tracker._next_id
+
+    @next_id.setter
+    def next_id(self, value: int) -> None:
+        self.deepsort.tracker._next_id = value
+
+    def live_tracks(self) -> int:
+        return sum(1 for t in self.deepsort.tracker.tracks if t.is_confirmed())
+
+    def kalman_tracks(self) -> List[Track]:
+        return list(self.deepsort.tracker.tracks)
+
+    def seed(self, tracks: List[Track]) -> None:
+        # Tracks without appearance samples are matched by IoU until they get some
+        self.deepsort.tracker.tracks = list(tracks)
+
+    def get_state(self) -> Dict[str, Any]:
+        tracker = self.deepsort.tracker
+        return {"tracks": tracker.tracks, "next_id": tracker._next_id, "samples": tracker.metric.samples}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        tracker = self.deepsort.tracker
+        tracker.tracks = state["tracks"]
+        tracker._next_id = state["next_id"]
+        tracker.metric.samples = state["samples"]
+
+
+class _IouTracker(Tracker):
+    """DeepSort's Tracker without an appearance metric: every track is matched
+    by the IoU of its predicted box, which is SORT's association."""
+
+    def __init__(self, max_iou_distance=0.7, max_age=70, n_init=3):
+        super().__init__(None, max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init)
+
+    def update(self, detections):
+        matches, unmatched_tracks, unmatched_detections = self._match(detections)
+        for track_idx, detection_idx in matches:
+            self.tracks[track_idx].update(self.kf, detections[detection_idx])
+            self.tracks[track_idx].features = []
+        for track_idx in unmatched_tracks:
+            self.tracks[track_idx].mark_missed()
+        for detection_idx in unmatched_detections:
+            self._initiate_track(detections[detection_idx])
+            self.tracks[-1].features = []
+        self.tracks = [t for t in self.tracks if not t.is_deleted()]
+
+    def _match(self, detections):
+        return linear_assignment.min_cost_matching(
+            self._iou_cost, self.max_iou_distance, self.tracks, detections
+        )
+
+    @staticmethod
+    def _iou_cost(tracks, detections, track_indices, detection_indices):
+        bboxes = np.asarray([tracks[i].to_tlwh() for i in track_indices])
+        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+        return 1.0 - iou_matching.iou_batch(bboxes, candidates)
+
+
+class SortTracker(TrackerStrategy):
+    """SORT on DeepSort's Kalman filter and track life cycle (n_init, max_age)."""
+
+    name = "sort"
+
+    def __init__(self, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=70, n_init=3):
+        super().__init__(min_confidence, nms_max_overlap)
+        self.tracker = _IouTracker(max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init)
+
+    def update(self, bbox_xywh, confidences, ori_img, features=None):
+        height, width = ori_img.shape[:2]
+        self.tracker.predict()
+        self.tracker.update(self._detections(bbox_xywh, confidences))
+        return _outputs(
+            [
+                (t.to_tlwh(), t.track_id)
+                for t in self.tracker.tracks
+                if t.is_confirmed() and t.time_since_update <= 1
+            ],
+            width,
+            height,
+        )
+
+    def increment_ages(self) -> None:
+        self.tracker.increment_ages()
+
+    @property
+    def next_id(self) -> int:
+        return self.tracker._next_id
+
+    @next_id.setter
+    def next_id(self, value: int) -> None:
+        self.tracker._next_id = value
+
+    def live_tracks(self) -> int:
+        return sum(1 for t in self.tracker.tracks if t.is_confirmed())
+
+    def kalman_tracks(self) -> List[Track]:
+        return list(self.tracker.tracks)
+
+    def seed(self, tracks: List[Track]) -> None:
+        for track in tracks:
+            track.features = []
+        self.tracker.tracks = list(tracks)
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"tracks": self.tracker.tracks, "next_id": self.tracker._next_id}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.tracker.tracks = state["tracks"]
+        self.tracker._next_id = state["next_id"]
+
+
+class _CentroidTrack:
+    def __init__(self, track_id: int, tlwh: np.ndarray):
+        self.track_id = track_id
+        self.tlwh = tlwh
+        self.hits = 1
+        self.time_since_update = 0
+
+
+class CentroidTracker(TrackerStrategy):
+    """Nearest-centre association without a motion model.
+
+    A detection joins the track whose last box centre is closest, if that is
+    within `max_distance` times the detection's height; a track is reported
+    once it has `n_init` hits and dropped after `max_age` frames without one.
+    """
+
+    name = "centroid"
+
+    def __init__(self, min_confidence=0.3, nms_max_overlap=1.0, max_distance=2.0, max_age=70, n_init=3):
+        super().__init__(min_confidence, nms_max_overlap)
+        self.max_distance = float(max_distance)
+        self.max_age = max_age
+        self.n_init = n_init
+        self.tracks: List[_CentroidTrack] = []
+        self._next_id = 1
+
+    def _distance(self, tracks, detections, track_indices, detection_indices):
+        """Centre distance in detection heights."""
+        boxes = np.asarray([tracks[i].tlwh for i in track_indices])
+        candidates = np.asarray([detections[i].tlwh for i in detection_indices])
+        centres = boxes[:, :2] + boxes[:, 2:] / 2.0
+        candidate_centres = candidates[:, :2] + candidates[:, 2:] / 2.0
+        distance = np.linalg.norm(centres[:, np.newaxis, :] - candidate_centres[np.newaxis, :, :], axis=2)
+        return distance / np.maximum(candidates[np.newaxis, :, 3], 1.0)
+
+    def update(self, bbox_xywh, confidences, ori_img, features=None):
+        height, width = ori_img.shape[:2]
+        detections = self._detections(bbox_xywh, confidences)
+        matches, unmatched_tracks, unmatched_detections = linear_assignment.min_cost_matching(
+            self._distance, self.max_distance, self.tracks, detections
+        )
+        for track_idx, detection_idx in matches:
+            track = self.tracks[track_idx]
+            track.tlwh = detections[detection_idx].tlwh
+            track.hits += 1
+            track.time_since_update = 0
+        for track_idx in unmatched_tracks:
+            self.tracks[track_idx].time_since_update += 1
+        for detection_idx in unmatched_detections:
+            self.tracks.append(_CentroidTrack(self._next_id, detections[detection_idx].tlwh))
+            self._next_id += 1
+        # Like DeepSort, a track missed before it was confirmed is dropped
+        self.tracks = [
+            t
+            for t in self.tracks
+            if t.time_since_update <= self.max_age and (t.hits >= self.n_init or t.time_since_update == 0)
+        ]
+        return _outputs(
+            [(t.tlwh, t.track_id) for t in self.tracks if t.hits >= self.n_init and t.time_since_update == 0],
+            width,
+            height,
+        )
+
+    def increment_ages(self) -> None:
+        for track in self.tracks:
+            track.time_since_update += 1
+        self.tracks = [t for t in self.tracks if t.hits >= self.n_init and t.time_since_update <= self.max_age]
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    @next_id.setter
+    def next_id(self, value: int) -> None:
+        self._next_id = value
+
+    def live_tracks(self) -> int:
+        return sum(1 for t in self.tracks if t.hits >= self.n_init)
+
+    def kalman_tracks(self) -> List[Track]:
+        # No velocity is known: each box starts a Kalman track at rest
+        kf = KalmanFilter()
+        tracks = []
+        for t in self.tracks:
+            xyah = np.asarray(t.tlwh, dtype=np.float64).copy()
+            xyah[:2] += xyah[2:] / 2
+            xyah[2] /= max(xyah[3], 1e-6)
+            mean, covariance = kf.initiate(xyah)
+            track = Track(mean, covariance, t.track_id, self.n_init, self.max_age)
+            track.hits = t.hits
+            track.time_since_update = t.time_since_update
+            if t.hits >= self.n_init:
+                track.state = TrackState.Confirmed
+            tracks.append(track)
+        return tracks
+
+    def seed(self, tracks: List[Track]) -> None:
+        self.tracks = []
+        for t in tracks:
+            if t.is_deleted():
+                continue
+            track = _CentroidTrack(t.track_id, t.to_tlwh())
+            track.hits = t.hits
+            track.time_since_update = t.time_since_update
+            self.tracks.append(track)
+
+    def get_state(self) -> Dict[str, Any]:
+        return {"tracks": self.tracks, "next_id": self._next_id}
+
+    def set_state(self, state: Dict[str, Any]) -> None:
+        self.tracks = state["tracks"]
+        self._next_id = state["next_id"]
+
+
+def create(
+    mode: str,
+    *,
+    model_path: str = "",
+    extractor: Any = None,
+    max_dist: float = 0.2,
+    min_confidence: float = 0.3,
+    nms_max_overlap: float = 1.0,
+    max_iou_distance: float = 0.7,
+    max_age: int = 70,
+    n_init: int = 3,
+    nn_budget: int = 100,
+    centroid_max_distance: float = 2.0,
+    next_id: Optional[int] = None,
+) -> TrackerStrategy:
+    """A new tracker of `mode` (one of MODES), numbering its tracks from `next_id`."""
+    if mode == "deepsort":
+        strategy: TrackerStrategy = DeepSortTracker(
+            DeepSort(
+                model_path,
+                max_dist=max_dist,
+                min_confidence=min_confidence,
+                nms_max_overlap=nms_max_overlap,
+                max_iou_distance=max_iou_distance,
+                max_age=max_age,
+                n_init=n_init,
+                nn_budget=nn_budget,
+                use_cuda=True,
+                extractor=extractor,
+            )
+        )
+    elif mode == "sort":
+        strategy = SortTracker(min_confidence, nms_max_overlap, max_iou_distance, max_age, n_init)
+    elif mode == "centroid":
+        strategy = CentroidTracker(min_confidence, nms_max_overlap, centroid_max_distance, max_age, n_init)
+    else:
+        raise ValueError(f"Unknown tracker mode {mode!r}; expected one of {MODES}")
+    if next_id is not None:
+        strategy.next_id = next_id
+    return strategy
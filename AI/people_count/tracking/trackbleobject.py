@@ -1,3 +1,6 @@
+import time
+
+
 class TrackableObject:
     def __init__(self, objectID, centroid):
         # store the object ID, then initialize a list of centroids
@@ -8,3 +11,6 @@ class TrackableObject:
         # initialize a boolean used to indicate if the object has
         # already been counted or not
         self.counted = False
+
+        # when the tracker last reported the object (see common/tracking_state.py)
+        self.last_seen = time.time()
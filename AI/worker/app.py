@@ -0,0 +1,563 @@
+from common import startup  # first, so the start-up timing covers the imports below
+import os
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+import torch
+
+import my_utils as mu
+import config as cfg
+from common.http_client import get_client
+from common import frame_queue, ingest, motion_gate, sharding
+from model_init import get_model_device, load_model_from_path
+from common.pipeline import PipelineRunner
+from plugins import create_plugins
+
+startup.mark("imports")
+
+# ===================== Usecases and models =====================
+PLUGINS = create_plugins(cfg.WORKER_USECASES)
+PLUGIN_BY_NAME = {plugin.name: plugin for plugin in PLUGINS}
+
+DEVICE = get_model_device()
+GATE = motion_gate.get_gate()
+
+# One model per weight file, however many usecases use it
+MODELS: Dict[str, Any] = {}
+for _plugin in PLUGINS:
+    if _plugin.weight_path not in MODELS:
+        MODELS[_plugin.weight_path] = load_model_from_path(_plugin.weight_path)
+
+frame_status_url = cfg.FRAME_STATUS_URL
+get_frame_url = cfg.GET_FRAME_URL
+DELETE_SOURCE_IMAGE_URL = cfg.DELETE_SOURCE_IMAGE_URL
+
+
+def set_response_schema(current_time: str, statuses: Dict[str, str], camera_id: int):
+    """Report per-frame processing status for several usecases in one call.
+
+    The status API merges `camera_status` into the frame's existing statuses,
+    so one payload keyed by every usecase name updates them all.
+    """
+    if not statuses:
+        return
+    payload = {
+        "camera_id": camera_id,
+        "frame_time": str(current_time),
+        "camera_status": {name: status.upper() for name, status in statuses.items()},
+    }
+    cfg.logger.debug(
+        "Posting frame status | url=%s payload=%s", frame_status_url, payload
+    )
+    if cfg.HTTP_ASYNC_STATUS:
+        get_client().post_async("frame_status", frame_status_url, json=payload)
+    else:
+        get_client().post("frame_status", frame_status_url, json=payload)
+
+
+def _all_status(ctx: Dict[str, Any], status: str) -> Dict[str, str]:
+    return {name: status for name in ctx["mappings"]}
+
+
+# ============================ Per-camera stages ============================
+# A camera goes through resolve -> fetch -> load -> infer -> publish once per
+# cycle, whatever number of usecases are mapped to it: the frame is fetched
+# and decoded once, every distinct model runs once on it, and each usecase
+# plugin builds and publishes its own result from those detections.
+
+
+def resolve_camera(camera: Dict[str, Any], now: Optional[float]) -> Optional[Dict[str, Any]]:
+    """Collect the active mapping of every usecase that is due on this camera
+    (every usecase when `now` is None: claimed frames are paced by the queue).
+
+    Returns a frame context with `mappings` keyed by usecase name, or None when
+    no usecase is due and mapped. Runs on the main thread (MySQL).
+    """
+    camera_id = int(camera["id"])
+    mappings = {}
+    for plugin in PLUGINS:
+        if now is not None and not plugin.is_due(camera_id, now):
+            continue
+        if now is not None:
+            # Unmapped cameras are re-checked only after the usecase interval too
+            plugin.mark_run(camera_id, now)
+        mapping = plugin.resolve(camera_id)
+        if mapping is not None:
+            mappings[plugin.name] = mapping
+    if not mappings:
+        return None
+    cfg.logger.info(
+        "Running AI on camera_id :: %s | usecases=%s", camera_id, list(mappings)
+    )
+    return {"camera_id": camera_id, "mappings": mappings}
+
+
+def fetch_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Ask the frames API for the camera's frame from one minute ago."""
+    camera_id = ctx["camera_id"]
+    # Use current UTC time minus 1 minute for frame fetching
+    dt_utc_minus_1 = datetime.now(timezone.utc) - timedelta(minutes=1)
+    current_time = dt_utc_minus_1.strftime("%Y-%m-%d %H:%M:%S")
+    params = {"frame_time": current_time, "camera_id": int(camera_id)}
+    cfg.logger.info(f"Fetching frame | url={get_frame_url} params={params}")
+
+    t_get_start = time.time()
+    try:
+        response = get_client().get("get_frame", get_frame_url, params=params)
+    except requests.exceptions.RequestException as e:
+        cfg.logger.error(
+            "Frame fetch failed | url=%s params=%s error=%s", get_frame_url, params, e
+        )
+        set_response_schema(current_time, _all_status(ctx, "failed"), int(camera_id))
+        return None
+    cfg.perf_logger.info(
+        "get_frame latency_ms=%.2f camera_id=%s",
+        (time.time() - t_get_start) * 1000,
+        camera_id,
+    )
+
+    if response.status_code == 404:
+        # Frame not available yet; do not mark as failed, try on the next cycle
+        cfg.logger.warning(
+            "Frame data not found (404) for frame_time=%s camera_id=%s",
+            current_time,
+            camera_id,
+        )
+        return None
+    if response.status_code != 200:
+        cfg.logger.error(f"Error: {response.status_code}, {response.text}")
+        set_response_schema(current_time, _all_status(ctx, "failed"), int(camera_id))
+        return None
+
+    set_response_schema(current_time, _all_status(ctx, "started"), int(camera_id))
+    image_path = response.json().get("frame_data")
+    cfg.logger.info(f"Image get from api :: {image_path}")
+    if not image_path:
+        return None
+
+    ctx["camera_id"] = int(image_path.split("/")[-2])
+    return attach_frame(ctx, image_path, current_time)
+
+
+def attach_frame(ctx: Dict[str, Any], image_path: str, current_time: str) -> Dict[str, Any]:
+    """Record the frame's disk path/URL and time on the context and mark it processing."""
+    # Normalize ROOT_URL to avoid double slashes like http://ip//frames/...
+    base_url = (cfg.ROOT_URL or "").rstrip("/")
+    image_path_url = image_path.replace(cfg.ROOT_PATH, base_url)
+    cfg.logger.debug(f"Converted image_path_url (normalized): {image_path_url}")
+
+    set_response_schema(current_time, _all_status(ctx, "processing"), int(ctx["camera_id"]))
+
+    ctx.update(
+        current_time=current_time,
+        main_image_path=image_path,
+        image_path_url=image_path_url,
+    )
+    return ctx
+
+
+def claim_contexts(camera_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Resolve the cameras' mappings and lease their next unprocessed frames.
+
+    Used when FRAME_SOURCE=claim. The queue leases a frame per usecase, so
+    each plugin claims the frames of the cameras it is mapped on; the claims
+    of one frame are merged into a single context (`leases` by usecase name),
+    so the frame is still fetched and decoded once. Returns one context per
+    claimed frame, ready for `load_frame`, oldest first: the usecases' claims
+    are merged in claim order, so a camera's frames are re-sorted by time.
+    """
+    resolved = {}
+    for camera in camera_list:
+        ctx = resolve_camera(camera, None)
+        if ctx:
+            resolved[ctx["camera_id"]] = ctx
+
+    claimed: Dict[Any, Dict[str, Any]] = {}
+    for plugin in PLUGINS:
+        camera_ids = [camera_id for camera_id, ctx in resolved.items() if plugin.name in ctx["mappings"]]
+        for frame in frame_queue.claim_frames(plugin.name, camera_ids):
+            base = resolved.get(int(frame["camera_id"]))
+            if base is None:
+                continue
+            ctx = claimed.get(frame["id"])
+            if ctx is None:
+                ctx = claimed[frame["id"]] = dict(base, mappings={}, leases={}, frame_id=frame["id"], claim=frame)
+            ctx["mappings"][plugin.name] = base["mappings"][plugin.name]
+            ctx["leases"][plugin.name] = frame["lease_token"]
+
+    contexts = []
+    for ctx in claimed.values():
+        frame = ctx.pop("claim")
+        set_response_schema(frame["frame_time"], _all_status(ctx, "started"), int(ctx["camera_id"]))
+        contexts.append(attach_frame(ctx, frame["frame_data"], frame["frame_time"]))
+    contexts.sort(key=lambda ctx: str(ctx["current_time"]))
+    return contexts
+
+
+def complete_claims(ctx: Dict[str, Any], statuses: Dict[str, str]) -> None:
+    """Report each usecase's lease on a claimed frame as DONE when the usecase
+    completed, else FAILED. No-op for frames that were not claimed."""
+    for name, lease_token in ctx.get("leases", {}).items():
+        status = "DONE" if statuses.get(name) == "completed" else "FAILED"
+        frame_queue.complete_frame(name, {"lease_token": lease_token, "frame_id": ctx["frame_id"]}, status)
+
+
+def crop_rois(ctx: Dict[str, Any]) -> Optional[ingest.CropRois]:
+    """Union of the usecases' ROIs when every mapping on the camera selects
+    ROI-cropped inference (roi_type, see ingest.crop_selected) and has an ROI.
+
+    The frame is decoded once for all usecases, so a single usecase that
+    needs the whole frame keeps it whole (None).
+    """
+    boxes: List[List[int]] = []
+    polygons: List[List[Tuple[int, int]]] = []
+    for name, mapping in ctx["mappings"].items():
+        roi = PLUGIN_BY_NAME[name].motion_roi(mapping)
+        if roi is None or not ingest.crop_selected(mapping.get("roi_type")):
+            return None
+        boxes.extend(roi[0])
+        polygons.extend(roi[1])
+    return boxes, polygons
+
+
+def load_frame(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Read and decode the frame once for every usecase (see common/ingest.py),
+    preferring the local frames volume. When all its mappings select
+    ROI-cropped inference, the model input is the crops around their ROIs.
+
+    When neither disk nor HTTP can be read each usecase is given its own
+    `load_failed_status`.
+    """
+    camera_id = ctx["camera_id"]
+    image_path_url = ctx["image_path_url"]
+    main_image_path = ctx["main_image_path"]
+
+    t_load_start = time.time()
+    frame = ingest.load_frame(image_path_url, main_image_path, int(cfg.IMAGE_SIZE), crop=crop_rois(ctx))
+    cfg.perf_logger.info(
+        "load_image latency_ms=%.2f camera_id=%s usecases=%d path=%s source=%s scale=%.2f crops=%d",
+        (time.time() - t_load_start) * 1000,
+        camera_id,
+        len(ctx["mappings"]),
+        image_path_url,
+        frame.source[0] if frame else "none",
+        frame.scale if frame else 0.0,
+        len(frame.img) if frame and isinstance(frame.img, list) else 0,
+    )
+
+    if frame is None:
+        cfg.logger.error(
+            "Image fetch failed from both HTTP and disk. Skipping this frame. url=%s path=%s",
+            image_path_url,
+            main_image_path,
+        )
+        statuses = {
+            name: PLUGIN_BY_NAME[name].load_failed_status for name in ctx["mappings"]
+        }
+        set_response_schema(ctx["current_time"], statuses, int(camera_id))
+        complete_claims(ctx, {})
+        return None
+
+    return ingest.attach(ctx, frame)
+
+
+def fetch_and_load(ctx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Run the fetch and load stages for a resolved camera."""
+    # Claimed frames arrive with their path already attached
+    if "main_image_path" not in ctx:
+        ctx = fetch_frame(ctx)
+    if ctx:
+        ctx = load_frame(ctx)
+    return ctx
+
+
+def frame_changed(ctx: Dict[str, Any], key: Tuple[str, float, float]) -> bool:
+    """Motion gate for one model on one camera (see common/motion_gate.py).
+
+    The gate watches the union of the ROIs of the usecases sharing the model;
+    a usecase without an ROI makes it watch the whole frame.
+    """
+    boxes: Optional[List[List[int]]] = []
+    polygons: Optional[List[List[Tuple[int, int]]]] = []
+    for name, mapping in ctx["mappings"].items():
+        plugin = PLUGIN_BY_NAME[name]
+        if plugin.inference_key != key:
+            continue
+        roi = plugin.motion_roi(mapping)
+        if roi is None:
+            boxes = polygons = None
+            break
+        boxes.extend(roi[0])
+        polygons.extend(roi[1])
+    return GATE.check(gate_key(ctx, key), ctx["img0"], ctx["frame_shape"], boxes, polygons)
+
+
+def gate_key(ctx: Dict[str, Any], key: Tuple[str, float, float]) -> str:
+    weight_path, conf_thres, iou_thres = key
+    return f"{ctx['camera_id']}:{os.path.basename(weight_path)}:{conf_thres}:{iou_thres}"
+
+
+def infer_frames(contexts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Run each distinct model once over the frames that need it, then let
+    every mapped usecase build its result from those detections.
+
+    Frames the motion gate finds unchanged for a model skip it; their usecases
+    analyze the camera's last detections from that model instead (or none,
+    with MOTION_GATE_STATIC_RESULT=empty).
+
+    Returns, aligned with `contexts`, a dict of usecase name -> outcome (None
+    when the usecase's inference or analysis failed). Usecases run in
+    frame-time order because trackers are order-sensitive; the pipeline's
+    `serial_key` keeps a camera's frames in order across batches too.
+    """
+    order = sorted(range(len(contexts)), key=lambda i: str(contexts[i]["current_time"]))
+    detections: Dict[Any, Dict[int, Any]] = {}
+    for key in {plugin.inference_key for plugin in PLUGINS}:
+        indices = [
+            i
+            for i, ctx in enumerate(contexts)
+            if any(PLUGIN_BY_NAME[name].inference_key == key for name in ctx["mappings"])
+        ]
+        if not indices:
+            continue
+        weight_path, conf_thres, iou_thres = key
+        t_inf_start = time.time()
+        changed = {i: frame_changed(contexts[i], key) for i in indices}
+        active = [i for i in indices if changed[i]]
+        dets = (
+            mu.detect_batch(
+                MODELS[weight_path],
+                [contexts[i]["img"] for i in active],
+                [contexts[i]["frame_geometry"] for i in active],
+                DEVICE,
+                conf_thres,
+                iou_thres,
+                cfg.BATCH_SIZE,
+            )
+            if active
+            else []
+        )
+        cfg.perf_logger.info(
+            "batch_inference latency_ms=%.2f frames=%d skipped=%d weights=%s",
+            (time.time() - t_inf_start) * 1000,
+            len(active),
+            len(indices) - len(active),
+            weight_path,
+        )
+        found = dict(zip(active, dets))
+        # In frame-time order, so a skipped frame reuses its camera's latest detections
+        detections[key] = {}
+        for i in order:
+            if i not in changed:
+                continue
+            if changed[i]:
+                det = found[i]
+                GATE.remember(gate_key(contexts[i], key), det)
+            else:
+                det = GATE.static_result(gate_key(contexts[i], key), torch.zeros((0, 6)))
+            detections[key][i] = det
+
+    for plugin in PLUGINS:
+        # Work a usecase shares across the batch (e.g. ReID crops of every camera)
+        items = []
+        for i in order:
+            mapping = contexts[i]["mappings"].get(plugin.name)
+            det = detections.get(plugin.inference_key, {}).get(i)
+            if mapping is not None and det is not None:
+                items.append((contexts[i], mapping, det, MODELS[plugin.weight_path].names))
+        if not items:
+            continue
+        try:
+            plugin.prepare_batch(items)
+        except Exception as e:
+            cfg.logger.exception("Usecase %s batch preparation failed: %s", plugin.name, e)
+
+    outcomes: List[Dict[str, Any]] = [{} for _ in contexts]
+    for i in order:
+        ctx = contexts[i]
+        for name, mapping in ctx["mappings"].items():
+            plugin = PLUGIN_BY_NAME[name]
+            det = detections.get(plugin.inference_key, {}).get(i)
+            if det is None:
+                outcomes[i][name] = None
+                continue
+            t_an_start = time.time()
+            try:
+                outcomes[i][name] = plugin.analyze(
+                    ctx, mapping, det, MODELS[plugin.weight_path].names
+                )
+            except Exception as e:
+                cfg.logger.exception(
+                    "Usecase %s analysis failed for camera_id=%s: %s", name, ctx["camera_id"], e
+                )
+                outcomes[i][name] = None
+            cfg.perf_logger.info(
+                "analyze latency_ms=%.2f usecase=%s camera_id=%s",
+                (time.time() - t_an_start) * 1000,
+                name,
+                ctx["camera_id"],
+            )
+    return outcomes
+
+
+def publish_frame(ctx: Dict[str, Any], outcomes: Optional[Dict[str, Any]]) -> None:
+    """Publish every usecase's result for the frame, mark them completed in one
+    status update and delete the source frame when a usecase asks for it."""
+    camera_id = ctx["camera_id"]
+    outcomes = outcomes or {}
+    statuses = {}
+    for name, mapping in ctx["mappings"].items():
+        outcome = outcomes.get(name)
+        if outcome is None:
+            statuses[name] = "failed"
+            continue
+        t_pub_start = time.time()
+        try:
+            PLUGIN_BY_NAME[name].publish(ctx, mapping, outcome)
+            statuses[name] = "completed"
+        except Exception as e:
+            cfg.logger.exception(
+                "Usecase %s publish failed for camera_id=%s: %s", name, camera_id, e
+            )
+            statuses[name] = "failed"
+        cfg.perf_logger.info(
+            "publish latency_ms=%.2f usecase=%s camera_id=%s",
+            (time.time() - t_pub_start) * 1000,
+            name,
+            camera_id,
+        )
+
+    set_response_schema(ctx["current_time"], statuses, int(camera_id))
+    complete_claims(ctx, statuses)
+
+    if any(PLUGIN_BY_NAME[name].delete_source for name in ctx["mappings"]):
+        delete_source_image(ctx)
+    cfg.logger.info(
+        "AI Processing Ended - **************************************************"
+    )
+
+
+def delete_source_image(ctx: Dict[str, Any]) -> None:
+    """Delete the raw frame once every usecase on it has published."""
+    delete_params = {"image_source_url": ctx["image_path_url"]}
+    cfg.logger.info(f"Calling DELETE_SOURCE_IMAGE_URL API with: {delete_params}")
+    t_del_start = time.time()
+    try:
+        delete_response = get_client().delete(
+            "delete_image", DELETE_SOURCE_IMAGE_URL, params=delete_params
+        )
+        cfg.perf_logger.info(
+            "delete_image latency_ms=%.2f camera_id=%s status=%s",
+            (time.time() - t_del_start) * 1000,
+            ctx["camera_id"],
+            getattr(delete_response, "status_code", -1),
+        )
+    except Exception as e:
+        cfg.logger.error("Delete API exception: %s", e)
+
+
+# ============================ Cycle runners ============================
+
+
+def run_sequential_cycle(camera_list: List[Dict[str, Any]]) -> int:
+    """Process cameras one at a time. Returns the number of cameras with a due usecase."""
+    now = time.time()
+    dispatched = 0
+    for camera in camera_list:
+        cam_start_ts = time.time()
+        ctx = resolve_camera(camera, now)
+        if not ctx:
+            continue
+        dispatched += 1
+        ctx = fetch_and_load(ctx)
+        if ctx:
+            publish_frame(ctx, infer_frames([ctx])[0])
+        cfg.perf_logger.info(
+            "camera_cycle_total_ms=%.2f camera_id=%s",
+            (time.time() - cam_start_ts) * 1000,
+            camera["id"],
+        )
+    return dispatched
+
+
+def run_pipeline_cycle(runner: PipelineRunner, camera_list: List[Dict[str, Any]]) -> int:
+    """Resolve mappings on this thread, against the mapping-cache snapshot
+    refreshed once per cycle, then hand the cameras to the staged pipeline.
+    Returns the number of cameras with a due usecase."""
+    now = time.time()
+    contexts = [ctx for ctx in (resolve_camera(c, now) for c in camera_list) if ctx]
+    runner.run_cycle(ingest.by_input_shape(contexts))
+    return len(contexts)
+
+
+def run_claim_cycle(runner: Optional[PipelineRunner], camera_list: List[Dict[str, Any]]) -> int:
+    """Lease the next frames from the claim queue and process them in the
+    configured RUN_MODE. Returns the number of frames claimed."""
+    contexts = claim_contexts(camera_list)
+    if not contexts:
+        return 0
+    if runner is not None:
+        runner.run_cycle(ingest.by_input_shape(contexts))
+    else:
+        for ctx in contexts:
+            ctx = load_frame(ctx)
+            if ctx:
+                publish_frame(ctx, infer_frames([ctx])[0])
+    return len(contexts)
+
+
+if __name__ == "__main__":
+    cfg.logger.info("AI worker starting up | usecases=%s", [p.name for p in PLUGINS])
+    cfg.logger.info("Models: %s | Device: %s", list(MODELS), DEVICE)
+    cfg.logger.info("Run mode: %s | Batch size: %s", cfg.RUN_MODE, cfg.BATCH_SIZE)
+    cfg.logger.info("Frame source: %s | Worker: %s", cfg.FRAME_SOURCE, cfg.WORKER_ID)
+    runner = None
+    if cfg.RUN_MODE == "pipeline":
+        runner = PipelineRunner(
+            "ai_worker",
+            prepare_fn=fetch_and_load,
+            infer_fn=infer_frames,
+            publish_fn=publish_frame,
+            fetch_workers=cfg.PIPELINE_FETCH_WORKERS,
+            publish_workers=cfg.PIPELINE_PUBLISH_WORKERS,
+            queue_size=cfg.PIPELINE_QUEUE_SIZE,
+            batch_size=cfg.BATCH_SIZE,
+            # A claim cycle can hold several frames of a camera; its tracker needs them in order
+            serial_key=lambda ctx: ctx["camera_id"],
+        )
+    startup.watch_db(mu.db)
+    startup.mark("init")
+    startup.log_summary()
+    while True:
+        try:
+            start_cycle_ts = time.time()
+            camera_list = sharding.mine(mu.get_all_camera())
+            cfg.logger.debug(f"camera_list :: {camera_list}")
+
+            if cfg.FRAME_SOURCE == "claim":
+                dispatched = run_claim_cycle(runner, camera_list)
+            elif runner is not None:
+                dispatched = run_pipeline_cycle(runner, camera_list)
+            else:
+                dispatched = run_sequential_cycle(camera_list)
+            camera_ids = [int(c["id"]) for c in camera_list]
+            for plugin in PLUGINS:
+                plugin.end_cycle(camera_ids)
+
+            cfg.perf_logger.info(
+                "iteration_total_ms=%.2f cameras=%d dispatched=%d",
+                (time.time() - start_cycle_ts) * 1000,
+                len(camera_list),
+                dispatched,
+            )
+            get_client().log_latency_summary()
+            mu.db.log_latency_summary()
+            GATE.log_stats()
+            if not dispatched:
+                # Claim mode keeps draining while the queue has work
+                time.sleep(cfg.CLAIM_IDLE_SLEEP if cfg.FRAME_SOURCE == "claim" else cfg.WORKER_IDLE_SLEEP)
+
+        except Exception as e:
+            cfg.logger.exception("Unhandled exception in main loop: %s", e)
@@ -0,0 +1,68 @@
+import os
+
+from my_utils import get_device, load_model
+from common.inference_engine import create_engine
+from common.inference_client import RemoteDetector
+import config as cfg
+from common import startup
+
+# Fused models handed over by common/supervisor.py (in shared memory), keyed by weight path
+_PRELOADED = {}
+
+
+def preload(weight_path, model):
+    """Use `model`, an already loaded and fused model, for `weight_path`."""
+    _PRELOADED[os.path.normpath(weight_path)] = model
+
+
+def load_model_from_path(weight_path, local=False):
+    """Load a YOLO model from the given weight path using detected device.
+
+    The returned object is an inference engine (see common/inference_engine.py) for
+    the configured INFERENCE_BACKEND; it is called like the model and exposes
+    `names`. With INFERENCE_SERVER_URL set (and `local` False) it is a
+    `RemoteDetector` for the shared inference server instead, falling back to
+    a local model when INFERENCE_SERVER_FALLBACK is on and the server cannot
+    be reached.
+    """
+    if cfg.INFERENCE_SERVER_URL and not local:
+        try:
+            detector = RemoteDetector(cfg.INFERENCE_SERVER_URL, weight_path)
+            cfg.logger.info("Using inference server %s for %s", cfg.INFERENCE_SERVER_URL, weight_path)
+            return detector
+        except Exception as e:
+            if not cfg.INFERENCE_SERVER_FALLBACK:
+                raise
+            cfg.logger.warning(
+                "Inference server %s unavailable for %s (%s); loading the model locally",
+                cfg.INFERENCE_SERVER_URL,
+                weight_path,
+                e,
+            )
+    try:
+        cfg.logger.info("Loading model from %s", weight_path)
+        device = get_device()
+        with startup.phase("model_load"):
+            model = _PRELOADED.get(os.path.normpath(weight_path))
+            if model is not None:
+                cfg.logger.info("Using the shared model for %s", weight_path)
+            else:
+                model = load_model(weight_path, device)
+        with startup.phase("engine"):
+            engine = create_engine(
+                model,
+                weight_path,
+                device,
+                backend=cfg.INFERENCE_BACKEND,
+                half=cfg.INFERENCE_HALF,
+            )
+        cfg.logger.info("Model loading completed")
+        return engine
+    except Exception as e:
+        cfg.logger.exception("Exception in model loading: %s", e)
+        raise
+
+
+def get_model_device():
+    """Return the selected compute device for the model (e.g., CUDA or CPU)."""
+    return get_device()
@@ -0,0 +1,692 @@
+from urllib.parse import urlparse
+import config as cfg
+from common.http_client import get_client
+from common.db import get_db
+from common import preprocess
+from common.inference_engine import load_fused_model
+from utils.general import non_max_suppression, scale_coords
+from utils.torch_utils import select_device, time_synchronized
+from datetime import datetime, timezone
+from collections import defaultdict
+import json
+from common.mapping_cache import MappingCache, decode_labels
+import os
+from typing import List, Dict, Any, Optional, Tuple
+import cv2
+import numpy as np
+import torch
+
+format = "%Y-%m-%d %H:%M:%S"
+
+ADD_RESULT_URL = os.getenv("ADD_RESULT_URL")
+
+# Pooled MySQL access (see common/db.py); replaces the single import-time connection
+db = get_db()
+
+
+def store_result(file_name, file_path, file_url, bounding_box, frame_time, camera_id):
+    """Persist result to ADD_RESULT_URL matching MongoDB schema.
+
+    Maps to:
+    {
+      user_id, camera_id, image_name, image_url,
+      result, is_hide, created_date, updated_date, status,
+      counts, video_url, frame_date
+    }
+    """
+
+    # Timestamps in UTC ISO format
+    now_iso = datetime.now(timezone.utc).isoformat()
+    if isinstance(frame_time, datetime):
+        frame_iso = frame_time.astimezone(timezone.utc).isoformat()
+    else:
+        try:
+            # Expecting '%Y-%m-%d %H:%M:00' in UTC
+            dt = datetime.strptime(str(frame_time), "%Y-%m-%d %H:%M:%S").replace(
+                tzinfo=timezone.utc
+            )
+            frame_iso = dt.isoformat()
+        except Exception:
+            # Fallback to now if parsing fails
+            frame_iso = now_iso
+
+    # Derive image_name from URL path
+    try:
+        image_path_from_url = urlparse(file_url).path or ""
+    except Exception:
+        image_path_from_url = f"/{file_name}" if file_name else ""
+
+    # Compute counts from detections
+    counts: dict = defaultdict(int)
+    for det in (
+        bounding_box.get("detection", []) if isinstance(bounding_box, dict) else []
+    ):
+        lbl = det.get("label")
+        if lbl:
+            counts[lbl] += 1
+
+    payload = {
+        "user_id": str(cfg.USER_ID or ""),
+        "camera_id": str(camera_id),
+        "image_name": image_path_from_url,
+        "image_url": file_url,
+        "result": {
+            "detection": (
+                bounding_box.get("detection", [])
+                if isinstance(bounding_box, dict)
+                else []
+            )
+        },
+        "is_hide": False,
+        "created_date": now_iso,
+        "updated_date": now_iso,
+        "status": True,
+        "counts": dict(counts),
+        "video_url": "",
+        "frame_date": frame_iso,
+    }
+    try:
+        cfg.logger.debug(
+            "Posting add_result | url=%s camera_id=%s file=%s payload_keys=%s",
+            ADD_RESULT_URL,
+            camera_id,
+            file_name,
+            list(payload.keys()),
+        )
+        t_post_start = time_synchronized()
+        response = get_client().post("add_result", ADD_RESULT_URL, json=payload)
+        t_post_end = time_synchronized()
+        cfg.perf_logger.info(
+            "add_result latency_ms=%.2f camera_id=%s status=%s",
+            (t_post_end - t_post_start) * 1000,
+            camera_id,
+            response.status_code,
+        )
+        # Check the response status
+        if response.status_code == 200:
+            try:
+                cfg.logger.info(
+                    "Result added successfully | camera_id=%s file=%s",
+                    camera_id,
+                    file_name,
+                )
+                cfg.logger.debug("add_result response: %s", response.json())
+            except Exception:
+                cfg.logger.debug(
+                    "add_result non-JSON response body: %s",
+                    getattr(response, "text", ""),
+                )
+        else:
+            cfg.logger.error(
+                "Failed to add result | status=%s body=%s",
+                response.status_code,
+                getattr(response, "text", ""),
+            )
+    except Exception as e:
+        cfg.logger.exception("Exception during add_result post: %s", e)
+
+
+def get_device():
+    """Return compute device based on configuration.
+
+    Accepts only two options via cfg.DEVICE:
+    - "0": selects GPU 0 if available
+    - "cpu": forces CPU
+
+    Any other value falls back to CPU. Default is "0".
+    """
+    try:
+        configured = str(getattr(cfg, "DEVICE", "0")).strip().lower()
+        device_arg = "0" if configured == "0" else "cpu"
+        cfg.logger.debug("Selecting device via my_utils.get_device(): %s", device_arg)
+        return select_device(device_arg)
+    except Exception as e:
+        cfg.logger.warning("Failed to select configured device, falling back to CPU: %s", e)
+        return select_device("cpu")
+
+
+def load_model(weight_path, map_location):
+    cfg.logger.info("Load Model")
+    return load_fused_model(weight_path, map_location)
+
+
+def load_image_from_url(image_path, img_size=640):
+    try:
+        if image_path:
+            response = get_client().get("load_image", image_path)
+            if response.status_code != 200:
+                cfg.logger.error(
+                    "Error in load_image_from_url :: HTTP %s for %s",
+                    response.status_code,
+                    image_path,
+                )
+                return False
+            arr = np.frombuffer(response.content, dtype=np.uint8)
+            img0 = cv2.imdecode(arr, -1)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
+            return img, img0, image_path
+        else:
+            cfg.logger.error("ERROR: image not found from URL")
+            return False
+    except Exception as e:
+        cfg.logger.error(f"Error in load_image_from_url :: {e}")
+        return False
+
+
+def load_image_from_disk(image_path, img_size=640):
+    try:
+        if os.path.exists(image_path):
+            img0 = cv2.imread(image_path)
+            img = preprocess.letterbox_frame(img0, img_size)[0]
+            return img, img0, image_path
+        else:
+            cfg.logger.error("ERROR: image not found in local")
+    except Exception as e:
+        cfg.logger.error(f"Error in load_image_from_disk :: {e}")
+        return False
+
+
+
+
+def frame_shape(im0) -> Tuple[int, ...]:
+    """Shape boxes are rescaled to: an original frame, or its (h, w, c) when the
+    frame was decoded at reduced resolution (see common/ingest.py)."""
+    return tuple(im0) if isinstance(im0, (tuple, list)) else im0.shape
+
+
+def rescale_boxes(det, input_shape, im0):
+    """Rescale det[:, :4] in place from the model input to original-frame pixels.
+
+    `im0` is the frame's cached `preprocess.Geometry` (a constant-time lookup),
+    or an original frame / (h, w, c) shape for which the gain is recomputed.
+    """
+    if isinstance(im0, preprocess.Geometry):
+        det[:, :4] = preprocess.to_original(det[:, :4], im0).round()
+    else:
+        det[:, :4] = scale_coords(input_shape, det[:, :4], frame_shape(im0)).round()
+    return det
+
+
+def frame_tiles(img, im0s) -> Tuple[List[Any], List[Any]]:
+    """(canvases, geometries) of one frame: its ROI crops when it was loaded
+    cropped (lists, see common/ingest.py), else the single letterboxed frame."""
+    if isinstance(img, list):
+        return img, list(im0s)
+    return [img], [im0s]
+
+
+def run_detector(model, imgs, device, conf_thres, iou_thres, classes=None):
+    """Forward pass + NMS for same-shape letterboxed frames (HWC BGR uint8).
+
+    Returns one (n, 6) xyxy/conf/cls tensor (or None) per frame, in model input
+    pixels. `classes` (class indices, see `label_classes`) drops every other
+    class inside NMS. A `RemoteDetector` (INFERENCE_SERVER_URL, see
+    common/inference_client.py) runs both on the shared inference server instead.
+    """
+    if hasattr(model, "detect"):
+        return model.detect(imgs, conf_thres, iou_thres, classes)
+    # Letterboxed HWC BGR uint8 -> Nx3xHxW float in [0, 1] (see common/preprocess.py)
+    batch = preprocess.batch_tensor(imgs, device)
+    with torch.no_grad():
+        pred = model(batch)[0]
+    return non_max_suppression(pred, conf_thres, iou_thres, classes=classes, agnostic=False)
+
+
+def label_classes(names, labels) -> Optional[List[int]]:
+    """Class indices of `labels` for the `classes` argument of NMS.
+
+    None (keep every class) when no labels are given. Labels the model does not
+    know are ignored, so a list naming none of its classes keeps nothing.
+    """
+    if not labels:
+        return None
+    wanted = set(labels)
+    return [i for i, name in enumerate(names) if name in wanted]
+
+
+def keep_classes(det, classes):
+    """Rows of an (n, 6) detection tensor whose class is in `classes` (None keeps all)."""
+    if classes is None:
+        return det
+    return det[(det[:, 5:6] == det.new_tensor(classes)).any(1)]
+
+
+def roi_mask(det, rois) -> torch.Tensor:
+    """(n,) bool: rows of a rescaled (n, 6) detection tensor whose center lies
+    inside any ROI box [x1, y1, x2, y2].
+
+    Same rule as `filter_detections_by_rois` (integer center of the integer
+    box, bounds inclusive), evaluated for every box/ROI pair at once.
+    """
+    boxes = det[:, :4].trunc()
+    centers = ((boxes[:, :2] + boxes[:, 2:]) / 2).trunc()[:, None, :]
+    r = torch.as_tensor(rois, dtype=det.dtype, device=det.device).reshape(1, -1, 4)
+    return ((centers >= r[..., :2]) & (centers <= r[..., 2:])).all(2).any(1)
+
+
+def detect_batch(model, imgs, im0s_list, device, conf_thres, iou_thres, batch_size=8):
+    """Run the detector over several letterboxed frames and return raw detections.
+
+    Same batching as the single-usecase services' `predict_batch`: frames are
+    grouped by letterboxed shape and sent through the model in chunks of at
+    most `batch_size`. Each entry of the returned list (aligned with `imgs`)
+    is the NMS output for that frame with boxes already rescaled to its
+    original size, as an (n, 6) tensor of xyxy, conf, cls on the CPU, or None
+    when a batch containing that frame failed. A frame loaded as ROI crops
+    (see common/ingest.py) is batched crop by crop and gets the detections of all
+    its crops.
+
+    Usecase plugins turn these tensors into their own result format, so one
+    forward pass can serve every usecase that shares the weights.
+    """
+    results: List[Optional[torch.Tensor]] = [None] * len(imgs)
+    if not imgs:
+        return results
+    batch_size = max(1, int(batch_size))
+
+    # (frame index, canvas, geometry): one entry per frame, or per crop of a cropped frame
+    entries = []
+    for idx, (img, im0s) in enumerate(zip(imgs, im0s_list)):
+        tiles, geometries = frame_tiles(img, im0s)
+        entries.extend((idx, tile, geom) for tile, geom in zip(tiles, geometries))
+    groups: Dict[Tuple[int, ...], List[int]] = defaultdict(list)
+    for k, (_, tile, _) in enumerate(entries):
+        groups[tuple(tile.shape)].append(k)
+
+    detections: List[List[torch.Tensor]] = [[] for _ in imgs]
+    failed = set()
+    for shape, members in groups.items():
+        for start in range(0, len(members), batch_size):
+            chunk = members[start : start + batch_size]
+            try:
+                t1 = time_synchronized()
+                pred = run_detector(model, [entries[k][1] for k in chunk], device, conf_thres, iou_thres)
+                t2 = time_synchronized()
+                cfg.perf_logger.info(
+                    "batch_forward latency_ms=%.2f frames=%d shape=%s",
+                    (t2 - t1) * 1000,
+                    len(chunk),
+                    shape,
+                )
+
+                for det, k in zip(pred, chunk):
+                    if det is not None and len(det):
+                        idx, _, geom = entries[k]
+                        rescale_boxes(det, shape[:2], geom)
+                        detections[idx].append(det.cpu())
+            except Exception as e:
+                failed.update(entries[k][0] for k in chunk)
+                cfg.logger.error(
+                    "An error occurred in detect_batch() shape=%s frames=%d :: %s",
+                    shape,
+                    len(chunk),
+                    str(e),
+                )
+
+    for idx, dets in enumerate(detections):
+        if idx not in failed:
+            results[idx] = torch.cat(dets) if dets else torch.zeros((0, 6))
+    return results
+
+
+def format_detections(det, names) -> List[Dict[str, Any]]:
+    """Convert an (n, 6) detection tensor to the [{label, location}] result format.
+
+    Boxes and classes are materialised with a single `.tolist()`.
+    """
+    if det is None or not len(det):
+        return []
+    rows = det[:, [0, 1, 2, 3, 5]].int().tolist()
+    return [{"label": names[row[4]], "location": row[:4]} for row in rows]
+
+
+def _prepare_mapping(row: Dict[str, Any]) -> None:
+    """Pre-parse a mapping row once per cache load for every plugin.
+
+    Adds `labels_parsed` (decoded labels column), `roi_boxes`, `roi_polygons`
+    and `line`; plugins read these instead of the raw JSON columns.
+    """
+    roi_raw = row.get("roi")
+    row["labels_parsed"] = decode_labels(row.get("labels"))
+    row["roi_boxes"] = parse_roi_boxes(roi_raw)
+    row["roi_polygons"] = parse_roi_polygons(roi_raw) if roi_raw else []
+    row["line"] = parse_line_points(row.get("line_roi"))
+
+
+MAPPINGS = MappingCache(
+    db,
+    prepare=_prepare_mapping,
+    enabled=cfg.MAPPING_CACHE_ENABLED,
+    check_interval=cfg.MAPPING_CACHE_CHECK_INTERVAL,
+    max_age=cfg.MAPPING_CACHE_MAX_AGE,
+)
+
+
+def get_active_mapping(usecase_id, camera_id) -> Optional[Dict[str, Any]]:
+    """Return the active camera_usecase_mapping row for a camera/usecase.
+
+    Active means status=1 and the current UTC time is inside
+    [start_time_utc, end_time_utc]; the row comes from the mapping cache with
+    its pre-parsed fields. Label validation is left to the usecase plugin.
+    Returns None when there is no active mapping.
+    """
+    try:
+        row = MAPPINGS.active_mapping(usecase_id, camera_id)
+        if not row:
+            cfg.logger.debug(
+                "No active mapping for camera_id=%s usecase_id=%s", camera_id, usecase_id
+            )
+        return row
+    except Exception as e:
+        cfg.logger.error("An error occurred in get_active_mapping :: %s", str(e))
+        return None
+
+
+def get_all_camera():
+    """Return every camera row; refreshes the mapping cache once per cycle."""
+    try:
+        cfg.logger.debug("Fetching cameras from table: %s", cfg.CAMERA_TABLE_NAME)
+        MAPPINGS.refresh()
+        return MAPPINGS.cameras()
+    except Exception as e:
+        cfg.logger.error("An error occurred in get_all_camera :: %s", str(e))
+        # Return empty list to allow the app loop to continue gracefully
+        return []
+
+
+def get_location_id_by_camera_id(camera_id: int) -> Optional[int]:
+    """Return location_id of the given camera from the cached camera table."""
+    try:
+        row = MAPPINGS.camera(camera_id)
+        if row and row.get("location_id") is not None:
+            try:
+                return int(row["location_id"])
+            except Exception:
+                return None
+        return None
+    except Exception as e:
+        cfg.logger.error("get_location_id_by_camera_id error: %s", e)
+        return None
+
+
+# ============================ ROI Utilities ============================
+def parse_roi_boxes(roi_raw: Any) -> List[List[int]]:
+    """Parse ROI boxes from DB value to a list of [x1,y1,x2,y2].
+
+    The DB column may store JSON like: {"location": [[x1,y1,x2,y2], ...]}
+    or directly a list of boxes. Any invalid entries are ignored.
+    """
+    boxes: List[List[int]] = []
+    try:
+        if not roi_raw:
+            return boxes
+        data = json.loads(roi_raw) if isinstance(roi_raw, str) else roi_raw
+        if isinstance(data, dict) and "location" in data:
+            cand = data.get("location", [])
+        else:
+            cand = data
+        if isinstance(cand, list):
+            for item in cand:
+                if (
+                    isinstance(item, (list, tuple))
+                    and len(item) == 4
+                    and all(isinstance(v, (int, float)) for v in item)
+                ):
+                    x1, y1, x2, y2 = item
+                    if x2 > x1 and y2 > y1:
+                        boxes.append([int(x1), int(y1), int(x2), int(y2)])
+        return boxes
+    except Exception as e:
+        cfg.logger.warning("Failed to parse ROI boxes: %s", e)
+        return []
+
+
+def parse_roi_polygons(roi_raw) -> List[List[Tuple[int, int]]]:
+    """Parse ROI JSON from DB into list of polygons [[(x,y),...], ...].
+
+    Supports formats:
+    - Dict with bounding boxes: {"location": [[x1,y1,x2,y2], ...]}
+    - List of points dicts: [{"x":10,"y":20}, ...]
+    - List of [x,y]
+    - List of polygons (list of lists of points)
+    Returns empty list on failure.
+    """
+    polys: List[List[Tuple[int, int]]] = []
+    try:
+        data = json.loads(roi_raw) if isinstance(roi_raw, str) else roi_raw
+
+        # Case 1: Dict with 'location' holding list of [x1,y1,x2,y2] rectangles
+        if isinstance(data, dict) and "location" in data:
+            locs = data.get("location")
+            if isinstance(locs, list):
+                for box in locs:
+                    if (
+                        isinstance(box, (list, tuple))
+                        and len(box) == 4
+                        and all(isinstance(v, (int, float)) for v in box)
+                    ):
+                        x1, y1, x2, y2 = [int(v) for v in box]
+                        # Convert rectangle to polygon (clockwise)
+                        polys.append([(x1, y1), (x2, y1), (x2, y2), (x1, y2)])
+            return polys
+
+        # Case 2: List-like data (points or polygons)
+        if not isinstance(data, list):
+            return []
+        # Detect whether first level already multiple polygons
+        candidate = data
+        if len(data) and all(isinstance(p, (list, tuple, dict)) for p in data):
+            # If first element is a point, wrap into one polygon
+            is_point = False
+            first = data[0]
+            if isinstance(first, dict) and {"x", "y"}.issubset(first.keys()):
+                is_point = True
+            if (
+                isinstance(first, (list, tuple))
+                and len(first) == 2
+                and all(isinstance(v, (int, float)) for v in first)
+            ):
+                is_point = True
+            if is_point:
+                candidate = [data]
+        for poly in candidate:
+            pts: List[Tuple[int, int]] = []
+            if isinstance(poly, list):
+                for pt in poly:
+                    if isinstance(pt, dict) and "x" in pt and "y" in pt:
+                        pts.append((int(pt["x"]), int(pt["y"])) )
+                    elif isinstance(pt, (list, tuple)) and len(pt) == 2:
+                        pts.append((int(pt[0]), int(pt[1])))
+            if pts:
+                polys.append(pts)
+        return polys
+    except Exception:
+        return []
+
+
+def point_in_polygon(x: int, y: int, polygon: List[Tuple[int, int]]) -> bool:
+    """Ray casting algorithm to test if point is inside polygon."""
+    inside = False
+    n = len(polygon)
+    if n < 3:
+        return False
+    px1, py1 = polygon[0]
+    for i in range(1, n + 1):
+        px2, py2 = polygon[i % n]
+        if min(py1, py2) < y <= max(py1, py2) and x <= max(px1, px2):
+            if py1 != py2:
+                xinters = (y - py1) * (px2 - px1) / (py2 - py1) + px1
+            else:
+                xinters = x
+            if px1 == px2 or x <= xinters:
+                inside = not inside
+        px1, py1 = px2, py2
+    return inside
+
+
+def points_in_polygon(points: np.ndarray, polygon: List[Tuple[int, int]]) -> np.ndarray:
+    """`point_in_polygon` for every (x, y) row of `points` at once (one pass over the edges)."""
+    x = points[:, 0].astype(np.float64)
+    y = points[:, 1].astype(np.float64)
+    inside = np.zeros(len(points), dtype=bool)
+    n = len(polygon)
+    if n < 3:
+        return inside
+    px1, py1 = polygon[0]
+    for i in range(1, n + 1):
+        px2, py2 = polygon[i % n]
+        crossing = (min(py1, py2) < y) & (y <= max(py1, py2)) & (x <= max(px1, px2))
+        if py1 != py2 and px1 != px2:
+            crossing &= x <= (y - py1) * (px2 - px1) / (py2 - py1) + px1
+        inside ^= crossing
+        px1, py1 = px2, py2
+    return inside
+
+
+def relabel_intrusions(
+    result: dict, roi_polys: List[List[Tuple[int, int]]], frame_wh: Tuple[int, int]
+) -> dict:
+    """Relabel detections: if a person center lies inside any ROI polygon mark as 'intrusion'.
+
+    If roi_polys is empty, treat full frame as ROI.
+    """
+    try:
+        if not isinstance(result, dict):
+            return result
+        detections = result.get("detection", [])
+        W, H = frame_wh
+        effective_polys = (
+            roi_polys[:] if roi_polys else [[(0, 0), (W, 0), (W, H), (0, H)]]
+        )
+        if not detections:
+            return result
+        boxes = np.array([det.get("location", [0, 0, 0, 0]) for det in detections], dtype=np.int64)
+        centers = (boxes[:, :2] + boxes[:, 2:]) // 2
+        inside = np.zeros(len(detections), dtype=bool)
+        for poly in effective_polys:
+            inside |= points_in_polygon(centers, poly)
+        for det, hit in zip(detections, inside.tolist()):
+            if hit:
+                det["label"] = "intrusion"
+        return result
+    except Exception as e:
+        cfg.logger.error("Error in relabel_intrusions: %s", e)
+        return result
+
+
+def parse_line_points(line_raw: Any) -> Optional[Dict[str, List[int]]]:
+    """Parse a virtual line definition into {"p1":[x,y], "p2":[x,y]}.
+
+    Accepts formats:
+    - {"p1":[x,y], "p2":[x,y]}
+    - [[x1,y1],[x2,y2]]
+    - {"location": [[x1,y1],[x2,y2]]}
+    Returns None if invalid.
+    """
+    try:
+        if not line_raw:
+            return None
+        data = json.loads(line_raw) if isinstance(line_raw, str) else line_raw
+        # dict with p1/p2
+        if isinstance(data, dict):
+            if "p1" in data and "p2" in data:
+                p1 = list(map(int, data["p1"]))
+                p2 = list(map(int, data["p2"]))
+                if len(p1) == 2 and len(p2) == 2:
+                    return {"p1": p1, "p2": p2}
+            if "location" in data:
+                pts = data.get("location", [])
+                if (
+                    isinstance(pts, list)
+                    and len(pts) >= 2
+                    and all(isinstance(pt, (list, tuple)) and len(pt) == 2 for pt in pts[:2])
+                ):
+                    p1 = list(map(int, pts[0]))
+                    p2 = list(map(int, pts[1]))
+                    return {"p1": p1, "p2": p2}
+        # list of two points
+        if (
+            isinstance(data, list)
+            and len(data) >= 2
+            and all(isinstance(pt, (list, tuple)) and len(pt) == 2 for pt in data[:2])
+        ):
+            p1 = list(map(int, data[0]))
+            p2 = list(map(int, data[1]))
+            return {"p1": p1, "p2": p2}
+    except Exception as e:
+        cfg.logger.warning("Failed to parse line points: %s", e)
+    return None
+
+
+def box_center(box: List[int]) -> Tuple[int, int]:
+    """Return integer center (cx, cy) of a box [x1,y1,x2,y2]."""
+    x1, y1, x2, y2 = box
+    return int((x1 + x2) / 2), int((y1 + y2) / 2)
+
+
+def point_in_box(pt: Tuple[int, int], box: List[int]) -> bool:
+    """Check if point lies strictly inside the box."""
+    x, y = pt
+    x1, y1, x2, y2 = box
+    return x1 <= x <= x2 and y1 <= y <= y2
+
+
+def filter_detections_by_rois(detections: List[Dict[str, Any]], rois: List[List[int]]) -> List[Dict[str, Any]]:
+    """Keep detections whose center lies inside any ROI.
+
+    This is a stable and efficient filter criterion and avoids edge cases
+    where large boxes only slightly intersect an ROI.
+    """
+    if not rois:
+        return detections
+    kept: List[Dict[str, Any]] = []
+    for det in detections or []:
+        loc = det.get("location")
+        if not (isinstance(loc, (list, tuple)) and len(loc) == 4):
+            continue
+        cx, cy = box_center([int(loc[0]), int(loc[1]), int(loc[2]), int(loc[3])])
+        for roi in rois:
+            if point_in_box((cx, cy), roi):
+                kept.append(det)
+                break
+    return kept
+
+
+def draw_rois(
+    image: np.ndarray,
+    rois: List[List[int]],
+    color=(0, 255, 255),
+    thickness: int = 2,
+    label: str = "ROI",
+) -> np.ndarray:
+    """Draw ROI rectangles with a small 'ROI' title on each rectangle.
+
+    Returns the modified image (in place mutation also happens).
+    """
+    if image is None or not isinstance(image, np.ndarray):
+        return image
+    for idx, roi in enumerate(rois or []):
+        if not (isinstance(roi, (list, tuple)) and len(roi) == 4):
+            continue
+        x1, y1, x2, y2 = map(int, roi)
+        cv2.rectangle(image, (x1, y1), (x2, y2), color, thickness)
+        ((tw, th), baseline) = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+        y_text = max(y1 - 6, th + 6)
+        cv2.rectangle(image, (x1, y_text - th - baseline - 4), (x1 + tw + 6, y_text + baseline), color, -1)
+        cv2.putText(image, label, (x1 + 3, y_text), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 2, cv2.LINE_AA)
+    return image
+
+
+def save_overlay_image(base_img: np.ndarray, out_disk_path: str) -> Optional[str]:
+    """Save the provided image to disk, creating parent directories as needed.
+
+    Returns the same path on success, None on failure.
+    """
+    try:
+        os.makedirs(os.path.dirname(out_disk_path), exist_ok=True)
+        ok = cv2.imwrite(out_disk_path, base_img)
+        return out_disk_path if ok else None
+    except Exception as e:
+        cfg.logger.warning("Failed to save overlay image at %s: %s", out_disk_path, e)
+        return None
+
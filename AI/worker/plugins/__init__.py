@@ -0,0 +1,36 @@
+"""Usecase plugins for the multi-usecase worker.
+
+Plugins are looked up by their status key (the name used in the frame's
+camera_status). Modules are imported only when their usecase is enabled, so a
+worker running PPE alone never imports DeepSort.
+"""
+
+import importlib
+from typing import List
+
+import config as cfg
+from plugins.base import UsecasePlugin
+
+# usecase name -> "module:class"
+PLUGINS = {
+    "ppe_detection": "plugins.ppe:PPEPlugin",
+    "intrusion_detection": "plugins.intrusion:IntrusionPlugin",
+    "people_inout": "plugins.people_count:PeopleCountPlugin",
+}
+
+
+def create_plugins(names: List[str]) -> List[UsecasePlugin]:
+    """Instantiate the plugins listed in `names`, skipping unknown ones."""
+    plugins = []
+    for name in names:
+        target = PLUGINS.get(name)
+        if target is None:
+            cfg.logger.warning(
+                "Unknown usecase plugin '%s'; available: %s", name, sorted(PLUGINS)
+            )
+            continue
+        module_name, class_name = target.split(":")
+        plugin_cls = getattr(importlib.import_module(module_name), class_name)
+        plugins.append(plugin_cls())
+        cfg.logger.info("Usecase plugin enabled: %s", name)
+    return plugins
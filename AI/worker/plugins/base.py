@@ -0,0 +1,173 @@
+"""Base class and shared helpers for worker usecase plugins.
+
+A plugin describes one usecase (PPE, intrusion, people in/out) in terms of
+the shared frame the worker has already fetched and decoded:
+
+* ``resolve(camera_id)`` - look up the camera's active mapping (main thread,
+  the only place that touches MySQL). None means "not mapped".
+* ``analyze(ctx, mapping, det, names)`` - turn the raw detections of the
+  plugin's model into its result. Runs on the single inference thread, on
+  each camera's frames in frame-time order (also across pipeline batches,
+  see PipelineRunner's `serial_key`), so order-sensitive state (trackers) is
+  safe here.
+* ``prepare_batch(items)`` - optional work shared by all frames of one
+  inference batch, run just before their ``analyze`` calls, e.g. batching
+  the ReID crops of every camera through one forward pass.
+* ``publish(ctx, mapping, outcome)`` - copy/store/post the result. Runs on a
+  publisher thread and may only use HTTP.
+* ``end_cycle(camera_ids)`` - optional housekeeping after every cycle, on the
+  main thread while no frame is in flight, e.g. expiring tracker state.
+* ``motion_roi(mapping)`` - optional ROI for the motion gate (common/motion_gate.py),
+  also the region kept by ROI-cropped inference (the mapping's ``roi_type``).
+
+Plugins never modify ``ctx["img0"]`` or the detection tensor in place, since
+both are shared with the other plugins of the same frame.
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config as cfg
+import my_utils as mu
+from common.http_client import get_client
+
+
+class UsecasePlugin:
+    """One usecase run by the worker on a shared decoded frame."""
+
+    # Status key posted to FRAME_STATUS_URL, e.g. "ppe_detection"
+    name: str = ""
+    # Status to report when the frame cannot be decoded
+    load_failed_status: str = "failed"
+    # Ask the worker to delete the source frame once every plugin has published
+    delete_source: bool = False
+
+    def __init__(
+        self,
+        weight_path: str,
+        conf_thres: float,
+        iou_thres: float,
+        interval: float = 0.0,
+    ):
+        self.weight_path = weight_path
+        self.conf_thres = float(conf_thres)
+        self.iou_thres = float(iou_thres)
+        self.interval = float(interval)
+        self._last_run: Dict[int, float] = {}
+
+    @property
+    def inference_key(self) -> Tuple[str, float, float]:
+        """Plugins with the same key share one forward pass + NMS per frame."""
+        return self.weight_path, self.conf_thres, self.iou_thres
+
+    # ------------------------------------------------------------ scheduling
+
+    def is_due(self, camera_id: int, now: float) -> bool:
+        """True when `interval` seconds have passed since this camera last ran."""
+        return now - self._last_run.get(camera_id, 0.0) >= self.interval
+
+    def mark_run(self, camera_id: int, now: float) -> None:
+        self._last_run[camera_id] = now
+
+    # ------------------------------------------------------------- interface
+
+    def resolve(self, camera_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def analyze(
+        self, ctx: Dict[str, Any], mapping: Dict[str, Any], det, names: List[str]
+    ) -> Any:
+        raise NotImplementedError
+
+    def prepare_batch(self, items: List[Tuple[Dict[str, Any], Dict[str, Any], Any, List[str]]]) -> None:
+        """Called with (ctx, mapping, det, names) for every frame of a batch, in
+        frame-time order, before `analyze` runs on each of them."""
+
+    def publish(self, ctx: Dict[str, Any], mapping: Dict[str, Any], outcome: Any) -> None:
+        raise NotImplementedError
+
+    def end_cycle(self, camera_ids: List[int]) -> None:
+        """Called on the main thread after every cycle with the ids of the
+        cameras this process handles, while no frame is being processed."""
+
+    def motion_roi(
+        self, mapping: Dict[str, Any]
+    ) -> Optional[Tuple[List[List[int]], List[List[Tuple[int, int]]]]]:
+        """(boxes, polygons) for the motion gate and ROI crops of this usecase; None is the whole frame."""
+        return None
+
+
+def publish_event(
+    ctx: Dict[str, Any],
+    result: Optional[Dict[str, Any]],
+    usecase: str,
+    source_url: Optional[str] = None,
+    dest_overlay: Optional[np.ndarray] = None,
+) -> None:
+    """Copy the frame to the events folder and store the result.
+
+    `source_url` overrides the image that is copied (e.g. an ROI overlay that
+    was saved next to the raw frame); `dest_overlay` is written over the copied
+    events image once the copy succeeded. Does nothing when `result` has no
+    detections.
+    """
+    camera_id = ctx["camera_id"]
+    image_path_url = ctx["image_path_url"]
+    main_image_path = ctx["main_image_path"]
+
+    if not (result and result.get("detection")):
+        cfg.logger.info(
+            "No detections after filtering; skipping copy/store | usecase=%s camera_id=%s",
+            usecase,
+            camera_id,
+        )
+        return
+
+    params = {
+        "image_source_url": source_url or image_path_url,
+        "image_des_url": image_path_url.replace("raw_frames", "events"),
+        "image_size": cfg.IMAGE_SIZE,
+    }
+    cfg.logger.info(f"copy output image :: {params}")
+
+    t_copy_start = time.time()
+    response = get_client().post("copy_image", cfg.COPY_IMAGES_URL, params=params)
+    t_copy_end = time.time()
+    cfg.perf_logger.info(
+        "copy_image latency_ms=%.2f camera_id=%s usecase=%s status=%s",
+        (t_copy_end - t_copy_start) * 1000,
+        camera_id,
+        usecase,
+        response.status_code,
+    )
+
+    if response.status_code != 200:
+        cfg.logger.error(
+            "Copy API failed | usecase=%s status=%s body=%s",
+            usecase,
+            response.status_code,
+            getattr(response, "text", ""),
+        )
+        return
+
+    cfg.logger.info("Copy API succeeded, persisting results to backend DB")
+    if dest_overlay is not None:
+        try:
+            dest_local_path = main_image_path.replace("raw_frames", "events")
+            mu.save_overlay_image(dest_overlay, dest_local_path)
+            cfg.logger.info("ROI overlay written to destination image: %s", dest_local_path)
+        except Exception as e:
+            cfg.logger.warning("Failed to write ROI overlay to destination image: %s", e)
+
+    mu.store_result(
+        file_name=image_path_url.split("/")[-1],
+        file_path=os.path.dirname(main_image_path.replace("raw_frames", "events")),
+        file_url=image_path_url.replace("raw_frames", "events"),
+        bounding_box=result,
+        frame_time=ctx["current_time"],
+        camera_id=int(camera_id),
+    )
+
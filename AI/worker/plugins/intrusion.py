@@ -0,0 +1,110 @@
+"""Intrusion detection as a worker plugin.
+
+Persons whose box center lies inside a mapping ROI polygon (or anywhere in
+the frame when the mapping has no ROI) are relabelled "intrusion"; only
+those are stored. The events image gets the ROI outline drawn on it.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import cv2
+
+import config as cfg
+from common import ingest
+import my_utils as mu
+from plugins.base import UsecasePlugin, publish_event
+
+
+class IntrusionPlugin(UsecasePlugin):
+    name = "intrusion_detection"
+    # Unreadable frames are marked completed so they do not block downstream consumers
+    load_failed_status = "completed"
+
+    def __init__(self):
+        super().__init__(
+            cfg.INTRUSION_WEIGHT_PATH,
+            cfg.INTRUSION_MODEL_CONF,
+            cfg.INTRUSION_MODEL_IOU,
+            interval=cfg.INTRUSION_INTERVAL,
+        )
+        self.result_type_id = cfg.INTRUSION_RESULT_TYPE_ID
+
+    def resolve(self, camera_id: int) -> Optional[Dict[str, Any]]:
+        row = mu.get_active_mapping(self.result_type_id, camera_id)
+        if not row:
+            return None
+
+        parsed = row.get("labels_parsed")
+        labels_list: List[str] = []
+        if isinstance(parsed, dict):
+            # Accept any key; flatten to list
+            for v in parsed.values():
+                if isinstance(v, list):
+                    labels_list.extend(str(x).strip().lower() for x in v)
+        elif isinstance(parsed, list):
+            labels_list = [str(x).strip().lower() for x in parsed]
+
+        if "intrusion" not in set(labels_list):
+            cfg.logger.info(
+                "Mapping labels do not include 'intrusion' | camera_id=%s labels=%s",
+                camera_id,
+                labels_list,
+            )
+            return None
+
+        roi_polys = row.get("roi_polygons") or []
+        cfg.logger.debug(
+            "Intrusion mapping accepted | camera_id=%s polygons=%d", camera_id, len(roi_polys)
+        )
+        return {"roi_polys": roi_polys, "roi_type": row.get("roi_type")}
+
+    def analyze(
+        self, ctx: Dict[str, Any], mapping: Dict[str, Any], det, names: List[str]
+    ) -> Dict[str, Any]:
+        # Keep only person detections, then relabel those inside the ROI
+        if det is not None and len(det):
+            det = mu.keep_classes(det, mu.label_classes(names, ["person"]))
+        detections = mu.format_detections(det, names)
+        h, w = ctx["frame_shape"][:2]
+        result = mu.relabel_intrusions({"detection": detections}, mapping["roi_polys"], (w, h))
+        result["detection"] = [d for d in result["detection"] if d["label"] == "intrusion"]
+        cfg.logger.info(
+            "Intrusion result | camera_id=%s persons=%d intrusions=%d",
+            ctx["camera_id"],
+            len(detections),
+            len(result["detection"]),
+        )
+        return result
+
+    def motion_roi(self, mapping: Dict[str, Any]):
+        roi_polys = mapping["roi_polys"]
+        return ([], roi_polys) if roi_polys else None
+
+    def publish(self, ctx: Dict[str, Any], mapping: Dict[str, Any], outcome: Any) -> None:
+        overlay = None
+        roi_polys = mapping["roi_polys"]
+        if roi_polys and outcome and outcome.get("detection"):
+            overlay = self._draw_roi_polygons(ingest.full_frame(ctx).copy(), roi_polys)
+        publish_event(ctx, outcome, self.name, dest_overlay=overlay)
+
+    @staticmethod
+    def _draw_roi_polygons(img, roi_polys):
+        try:
+            for poly in roi_polys:
+                pts = [(int(x), int(y)) for x, y in poly]
+                for i in range(len(pts)):
+                    cv2.line(img, pts[i], pts[(i + 1) % len(pts)], (255, 0, 0), 2)
+                cv2.putText(
+                    img,
+                    "Intrusion ROI",
+                    pts[0],
+                    cv2.FONT_HERSHEY_SIMPLEX,
+                    0.7,
+                    (255, 0, 0),
+                    2,
+                    cv2.LINE_AA,
+                )
+            return img
+        except Exception as e:
+            cfg.logger.warning("Failed to generate ROI overlay: %s", e)
+            return None
@@ -0,0 +1,327 @@
+"""People In/Out counting (head detection + tracking) as a worker plugin.
+
+Tracking state is kept per camera inside the plugin. `analyze` runs on the
+single inference thread, on each camera's frames in frame-time order (in a
+batch by sorting, across batches through the pipeline's per-camera
+`serial_key`), which is what DeepSort needs;
+`publish` only posts the IN/OUT counts and the optional visualization.
+Every camera's tracker embeds its crops through the shared ReID extractor
+(common/reid.py); `prepare_batch` embeds the crops of a whole batch at once.
+Each camera's tracker is DeepSort, SORT or centroid, from its mapping or
+TRACKER_MODE; `end_cycle` expires and snapshots the tracking state
+(common/tracking_state.py).
+"""
+
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+import config as cfg
+from common import ingest
+import my_utils as mu
+from common import reid, tracking_state
+from common.http_client import get_client
+from plugins.base import UsecasePlugin
+from tracking import strategies
+from tracking.strategies import TrackerStrategy
+from tracking.trackbleobject import TrackableObject
+
+
+def line_side(p1: Tuple[int, int], p2: Tuple[int, int], pt: Tuple[float, float]) -> float:
+    """Return signed distance proxy to decide which side of the line (p1->p2) a point lies."""
+    return (pt[0] - p1[0]) * (p2[1] - p1[1]) - (pt[1] - p1[1]) * (p2[0] - p1[0])
+
+
+def is_horizontal_line(p1: Tuple[int, int], p2: Tuple[int, int]) -> bool:
+    return abs(p1[1] - p2[1]) <= 2
+
+
+class PeopleCountPlugin(UsecasePlugin):
+    name = "people_inout"
+    # The people_count service always deleted the raw frame after posting counts
+    delete_source = True
+
+    def __init__(self):
+        super().__init__(
+            cfg.PEOPLE_WEIGHT_PATH,
+            cfg.PEOPLE_MODEL_CONF,
+            cfg.PEOPLE_MODEL_IOU,
+            interval=cfg.PEOPLE_INTERVAL,
+        )
+        usecase_id = cfg.PEOPLE_USECASE_ID
+        self.usecase_id = int(usecase_id) if str(usecase_id).isdigit() else usecase_id
+        self.reid = reid.get_reid()
+        self.tracking = tracking_state.TrackingState(
+            self._new_tracker,
+            mode=cfg.TRACKER_MODE,
+            auto_light=cfg.TRACKER_AUTO_LIGHT,
+            auto_max_people=cfg.TRACKER_AUTO_MAX_PEOPLE,
+            auto_window=cfg.TRACKER_AUTO_WINDOW,
+            ttl=cfg.TRACK_STATE_TTL_SECONDS,
+            snapshot_dir=cfg.TRACK_SNAPSHOT_DIR,
+            snapshot_interval=cfg.TRACK_SNAPSHOT_SECONDS,
+        )
+        # ReID features from prepare_batch, by id() of the frame context
+        self._features: Dict[int, np.ndarray] = {}
+
+    def _new_tracker(self, mode: str, next_id: Optional[int]) -> TrackerStrategy:
+        return strategies.create(
+            mode,
+            model_path=cfg.REID_CKPT,
+            extractor=self.reid,
+            max_dist=cfg.MAX_DIST,
+            min_confidence=cfg.MIN_CONFIDENCE,
+            nms_max_overlap=cfg.NMS_MAX_OVERLAP,
+            max_iou_distance=cfg.MAX_IOU_DISTANCE,
+            max_age=cfg.MAX_AGE,
+            n_init=cfg.N_INIT,
+            nn_budget=cfg.NN_BUDGET,
+            centroid_max_distance=cfg.CENTROID_MAX_DISTANCE,
+            next_id=next_id,
+        )
+
+    def resolve(self, camera_id: int) -> Optional[Dict[str, Any]]:
+        row = mu.get_active_mapping(self.usecase_id, camera_id)
+        if not row:
+            return None
+        line_cfg = row.get("line")
+        if not line_cfg:
+            cfg.logger.warning(
+                "No line mapping in DB for camera_id=%s. Skipping people counting.", camera_id
+            )
+            return None
+        rois = row.get("roi_boxes") or []
+        mapping = {
+            "roi_box": rois[0] if rois else None,
+            "p1": tuple(map(int, line_cfg["p1"])),
+            "p2": tuple(map(int, line_cfg["p2"])),
+            # Looked up here so the publish stage never needs the DB connection
+            "location_id": mu.get_location_id_by_camera_id(camera_id) or 0,
+            "roi_type": row.get("roi_type"),
+            # Tracker mode of the mapping (None: TRACKER_MODE), see common/tracking_state.py
+            "tracker_mode": row.get("tracker"),
+        }
+        cfg.logger.info(
+            "People mapping | camera_id=%s roi_box=%s line p1=%s p2=%s",
+            camera_id,
+            mapping["roi_box"],
+            mapping["p1"],
+            mapping["p2"],
+        )
+        return mapping
+
+    @staticmethod
+    def _heads(ctx: Dict[str, Any], mapping: Dict[str, Any], det, names: List[str]):
+        """Head detections inside the mapping's ROI (missing ROI means the full frame), and that ROI."""
+        if det is not None and len(det) and "head" in names:
+            det = det[det[:, 5] == names.index("head")]
+        roi_box = mapping["roi_box"]
+        if not roi_box:
+            h, w = ctx["frame_shape"][:2]
+            roi_box = [0, 0, int(w - 1), int(h - 1)]
+        if det is not None and len(det):
+            x1r, y1r, x2r, y2r = roi_box
+            cx = (det[:, 0] + det[:, 2]) / 2.0
+            cy = (det[:, 1] + det[:, 3]) / 2.0
+            det = det[(cx >= x1r) & (cx <= x2r) & (cy >= y1r) & (cy <= y2r)]
+        return det, roi_box
+
+    @staticmethod
+    def _track_boxes(ctx: Dict[str, Any], det) -> torch.Tensor:
+        """Center/size boxes for DeepSort in img0 coordinates."""
+        xywhs = torch.stack(
+            (
+                (det[:, 0] + det[:, 2]) / 2.0,
+                (det[:, 1] + det[:, 3]) / 2.0,
+                (det[:, 2] - det[:, 0]).abs(),
+                (det[:, 3] - det[:, 1]).abs(),
+            ),
+            dim=1,
+        )
+        # Boxes are in original-frame coordinates; DeepSort crops from img0,
+        # which may be decoded at reduced resolution
+        return xywhs / ctx.get("frame_scale", 1.0)
+
+    def prepare_batch(self, items: List[Tuple[Dict[str, Any], Dict[str, Any], Any, List[str]]]) -> None:
+        """Pick each frame's tracker, then embed the head crops of every frame
+        tracked by DeepSort in one ReID pass."""
+        frames = []
+        for ctx, mapping, det, names in items:
+            det, _ = self._heads(ctx, mapping, det, names)
+            count = 0 if det is None else len(det)
+            tracker = self.tracking.observe(ctx["camera_id"], mapping.get("tracker_mode"), count)
+            if count and tracker.uses_reid:
+                frames.append((ctx, tracker.crops(self._track_boxes(ctx, det), ctx["img0"])))
+        features = self.reid.embed_many([crops for _, crops in frames])
+        self._features = {id(ctx): f for (ctx, _), f in zip(frames, features)}
+
+    def analyze(
+        self, ctx: Dict[str, Any], mapping: Dict[str, Any], det, names: List[str]
+    ) -> Dict[str, Any]:
+        camera_id = ctx["camera_id"]
+        img0 = ctx["img0"]
+        p1, p2 = mapping["p1"], mapping["p2"]
+
+        det, roi_box = self._heads(ctx, mapping, det, names)
+        result = {"detection": mu.format_detections(det, names)}
+
+        # ===================== Tracking and counting =====================
+        in_count = 0
+        out_count = 0
+        outputs = []
+        trackables: Dict[int, TrackableObject] = {}
+        if det is not None and len(det):
+            tracker = self.tracking.tracker(camera_id)
+            trackables = self.tracking.trackables(camera_id)
+            confss = det[:, 4:5]
+            scale = ctx.get("frame_scale", 1.0)
+            # Features embedded by prepare_batch (None: the tracker embeds its own crops)
+            features = self._features.pop(id(ctx), None)
+            outputs = tracker.update(self._track_boxes(ctx, det), confss, img0, features=features)
+            if len(outputs) > 0 and scale != 1.0:
+                outputs[:, :4] = np.rint(outputs[:, :4] * scale)
+            if len(outputs) == 0:
+                tracker.increment_ages()
+
+            horiz = is_horizontal_line(p1, p2)
+            line_y = p1[1]
+            now = time.time()
+            for cord in outputs:
+                x1o, y1o, x2o, y2o, tid = cord.tolist()
+                cx, cy = (x1o + x2o) / 2.0, (y1o + y2o) / 2.0
+                to = trackables.get(tid)
+                if to is None:
+                    trackables[tid] = TrackableObject(tid, (cx, cy))
+                    continue
+                prev = to.centroids[-1]
+                to.centroids.append((cx, cy))
+                to.last_seen = now
+                if to.counted:
+                    continue
+                if horiz:
+                    # bottom->top IN ; top->bottom OUT
+                    prev_side = prev[1] - line_y
+                    curr_side = cy - line_y
+                    if prev_side > 0 >= curr_side:
+                        in_count += 1
+                        to.counted = True
+                    elif prev_side < 0 <= curr_side:
+                        out_count += 1
+                        to.counted = True
+                elif line_side(p1, p2, prev) * line_side(p1, p2, (cx, cy)) <= 0:
+                    # Heuristic for IN/OUT using vertical orientation
+                    if cy < prev[1]:
+                        in_count += 1
+                    else:
+                        out_count += 1
+                    to.counted = True
+                if to.counted:
+                    cfg.logger.info(
+                        "Track %s crossed line at %s-%s: IN=%d OUT=%d",
+                        tid,
+                        p1,
+                        p2,
+                        in_count,
+                        out_count,
+                    )
+
+        # Snapshot trajectories so drawing never reads live tracker state
+        trajectories = {}
+        if cfg.VISUALIZE and len(outputs) > 0:
+            for cord in outputs:
+                to = trackables.get(int(cord[4]))
+                if to and getattr(to, "centroids", None):
+                    trajectories[int(cord[4])] = list(to.centroids[-30:])
+
+        return {
+            "result": result,
+            "roi_box": roi_box,
+            "in_count": in_count,
+            "out_count": out_count,
+            "outputs": outputs,
+            "trajectories": trajectories,
+        }
+
+    def end_cycle(self, camera_ids: List[int]) -> None:
+        self.tracking.housekeep(camera_ids)
+
+    def motion_roi(self, mapping: Dict[str, Any]):
+        roi_box = mapping["roi_box"]
+        return ([roi_box], []) if roi_box else None
+
+    def publish(self, ctx: Dict[str, Any], mapping: Dict[str, Any], outcome: Any) -> None:
+        outcome = outcome or {}
+        camera_id = ctx["camera_id"]
+        in_count = outcome.get("in_count", 0)
+        out_count = outcome.get("out_count", 0)
+
+        if cfg.VISUALIZE:
+            self._save_visualization(ctx, mapping, outcome)
+
+        frame_time_iso = str(ctx["current_time"]).replace(" ", "T") + "Z"
+        for label, cnt in (("IN", in_count), ("OUT", out_count)):
+            if cnt <= 0:
+                continue
+            payload = {
+                "frame_time": frame_time_iso,
+                "frame_analysis": label,
+                "frame_count": int(cnt),
+                "camera_id": int(camera_id),
+                "user_id": int(cfg.USER_ID) if str(cfg.USER_ID).isdigit() else cfg.USER_ID,
+                "location_id": int(mapping["location_id"]),
+                "usecase_id": self.usecase_id,
+            }
+            cfg.logger.info(
+                "Posting counts | url=%s payload=%s", cfg.PEOPLE_COUNTS_API_URL, payload
+            )
+            t_post_s = time.time()
+            try:
+                resp = get_client().post("people_counts", cfg.PEOPLE_COUNTS_API_URL, json=payload)
+                cfg.perf_logger.info(
+                    "counts_post latency_ms=%.2f camera_id=%s status=%s",
+                    (time.time() - t_post_s) * 1000,
+                    camera_id,
+                    getattr(resp, "status_code", -1),
+                )
+                if resp.status_code != 200:
+                    cfg.logger.error(
+                        "Counts API failed | status=%s body=%s",
+                        resp.status_code,
+                        getattr(resp, "text", ""),
+                    )
+            except Exception as e:
+                cfg.logger.error("Counts API exception: %s", e)
+
+    @staticmethod
+    def _save_visualization(ctx: Dict[str, Any], mapping: Dict[str, Any], outcome: Dict[str, Any]) -> None:
+        try:
+            vis = ingest.full_frame(ctx).copy()
+            p1, p2 = mapping["p1"], mapping["p2"]
+            roi_box = outcome.get("roi_box")
+            if roi_box:
+                x1r, y1r, x2r, y2r = roi_box
+                cv2.rectangle(vis, (x1r, y1r), (x2r, y2r), (0, 255, 255), 2)
+            cv2.line(vis, p1, p2, (0, 0, 255), 2)
+            for det in (outcome.get("result") or {}).get("detection", []):
+                x1, y1, x2, y2 = [int(v) for v in det.get("location", [0, 0, 0, 0])]
+                cv2.rectangle(vis, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            trajectories = outcome.get("trajectories", {})
+            for x1o, y1o, x2o, y2o, tid in outcome.get("outputs", []):
+                x1o, y1o, x2o, y2o, tid = int(x1o), int(y1o), int(x2o), int(y2o), int(tid)
+                cv2.rectangle(vis, (x1o, y1o), (x2o, y2o), (255, 0, 255), 2)
+                cv2.putText(vis, f"ID:{tid}", (x1o, max(y1o - 5, 12)), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 255), 2, cv2.LINE_AA)
+                pts = [(int(cx), int(cy)) for (cx, cy) in trajectories.get(tid, [])]
+                for i in range(1, len(pts)):
+                    cv2.line(vis, pts[i - 1], pts[i], (255, 255, 0), 2)
+            summary = f"camera_id={ctx['camera_id']} in={outcome.get('in_count', 0)} out={outcome.get('out_count', 0)}"
+            cv2.putText(vis, summary, (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2, cv2.LINE_AA)
+            os.makedirs(cfg.OUTPUTS_DIR, exist_ok=True)
+            out_path = os.path.join(cfg.OUTPUTS_DIR, ctx["image_path_url"].split("/")[-1])
+            cv2.imwrite(out_path, vis)
+            cfg.logger.info("Saved visualization image: %s", out_path)
+        except Exception as e:
+            cfg.logger.warning("Failed to generate visualization: %s", e)
@@ -0,0 +1,115 @@
+"""PPE detection (hardhat / vest) as a worker plugin.
+
+Same filtering as the PPE service: detections are limited to the labels
+listed in the mapping and to the mapping's ROI boxes, and the copied event
+image carries the ROI overlay when one can be saved next to the raw frame.
+"""
+
+import os
+from typing import Any, Dict, List, Optional
+
+import config as cfg
+from common import ingest
+import my_utils as mu
+from plugins.base import UsecasePlugin, publish_event
+
+# A mapping is only treated as PPE when it lists at least one of these labels
+REQUIRED_LABELS = {"no_vest", "no_hardhat", "vest", "hardhat"}
+
+
+class PPEPlugin(UsecasePlugin):
+    name = "ppe_detection"
+
+    def __init__(self):
+        super().__init__(
+            cfg.PPE_WEIGHT_PATH,
+            cfg.PPE_MODEL_CONF,
+            cfg.PPE_MODEL_IOU,
+            interval=cfg.PPE_INTERVAL,
+        )
+        self.result_type_id = cfg.PPE_RESULT_TYPE_ID
+
+    def resolve(self, camera_id: int) -> Optional[Dict[str, Any]]:
+        row = mu.get_active_mapping(self.result_type_id, camera_id)
+        if not row:
+            return None
+
+        parsed = row.get("labels_parsed")
+        if isinstance(parsed, dict):
+            # Expected format: {"ppe": ["no_vest", "no_hardhat", "vest", "hardhat"]}
+            if "ppe" not in parsed:
+                cfg.logger.info(
+                    "Labels provided for a non-PPE usecase; ignoring mapping | camera_id=%s labels_keys=%s",
+                    camera_id,
+                    list(parsed.keys()),
+                )
+                return None
+            parsed = parsed.get("ppe")
+        labels_list = [str(x).strip() for x in parsed] if isinstance(parsed, list) else []
+
+        if not any(lbl in REQUIRED_LABELS for lbl in labels_list):
+            cfg.logger.info(
+                "Mapping labels do not include required PPE labels | camera_id=%s labels=%s",
+                camera_id,
+                labels_list,
+            )
+            return None
+
+        roi_boxes = row.get("roi_boxes") or []
+        cfg.logger.debug(
+            "PPE mapping accepted | camera_id=%s labels=%s rois=%d",
+            camera_id,
+            labels_list,
+            len(roi_boxes),
+        )
+        return {"allowed_labels": labels_list, "roi_boxes": roi_boxes, "roi_type": row.get("roi_type")}
+
+    def analyze(
+        self, ctx: Dict[str, Any], mapping: Dict[str, Any], det, names: List[str]
+    ) -> Dict[str, Any]:
+        # The forward pass is shared with other plugins, so filter here with tensor masks
+        if det is not None and len(det):
+            det = mu.keep_classes(det, mu.label_classes(names, mapping["allowed_labels"]))
+            if mapping["roi_boxes"]:
+                det = det[mu.roi_mask(det, mapping["roi_boxes"])]
+        detections = mu.format_detections(det, names)
+        cfg.logger.info(
+            "PPE result | camera_id=%s detections=%d", ctx["camera_id"], len(detections)
+        )
+        return {"detection": detections}
+
+    def motion_roi(self, mapping: Dict[str, Any]):
+        roi_boxes = mapping["roi_boxes"]
+        return (roi_boxes, []) if roi_boxes else None
+
+    def publish(self, ctx: Dict[str, Any], mapping: Dict[str, Any], outcome: Any) -> None:
+        source_url = None
+        roi_boxes = mapping["roi_boxes"]
+        if roi_boxes and outcome and outcome.get("detection"):
+            source_url = self._save_roi_overlay(ctx, roi_boxes)
+        publish_event(ctx, outcome, self.name, source_url=source_url)
+
+    @staticmethod
+    def _save_roi_overlay(ctx: Dict[str, Any], roi_boxes: List[List[int]]) -> Optional[str]:
+        """Save the frame with ROI boxes drawn next to the raw frame; return its URL."""
+        try:
+            main_image_path = ctx["main_image_path"]
+            name, ext = os.path.splitext(os.path.basename(main_image_path))
+            overlay_disk_path = os.path.join(
+                os.path.dirname(main_image_path), f"{name}_roi{ext or '.jpg'}"
+            )
+            # Only when the raw frame directory is local and writable on this host
+            dest_dir = os.path.dirname(overlay_disk_path)
+            if not (os.path.isdir(dest_dir) and os.access(dest_dir, os.W_OK)):
+                cfg.logger.debug(
+                    "Skipping overlay save; non-writable or non-local path: %s", dest_dir
+                )
+                return None
+            over_img = mu.draw_rois(ingest.full_frame(ctx).copy(), roi_boxes, label="PPE ROI")
+            saved_path = mu.save_overlay_image(over_img, overlay_disk_path)
+            if saved_path:
+                base_url = (cfg.ROOT_URL or "").rstrip("/")
+                return saved_path.replace(cfg.ROOT_PATH, base_url)
+        except Exception as e:
+            cfg.logger.warning("Failed to create ROI overlay source: %s", e)
+        return None
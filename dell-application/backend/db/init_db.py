@@ -1,17 +1,43 @@
 """Database initialization entry.
 
- Ensures all SQLAlchemy models are registered and creates tables against the
- configured engine. Invoked on module import.
+ Ensures all SQLAlchemy models are registered, creates tables against the
+ configured engine and adds columns introduced after a table was created.
+ Invoked on module import.
 
  Category: Database / Initialization
  """
 
+from sqlalchemy import inspect, text
+
 from db import base
 from db.session import engine
 
+# Columns added to existing tables after their first release. `create_all`
+# only creates missing tables, so databases created before a column existed
+# get it here (nullable, so existing rows keep working).
+ADDED_COLUMNS = {
+    "camera_usecase_mapping": ["tracker"],
+}
+
+
+def add_missing_columns() -> None:
+    inspector = inspect(engine)
+    for table_name, column_names in ADDED_COLUMNS.items():
+        if not inspector.has_table(table_name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table_name)}
+        table = base.Base.metadata.tables[table_name]
+        for name in column_names:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {column_type} NULL"))
+
 
 def init_db() -> None:
     base.Base.metadata.create_all(bind=engine)
+    add_missing_columns()
 
 
 init_db()
@@ -1,6 +1,9 @@
-from typing import Optional, List
+from typing import Literal, Optional, List
 from pydantic import BaseModel
 
+# People counting tracker of a mapping (None: the AI service's TRACKER_MODE)
+TrackerMode = Literal["deepsort", "sort", "centroid", "auto"]
+
 
 class CameraUseCaseResponse(BaseModel):
     usecase_id: int
@@ -19,6 +22,7 @@ class UsecaseMappingCreate(BaseModel):
     usecase_timeout: Optional[int] = 0
     second_before_event: Optional[int] = 0
     second_after_event: Optional[int] = 0
+    tracker: Optional[TrackerMode] = None
 
 
 class UsecaseMappingUpdate(BaseModel):
@@ -27,6 +31,7 @@ class UsecaseMappingUpdate(BaseModel):
     usecase_id: Optional[int]
     roi: Optional[list]
     roi_type: Optional[str]
+    tracker: Optional[TrackerMode]
     line_roi: Optional[list]
     usecase_timeout: Optional[int]
     second_before_event: Optional[int]